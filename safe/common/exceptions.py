@@ -471,3 +471,10 @@ class MetadataConversionError(InaSAFEError):
     """When failed to convert metadata."""
 
     pass
+
+
+class AnalysisCancelledError(InaSAFEError):
+
+    """When the user cancels a running analysis."""
+
+    pass
@@ -7,6 +7,7 @@ import ctypes
 import getpass
 import logging
 import math
+import multiprocessing
 import os
 import platform
 import sys
@@ -656,3 +657,26 @@ def add_to_list(my_list, my_element):
             my_list.append(my_element)
 
     return my_list
+
+
+def process_pool(processes, initializer=None):
+    """Create a pool of worker processes, also when running inside QGIS.
+
+    Inside QGIS on Windows, the executable is QGIS itself, not Python, so
+    the workers are started with pythonw.exe.
+
+    .. versionadded:: 4.3
+
+    :param processes: Number of worker processes.
+    :type processes: int
+
+    :param initializer: A function called when each worker starts.
+    :type initializer: function
+
+    :return: The pool, to close and join after use.
+    :rtype: multiprocessing.pool.Pool
+    """
+    if os.name == 'nt':
+        multiprocessing.set_executable(
+            os.path.join(sys.exec_prefix, 'pythonw.exe'))
+    return multiprocessing.Pool(processes, initializer=initializer)
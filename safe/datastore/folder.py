@@ -5,6 +5,7 @@
 from itertools import product
 
 from PyQt4.QtCore import QFileInfo, QDir, QFile
+from osgeo import ogr
 from qgis.core import (
     QgsVectorFileWriter,
     QgsRasterPipe,
@@ -20,11 +21,33 @@ __license__ = "GPL version 3"
 __email__ = "info@inasafe.org"
 __revision__ = '$Format:%H$'
 
-VECTOR_EXTENSIONS = ('shp', 'kml', 'geojson')
+VECTOR_EXTENSIONS = ('shp', 'kml', 'geojson', 'gpkg', 'fgb')
 RASTER_EXTENSIONS = ('asc', 'tiff', 'tif')
 TABULAR_EXTENSIONS = ('csv',)
 EXTENSIONS = RASTER_EXTENSIONS + VECTOR_EXTENSIONS + TABULAR_EXTENSIONS
 
+# OGR driver used for each vector format.
+VECTOR_FORMAT_DRIVERS = {
+    'shp': 'ESRI Shapefile',
+    'kml': 'KML',
+    'geojson': 'GeoJSON',
+    'gpkg': 'GPKG',
+    'fgb': 'FlatGeobuf',  # GDAL 3.1
+}
+
+
+def available_vector_formats():
+    """List the vector formats supported by the installed OGR.
+
+    :return: The extensions of the formats.
+    :rtype: list
+
+    .. versionadded:: 4.3
+    """
+    return [
+        extension for extension in VECTOR_EXTENSIONS
+        if ogr.GetDriverByName(VECTOR_FORMAT_DRIVERS[extension])]
+
 
 class Folder(DataStore):
     """
@@ -68,11 +91,13 @@ class Folder(DataStore):
     def default_vector_format(self, default_format):
         """Set the default vector format for the folder datastore.
 
+        The format is not changed if OGR does not support it.
+
         :param default_format: The default output format.
-            It can be 'shp', 'geojson' or 'kml'.
+            It can be 'shp', 'geojson', 'kml', 'gpkg' or 'fgb'.
         :param default_format: str
         """
-        if default_format in VECTOR_EXTENSIONS:
+        if default_format in available_vector_formats():
             self._default_vector_format = default_format
 
     @property
@@ -194,18 +219,12 @@ class Folder(DataStore):
         output = QFileInfo(
             self.uri.filePath(layer_name + '.' + self._default_vector_format))
 
-        driver_mapping = {
-            'shp': 'ESRI Shapefile',
-            'kml': 'KML',
-            'geojson': 'GeoJSON',
-        }
-
         QgsVectorFileWriter.writeAsVectorFormat(
             vector_layer,
             output.absoluteFilePath(),
             'utf-8',
             vector_layer.crs(),
-            driver_mapping[self._default_vector_format])
+            VECTOR_FORMAT_DRIVERS[self._default_vector_format])
 
         assert output.exists()
         return True, output.baseName()
@@ -11,15 +11,41 @@ Contact : ole.moller.nielsen@gmail.com
 
 """
 
-from PyQt4.QtCore import QFileInfo
+from PyQt4.QtCore import QFileInfo, QPyNullVariant, Qt
 from osgeo import ogr, osr, gdal
-from qgis.core import (
-    QgsVectorLayer,
-)
 
 from safe.common.exceptions import ErrorDataStore
 from safe.datastore.datastore import DataStore
-from safe.definitions.gis import QGIS_OGR_GEOMETRY_MAP
+from safe.definitions.gis import (
+    QGIS_OGR_GEOMETRY_MAP, QGIS_OGR_FIELD_TYPE_MAP)
+
+# Number of features written in a single transaction.
+batch_size = 10000
+
+# Data types of the tiled gridded coverage extension, GDAL 2.2.
+RASTER_DATA_TYPES = [
+    gdal.GDT_Byte, gdal.GDT_Int16, gdal.GDT_UInt16, gdal.GDT_Float32]
+
+
+def _ogr_value(value):
+    """Convert an attribute from QGIS to a value accepted by OGR.
+
+    :param value: The attribute.
+    :type value: object
+
+    :return: The value, None for a NULL attribute.
+    :rtype: object
+    """
+    if value is None or isinstance(value, QPyNullVariant):
+        return None
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, bool):
+        return int(value)
+    if hasattr(value, 'toString'):
+        # QDate, QTime and QDateTime
+        return str(value.toString(Qt.ISODate))
+    return value
 
 
 class GeoPackage(DataStore):
@@ -85,7 +111,7 @@ class GeoPackage(DataStore):
         .. versionadded:: 4.0
         """
         # Fixme, need to check DB permissions ?
-        return self._uri.absolutePath().isWritable()
+        return QFileInfo(self._uri.absolutePath()).isWritable()
 
     def supports_rasters(self):
         """Check if we can support raster in the geopackage.
@@ -182,6 +208,9 @@ class GeoPackage(DataStore):
     def _add_vector_layer(self, vector_layer, layer_name):
         """Add a vector layer to the geopackage.
 
+        Features are written with OGR in transactions of `batch_size`
+        features. The R-tree index is created once all features are written.
+
         :param vector_layer: The layer to add.
         :type vector_layer: QgsVectorLayer
 
@@ -195,32 +224,70 @@ class GeoPackage(DataStore):
 
         .. versionadded:: 4.0
         """
+        if not self.is_writable():
+            return False, 'The destination is not writable.'
 
-        # Fixme
-        # if not self.is_writable():
-        #    return False, 'The destination is not writable.'
+        geometry_type = QGIS_OGR_GEOMETRY_MAP[vector_layer.wkbType()]
 
-        geometry = QGIS_OGR_GEOMETRY_MAP[vector_layer.wkbType()]
-
-        spatial_reference = osr.SpatialReference()
-        qgis_spatial_reference = vector_layer.crs().authid()
-        spatial_reference.ImportFromEPSG(
-            int(qgis_spatial_reference.split(':')[1]))
+        spatial_reference = None
+        if vector_layer.crs().isValid():
+            spatial_reference = osr.SpatialReference()
+            spatial_reference.ImportFromWkt(vector_layer.crs().toWkt())
 
         vector_datasource = self.vector_driver.Open(
             self.uri.absoluteFilePath(), True)
-        vector_datasource.CreateLayer(layer_name, spatial_reference, geometry)
-        uri = u'{}|layerid=0'.format(self.uri.absoluteFilePath())
-        vector_layer = QgsVectorLayer(uri, layer_name, u'ogr')
-
-        data_provider = vector_layer.dataProvider()
-        for feature in vector_layer.getFeatures():
-            data_provider.addFeatures([feature])
-
+        output_layer = vector_datasource.CreateLayer(
+            layer_name.encode('utf-8'),
+            spatial_reference,
+            geometry_type,
+            ['SPATIAL_INDEX=NO'])
+        if output_layer is None:
+            return False, gdal.GetLastErrorMsg()
+
+        for field in vector_layer.fields():
+            field_type = QGIS_OGR_FIELD_TYPE_MAP.get(
+                field.type(), ogr.OFTString)
+            output_layer.CreateField(
+                ogr.FieldDefn(field.name().encode('utf-8'), field_type))
+        definition = output_layer.GetLayerDefn()
+
+        output_layer.StartTransaction()
+        for i, feature in enumerate(vector_layer.getFeatures()):
+            output_feature = ogr.Feature(definition)
+            for index, value in enumerate(feature.attributes()):
+                value = _ogr_value(value)
+                if value is not None:
+                    output_feature.SetField(index, value)
+            geometry = feature.geometry()
+            if geometry and not geometry.isEmpty():
+                output_feature.SetGeometry(
+                    ogr.CreateGeometryFromWkb(geometry.asWkb()))
+            output_layer.CreateFeature(output_feature)
+
+            if (i + 1) % batch_size == 0:
+                output_layer.CommitTransaction()
+                output_layer.StartTransaction()
+        output_layer.CommitTransaction()
+
+        if geometry_type != ogr.wkbNone:
+            result = vector_datasource.ExecuteSQL(
+                "SELECT CreateSpatialIndex('%s', '%s')" % (
+                    layer_name.encode('utf-8').replace("'", "''"),
+                    output_layer.GetGeometryColumn()))
+            if result is not None:
+                vector_datasource.ReleaseResultSet(result)
+
+        # Once we're done, close properly the datasource
+        output_layer = None
+        vector_datasource = None
         return True, layer_name
 
     def _add_raster_layer(self, raster_layer, layer_name):
-        """Add a raster layer to the folder.
+        """Add a raster layer to the geopackage.
+
+        The first band is copied one row of tiles at a time. The data type of
+        the source is kept if the geopackage supports it, otherwise values
+        are written as Float32.
 
         :param raster_layer: The layer to add.
         :type raster_layer: QgsRasterLayer
@@ -235,9 +302,12 @@ class GeoPackage(DataStore):
 
         .. versionadded:: 4.0
         """
-
         source = gdal.Open(raster_layer.source())
-        array = source.GetRasterBand(1).ReadAsArray()
+        band = source.GetRasterBand(1)
+
+        data_type = band.DataType
+        if data_type not in RASTER_DATA_TYPES:
+            data_type = gdal.GDT_Float32
 
         x_size = source.RasterXSize
         y_size = source.RasterYSize
@@ -247,15 +317,30 @@ class GeoPackage(DataStore):
             x_size,
             y_size,
             1,
-            gdal.GDT_Byte,
+            data_type,
             ['APPEND_SUBDATASET=YES', 'RASTER_TABLE=%s' % layer_name]
         )
+        if output is None:
+            return False, gdal.GetLastErrorMsg()
 
         output.SetGeoTransform(source.GetGeoTransform())
         output.SetProjection(source.GetProjection())
-        output.GetRasterBand(1).WriteArray(array)
+        output_band = output.GetRasterBand(1)
+
+        no_data = band.GetNoDataValue()
+        if no_data is not None and data_type != gdal.GDT_Byte:
+            output_band.SetNoDataValue(no_data)
+
+        _, block_y_size = output_band.GetBlockSize()
+        for y_offset in range(0, y_size, block_y_size):
+            rows = min(block_y_size, y_size - y_offset)
+            data = band.ReadRaster(
+                0, y_offset, x_size, rows, buf_type=data_type)
+            output_band.WriteRaster(
+                0, y_offset, x_size, rows, data, buf_type=data_type)
 
         # Once we're done, close properly the dataset
+        output_band = None
         output = None
         source = None
         return True, layer_name
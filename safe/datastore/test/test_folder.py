@@ -20,7 +20,7 @@ from safe.test.utilities import qgis_iface
 from PyQt4.QtCore import QDir
 
 from safe.test.utilities import load_test_raster_layer, load_test_vector_layer
-from safe.datastore.folder import Folder
+from safe.datastore.folder import Folder, available_vector_formats
 
 qgis_iface()
 
@@ -109,5 +109,29 @@ class TestFolder(unittest.TestCase):
             data_store.layer_keyword('layer_purpose', 'hazard')
         )
 
+    def test_vector_formats(self):
+        """Test we can store vector layers in each available format."""
+        layer = load_test_vector_layer(
+            'gisv4', 'hazard', 'classified_vector.geojson')
+        data_store = Folder(mkdtemp())
+
+        # An unknown format is ignored.
+        data_store.default_vector_format = 'unknown'
+        self.assertEqual(data_store.default_vector_format, 'shp')
+
+        for vector_format in available_vector_formats():
+            data_store.default_vector_format = vector_format
+            self.assertEqual(data_store.default_vector_format, vector_format)
+            result = data_store.add_layer(layer, vector_format)
+            self.assertTrue(result[0])
+            self.assertTrue(
+                data_store.layer_uri(vector_format).endswith(vector_format))
+
+            stored_layer = data_store.layer(vector_format)
+            self.assertEqual(
+                stored_layer.featureCount(), layer.featureCount())
+            self.assertEqual(
+                stored_layer.keywords['layer_purpose'], 'hazard')
+
 if __name__ == '__main__':
     unittest.main()
@@ -16,7 +16,7 @@ import sys
 from tempfile import mktemp
 from qgis.core import QgsVectorLayer, QgsRasterLayer
 from PyQt4.QtCore import QFileInfo
-from osgeo import gdal
+from osgeo import gdal, ogr
 
 from safe.test.utilities import (
     get_qgis_app,
@@ -122,6 +122,51 @@ class TestGeoPackage(unittest.TestCase):
         result = data_store.add_layer(layer, tabular_layer_name)
         self.assertTrue(result[0])
 
+    @unittest.skipIf(
+        int(gdal.VersionInfo('VERSION_NUM')) < 2020000,
+        'GDAL 2.2 is required for float rasters in geopackage.')
+    def test_bulk_write(self):
+        """Test we keep features, fields and data types in a geopackage."""
+        path = QFileInfo(mktemp() + '.gpkg')
+        data_store = GeoPackage(path)
+
+        vector_layer = load_test_vector_layer(
+            'gisv4', 'hazard', 'classified_vector.geojson')
+        result = data_store.add_layer(vector_layer, 'hazard')
+        self.assertTrue(result[0])
+
+        layer = data_store.layer('hazard')
+        self.assertEqual(layer.featureCount(), vector_layer.featureCount())
+        self.assertEqual(
+            [field.name() for field in layer.fields()][1:],
+            [field.name() for field in vector_layer.fields()])
+        self.assertEqual(
+            layer.keywords['hazard'], vector_layer.keywords['hazard'])
+
+        # The R-tree index has been created.
+        datasource = ogr.Open(path.absoluteFilePath())
+        result = datasource.ExecuteSQL(
+            "SELECT count(*) FROM gpkg_extensions "
+            "WHERE extension_name = 'gpkg_rtree_index' "
+            "AND table_name = 'hazard'")
+        self.assertEqual(result.GetNextFeature().GetField(0), 1)
+        datasource.ReleaseResultSet(result)
+        datasource = None
+
+        # Float values are not converted to bytes.
+        raster = standard_data_path('hazard', 'earthquake.tif')
+        raster_layer = QgsRasterLayer(raster, 'earthquake')
+        result = data_store.add_layer(raster_layer, 'earthquake')
+        self.assertTrue(result[0])
+        source = gdal.Open(raster)
+        output = gdal.Open(data_store.layer_uri('earthquake'))
+        self.assertEqual(
+            output.GetRasterBand(1).DataType, gdal.GDT_Float32)
+        self.assertAlmostEqual(
+            output.GetRasterBand(1).ComputeRasterMinMax()[1],
+            source.GetRasterBand(1).ComputeRasterMinMax()[1],
+            places=3)
+
     @unittest.skipIf(
         int(gdal.VersionInfo('VERSION_NUM')) < 2000000,
         'GDAL 2.0 is required for geopackage.')
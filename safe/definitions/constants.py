@@ -88,7 +88,7 @@ RASTER_DRIVERS = ['gdal', 'wms', 'wcs', 'grassraster']
 QGIS_DRIVERS = VECTOR_DRIVERS + RASTER_DRIVERS
 
 # Small list of extensions
-OGR_EXTENSIONS = ['shp', 'geojson']
+OGR_EXTENSIONS = ['shp', 'geojson', 'gpkg', 'fgb']
 GDAL_EXTENSIONS = ['asc', 'tif', 'tiff']
 
 # Smoothing mode
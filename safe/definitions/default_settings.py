@@ -23,6 +23,21 @@ inasafe_default_settings = {
     'developer_mode': False,
     'generate_report': True,
     'memory_profile': False,
+    'profiling': True,
+    'columnar_post_processors': False,
+    'raster_native_hazard': False,
+    'native_zonal_statistics': False,
+    'tiled_union': False,
+    'prepared_layer_cache': False,
+    'prepared_layer_cache_directory': '',
+    'prepared_layer_cache_size': 1024,
+    'batch_processes': 1,
+    'geometry_processes': 1,
+    'single_geopackage_output': False,
+    'vector_output_format': 'gpkg',
+    'in_place_pipeline': False,
+    'report_rendering_threads': 4,
+    'background_analysis': False,
 
     'ISO19115_ORGANIZATION': 'InaSAFE.org',
     'ISO19115_URL': 'http://inasafe.org',
@@ -5,13 +5,40 @@
 import numpy
 
 from safe.utilities.i18n import tr
-from safe.utilities.settings import setting
+from safe.utilities.settings import setting, settings_generation
 
 __copyright__ = "Copyright 2016, The InaSAFE Project"
 __license__ = "GPL version 3"
 __email__ = "info@inasafe.org"
 __revision__ = '$Format:%H$'
 
+# Fatality rates by MMI of the current model, see
+# `current_earthquake_fatality_rates`.
+_fatality_rates = {}
+
+
+def current_earthquake_fatality_rates():
+    """Fatality rates by MMI for the currently active earthquake model.
+
+    The model is read from the settings only once. The rates are kept until
+    a setting is changed.
+
+    :returns: The fatality rates keyed by MMI or None if the model defined in
+        the settings doesn't exist.
+    :rtype: dict
+    """
+    generation = settings_generation()
+    if _fatality_rates.get('generation') != generation:
+        earthquake_function = setting(
+            'earthquake_function', EARTHQUAKE_FUNCTIONS[0]['key'], str)
+        rates = None
+        for model in EARTHQUAKE_FUNCTIONS:
+            if model['key'] == earthquake_function:
+                rates = model['fatality_rates']()
+        _fatality_rates['generation'] = generation
+        _fatality_rates['rates'] = rates
+    return _fatality_rates['rates']
+
 
 def earthquake_fatality_rate(hazard_level):
     """Earthquake fatality ratio for a given hazard level.
@@ -25,14 +52,10 @@ def earthquake_fatality_rate(hazard_level):
     :return: The fatality rate.
     :rtype: float
     """
-    earthquake_function = setting(
-        'earthquake_function', EARTHQUAKE_FUNCTIONS[0]['key'], str)
-    ratio = 0
-    for model in EARTHQUAKE_FUNCTIONS:
-        if model['key'] == earthquake_function:
-            eq_function = model['fatality_rates']
-            ratio = eq_function().get(hazard_level)
-    return ratio
+    rates = current_earthquake_fatality_rates()
+    if rates is None:
+        return 0
+    return rates.get(hazard_level)
 
 
 def itb_fatality_rates():
@@ -20,3 +20,17 @@ QGIS_OGR_GEOMETRY_MAP = {
     6: ogr.wkbMultiPolygon,
     100: ogr.wkbNone
 }
+
+# From http://doc.qt.io/qt-4.8/qvariant.html#Type-enum
+QGIS_OGR_FIELD_TYPE_MAP = {
+    1: ogr.OFTInteger,  # Bool
+    2: ogr.OFTInteger,  # Int
+    3: ogr.OFTInteger,  # UInt
+    4: getattr(ogr, 'OFTInteger64', ogr.OFTReal),  # LongLong, GDAL 2
+    5: getattr(ogr, 'OFTInteger64', ogr.OFTReal),  # ULongLong, GDAL 2
+    6: ogr.OFTReal,  # Double
+    10: ogr.OFTString,  # String
+    14: ogr.OFTDate,  # Date
+    15: ogr.OFTTime,  # Time
+    16: ogr.OFTDateTime,  # DateTime
+}
@@ -139,3 +139,8 @@ zonal_stats_steps = {
     'step_name': tr('Zonal statistics'),
     'output_layer_name': 'zonal_stats',
 }
+
+zonal_hazard_stats_steps = {
+    'step_name': tr('Zonal statistics by hazard class'),
+    'output_layer_name': 'zonal_hazard_stats',
+}
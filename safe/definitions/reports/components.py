@@ -94,6 +94,7 @@ analysis_question_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': analysis_question_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'analysis-result-output.html',
     'template': 'standard-template/'
@@ -109,6 +110,7 @@ general_report_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': general_report_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'general-report-output.html',
     'template': 'standard-template/'
@@ -167,6 +169,7 @@ mmi_detail_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': mmi_detail_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'mmi-detail-output.html',
     'template': 'standard-template/'
@@ -206,6 +209,7 @@ analysis_detail_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': analysis_detail_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'analysis-detail-output.html',
     'template': 'standard-template/'
@@ -258,6 +262,7 @@ action_checklist_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': action_checklist_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'action-checklist-output.html',
     'template': 'standard-template/'
@@ -273,6 +278,7 @@ notes_assumptions_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': notes_assumptions_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'notes-assumptions-output.html',
     'template': 'standard-template/'
@@ -320,6 +326,7 @@ minimum_needs_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': minimum_needs_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'minimum-needs-output.html',
     'template': 'standard-template/'
@@ -343,6 +350,7 @@ aggregation_result_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': aggregation_result_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'aggregation-result-output.html',
     'template': 'standard-template/'
@@ -364,6 +372,7 @@ aggregation_postprocessors_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': aggregation_postprocessors_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'aggregation-postprocessors-output.html',
     'template': 'standard-template/'
@@ -408,6 +417,7 @@ analysis_provenance_details_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': analysis_provenance_details_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'analysis-provenance-details-output.html',
     'template': 'standard-template/'
@@ -437,6 +447,7 @@ analysis_provenance_details_simplified_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': analysis_provenance_details_simplified_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'analysis-provenance-details-simplified-output.html',
     'template': 'standard-template/'
@@ -472,6 +483,7 @@ population_chart_svg_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': population_chart_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.File,
     'output_path': 'population-chart.svg',
     'template': 'standard-template'
@@ -490,6 +502,7 @@ population_chart_png_component = {
     'type': qt_renderer_component_type,
     'processor': qt_svg_to_png_renderer,
     'extractor': population_chart_to_png_extractor,
+    'dependencies': ['population-chart'],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.File,
     'output_path': 'population-chart.png',
     'tags': [png_product_tag],
@@ -505,6 +518,7 @@ population_chart_legend_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': population_chart_legend_extractor,
+    'dependencies': ['population-chart', 'population-chart-png'],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'population-chart-legend-output.html',
     'template': 'standard-template/'
@@ -517,6 +531,7 @@ infographic_people_section_notes_component = {
     'type': jinja2_component_type,
     'processor': jinja2_renderer,
     'extractor': infographic_people_section_notes_extractor,
+    'dependencies': [],
     'output_format': Jinja2ComponentsMetadata.OutputFormat.String,
     'output_path': 'infographic-people-section-notes-output.html',
     'template': 'standard-template/'
@@ -540,6 +555,11 @@ population_infographic_component = {
     'type': qgis_composer_component_type,
     'processor': qgis_composer_renderer,
     'extractor': qgis_composer_infographic_extractor,
+    'dependencies': [
+        'population-chart-png',
+        'population-chart-legend',
+        'infographic-people-section-notes'
+    ],
     'output_format': {
         'map': QgisComposerComponentsMetadata.OutputFormat.PDF,
         'template': QgisComposerComponentsMetadata.OutputFormat.QPT
@@ -596,6 +616,18 @@ standard_impact_report_metadata_html = {
             'type': jinja2_component_type,
             'processor': jinja2_renderer,
             'extractor': impact_table_extractor,
+            'dependencies': [
+                'analysis-question',
+                'general-report',
+                'mmi-detail',
+                'analysis-detail',
+                'action-checklist',
+                'notes-assumptions',
+                'minimum-needs',
+                'aggregation-result',
+                'aggregation-postprocessors',
+                'analysis-provenance-details-simplified'
+            ],
             'output_format': Jinja2ComponentsMetadata.OutputFormat.File,
             'output_path': 'impact-report-output.html',
             'resources': [
@@ -631,6 +663,11 @@ standard_impact_report_metadata_html = {
             'type': jinja2_component_type,
             'processor': jinja2_renderer,
             'extractor': action_checklist_report_extractor,
+            'dependencies': [
+                'analysis-question',
+                'action-checklist',
+                'analysis-provenance-details-simplified'
+            ],
             'output_format': Jinja2ComponentsMetadata.OutputFormat.File,
             'output_path': 'action-checklist-output.html',
             'template': 'standard-template/'
@@ -655,6 +692,10 @@ standard_impact_report_metadata_html = {
             'type': jinja2_component_type,
             'processor': jinja2_renderer,
             'extractor': analysis_provenance_details_report_extractor,
+            'dependencies': [
+                'analysis-question',
+                'analysis-provenance-details'
+            ],
             'output_format': Jinja2ComponentsMetadata.OutputFormat.File,
             'output_path': 'analysis-provenance-details-report-output.html',
             'template': 'standard-template/'
@@ -682,6 +723,7 @@ impact_report_pdf_component = {
     'type': qgis_composer_component_type,
     'processor': qgis_composer_html_renderer,
     'extractor': impact_table_pdf_extractor,
+    'dependencies': ['impact-report'],
     'output_format': QgisComposerComponentsMetadata.OutputFormat.PDF,
     'output_path': 'impact-report-output.pdf',
     'tags': [
@@ -700,6 +742,7 @@ action_checklist_pdf_component = {
     'type': qgis_composer_component_type,
     'processor': qgis_composer_html_renderer,
     'extractor': action_checklist_report_pdf_extractor,
+    'dependencies': ['action-checklist-report'],
     'output_format': QgisComposerComponentsMetadata.OutputFormat.PDF,
     'output_path': 'action-checklist-output.pdf',
     'tags': [
@@ -715,6 +758,7 @@ analysis_provenance_details_pdf_component = {
     'type': qgis_composer_component_type,
     'processor': qgis_composer_html_renderer,
     'extractor': analysis_provenance_details_pdf_extractor,
+    'dependencies': ['analysis-provenance-details-report'],
     'output_format': QgisComposerComponentsMetadata.OutputFormat.PDF,
     'output_path': 'analysis-provenance-details-report-output.pdf',
     'tags': [
@@ -753,6 +797,7 @@ standard_multi_exposure_impact_report_metadata_html = {
             'type': jinja2_component_type,
             'processor': jinja2_renderer,
             'extractor': impact_table_extractor,
+            'dependencies': ['analysis-question', 'general-report'],
             'output_format': Jinja2ComponentsMetadata.OutputFormat.File,
             'output_path': 'multi-exposure-impact-report-output.html',
             'resources': [
@@ -790,6 +835,7 @@ standard_multi_exposure_impact_report_metadata_pdf = {
                     'type': qgis_composer_component_type,
                     'processor': qgis_composer_html_renderer,
                     'extractor': impact_table_pdf_extractor,
+                    'dependencies': ['multi-exposure-impact-report'],
                     'output_format': (
                         QgisComposerComponentsMetadata.OutputFormat.PDF),
                     'output_path': 'multi-exposure-impact-report-output.pdf',
@@ -845,6 +891,7 @@ map_report = {
             'type': qgis_composer_component_type,
             'processor': qgis_composer_renderer,
             'extractor': qgis_composer_extractor,
+            'dependencies': [],
             'output_format': {
                 'map': QgisComposerComponentsMetadata.OutputFormat.PDF,
                 'template': QgisComposerComponentsMetadata.OutputFormat.QPT
@@ -869,6 +916,7 @@ map_report = {
             'type': qgis_composer_component_type,
             'processor': qgis_composer_renderer,
             'extractor': qgis_composer_extractor,
+            'dependencies': [],
             'output_format': {
                 'map': QgisComposerComponentsMetadata.OutputFormat.PDF,
                 'template': QgisComposerComponentsMetadata.OutputFormat.QPT
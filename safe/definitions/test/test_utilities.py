@@ -83,6 +83,7 @@ from safe.definitions.utilities import (
     generate_default_profile,
     get_displacement_rate,
     is_affected,
+    hazard_class_policy,
 )
 
 from safe.utilities.resources import resources_path
@@ -630,6 +631,29 @@ class TestDefinitionsUtilities(unittest.TestCase):
         # Should be 0 since it's not affected
         self.assertEqual(value, 0)
 
+    def test_hazard_class_policy(self):
+        """Test the hazard class policy is cached until settings change."""
+        default_profile = generate_default_profile()
+        class_key = flood_hazard_classes['classes'][0]['key']
+        key = (hazard_flood['key'], flood_hazard_classes['key'], class_key)
+
+        set_setting('population_preference', default_profile)
+        lookup = hazard_class_policy()
+        self.assertIs(lookup, hazard_class_policy())
+        self.assertEqual(
+            lookup[key][1],
+            default_profile[key[0]][key[1]][key[2]]['displacement_rate'])
+
+        # Changing the setting invalidates the lookup table.
+        profile = deepcopy(default_profile)
+        profile[key[0]][key[1]][key[2]]['displacement_rate'] = 0.42
+        profile[key[0]][key[1]][key[2]]['affected'] = True
+        set_setting('population_preference', profile)
+        self.assertIsNot(lookup, hazard_class_policy())
+        self.assertEqual(0.42, get_displacement_rate(*key))
+
+        set_setting('population_preference', default_profile)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -32,7 +32,7 @@ from safe.definitions import (
 from safe.definitions.reports.report_descriptions import (
     landscape_map_report_description, portrait_map_report_description)
 from safe.report.report_metadata import QgisComposerComponentsMetadata
-from safe.utilities.settings import setting
+from safe.utilities.settings import setting, settings_generation
 
 __copyright__ = "Copyright 2016, The InaSAFE Project"
 __license__ = "GPL version 3"
@@ -721,6 +721,68 @@ def generate_default_profile():
     return data_format
 
 
+# Lookup table of (affected, displacement rate) by (hazard, classification,
+# hazard class), resolved from the settings by `hazard_class_policy`.
+_hazard_class_policy = {}
+
+
+def hazard_class_policy(qsettings=None):
+    """Get the affected flag and displacement rate of every hazard class.
+
+    The population preference is read from the settings only once. The
+    lookup table is kept until a setting is changed.
+
+    :param qsettings: A custom QSettings to use. If it's not defined, it will
+        use the default one. The lookup table is not cached with a custom
+        QSettings.
+    :type qsettings: qgis.PyQt.QtCore.QSettings
+
+    :returns: Dictionary of (affected, displacement_rate) keyed by
+        (hazard, classification, hazard_class).
+    :rtype: dict
+    """
+    generation = settings_generation()
+    if qsettings is None and (
+            _hazard_class_policy.get('generation') == generation):
+        return _hazard_class_policy['lookup']
+
+    default_profile = generate_default_profile()
+    preference_data = setting(
+        'population_preference',
+        default=default_profile,
+        qsettings=qsettings)
+
+    keys = set()
+    for profile in [default_profile, preference_data]:
+        for hazard, classifications in profile.items():
+            for classification, classes in classifications.items():
+                for hazard_class in classes:
+                    keys.add((hazard, classification, hazard_class))
+
+    lookup = {}
+    for hazard, classification, hazard_class in keys:
+        # noinspection PyUnresolvedReferences
+        preference = preference_data.get(hazard, {}).get(
+            classification, {}).get(hazard_class, {})
+        default = default_profile.get(hazard, {}).get(
+            classification, {}).get(hazard_class, {})
+
+        affected = preference.get(
+            'affected', default.get('affected', False))
+        if affected:
+            displacement_rate = preference.get(
+                'displacement_rate', default.get('displacement_rate', 0))
+        else:
+            displacement_rate = 0
+        lookup[(hazard, classification, hazard_class)] = (
+            affected, displacement_rate)
+
+    if qsettings is None:
+        _hazard_class_policy['generation'] = generation
+        _hazard_class_policy['lookup'] = lookup
+    return lookup
+
+
 def get_displacement_rate(
         hazard, classification, hazard_class, qsettings=None):
     """Get displacement rate for hazard in classification in hazard class.
@@ -741,22 +803,8 @@ def get_displacement_rate(
     :returns: The value of displacement rate. If it's not affected, return 0.
     :rtype: int
     """
-    if not is_affected(hazard, classification, hazard_class, qsettings):
-        return 0
-    preference_data = setting(
-        'population_preference',
-        default=generate_default_profile(),
-        qsettings=qsettings)
-
-    # Use default from the default profile
-    default_profile = generate_default_profile()
-    default_displacement_rate_value = default_profile.get(hazard, {}).get(
-        classification, {}).get(hazard_class, {}).get('displacement_rate', 0)
-
-    # noinspection PyUnresolvedReferences
-    return preference_data.get(hazard, {}).get(classification, {}).get(
-        hazard_class, {}).get(
-        'displacement_rate', default_displacement_rate_value)
+    lookup = hazard_class_policy(qsettings)
+    return lookup.get((hazard, classification, hazard_class), (False, 0))[1]
 
 
 def is_affected(hazard, classification, hazard_class, qsettings=None):
@@ -778,15 +826,5 @@ def is_affected(hazard, classification, hazard_class, qsettings=None):
     :returns: True if it's affected, else False. Default to False.
     :rtype: bool
     """
-    preference_data = setting(
-        'population_preference',
-        default=generate_default_profile(),
-        qsettings=qsettings)
-
-    # Use default from the default profile
-    default_profile = generate_default_profile()
-    default_affected_value = default_profile.get(hazard, {}).get(
-        classification, {}).get(hazard_class, {}).get('affected', False)
-    # noinspection PyUnresolvedReferences
-    return preference_data.get(hazard, {}).get(classification, {}).get(
-        hazard_class, {}).get('affected', default_affected_value)
+    lookup = hazard_class_policy(qsettings)
+    return lookup.get((hazard, classification, hazard_class), (False, 0))[0]
@@ -3,6 +3,7 @@
 """Reclassify a raster layer."""
 
 from os.path import isfile
+from shutil import move
 
 import numpy as np
 from osgeo import gdal
@@ -14,6 +15,7 @@ from safe.common.utilities import unique_filename, temp_dir
 from safe.definitions.constants import no_data_value
 from safe.definitions.processing_steps import reclassify_raster_steps
 from safe.definitions.utilities import definition
+from safe.gis.raster.tools import raster_blocks
 from safe.gis.sanity_check import check_layer
 from safe.utilities.metadata import (
     active_thresholds_value_maps, active_classification)
@@ -24,9 +26,17 @@ __license__ = "GPL version 3"
 __email__ = "info@inasafe.org"
 __revision__ = '$Format:%H$'
 
+# Creation options of the classified raster.
+output_options = ['TILED=YES', 'COMPRESS=DEFLATE']
+
 
 @profile
-def reclassify(layer, exposure_key=None, overwrite_input=False, callback=None):
+def reclassify(
+        layer,
+        exposure_key=None,
+        overwrite_input=False,
+        callback=None,
+        window_size=None):
     """Reclassify a continuous raster layer.
 
     Issue https://github.com/inasafe/inasafe/issues/3182
@@ -64,13 +74,17 @@ def reclassify(layer, exposure_key=None, overwrite_input=False, callback=None):
         Defaults to None.
     :type callback: function
 
+    :param window_size: Maximum number of cells read at once. The raster is
+        read and written by strips of its native blocks.
+    :type window_size: int
+
     :return: The classified raster layer.
     :rtype: QgsRasterLayer
 
     .. versionadded:: 4.0
     """
     output_layer_name = reclassify_raster_steps['output_layer_name']
-    processing_step = reclassify_raster_steps['step_name']  # NOQA
+    processing_step = reclassify_raster_steps['step_name']
     output_layer_name = output_layer_name % layer.keywords['layer_purpose']
 
     if exposure_key:
@@ -103,43 +117,59 @@ def reclassify(layer, exposure_key=None, overwrite_input=False, callback=None):
         output_raster = layer.source()
     else:
         output_raster = unique_filename(suffix='.tiff', dir=temp_dir())
+    # We can't write in the file we are reading, it's moved at the end.
+    temporary_raster = unique_filename(suffix='.tiff', dir=temp_dir())
 
     driver = gdal.GetDriverByName('GTiff')
 
     raster_file = gdal.Open(layer.source())
     band = raster_file.GetRasterBand(1)
     no_data = band.GetNoDataValue()
-    source = band.ReadAsArray()
-    destination = source.copy()
-
-    for value, interval in ranges.iteritems():
-        v_min = interval[0]
-        v_max = interval[1]
-
-        if v_min is None:
-            destination[np.where(source <= v_max)] = value
-
-        if v_max is None:
-            destination[np.where(source > v_min)] = value
-
-        if v_min < v_max:
-            destination[np.where((v_min < source) & (source <= v_max))] = value
-
-    # Tag no data cells
-    destination[np.where(source == no_data)] = no_data_value
+    lookups = {}
 
     # Create the new file.
     output_file = driver.Create(
-        output_raster, raster_file.RasterXSize, raster_file.RasterYSize, 1)
-    output_file.GetRasterBand(1).WriteArray(destination)
-    output_file.GetRasterBand(1).SetNoDataValue(no_data_value)
+        temporary_raster,
+        raster_file.RasterXSize,
+        raster_file.RasterYSize,
+        1,
+        options=output_options)
+    output_band = output_file.GetRasterBand(1)
+    output_band.SetNoDataValue(no_data_value)
 
     # CRS
     output_file.SetProjection(raster_file.GetProjection())
     output_file.SetGeoTransform(raster_file.GetGeoTransform())
+
+    blocks = list(raster_blocks(
+        0,
+        0,
+        raster_file.RasterXSize,
+        raster_file.RasterYSize,
+        band.GetBlockSize()[1],
+        window_size))
+    for i, (x, y, width, height) in enumerate(blocks):
+        if callback:
+            callback(current=i, maximum=len(blocks), step=processing_step)
+
+        source = band.ReadAsArray(x, y, width, height)
+        if source.dtype not in lookups:
+            lookups[source.dtype] = class_lookup(ranges, source.dtype)
+        edges, classes = lookups[source.dtype]
+        destination = classify_array(source, edges, classes)
+
+        # Tag no data cells
+        destination[source == no_data] = no_data_value
+        output_band.WriteArray(destination, x, y)
+
     output_file.FlushCache()
 
+    del output_band
     del output_file
+    del band
+    del raster_file
+
+    move(temporary_raster, output_raster)
 
     if not isfile(output_raster):
         raise FileNotFoundError
@@ -161,3 +191,84 @@ def reclassify(layer, exposure_key=None, overwrite_input=False, callback=None):
 
     check_layer(reclassified)
     return reclassified
+
+
+def class_lookup(ranges, data_type=np.float64):
+    """Compute the lookup table used by `classify_array`.
+
+    Every range is left open and right closed, so the class of a value only
+    depends on the interval between two consecutive range bounds. We find the
+    class of each interval once, by applying the cell by cell algorithm on one
+    value per interval: the last matching range wins.
+
+    :param ranges: Dictionary of the class value and the [min, max] range.
+        None means no bound.
+    :type ranges: dict
+
+    :param data_type: The numpy type of the values to classify. Bounds are
+        compared in this type if it is a floating type, like numpy does.
+    :type data_type: numpy.dtype
+
+    :return: Tuple with the sorted bounds and the class of each interval.
+        The class is NaN if the value must be kept.
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    if not np.issubdtype(data_type, np.floating):
+        data_type = np.float64
+
+    bounds = []
+    for interval in ranges.itervalues():
+        bounds.extend([bound for bound in interval if bound is not None])
+    edges = np.unique(np.array(bounds, dtype=data_type))
+
+    # The interval i is (edges[i - 1], edges[i]], the last one is above.
+    source = np.append(edges, np.inf).astype(data_type)
+    destination = np.empty(source.shape)
+    destination.fill(np.nan)
+
+    for value, interval in ranges.iteritems():
+        v_min = interval[0]
+        v_max = interval[1]
+
+        if v_min is None:
+            destination[np.where(source <= v_max)] = value
+
+        if v_max is None:
+            destination[np.where(source > v_min)] = value
+
+        if v_min < v_max:
+            destination[np.where((v_min < source) & (source <= v_max))] = value
+
+    return edges, destination
+
+
+def classify_array(source, edges, classes):
+    """Classify an array with a lookup from `class_lookup`.
+
+    :param source: The values to classify.
+    :type source: numpy.ndarray
+
+    :param edges: The sorted bounds of the ranges.
+    :type edges: numpy.ndarray
+
+    :param classes: The class of each interval, NaN to keep the value.
+    :type classes: numpy.ndarray
+
+    :return: The classified values, with the same type as the source.
+    :rtype: numpy.ndarray
+    """
+    if len(edges):
+        indexes = np.digitize(source.ravel(), edges, right=True)
+        indexes = indexes.reshape(source.shape)
+    else:
+        indexes = np.zeros(source.shape, dtype=np.int64)
+
+    lookup = classes[indexes]
+    keep = np.isnan(lookup)
+    if np.issubdtype(source.dtype, np.floating):
+        # NaN is not in any range.
+        keep |= np.isnan(source)
+
+    destination = source.copy()
+    destination[~keep] = lookup[~keep]
+    return destination
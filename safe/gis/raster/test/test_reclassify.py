@@ -8,10 +8,12 @@ from safe.test.utilities import (
     load_test_raster_layer)
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
 
+import numpy as np
 from qgis.core import QgsRasterBandStats
 
 from safe.definitions.processing_steps import reclassify_raster_steps
-from safe.gis.raster.reclassify import reclassify
+from safe.gis.raster.reclassify import (
+    reclassify, class_lookup, classify_array)
 from safe.definitions.exposure import exposure_structure
 from safe.definitions.hazard_classifications import generic_hazard_classes
 
@@ -75,3 +77,36 @@ class TestReclassifyRaster(unittest.TestCase):
             1, QgsRasterBandStats.Min | QgsRasterBandStats.Max)
         self.assertEqual(stats.minimumValue, 1.0)
         self.assertEqual(stats.maximumValue, 3.0)
+
+        # With a small window, the raster is classified in many blocks.
+        layer = load_test_raster_layer('hazard', 'continuous_flood_20_20.asc')
+        layer.keywords['thresholds'] = ranges
+        streamed = reclassify(layer, exposure_structure['key'], window_size=20)
+        self.assertEqual(
+            streamed.dataProvider().block(
+                1, streamed.extent(), 20, 20).data(),
+            reclassified.dataProvider().block(
+                1, reclassified.extent(), 20, 20).data())
+
+    def test_classify_array(self):
+        """Test the lookup gives the same classes as the ranges."""
+        ranges = {
+            1: [None, 0.2],
+            2: [0.2, 1],
+            3: [1, None],
+        }
+        source = np.array(
+            [[-1, 0, 0.2, 0.3], [1, 1.5, np.nan, 10]], dtype=np.float32)
+        edges, classes = class_lookup(ranges, source.dtype)
+        destination = classify_array(source, edges, classes)
+        expected = np.array(
+            [[1, 1, 1, 2], [2, 3, np.nan, 3]], dtype=np.float32)
+        np.testing.assert_array_equal(destination, expected)
+        self.assertEqual(destination.dtype, source.dtype)
+
+        # Values outside of the ranges are kept.
+        ranges = {1: [0, 1]}
+        source = np.array([-5, 0, 1, 5], dtype=np.int32)
+        edges, classes = class_lookup(ranges, source.dtype)
+        destination = classify_array(source, edges, classes)
+        np.testing.assert_array_equal(destination, [-5, 0, 1, 5])
@@ -0,0 +1,119 @@
+# coding=utf-8
+import unittest
+
+from safe.test.utilities import (
+    get_qgis_app,
+    load_test_raster_layer,
+    load_test_vector_layer
+)
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+from qgis.core import QGis
+from safe.definitions.fields import exposure_count_field, hazard_class_field
+from safe.definitions.hazard_classifications import (
+    generic_hazard_classes, not_exposed_class)
+from safe.gis.raster.tools import raster_blocks, pixel_window
+from safe.gis.raster.zonal_hazard_statistics import zonal_hazard_stats
+from safe.gis.raster.zonal_statistics import zonal_stats
+from safe.gis.vector.tools import create_memory_layer, copy_layer
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+
+class TestZonalHazardStatistics(unittest.TestCase):
+
+    def test_raster_blocks(self):
+        """Test we can split a window in strips of rows."""
+        blocks = list(raster_blocks(0, 0, 10, 10, 1, 30))
+        self.assertEqual(len(blocks), 4)
+        self.assertEqual(blocks[0], (0, 0, 10, 3))
+        self.assertEqual(blocks[-1], (0, 9, 10, 1))
+
+        # Strips are aligned on the native blocks of the raster.
+        blocks = list(raster_blocks(2, 3, 10, 10, 4, 30))
+        self.assertEqual(
+            [block[1] for block in blocks], [3, 4, 8, 12])
+        self.assertEqual(sum(block[3] for block in blocks), 10)
+
+    def test_pixel_window(self):
+        """Test we can compute the window of pixels covering an extent."""
+        raster = load_test_raster_layer(
+            'hazard', 'classified_flood_20_20.asc')
+        geo_transform = (
+            raster.extent().xMinimum(),
+            raster.rasterUnitsPerPixelX(),
+            0,
+            raster.extent().yMaximum(),
+            0,
+            -raster.rasterUnitsPerPixelY())
+        window = pixel_window(geo_transform, 20, 20, raster.extent())
+        self.assertEqual(window, (0, 0, 20, 20))
+
+    def test_zonal_hazard_stats(self):
+        """Test we can do zonal statistics by hazard class."""
+        exposure = load_test_raster_layer(
+            'exposure', 'pop_binary_raster_20_20.asc')
+        exposure.keywords['inasafe_default_values'] = {}
+        hazard = load_test_raster_layer(
+            'hazard', 'classified_flood_20_20.asc')
+        aggregation = load_test_vector_layer(
+            'aggregation', 'grid_jakarta_4326.geojson')
+
+        # With a small window, we read the exposure in many blocks.
+        layer = zonal_hazard_stats(
+            exposure, hazard, aggregation, window_size=20)
+        self.assertEqual(layer.geometryType(), QGis.Polygon)
+
+        output_field = exposure_count_field['field_name'] % 'population'
+        classes = [not_exposed_class['key']]
+        classes.extend([c['key'] for c in generic_hazard_classes['classes']])
+        total = 0
+        for feature in layer.getFeatures():
+            self.assertIn(
+                feature[hazard_class_field['field_name']], classes)
+            total += feature[output_field]
+
+        # The total must be the same as the classic zonal stats.
+        aggregation = load_test_vector_layer(
+            'aggregation', 'grid_jakarta_4326.geojson')
+        aggregation.keywords['hazard_keywords'] = {}
+        aggregation.keywords['aggregation_keywords'] = {}
+        exposure.keywords['inasafe_default_values'] = {}
+        expected = sum(
+            feature[output_field]
+            for feature in zonal_stats(exposure, aggregation).getFeatures())
+        self.assertAlmostEqual(total, expected)
+
+    def test_zonal_hazard_stats_other_crs(self):
+        """Test zones are matched to their area with another CRS."""
+        exposure = load_test_raster_layer(
+            'exposure', 'pop_binary_raster_20_20.asc')
+        exposure.keywords['inasafe_default_values'] = {}
+        hazard = load_test_raster_layer(
+            'hazard', 'classified_flood_20_20.asc')
+        source = load_test_vector_layer(
+            'aggregation', 'grid_jakarta.geojson')
+
+        # Feature IDs with a gap, like after removing some features.
+        aggregation = create_memory_layer(
+            'aggregation', source.geometryType(), source.crs(),
+            source.fields())
+        copy_layer(source, aggregation)
+        aggregation.keywords = source.keywords
+        first = next(aggregation.getFeatures())
+        aggregation.dataProvider().deleteFeatures([first.id()])
+        self.assertNotEqual(aggregation.crs(), exposure.crs())
+
+        areas = {}
+        for area in aggregation.getFeatures():
+            areas[area['name']] = area.geometry()
+
+        layer = zonal_hazard_stats(exposure, hazard, aggregation)
+        self.assertEqual(layer.crs(), aggregation.crs())
+        self.assertTrue(layer.featureCount())
+        for feature in layer.getFeatures():
+            self.assertTrue(
+                feature.geometry().isGeosEqual(areas[feature['name']]))
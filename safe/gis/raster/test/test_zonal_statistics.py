@@ -65,3 +65,40 @@ class TestReclassifyRaster(unittest.TestCase):
         for feature_a, feature_b in zip(
                 vector.getFeatures(), vector_b.getFeatures()):
             self.assertEqual(feature_a.attributes(), feature_b.attributes())
+
+    def test_native_zonal_statistics(self):
+        """Test our own zonal statistics engine."""
+        raster = load_test_raster_layer(
+            'exposure', 'pop_binary_raster_20_20.asc')
+        raster.keywords['inasafe_default_values'] = {}
+        vector = load_test_vector_layer(
+            'aggregation', 'grid_jakarta_4326.geojson')
+        vector.keywords['hazard_keywords'] = {}
+        vector.keywords['aggregation_keywords'] = {}
+        expected = zonal_stats(raster, vector)
+
+        vector = load_test_vector_layer(
+            'aggregation', 'grid_jakarta_4326.geojson')
+        vector.keywords['hazard_keywords'] = {}
+        vector.keywords['aggregation_keywords'] = {}
+        number_fields = vector.fields().count()
+        # With a small window, we read the raster in many blocks.
+        native = zonal_stats(raster, vector, native=True, window_size=20)
+
+        self.assertEqual(native.fields().count(), number_fields + 1)
+        self.assertEqual(native.geometryType(), QGis.Polygon)
+        self.assertEqual(native.keywords, expected.keywords)
+        for feature_a, feature_b in zip(
+                expected.getFeatures(), native.getFeatures()):
+            self.assertEqual(feature_a.attributes(), feature_b.attributes())
+
+        # With fractional cells on the edges of zones.
+        vector = load_test_vector_layer(
+            'aggregation', 'grid_jakarta_4326.geojson')
+        vector.keywords['hazard_keywords'] = {}
+        vector.keywords['aggregation_keywords'] = {}
+        fractional = zonal_stats(raster, vector, native=True, fractional=True)
+        field = fractional.fields().count() - 1
+        for feature in fractional.getFeatures():
+            self.assertGreaterEqual(feature.attributes()[field], 0)
+
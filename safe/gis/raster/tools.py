@@ -0,0 +1,267 @@
+# coding=utf-8
+
+"""Tools for raster layers."""
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+from qgis.core import QgsCoordinateTransform, QgsFeatureRequest
+
+from safe.utilities.profiling import profile
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+# Number of cells read at once when we iterate over a raster.
+default_window_size = 2 ** 20
+
+
+def spatial_reference(coordinate_reference_system):
+    """Convert a QGIS CRS to an OSR spatial reference.
+
+    :param coordinate_reference_system: The QGIS CRS.
+    :type coordinate_reference_system: QgsCoordinateReferenceSystem
+
+    :return: The OSR spatial reference.
+    :rtype: osr.SpatialReference
+    """
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(coordinate_reference_system.toWkt())
+    return srs
+
+
+@profile
+def zones_datasource(layer, crs=None):
+    """Copy polygons of a vector layer in an OGR memory datasource.
+
+    Each feature is numbered in a 'zone' attribute, from 1 to N, in the order
+    of the feature iterator. The zone 0 is never used so it can be used as
+    the background value when we rasterize these zones.
+
+    :param layer: The polygon vector layer.
+    :type layer: QgsVectorLayer
+
+    :param crs: The CRS of the datasource. Geometries are transformed if it
+        is not the CRS of the layer. Defaults to the CRS of the layer.
+    :type crs: QgsCoordinateReferenceSystem
+
+    :return: Tuple with the OGR datasource and the list of QGIS feature IDs.
+        The feature ID of the zone N is at the index N - 1.
+    :rtype: (ogr.DataSource, list)
+    """
+    if crs is None or crs.authid() == layer.crs().authid():
+        crs = layer.crs()
+        crs_transform = None
+    else:
+        crs_transform = QgsCoordinateTransform(layer.crs(), crs)
+
+    driver = ogr.GetDriverByName('Memory')
+    datasource = driver.CreateDataSource('zones')
+    ogr_layer = datasource.CreateLayer(
+        'zones', spatial_reference(crs), ogr.wkbMultiPolygon)
+    ogr_layer.CreateField(ogr.FieldDefn('zone', ogr.OFTInteger))
+    layer_definition = ogr_layer.GetLayerDefn()
+
+    feature_ids = []
+    request = QgsFeatureRequest().setSubsetOfAttributes([])
+    for feature in layer.getFeatures(request):
+        geometry = feature.geometry()
+        if not geometry or geometry.isGeosEmpty():
+            continue
+        if crs_transform:
+            geometry.transform(crs_transform)
+        feature_ids.append(feature.id())
+        ogr_feature = ogr.Feature(layer_definition)
+        ogr_feature.SetGeometry(ogr.CreateGeometryFromWkb(geometry.asWkb()))
+        ogr_feature.SetField('zone', len(feature_ids))
+        ogr_layer.CreateFeature(ogr_feature)
+
+    return datasource, feature_ids
+
+
+def pixel_window(geo_transform, x_size, y_size, extent):
+    """Compute the window of pixels of a raster covering an extent.
+
+    :param geo_transform: The GDAL geo transform of the raster, without
+        rotation.
+    :type geo_transform: tuple
+
+    :param x_size: The number of columns in the raster.
+    :type x_size: int
+
+    :param y_size: The number of rows in the raster.
+    :type y_size: int
+
+    :param extent: The extent in the raster CRS.
+    :type extent: QgsRectangle
+
+    :return: Tuple (x_offset, y_offset, width, height). Width or height are
+        zero if the extent does not overlap the raster.
+    :rtype: tuple
+    """
+    origin_x, pixel_x, _, origin_y, _, pixel_y = geo_transform
+
+    columns = sorted([
+        (extent.xMinimum() - origin_x) / pixel_x,
+        (extent.xMaximum() - origin_x) / pixel_x])
+    rows = sorted([
+        (extent.yMinimum() - origin_y) / pixel_y,
+        (extent.yMaximum() - origin_y) / pixel_y])
+
+    x_min = max(0, int(np.floor(columns[0])))
+    x_max = min(x_size, int(np.ceil(columns[1])))
+    y_min = max(0, int(np.floor(rows[0])))
+    y_max = min(y_size, int(np.ceil(rows[1])))
+    return x_min, y_min, max(0, x_max - x_min), max(0, y_max - y_min)
+
+
+def raster_blocks(
+        x_offset, y_offset, width, height, block_height=1,
+        window_size=None):
+    """Split a window of pixels in strips of rows.
+
+    Strips are aligned on the native block height of the raster and hold at
+    most window_size cells (but always one block).
+
+    :param x_offset: The first column of the window.
+    :type x_offset: int
+
+    :param y_offset: The first row of the window.
+    :type y_offset: int
+
+    :param width: The number of columns of the window.
+    :type width: int
+
+    :param height: The number of rows of the window.
+    :type height: int
+
+    :param block_height: The native block height of the raster.
+    :type block_height: int
+
+    :param window_size: The maximum number of cells in a strip.
+    :type window_size: int
+
+    :return: A generator of (x_offset, y_offset, width, height) tuples.
+    :rtype: generator
+    """
+    if not window_size:
+        window_size = default_window_size
+    block_height = max(1, block_height)
+    rows = max(1, window_size // max(1, width))
+    rows = max(block_height, rows // block_height * block_height)
+
+    row = y_offset
+    end = y_offset + height
+    while row < end:
+        # Align the end of the strip on the blocks of the raster.
+        next_row = min(end, (row + rows) // block_height * block_height)
+        if next_row <= row:
+            next_row = min(end, row + block_height)
+        yield x_offset, row, width, next_row - row
+        row = next_row
+
+
+def block_geo_transform(geo_transform, x_offset, y_offset):
+    """Geo transform of a window of pixels inside a raster.
+
+    :param geo_transform: The GDAL geo transform of the raster.
+    :type geo_transform: tuple
+
+    :param x_offset: The first column of the window.
+    :type x_offset: int
+
+    :param y_offset: The first row of the window.
+    :type y_offset: int
+
+    :return: The GDAL geo transform of the window.
+    :rtype: tuple
+    """
+    return (
+        geo_transform[0] +
+        x_offset * geo_transform[1] +
+        y_offset * geo_transform[2],
+        geo_transform[1],
+        geo_transform[2],
+        geo_transform[3] +
+        x_offset * geo_transform[4] +
+        y_offset * geo_transform[5],
+        geo_transform[4],
+        geo_transform[5],
+    )
+
+
+def rasterize_zones(
+        datasource, geo_transform, projection, x_offset, y_offset, width,
+        height, all_touched=False):
+    """Rasterize zones from `zones_datasource` on a window of a raster grid.
+
+    :param datasource: The datasource made by `zones_datasource`.
+    :type datasource: ogr.DataSource
+
+    :param geo_transform: The GDAL geo transform of the raster grid.
+    :type geo_transform: tuple
+
+    :param projection: The WKT projection of the raster grid.
+    :type projection: str
+
+    :param x_offset: The first column of the window.
+    :type x_offset: int
+
+    :param y_offset: The first row of the window.
+    :type y_offset: int
+
+    :param width: The number of columns of the window.
+    :type width: int
+
+    :param height: The number of rows of the window.
+    :type height: int
+
+    :param all_touched: If True, every cell touched by a polygon is burnt,
+        otherwise only cells whose center is in the polygon.
+    :type all_touched: bool
+
+    :return: The zone number of each cell, 0 if the cell is in no zone.
+    :rtype: numpy.ndarray
+    """
+    driver = gdal.GetDriverByName('MEM')
+    grid = driver.Create('', width, height, 1, gdal.GDT_Int32)
+    grid.SetGeoTransform(
+        block_geo_transform(geo_transform, x_offset, y_offset))
+    grid.SetProjection(projection)
+    grid.GetRasterBand(1).Fill(0)
+
+    options = ['ATTRIBUTE=zone']
+    if all_touched:
+        options.append('ALL_TOUCHED=TRUE')
+    gdal.RasterizeLayer(grid, [1], datasource.GetLayer(0), options=options)
+    return grid.GetRasterBand(1).ReadAsArray()
+
+
+def cell_centers(geo_transform, x_offset, y_offset, width, height):
+    """Coordinates of the center of each cell in a window of a raster.
+
+    :param geo_transform: The GDAL geo transform of the raster, without
+        rotation.
+    :type geo_transform: tuple
+
+    :param x_offset: The first column of the window.
+    :type x_offset: int
+
+    :param y_offset: The first row of the window.
+    :type y_offset: int
+
+    :param width: The number of columns of the window.
+    :type width: int
+
+    :param height: The number of rows of the window.
+    :type height: int
+
+    :return: Tuple of two arrays (x, y) with the shape (height, width).
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    columns = np.arange(x_offset, x_offset + width) + 0.5
+    rows = np.arange(y_offset, y_offset + height) + 0.5
+    x = geo_transform[0] + columns * geo_transform[1]
+    y = geo_transform[3] + rows * geo_transform[5]
+    return np.meshgrid(x, y)
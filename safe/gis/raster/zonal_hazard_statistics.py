@@ -0,0 +1,426 @@
+# coding=utf-8
+
+"""Zonal statistics of a raster exposure by aggregation and hazard class."""
+
+import logging
+
+import numpy as np
+from osgeo import gdal, osr
+from qgis.core import (
+    QGis,
+    QgsFeature,
+    QgsGeometry,
+    QgsRectangle,
+)
+
+from safe.common.exceptions import InvalidKeywordsForProcessingAlgorithm
+from safe.definitions.fields import (
+    hazard_id_field,
+    hazard_class_field,
+    exposure_count_field,
+    total_field,
+    size_field,
+)
+from safe.definitions.hazard_classifications import not_exposed_class
+from safe.definitions.layer_purposes import (
+    layer_purpose_aggregate_hazard_impacted)
+from safe.definitions.processing_steps import zonal_hazard_stats_steps
+from safe.definitions.utilities import definition
+from safe.gis.raster.tools import (
+    spatial_reference,
+    zones_datasource,
+    pixel_window,
+    raster_blocks,
+    rasterize_zones,
+    cell_centers,
+)
+from safe.gis.sanity_check import check_layer
+from safe.gis.vector.tools import (
+    create_memory_layer, create_field_from_definition, SizeCalculator)
+from safe.utilities.metadata import (
+    active_classification, active_thresholds_value_maps, copy_layer_keywords)
+from safe.utilities.profiling import profile
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+LOGGER = logging.getLogger('InaSAFE')
+
+
+@profile
+def zonal_hazard_stats(
+        exposure, hazard, aggregation, window_size=None, callback=None):
+    """Sum a raster exposure by aggregation area and hazard class.
+
+    This is the raster native version of polygonize, union and zonal_stats.
+    The hazard raster is never converted to polygons. The aggregation layer is
+    rasterized on the exposure grid, block by block, and each exposure cell is
+    assigned to the hazard cell which contains its center. Like the zonal
+    statistics, a cell belongs to an aggregation area if its center is in the
+    area.
+
+    The output has one feature for each aggregation area and hazard class
+    found in this area. As we don't have hazard polygons, the geometry of the
+    feature is the geometry of the aggregation area. The size field is
+    computed from the area of the exposure cells.
+
+    :param exposure: The continuous raster exposure.
+    :type exposure: QgsRasterLayer
+
+    :param hazard: The classified raster hazard.
+    :type hazard: QgsRasterLayer
+
+    :param aggregation: The aggregation vector layer.
+    :type aggregation: QgsVectorLayer
+
+    :param window_size: Maximum number of exposure cells read at once.
+    :type window_size: int
+
+    :param callback: A function to all to indicate progress. The function
+        should accept params 'current' (int), 'maximum' (int) and 'step' (str).
+        Defaults to None.
+    :type callback: function
+
+    :return: The aggregate hazard layer with the exposure count.
+    :rtype: QgsVectorLayer
+
+    .. versionadded:: 4.3
+    """
+    output_layer_name = zonal_hazard_stats_steps['output_layer_name']
+    processing_step = zonal_hazard_stats_steps['step_name']
+
+    exposure_key = exposure.keywords['exposure']
+    classification_key = active_classification(hazard.keywords, exposure_key)
+    value_map = active_thresholds_value_maps(hazard.keywords, exposure_key)
+    if not classification_key or not value_map:
+        raise InvalidKeywordsForProcessingAlgorithm(
+            'The hazard classification is missing for %s' % exposure_key)
+
+    # Code 0 is not exposed, code N is the hazard class N - 1.
+    hazard_classes = definition(classification_key)['classes']
+    class_keys = [not_exposed_class['key']]
+    class_keys.extend([hazard_class['key'] for hazard_class in hazard_classes])
+    value_codes = {}
+    for code, hazard_class in enumerate(hazard_classes, 1):
+        for value in value_map.get(hazard_class['key'], []):
+            try:
+                # Polygonize is storing hazard values as integers.
+                value_codes[int(float(value))] = code
+            except (TypeError, ValueError):
+                continue
+
+    hazard_codes, hazard_geo_transform = _hazard_codes(
+        hazard, value_codes, window_size)
+
+    # Zones are rasterized on the exposure grid. They are transformed to the
+    # exposure CRS one by one, so the zone IDs are the feature IDs of the
+    # aggregation layer.
+    datasource, zone_ids = zones_datasource(aggregation, exposure.crs())
+    zones_extent = datasource.GetLayer(0).GetExtent()
+
+    exposure_dataset = gdal.Open(exposure.source(), gdal.GA_ReadOnly)
+    exposure_band = exposure_dataset.GetRasterBand(
+        exposure.keywords.get('active_band', 1))
+    exposure_no_data = exposure_band.GetNoDataValue()
+    exposure_geo_transform = exposure_dataset.GetGeoTransform()
+    exposure_projection = exposure_dataset.GetProjection()
+
+    x_offset, y_offset, width, height = pixel_window(
+        exposure_geo_transform,
+        exposure_dataset.RasterXSize,
+        exposure_dataset.RasterYSize,
+        QgsRectangle(
+            zones_extent[0], zones_extent[2],
+            zones_extent[1], zones_extent[3]))
+
+    # Exposure cell centers must be in the hazard CRS for the lookup.
+    if hazard.crs().authid() != exposure.crs().authid():
+        to_hazard = osr.CoordinateTransformation(
+            spatial_reference(exposure.crs()),
+            spatial_reference(hazard.crs()))
+    else:
+        to_hazard = None
+
+    size_calculator = SizeCalculator(
+        exposure.crs(), QGis.Polygon, exposure_key)
+
+    code_count = len(class_keys)
+    bins = (len(zone_ids) + 1) * code_count
+    sums = np.zeros(bins)
+    cells = np.zeros(bins, dtype=np.int64)
+    sizes = np.zeros(bins)
+
+    blocks = list(raster_blocks(
+        x_offset,
+        y_offset,
+        width,
+        height,
+        exposure_band.GetBlockSize()[1],
+        window_size))
+    for i, (x, y, block_width, block_height) in enumerate(blocks):
+        if callback:
+            callback(
+                current=i, maximum=len(blocks), step=processing_step)
+
+        zone_grid = rasterize_zones(
+            datasource,
+            exposure_geo_transform,
+            exposure_projection,
+            x,
+            y,
+            block_width,
+            block_height)
+        values = exposure_band.ReadAsArray(
+            x, y, block_width, block_height).astype(np.float64)
+
+        valid = (zone_grid > 0) & np.isfinite(values)
+        if exposure_no_data is not None:
+            valid &= values != exposure_no_data
+        if not valid.any():
+            continue
+
+        rows, columns = np.nonzero(valid)
+        center_x, center_y = cell_centers(
+            exposure_geo_transform, x, y, block_width, block_height)
+        center_x = center_x[valid]
+        center_y = center_y[valid]
+        if to_hazard:
+            points = to_hazard.TransformPoints(
+                np.column_stack((center_x, center_y)).tolist())
+            points = np.array(points)
+            center_x = points[:, 0]
+            center_y = points[:, 1]
+
+        codes = _lookup_codes(
+            hazard_codes, hazard_geo_transform, center_x, center_y)
+
+        keys = zone_grid[valid].astype(np.int64) * code_count + codes
+        sums += np.bincount(keys, weights=values[valid], minlength=bins)
+        cells += np.bincount(keys, minlength=bins)
+
+        # Cells have the same area on a row.
+        row_sizes = _row_sizes(
+            size_calculator, exposure_geo_transform, x, y, block_height)
+        sizes += np.bincount(keys, weights=row_sizes[rows], minlength=bins)
+
+    sums = sums.reshape(-1, code_count)
+    cells = cells.reshape(-1, code_count)
+    sizes = sizes.reshape(-1, code_count)
+
+    layer = _write_aggregate_hazard(
+        output_layer_name,
+        aggregation,
+        zone_ids,
+        class_keys,
+        sums,
+        cells,
+        sizes,
+        exposure_key)
+
+    hazard_keywords = copy_layer_keywords(hazard.keywords)
+    hazard_keywords['classification'] = classification_key
+    hazard_keywords['inasafe_fields'] = {
+        hazard_id_field['key']: hazard_id_field['field_name'],
+        hazard_class_field['key']: hazard_class_field['field_name'],
+    }
+
+    output_field = exposure_count_field['field_name'] % exposure_key
+    layer.keywords = exposure.keywords.copy()
+    layer.keywords['inasafe_fields'] = (
+        aggregation.keywords['inasafe_fields'].copy())
+    layer.keywords['inasafe_fields'].update(
+        hazard_keywords['inasafe_fields'])
+    layer.keywords['inasafe_default_values'] = (
+        exposure.keywords['inasafe_default_values'].copy())
+
+    # Special case here, one field is the exposure count and the total.
+    key = exposure_count_field['key'] % exposure_key
+    layer.keywords['inasafe_fields'][key] = output_field
+    layer.keywords['inasafe_fields'][total_field['key']] = output_field
+    layer.keywords['inasafe_fields'][size_field['key']] = (
+        size_field['field_name'])
+
+    layer.keywords['exposure_keywords'] = exposure.keywords.copy()
+    layer.keywords['hazard_keywords'] = hazard_keywords
+    layer.keywords['aggregation_keywords'] = (
+        copy_layer_keywords(aggregation.keywords))
+    layer.keywords['layer_purpose'] = (
+        layer_purpose_aggregate_hazard_impacted['key'])
+
+    layer.keywords['title'] = output_layer_name
+
+    check_layer(layer)
+    return layer
+
+
+def _hazard_codes(hazard, value_codes, window_size=None):
+    """Read the hazard raster as an array of hazard class codes.
+
+    The hazard band is read block by block, only the codes (one byte per
+    cell) are kept in memory.
+
+    :param hazard: The classified raster hazard.
+    :type hazard: QgsRasterLayer
+
+    :param value_codes: Dictionary of the hazard value and the class code.
+    :type value_codes: dict
+
+    :param window_size: Maximum number of hazard cells read at once.
+    :type window_size: int
+
+    :return: Tuple with the array of codes and the geo transform.
+    :rtype: (numpy.ndarray, tuple)
+    """
+    hazard_dataset = gdal.Open(hazard.source(), gdal.GA_ReadOnly)
+    band = hazard_dataset.GetRasterBand(hazard.keywords.get('active_band', 1))
+    width = hazard_dataset.RasterXSize
+    height = hazard_dataset.RasterYSize
+
+    codes = np.zeros((height, width), dtype=np.uint8)
+    blocks = raster_blocks(
+        0, 0, width, height, band.GetBlockSize()[1], window_size)
+    for x, y, block_width, block_height in blocks:
+        source = band.ReadAsArray(x, y, block_width, block_height)
+        valid = np.isfinite(source)
+        # Like polygonize, we truncate hazard values to integers.
+        integers = np.zeros(source.shape, dtype=np.int64)
+        integers[valid] = source[valid].astype(np.int64)
+        block_codes = codes[y:y + block_height, x:x + block_width]
+        for value, code in value_codes.iteritems():
+            block_codes[valid & (integers == value)] = code
+
+    return codes, hazard_dataset.GetGeoTransform()
+
+
+def _lookup_codes(codes, geo_transform, x, y):
+    """Hazard class codes of the hazard cells containing some points.
+
+    :param codes: The hazard class codes.
+    :type codes: numpy.ndarray
+
+    :param geo_transform: The GDAL geo transform of the hazard.
+    :type geo_transform: tuple
+
+    :param x: The X coordinates of the points in the hazard CRS.
+    :type x: numpy.ndarray
+
+    :param y: The Y coordinates of the points in the hazard CRS.
+    :type y: numpy.ndarray
+
+    :return: The code of each point, 0 (not exposed) outside the hazard.
+    :rtype: numpy.ndarray
+    """
+    columns = np.floor((x - geo_transform[0]) / geo_transform[1])
+    rows = np.floor((y - geo_transform[3]) / geo_transform[5])
+    inside = (
+        (columns >= 0) & (columns < codes.shape[1]) &
+        (rows >= 0) & (rows < codes.shape[0]))
+
+    result = np.zeros(x.shape, dtype=np.int64)
+    result[inside] = codes[
+        rows[inside].astype(np.int64), columns[inside].astype(np.int64)]
+    return result
+
+
+def _row_sizes(size_calculator, geo_transform, x_offset, y_offset, height):
+    """Size of one cell for each row of a block.
+
+    :param size_calculator: The size calculator in the raster CRS.
+    :type size_calculator: SizeCalculator
+
+    :param geo_transform: The GDAL geo transform of the raster.
+    :type geo_transform: tuple
+
+    :param x_offset: The first column of the block.
+    :type x_offset: int
+
+    :param y_offset: The first row of the block.
+    :type y_offset: int
+
+    :param height: The number of rows of the block.
+    :type height: int
+
+    :return: The size of a cell, one value per row.
+    :rtype: numpy.ndarray
+    """
+    x_min = geo_transform[0] + x_offset * geo_transform[1]
+    x_max = x_min + geo_transform[1]
+    sizes = np.zeros(height)
+    for row in range(height):
+        y_a = geo_transform[3] + (y_offset + row) * geo_transform[5]
+        y_b = y_a + geo_transform[5]
+        cell = QgsGeometry.fromRect(QgsRectangle(x_min, y_a, x_max, y_b))
+        sizes[row] = size_calculator.measure(cell)
+    return sizes
+
+
+def _write_aggregate_hazard(
+        name, aggregation, zone_ids, class_keys, sums, cells, sizes,
+        exposure_key):
+    """Write one feature per aggregation area and hazard class.
+
+    :param name: The name of the output layer.
+    :type name: basestring
+
+    :param aggregation: The aggregation vector layer.
+    :type aggregation: QgsVectorLayer
+
+    :param zone_ids: Feature ID of each zone in the aggregation layer, the
+        zone N is at index N - 1.
+    :type zone_ids: list
+
+    :param class_keys: Hazard class key for each code.
+    :type class_keys: list
+
+    :param sums: Sum of the exposure by zone and code.
+    :type sums: numpy.ndarray
+
+    :param cells: Number of exposure cells by zone and code.
+    :type cells: numpy.ndarray
+
+    :param sizes: Size of the exposure cells by zone and code.
+    :type sizes: numpy.ndarray
+
+    :param exposure_key: The exposure key.
+    :type exposure_key: basestring
+
+    :return: The aggregate hazard layer.
+    :rtype: QgsVectorLayer
+    """
+    fields = aggregation.fields()
+    fields.append(create_field_from_definition(hazard_id_field))
+    fields.append(create_field_from_definition(hazard_class_field))
+    fields.append(
+        create_field_from_definition(exposure_count_field, exposure_key))
+    fields.append(create_field_from_definition(size_field))
+
+    layer = create_memory_layer(
+        name, QGis.Polygon, aggregation.crs(), fields)
+
+    areas = {}
+    for area in aggregation.getFeatures():
+        areas[area.id()] = area
+
+    features = []
+    for zone, feature_id in enumerate(zone_ids, 1):
+        area = areas[feature_id]
+        codes = np.flatnonzero(cells[zone])
+        if not len(codes):
+            # No cell center in this area, but we keep the area.
+            codes = [0]
+        for code in codes:
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry(area.geometry()))
+            feature.setAttributes(area.attributes() + [
+                int(code),
+                class_keys[code],
+                float(sums[zone, code]),
+                float(sizes[zone, code]),
+            ])
+            features.append(feature)
+
+    layer.dataProvider().addFeatures(features)
+    layer.updateExtents()
+    return layer
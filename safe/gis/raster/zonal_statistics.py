@@ -4,13 +4,22 @@
 
 import logging
 
+import numpy as np
+from osgeo import gdal, ogr
 from qgis.analysis import QgsZonalStatistics
-from qgis.core import QgsFeatureRequest
+from qgis.core import QgsFeatureRequest, QgsFeature, QgsGeometry, QgsRectangle
 
 from safe.definitions.fields import exposure_count_field, total_field
 from safe.definitions.layer_purposes import (
     layer_purpose_aggregate_hazard_impacted)
 from safe.definitions.processing_steps import zonal_stats_steps
+from safe.gis.raster.tools import (
+    zones_datasource,
+    pixel_window,
+    raster_blocks,
+    block_geo_transform,
+    rasterize_zones,
+)
 from safe.gis.sanity_check import check_layer
 from safe.gis.vector.reproject import reproject
 from safe.gis.vector.tools import (
@@ -33,7 +42,13 @@ LOGGER = logging.getLogger('InaSAFE')
 
 
 @profile
-def zonal_stats(raster, vector, callback=None):
+def zonal_stats(
+        raster,
+        vector,
+        callback=None,
+        native=False,
+        fractional=False,
+        window_size=None):
     """Reclassify a continuous raster layer.
 
     Issue https://github.com/inasafe/inasafe/issues/3190
@@ -54,6 +69,20 @@ def zonal_stats(raster, vector, callback=None):
         Defaults to None.
     :type callback: function
 
+    :param native: True to use our own zonal sum engine instead of
+        QgsZonalStatistics. All zones are rasterized on the raster grid and
+        the raster is read by blocks.
+    :type native: bool
+
+    :param fractional: Only with the native engine. True to weight the cells
+        on the edges of zones by the fraction of the cell inside the zone.
+        Otherwise a cell belongs to a zone if its center is inside the zone.
+    :type fractional: bool
+
+    :param window_size: Only with the native engine, the maximum number of
+        cells read at once.
+    :type window_size: int
+
     :return: The output of the zonal stats.
     :rtype: QgsVectorLayer
 
@@ -63,6 +92,16 @@ def zonal_stats(raster, vector, callback=None):
     processing_step = zonal_stats_steps['step_name']  # NOQA
 
     exposure = raster.keywords['exposure']
+    if native:
+        layer = _native_zonal_stats(
+            raster,
+            vector,
+            output_layer_name,
+            fractional,
+            window_size,
+            callback)
+        return _set_keywords(layer, raster, vector, output_layer_name)
+
     if raster.crs().authid() != vector.crs().authid():
         layer = reproject(vector, raster.crs())
 
@@ -134,6 +173,29 @@ def zonal_stats(raster, vector, callback=None):
             layer.changeAttributeValue(feature.id(), index, 0)
     layer.commitChanges()
 
+    return _set_keywords(layer, raster, vector, output_layer_name)
+
+
+def _set_keywords(layer, raster, vector, output_layer_name):
+    """Set keywords of the zonal stats output layer and check it.
+
+    :param layer: The output layer with the exposure count.
+    :type layer: QgsVectorLayer
+
+    :param raster: The raster layer.
+    :type raster: QgsRasterLayer
+
+    :param vector: The vector layer.
+    :type vector: QgsVectorLayer
+
+    :param output_layer_name: The name of the output layer.
+    :type output_layer_name: basestring
+
+    :return: The output layer.
+    :rtype: QgsVectorLayer
+    """
+    output_field = exposure_count_field['field_name'] % (
+        raster.keywords['exposure'])
     layer.keywords = raster.keywords.copy()
     layer.keywords['inasafe_fields'] = vector.keywords['inasafe_fields'].copy()
     layer.keywords['inasafe_default_values'] = (
@@ -157,3 +219,197 @@ def zonal_stats(raster, vector, callback=None):
 
     check_layer(layer)
     return layer
+
+
+def _native_zonal_stats(
+        raster, vector, output_layer_name, fractional, window_size, callback):
+    """Sum a raster in each polygon of a vector layer, with our own engine.
+
+    All polygons are rasterized in a label grid aligned on the raster, block
+    by block, and the raster is summed by label with numpy.bincount.
+
+    Like QgsZonalStatistics, a zone without any cell center inside it gets
+    the sum of the cells it covers, weighted by the covered fraction.
+
+    :param raster: The raster layer.
+    :type raster: QgsRasterLayer
+
+    :param vector: The polygon vector layer.
+    :type vector: QgsVectorLayer
+
+    :param output_layer_name: The name of the output layer.
+    :type output_layer_name: basestring
+
+    :param fractional: True to weight the cells on the edges of zones by the
+        fraction of the cell inside the zone.
+    :type fractional: bool
+
+    :param window_size: The maximum number of cells read at once.
+    :type window_size: int
+
+    :param callback: A function to all to indicate progress.
+    :type callback: function
+
+    :return: A copy of the vector layer with the exposure count field.
+    :rtype: QgsVectorLayer
+    """
+    processing_step = zonal_stats_steps['step_name']
+
+    if raster.crs().authid() != vector.crs().authid():
+        layer = reproject(vector, raster.crs())
+    else:
+        layer = vector
+
+    datasource, zone_ids = zones_datasource(layer)
+    geometries = {}
+    for feature in layer.getFeatures():
+        geometries[feature.id()] = feature.geometry()
+    zone_geometries = [geometries[feature_id] for feature_id in zone_ids]
+    if fractional:
+        boundaries = _boundaries_datasource(datasource)
+
+    input_band = layer.keywords.get('active_band', 1)
+    dataset = gdal.Open(raster.source(), gdal.GA_ReadOnly)
+    band = dataset.GetRasterBand(input_band)
+    no_data = band.GetNoDataValue()
+    geo_transform = dataset.GetGeoTransform()
+    projection = dataset.GetProjection()
+
+    def read_block(x, y, width, height):
+        """Read a block of the raster with the mask of valid cells."""
+        values = band.ReadAsArray(x, y, width, height).astype(np.float64)
+        valid = np.isfinite(values)
+        if no_data is not None:
+            valid &= values != no_data
+        return values, valid
+
+    bins = len(zone_ids) + 1
+    sums = np.zeros(bins)
+    counts = np.zeros(bins, dtype=np.int64)
+
+    window = pixel_window(
+        geo_transform, dataset.RasterXSize, dataset.RasterYSize,
+        layer.extent())
+    blocks = list(raster_blocks(
+        *window, block_height=band.GetBlockSize()[1], window_size=window_size))
+    for i, (x, y, width, height) in enumerate(blocks):
+        if callback:
+            callback(current=i, maximum=len(blocks), step=processing_step)
+
+        zones = rasterize_zones(
+            datasource, geo_transform, projection, x, y, width, height)
+        values, valid = read_block(x, y, width, height)
+
+        if fractional:
+            edges = rasterize_zones(
+                boundaries, geo_transform, projection, x, y, width, height,
+                all_touched=True) > 0
+            block_transform = block_geo_transform(geo_transform, x, y)
+            for zone, geometry in enumerate(zone_geometries, 1):
+                sums[zone] += _fraction_sum(
+                    geometry, block_transform, values, valid & edges)
+            valid &= ~edges
+
+        valid &= zones > 0
+        sums += np.bincount(
+            zones[valid], weights=values[valid], minlength=bins)
+        counts += np.bincount(zones[valid], minlength=bins)
+
+    if not fractional:
+        # Zones smaller than a cell, as QgsZonalStatistics is doing.
+        for zone in np.flatnonzero(counts[1:] == 0) + 1:
+            geometry = zone_geometries[zone - 1]
+            x, y, width, height = pixel_window(
+                geo_transform, dataset.RasterXSize, dataset.RasterYSize,
+                geometry.boundingBox())
+            if not width or not height:
+                continue
+            values, valid = read_block(x, y, width, height)
+            sums[zone] += _fraction_sum(
+                geometry,
+                block_geo_transform(geo_transform, x, y),
+                values,
+                valid)
+
+    zone_sums = dict(zip(zone_ids, sums[1:].tolist()))
+
+    fields = vector.fields()
+    fields.append(create_field_from_definition(
+        exposure_count_field, raster.keywords['exposure']))
+    output_layer = create_memory_layer(
+        output_layer_name, vector.geometryType(), vector.crs(), fields)
+
+    # The reprojected layer has the same features in the same order.
+    features = []
+    for source, zone in zip(vector.getFeatures(), layer.getFeatures()):
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry(source.geometry()))
+        feature.setAttributes(
+            source.attributes() + [zone_sums.get(zone.id(), 0)])
+        features.append(feature)
+    output_layer.dataProvider().addFeatures(features)
+    output_layer.updateExtents()
+    return output_layer
+
+
+def _boundaries_datasource(datasource):
+    """Copy the boundaries of zones from `zones_datasource`.
+
+    :param datasource: The datasource made by `zones_datasource`.
+    :type datasource: ogr.DataSource
+
+    :return: A datasource with the boundary of each zone.
+    :rtype: ogr.DataSource
+    """
+    source_layer = datasource.GetLayer(0)
+    driver = ogr.GetDriverByName('Memory')
+    boundaries = driver.CreateDataSource('boundaries')
+    layer = boundaries.CreateLayer(
+        'boundaries', source_layer.GetSpatialRef(), ogr.wkbMultiLineString)
+    layer.CreateField(source_layer.GetLayerDefn().GetFieldDefn(0))
+    for feature in source_layer:
+        boundary = feature.Clone()
+        boundary.SetGeometry(feature.GetGeometryRef().Boundary())
+        layer.CreateFeature(boundary)
+    source_layer.ResetReading()
+    return boundaries
+
+
+def _fraction_sum(geometry, geo_transform, values, mask):
+    """Sum cells of a block weighted by the fraction covered by a polygon.
+
+    :param geometry: The polygon, in the raster CRS.
+    :type geometry: QgsGeometry
+
+    :param geo_transform: The GDAL geo transform of the block.
+    :type geo_transform: tuple
+
+    :param values: The values of the block.
+    :type values: numpy.ndarray
+
+    :param mask: The cells to use in the block.
+    :type mask: numpy.ndarray
+
+    :return: The weighted sum.
+    :rtype: float
+    """
+    height, width = values.shape
+    x, y, columns, rows = pixel_window(
+        geo_transform, width, height, geometry.boundingBox())
+    if not columns or not rows:
+        return 0
+
+    cell_area = abs(geo_transform[1] * geo_transform[5])
+    total = 0
+    for row, column in zip(*np.nonzero(mask[y:y + rows, x:x + columns])):
+        row += y
+        column += x
+        x_min = geo_transform[0] + column * geo_transform[1]
+        y_min = geo_transform[3] + row * geo_transform[5]
+        cell = QgsGeometry.fromRect(QgsRectangle(
+            x_min, y_min, x_min + geo_transform[1], y_min + geo_transform[5]))
+        if not geometry.intersects(cell):
+            continue
+        fraction = geometry.intersection(cell).area() / cell_area
+        total += values[row, column] * fraction
+    return total
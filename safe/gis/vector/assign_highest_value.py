@@ -4,6 +4,7 @@
 
 import logging
 
+import numpy
 from qgis.core import (
     QgsFeatureRequest,
     QgsGeometry,
@@ -16,7 +17,8 @@ from safe.definitions.hazard_classifications import (
 from safe.definitions.layer_purposes import layer_purpose_exposure_summary
 from safe.definitions.processing_steps import assign_highest_value_steps
 from safe.gis.sanity_check import check_layer
-from safe.gis.vector.tools import create_spatial_index
+from safe.gis.vector.tools import (
+    create_packed_index, packed_index_intersects)
 from safe.utilities.profiling import profile
 
 __copyright__ = "Copyright 2016, The InaSAFE Project"
@@ -59,7 +61,7 @@ def assign_highest_value(exposure, hazard, callback=None):
     .. versionadded:: 4.0
     """
     output_layer_name = assign_highest_value_steps['output_layer_name']
-    processing_step = assign_highest_value_steps['step_name']  # NOQA
+    processing_step = assign_highest_value_steps['step_name']
 
     hazard_inasafe_fields = hazard.keywords['inasafe_fields']
 
@@ -76,16 +78,6 @@ def assign_highest_value(exposure, hazard, callback=None):
     exposure.commitChanges()
     provider = exposure.dataProvider()
 
-    spatial_index = create_spatial_index(exposure)
-
-    # cache features from exposure layer for faster retrieval
-    exposure_features = {}
-    for f in exposure.getFeatures():
-        exposure_features[f.id()] = f
-
-    # Todo callback
-    # total = 100.0 / len(selectionA)
-
     hazard_field = hazard_inasafe_fields[hazard_class_field['key']]
 
     layer_classification = None
@@ -98,35 +90,89 @@ def assign_highest_value(exposure, hazard, callback=None):
     levels = [key['key'] for key in layer_classification['classes']]
     levels.append(not_exposed_class['key'])
 
-    # Let's loop over the hazard layer, from high to low hazard zone.
-    for hazard_value in levels:
-        expression = '"%s" = \'%s\'' % (hazard_field, hazard_value)
-        hazard_request = QgsFeatureRequest().setFilterExpression(expression)
-        update_map = {}
-        for area in hazard.getFeatures(hazard_request):
-            geometry = area.geometry()
-            intersects = spatial_index.intersects(geometry.boundingBox())
-
-            # use prepared geometry: makes multiple intersection tests faster
-            geometry_prepared = QgsGeometry.createGeometryEngine(
-                geometry.geometry())
-            geometry_prepared.prepareGeometry()
-
-            # We need to loop over each intersections exposure / hazard.
-            for i in intersects:
-                building = exposure_features[i]
-                building_geometry = building.geometry()
-
-                if geometry_prepared.intersects(building_geometry.geometry()):
-                    update_map[building.id()] = {}
-                    for index, value in zip(indices, area.attributes()):
-                        update_map[building.id()][index] = value
-
-                    # We don't want this building again, let's remove it from
-                    # the index.
-                    spatial_index.deleteFeature(building)
-
-        provider.changeAttributeValues(update_map)
+    # Only IDs and bounding boxes of buildings are kept in memory.
+    exposure_ids, boxes = _bounding_boxes(exposure)
+    packed_index = create_packed_index(boxes)
+    id_order = numpy.argsort(exposure_ids)
+
+    # Hazard areas are few, we keep them prepared.
+    hazard_class_index = hazard.fieldNameIndex(hazard_field)
+    areas = []
+    pair_buildings = []
+    pair_areas = []
+    total = hazard.featureCount()
+    for i, area in enumerate(hazard.getFeatures()):
+        if callback:
+            callback(current=i, maximum=total, step=processing_step)
+        hazard_value = area.attributes()[hazard_class_index]
+        geometry = area.geometry()
+        if hazard_value not in levels or not geometry:
+            continue
+
+        box = geometry.boundingBox()
+        candidates = packed_index_intersects(packed_index, (
+            box.xMinimum(), box.yMinimum(),
+            box.xMaximum(), box.yMaximum()))
+        if not len(candidates):
+            continue
+
+        # use prepared geometry: makes multiple intersection tests faster
+        geometry_prepared = QgsGeometry.createGeometryEngine(
+            geometry.geometry())
+        geometry_prepared.prepareGeometry()
+        # The geometry must live as long as the prepared geometry.
+        areas.append((
+            levels.index(hazard_value),
+            geometry,
+            geometry_prepared,
+            area.attributes()))
+        pair_buildings.append(candidates)
+        pair_areas.append(numpy.repeat(len(areas) - 1, len(candidates)))
+
+    if areas:
+        pair_buildings = numpy.concatenate(pair_buildings)
+        pair_areas = numpy.concatenate(pair_areas)
+    else:
+        pair_buildings = numpy.zeros(0, dtype=int)
+        pair_areas = numpy.zeros(0, dtype=int)
+
+    # Sort the pairs by building, then from the highest to the lowest hazard
+    # class, then in the order of the hazard layer.
+    ranks = numpy.array([area[0] for area in areas], dtype=int)
+    pair_order = numpy.lexsort(
+        (pair_areas, ranks[pair_areas], pair_buildings))
+    pair_buildings = pair_buildings[pair_order]
+    pair_areas = pair_areas[pair_order]
+    starts = numpy.flatnonzero(numpy.diff(pair_buildings)) + 1
+    starts = numpy.concatenate(([0], starts)).astype(int)
+    ends = numpy.concatenate((starts[1:], [len(pair_buildings)])).astype(int)
+    candidate_buildings = pair_buildings[starts]
+    LOGGER.info(
+        '%s pairs of buildings and hazard areas to check.'
+        % len(pair_buildings))
+
+    # Buildings are read once, each building gets the first hazard area
+    # intersecting it.
+    update_map = {}
+    if len(pair_buildings):
+        request = QgsFeatureRequest()
+        request.setSubsetOfAttributes([])
+        request.setFilterFids(
+            [int(exposure_ids[row]) for row in candidate_buildings])
+        for building in exposure.getFeatures(request):
+            row = id_order[numpy.searchsorted(
+                exposure_ids, building.id(), sorter=id_order)]
+            position = numpy.searchsorted(candidate_buildings, row)
+            building_geometry = building.geometry().geometry()
+            for area_index in pair_areas[
+                    starts[position]:ends[position]]:
+                _, _, geometry_prepared, attributes = areas[area_index]
+                if geometry_prepared.intersects(building_geometry):
+                    update_map[building.id()] = dict(
+                        zip(indices, attributes))
+                    break
+
+    provider.changeAttributeValues(update_map)
 
     exposure.updateExtents()
     exposure.updateFields()
@@ -145,3 +191,38 @@ def assign_highest_value(exposure, hazard, callback=None):
 
     check_layer(exposure)
     return exposure
+
+
+def _bounding_boxes(layer):
+    """Read the IDs and the bounding boxes of the features of a layer.
+
+    :param layer: The vector layer.
+    :type layer: QgsVectorLayer
+
+    :return: Tuple with the array of feature IDs and the array of
+        (x min, y min, x max, y max), in the order of the layer.
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    count = layer.featureCount()
+    ids = numpy.zeros(count, dtype=numpy.int64)
+    boxes = numpy.zeros((count, 4))
+
+    request = QgsFeatureRequest()
+    request.setSubsetOfAttributes([])
+    row = 0
+    for feature in layer.getFeatures(request):
+        geometry = feature.geometry()
+        if not geometry:
+            continue
+        if row == count:
+            # The feature count is not always exact.
+            count = max(1, count)
+            ids = numpy.concatenate((ids, numpy.zeros(count, ids.dtype)))
+            boxes = numpy.concatenate((boxes, numpy.zeros((count, 4))))
+            count *= 2
+        box = geometry.boundingBox()
+        ids[row] = feature.id()
+        boxes[row] = (
+            box.xMinimum(), box.yMinimum(), box.xMaximum(), box.yMaximum())
+        row += 1
+    return ids[:row], boxes[:row]
@@ -2,9 +2,13 @@
 
 """Try to make a layer valid."""
 
+from osgeo import ogr
+from qgis.core import QgsFeatureRequest, QgsGeometry
+
+from safe.common.utilities import process_pool
 from safe.definitions.processing_steps import clean_geometry_steps
 from safe.gis.sanity_check import check_layer
-from safe.utilities.profiling import profile
+from safe.utilities.profiling import profile, add_counter
 from safe.common.custom_logging import LOGGER
 
 __copyright__ = "Copyright 2016, The InaSAFE Project"
@@ -12,11 +16,56 @@ __license__ = "GPL version 3"
 __email__ = "info@inasafe.org"
 __revision__ = '$Format:%H$'
 
+# Number of geometries checked together by a worker process.
+chunk_size = 5000
+
+# Multi types used to keep only one dimension of a geometry collection.
+multi_types = {
+    0: ogr.wkbMultiPoint,
+    1: ogr.wkbMultiLineString,
+    2: ogr.wkbMultiPolygon,
+}
+
+
+def has_valid_geometries(layer):
+    """Check if all geometries of a layer are known to be valid.
+
+    :param layer: The vector layer.
+    :type layer: QgsVectorLayer
+
+    :return: True if the layer has been cleaned and not edited since.
+    :rtype: bool
+
+    .. versionadded:: 4.3
+    """
+    return getattr(layer, 'valid_geometries', False)
+
+
+def set_valid_geometries(layer, valid=True):
+    """Record if all geometries of a layer are known to be valid.
+
+    A layer must be flagged as not valid when its geometries are edited.
+
+    :param layer: The vector layer.
+    :type layer: QgsVectorLayer
+
+    :param valid: If all geometries are valid.
+    :type valid: bool
+
+    .. versionadded:: 4.3
+    """
+    layer.valid_geometries = valid
+
 
 @profile
-def clean_layer(layer, callback=None):
+def clean_layer(layer, callback=None, processes=1):
     """Clean a vector layer.
 
+    Geometries are checked and repaired by chunks with OGR, in worker
+    processes if requested. Geometries which can not be repaired are
+    removed. The layer is then flagged as valid, a layer already flagged is
+    not checked again.
+
     :param layer: The vector layer.
     :type layer: QgsVectorLayer
 
@@ -25,40 +74,199 @@ def clean_layer(layer, callback=None):
         'step' (str). Defaults to None.
     :type callback: function
 
+    :param processes: Number of worker processes. Defaults to 1, geometries
+        are checked in the current process.
+    :type processes: int
+
     :return: The buffered vector layer.
     :rtype: QgsVectorLayer
     """
     output_layer_name = clean_geometry_steps['output_layer_name']
-    processing_step = clean_geometry_steps['step_name']  # NOQA
+    processing_step = clean_geometry_steps['step_name']
     output_layer_name = output_layer_name % layer.keywords['layer_purpose']
 
-    # start editing
-    layer.startEditing()
-    count = 0
+    if has_valid_geometries(layer):
+        LOGGER.info(
+            'Geometries of %s are already valid, they are not checked again.'
+            % layer.name())
+        add_counter('skipped_layers')
+        layer.keywords['title'] = output_layer_name
+        return layer
 
-    # iterate through all features
-    for feature in layer.getFeatures():
-        geom = feature.geometry()
-        geometry_cleaned = geometry_checker(geom)
-        if geometry_cleaned:
-            feature.setGeometry(geometry_cleaned)
-        else:
-            count += 1
-            layer.deleteFeature(feature.id())
+    request = QgsFeatureRequest()
+    request.setSubsetOfAttributes([])
+    chunks = []
+    chunk = []
+    removed = []
+    for feature in layer.getFeatures(request):
+        geometry = feature.geometry()
+        if geometry is None or geometry.isEmpty():
+            removed.append(feature.id())
+            continue
+        chunk.append((feature.id(), geometry.asWkb()))
+        if len(chunk) == chunk_size:
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
 
-    LOGGER.info(
-        '%s features have been removed from %s because of invalid geometries.'
-        % (count, layer.name()))
+    valid_count = 0
+    repaired = {}
+    results = _check_chunks(chunks, processes)
+    for i, (chunk_valid, chunk_repaired, chunk_removed) in enumerate(results):
+        if callback:
+            callback(current=i, maximum=len(chunks), step=processing_step)
+        valid_count += chunk_valid
+        for feature_id, wkb in chunk_repaired:
+            geometry = QgsGeometry()
+            geometry.fromWkb(wkb)
+            repaired[feature_id] = geometry
+        removed.extend(chunk_removed)
+
+    data_provider = layer.dataProvider()
+    if repaired:
+        data_provider.changeGeometryValues(repaired)
+    if removed:
+        data_provider.deleteFeatures(removed)
+    layer.updateExtents()
 
-    # save changes
-    layer.commitChanges()
+    add_counter('valid_geometries', valid_count)
+    add_counter('repaired_geometries', len(repaired))
+    add_counter('removed_geometries', len(removed))
+    LOGGER.info(
+        '%s features have been repaired and %s features have been removed '
+        'from %s because of invalid geometries.'
+        % (len(repaired), len(removed), layer.name()))
 
+    set_valid_geometries(layer)
     layer.keywords['title'] = output_layer_name
 
     check_layer(layer)
     return layer
 
 
+@profile
+def _check_chunks(chunks, processes=1):
+    """Check and repair chunks of geometries, in worker processes if any.
+
+    :param chunks: List of chunks, each a list of (feature ID, WKB).
+    :type chunks: list
+
+    :param processes: Number of worker processes. Defaults to 1, chunks are
+        checked in the current process.
+    :type processes: int
+
+    :return: The results of `_check_chunk` for each chunk.
+    :rtype: list
+    """
+    if processes > 1 and len(chunks) > 1:
+        pool = process_pool(min(processes, len(chunks)))
+        try:
+            results = pool.map(_check_chunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_check_chunk(chunk) for chunk in chunks]
+    return results
+
+
+def _check_chunk(chunk):
+    """Check and repair a chunk of geometries with OGR.
+
+    It runs in a worker process, so it only uses WKB.
+
+    :param chunk: List of (feature ID, WKB).
+    :type chunk: list
+
+    :return: Tuple with the number of valid geometries, the list of
+        (feature ID, WKB) of repaired geometries and the list of feature IDs
+        which can not be repaired.
+    :rtype: (int, list, list)
+    """
+    valid_count = 0
+    repaired = []
+    removed = []
+    for feature_id, wkb in chunk:
+        geometry = ogr.CreateGeometryFromWkb(wkb)
+        if geometry is not None and geometry.IsValid():
+            valid_count += 1
+            continue
+        geometry = _make_valid(geometry)
+        if geometry is None:
+            removed.append(feature_id)
+        else:
+            repaired.append((feature_id, geometry.ExportToWkb(ogr.wkbNDR)))
+    return valid_count, repaired, removed
+
+
+def _make_valid(geometry):
+    """Repair an OGR geometry, keeping its dimension.
+
+    MakeValid from GEOS is used if OGR provides it (GDAL 3 with GEOS 3.8),
+    otherwise a buffer of 0 like `geometry_checker`.
+
+    :param geometry: The invalid geometry.
+    :type geometry: ogr.Geometry
+
+    :return: The valid geometry, None if it can not be repaired.
+    :rtype: ogr.Geometry
+    """
+    if geometry is None:
+        return None
+
+    dimension = geometry.GetDimension()
+    candidates = []
+    if hasattr(geometry, 'MakeValid'):
+        candidates.append(geometry.MakeValid)
+    candidates.append(lambda: geometry.Buffer(0, 5))
+
+    for candidate in candidates:
+        try:
+            new_geometry = _keep_dimension(candidate(), dimension)
+        except RuntimeError:
+            continue
+        if new_geometry is not None and new_geometry.IsValid():
+            return new_geometry
+    return None
+
+
+def _keep_dimension(geometry, dimension):
+    """Keep only the parts of an OGR geometry with a given dimension.
+
+    :param geometry: The geometry, it can be a geometry collection.
+    :type geometry: ogr.Geometry
+
+    :param dimension: The dimension, 0 for points, 1 for lines and 2 for
+        polygons.
+    :type dimension: int
+
+    :return: The geometry, None if there is no part with this dimension.
+    :rtype: ogr.Geometry
+    """
+    if geometry is None or geometry.IsEmpty():
+        return None
+    if ogr.GT_Flatten(geometry.GetGeometryType()) != ogr.wkbGeometryCollection:
+        if geometry.GetDimension() == dimension:
+            return geometry
+        return None
+
+    multi_geometry = ogr.Geometry(multi_types[dimension])
+    for i in range(geometry.GetGeometryCount()):
+        part = _keep_dimension(geometry.GetGeometryRef(i), dimension)
+        if part is None:
+            continue
+        if part.GetGeometryCount() and ogr.GT_Flatten(
+                part.GetGeometryType()) == multi_types[dimension]:
+            for j in range(part.GetGeometryCount()):
+                multi_geometry.AddGeometry(part.GetGeometryRef(j))
+        else:
+            multi_geometry.AddGeometry(part)
+    if multi_geometry.IsEmpty():
+        return None
+    return multi_geometry
+
+
 def geometry_checker(geometry):
     """Perform a cleaning if the geometry is not valid.
 
@@ -81,3 +289,20 @@ def geometry_checker(geometry):
         else:
             # Buffer 0 is not enough, the feature will be deleted.
             return None
+
+
+def layer_geometry_checker(layer):
+    """Get the function to check the geometries of a layer.
+
+    :param layer: The vector layer.
+    :type layer: QgsVectorLayer
+
+    :return: `geometry_checker`, or a function returning the geometry as it
+        is if the layer is flagged as valid.
+    :rtype: function
+
+    .. versionadded:: 4.3
+    """
+    if has_valid_geometries(layer):
+        return lambda geometry: geometry
+    return geometry_checker
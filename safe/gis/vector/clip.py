@@ -13,6 +13,7 @@ from qgis.core import (
 
 from safe.definitions.processing_steps import clip_steps
 from safe.gis.sanity_check import check_layer
+from safe.gis.vector.clean_geometry import set_valid_geometries
 from safe.gis.vector.tools import create_memory_layer
 from safe.utilities.i18n import tr
 from safe.utilities.profiling import profile
@@ -27,7 +28,7 @@ LOGGER = logging.getLogger('InaSAFE')
 
 
 @profile
-def clip(layer_to_clip, mask_layer, callback=None):
+def clip(layer_to_clip, mask_layer, callback=None, in_place=False):
     """Clip a vector layer with another.
 
     Issue https://github.com/inasafe/inasafe/issues/3186
@@ -47,6 +48,11 @@ def clip(layer_to_clip, mask_layer, callback=None):
         Defaults to None.
     :type callback: function
 
+    :param in_place: If the layer to clip is a memory layer which can be
+        edited. Features outside of the mask are deleted and only geometries
+        crossing the mask are changed, other features are not copied.
+    :type in_place: bool
+
     :return: The clip vector layer.
     :rtype: QgsVectorLayer
 
@@ -57,13 +63,18 @@ def clip(layer_to_clip, mask_layer, callback=None):
         layer_to_clip.keywords['layer_purpose'])
     processing_step = clip_steps['step_name']  # NOQA
 
-    writer = create_memory_layer(
-        output_layer_name,
-        layer_to_clip.geometryType(),
-        layer_to_clip.crs(),
-        layer_to_clip.fields()
-    )
-    writer.startEditing()
+    if in_place:
+        writer = layer_to_clip
+        kept_feature_ids = set()
+        clipped_geometries = {}
+    else:
+        writer = create_memory_layer(
+            output_layer_name,
+            layer_to_clip.geometryType(),
+            layer_to_clip.crs(),
+            layer_to_clip.fields()
+        )
+        writer.startEditing()
 
     # Begin copy/paste from Processing plugin.
     # Please follow their code as their code is optimized.
@@ -118,7 +129,8 @@ def clip(layer_to_clip, mask_layer, callback=None):
             if not engine.intersects(in_feat.geometry().geometry()):
                 continue
 
-            if not engine.contains(in_feat.geometry().geometry()):
+            contained = engine.contains(in_feat.geometry().geometry())
+            if not contained:
                 cur_geom = in_feat.geometry()
                 new_geom = combined_clip_geom.intersection(cur_geom)
                 if new_geom.wkbType() == QgsWKBTypes.Unknown \
@@ -150,7 +162,12 @@ def clip(layer_to_clip, mask_layer, callback=None):
                 out_feat.setGeometry(new_geom)
                 out_feat.setAttributes(in_feat.attributes())
                 if new_geom.type() == layer_to_clip.geometryType():
-                    writer.addFeature(out_feat)
+                    if not in_place:
+                        writer.addFeature(out_feat)
+                    else:
+                        kept_feature_ids.add(in_feat.id())
+                        if not contained:
+                            clipped_geometries[in_feat.id()] = new_geom
             except:
                 LOGGER.debug(
                     tr('Feature geometry error: One or more output features '
@@ -168,7 +185,21 @@ def clip(layer_to_clip, mask_layer, callback=None):
             pass
 
     # End copy/paste from Processing plugin.
-    writer.commitChanges()
+    if in_place:
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([])
+        removed_feature_ids = [
+            feature.id() for feature in writer.getFeatures(request)
+            if feature.id() not in kept_feature_ids]
+        data_provider = writer.dataProvider()
+        data_provider.deleteFeatures(removed_feature_ids)
+        data_provider.changeGeometryValues(clipped_geometries)
+        writer.updateExtents()
+        # Clipped geometries must be checked again.
+        set_valid_geometries(writer, False)
+    else:
+        writer.commitChanges()
 
     writer.keywords = layer_to_clip.keywords.copy()
     writer.keywords['title'] = output_layer_name
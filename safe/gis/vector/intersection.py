@@ -6,7 +6,6 @@ import logging
 
 from qgis.core import (
     QgsGeometry,
-    QgsFeatureRequest,
     QgsWKBTypes,
     QgsFeature,
 )
@@ -27,6 +26,9 @@ __revision__ = '$Format:%H$'
 
 LOGGER = logging.getLogger('InaSAFE')
 
+# Number of features written at once in the output layer.
+batch_size = 1000
+
 
 @profile
 def intersection(source, mask, callback=None):
@@ -57,7 +59,7 @@ def intersection(source, mask, callback=None):
     output_layer_name = intersection_steps['output_layer_name']
     output_layer_name = output_layer_name % (
         source.keywords['layer_purpose'])
-    processing_step = intersection_steps['step_name']  # NOQA
+    processing_step = intersection_steps['step_name']
 
     fields = source.fields()
     fields.extend(mask.fields())
@@ -69,66 +71,86 @@ def intersection(source, mask, callback=None):
         fields
     )
 
-    writer.startEditing()
-
     # Begin copy/paste from Processing plugin.
     # Please follow their code as their code is optimized.
     # The code below is not following our coding standards because we want to
     # be able to track any diffs from QGIS easily.
 
-    out_feature = QgsFeature()
     index = create_spatial_index(mask)
 
-    # Todo callback
-    # total = 100.0 / len(selectionA)
+    # Mask features are read once. Prepared geometries are created only for
+    # masks which are candidates for at least one feature.
+    mask_features = {}
+    for feature_mask in mask.getFeatures():
+        mask_features[feature_mask.id()] = [
+            feature_mask.geometry(), feature_mask.attributes(), None]
+
+    out_features = []
+    total = source.featureCount()
 
     for current, in_feature in enumerate(source.getFeatures()):
-        # progress.setPercentage(int(current * total))
+        if callback:
+            callback(current=current, maximum=total, step=processing_step)
         geom = in_feature.geometry()
         attributes = in_feature.attributes()
         intersects = index.intersects(geom.boundingBox())
         for i in intersects:
-            request = QgsFeatureRequest().setFilterFid(i)
-            feature_mask = next(mask.getFeatures(request))
-            tmp_geom = feature_mask.geometry()
-            if geom.intersects(tmp_geom):
-                mask_attributes = feature_mask.attributes()
+            cached_mask = mask_features.get(i)
+            if not cached_mask:
+                continue
+            tmp_geom, mask_attributes, engine = cached_mask
+            if engine is None:
+                engine = QgsGeometry.createGeometryEngine(tmp_geom.geometry())
+                engine.prepareGeometry()
+                cached_mask[2] = engine
+            if not engine.intersects(geom.geometry()):
+                continue
+            if engine.contains(geom.geometry()):
+                # The feature is inside the mask, no need to clip it.
+                int_geom = QgsGeometry(geom)
+            else:
                 int_geom = QgsGeometry(geom.intersection(tmp_geom))
-                if int_geom.wkbType() == QgsWKBTypes.Unknown\
-                        or QgsWKBTypes.flatType(
-                        int_geom.geometry().wkbType()) ==\
-                        QgsWKBTypes.GeometryCollection:
-                    int_com = geom.combine(tmp_geom)
-                    int_geom = QgsGeometry()
-                    if int_com:
-                        int_sym = geom.symDifference(tmp_geom)
-                        int_geom = QgsGeometry(int_com.difference(int_sym))
-                if int_geom.isGeosEmpty() or not int_geom.isGeosValid():
-                    # LOGGER.debug(
-                    #     tr('GEOS geoprocessing error: One or more input '
-                    #        'features have invalid geometry.'))
-                    pass
-                try:
-                    geom_types = wkb_type_groups[
-                        wkb_type_groups[int_geom.wkbType()]]
-                    if int_geom.wkbType() in geom_types:
-                        if int_geom.type() == source.geometryType():
-                            # We got some features which have not the same
-                            # kind of geometry. We want to skip them.
-                            out_feature.setGeometry(int_geom)
-                            attrs = []
-                            attrs.extend(attributes)
-                            attrs.extend(mask_attributes)
-                            out_feature.setAttributes(attrs)
-                            writer.addFeature(out_feature)
-                except:
-                    LOGGER.debug(
-                        tr('Feature geometry error: One or more output '
-                           'features ignored due to invalid geometry.'))
-                    continue
+            if int_geom.wkbType() == QgsWKBTypes.Unknown\
+                    or QgsWKBTypes.flatType(
+                    int_geom.geometry().wkbType()) ==\
+                    QgsWKBTypes.GeometryCollection:
+                int_com = geom.combine(tmp_geom)
+                int_geom = QgsGeometry()
+                if int_com:
+                    int_sym = geom.symDifference(tmp_geom)
+                    int_geom = QgsGeometry(int_com.difference(int_sym))
+            if int_geom.isGeosEmpty() or not int_geom.isGeosValid():
+                # LOGGER.debug(
+                #     tr('GEOS geoprocessing error: One or more input '
+                #        'features have invalid geometry.'))
+                pass
+            try:
+                geom_types = wkb_type_groups[
+                    wkb_type_groups[int_geom.wkbType()]]
+                if int_geom.wkbType() in geom_types:
+                    if int_geom.type() == source.geometryType():
+                        # We got some features which have not the same
+                        # kind of geometry. We want to skip them.
+                        out_feature = QgsFeature()
+                        out_feature.setGeometry(int_geom)
+                        attrs = []
+                        attrs.extend(attributes)
+                        attrs.extend(mask_attributes)
+                        out_feature.setAttributes(attrs)
+                        out_features.append(out_feature)
+            except:
+                LOGGER.debug(
+                    tr('Feature geometry error: One or more output '
+                       'features ignored due to invalid geometry.'))
+                continue
+
+        if len(out_features) >= batch_size:
+            writer.dataProvider().addFeatures(out_features)
+            out_features = []
 
     # End copy/paste from Processing plugin.
-    writer.commitChanges()
+    writer.dataProvider().addFeatures(out_features)
+    writer.updateExtents()
 
     writer.keywords = dict(source.keywords)
     writer.keywords['title'] = output_layer_name
@@ -61,7 +61,7 @@ LOGGER = logging.getLogger('InaSAFE')
 
 
 @profile
-def prepare_vector_layer(layer, callback=None):
+def prepare_vector_layer(layer, callback=None, in_place=False):
     """This function will prepare the layer to be used in InaSAFE :
      * Make a local copy of the layer.
      * Make sure that we have an InaSAFE ID column.
@@ -76,6 +76,10 @@ def prepare_vector_layer(layer, callback=None):
         Defaults to None.
     :type callback: function
 
+    :param in_place: If the layer is a memory layer which can be edited. No
+        local copy is made, only the keywords are copied.
+    :type in_place: bool
+
     :return: Cleaned memory layer.
     :rtype: QgsVectorLayer
 
@@ -89,13 +93,19 @@ def prepare_vector_layer(layer, callback=None):
         msg = 'inasafe_fields is missing in keywords from %s' % layer.name()
         raise InvalidKeywordsForProcessingAlgorithm(msg)
 
-    cleaned = create_memory_layer(
-        output_layer_name, layer.geometryType(), layer.crs(), layer.fields())
+    if in_place:
+        cleaned = layer
+    else:
+        cleaned = create_memory_layer(
+            output_layer_name,
+            layer.geometryType(),
+            layer.crs(),
+            layer.fields())
+        copy_layer(layer, cleaned)
 
     # We transfer keywords to the output.
     cleaned.keywords = copy_layer_keywords(layer.keywords)
 
-    copy_layer(layer, cleaned)
     _remove_features(cleaned)
 
     # After removing rows, let's check if there is still a feature.
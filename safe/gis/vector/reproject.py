@@ -2,9 +2,14 @@
 
 """Reproject a vector layer to a specific CRS."""
 
+import logging
+import struct
+
+import numpy
+from osgeo import osr
 from qgis.core import (
     QgsCoordinateTransform,
-    QgsFeature,
+    QgsGeometry,
 )
 
 from safe.definitions.processing_steps import reproject_steps
@@ -17,6 +22,18 @@ __license__ = "GPL version 3"
 __email__ = "info@inasafe.org"
 __revision__ = '$Format:%H$'
 
+LOGGER = logging.getLogger('InaSAFE')
+
+# Number of features transformed together.
+batch_size = 10000
+
+# WKB types made of a list of points.
+wkb_point_types = [1]
+wkb_curve_types = [2, 8]  # LineString, CircularString
+wkb_surface_types = [3, 17]  # Polygon, Triangle
+# WKB types made of other geometries, with their own header.
+wkb_collection_types = [4, 5, 6, 7, 9, 10, 11, 12, 15, 16]
+
 
 @profile
 def reproject(layer, output_crs, callback=None):
@@ -24,6 +41,11 @@ def reproject(layer, output_crs, callback=None):
 
     Issue https://github.com/inasafe/inasafe/issues/3183
 
+    Coordinates of many features are transformed together with OSR. If the
+    two CRS are equivalent, even with different authids, coordinates are
+    copied without any transformation. If OSR can not create the
+    transformation, each geometry is transformed with QGIS.
+
     :param layer: The layer to reproject.
     :type layer: QgsVectorLayer
 
@@ -50,23 +72,40 @@ def reproject(layer, output_crs, callback=None):
 
     reprojected = create_memory_layer(
         output_layer_name, layer.geometryType(), output_crs, input_fields)
-    reprojected.startEditing()
+    data_provider = reprojected.dataProvider()
 
     crs_transform = QgsCoordinateTransform(input_crs, output_crs)
+    equivalent = equivalent_crs(input_crs, output_crs)
+    if equivalent:
+        LOGGER.info(
+            'The CRS {input} and {output} are equivalent, coordinates are '
+            'not transformed.'.format(
+                input=input_crs.authid(), output=output_crs.authid()))
+        bulk_transform = None
+    else:
+        bulk_transform = coordinate_transformation(input_crs, output_crs)
+        if bulk_transform is None:
+            LOGGER.info(
+                'OSR can not transform {input} to {output}, geometries are '
+                'transformed with QGIS.'.format(
+                    input=input_crs.authid(), output=output_crs.authid()))
 
-    out_feature = QgsFeature()
-
+    features = []
     for i, feature in enumerate(layer.getFeatures()):
-        geom = feature.geometry()
-        geom.transform(crs_transform)
-        out_feature.setGeometry(geom)
-        out_feature.setAttributes(feature.attributes())
-        reprojected.addFeature(out_feature)
+        features.append(feature)
+
+        if len(features) == batch_size:
+            _transform_features(
+                features, bulk_transform, crs_transform, equivalent)
+            data_provider.addFeatures(features)
+            features = []
 
         if callback:
             callback(current=i, maximum=feature_count, step=processing_step)
 
-    reprojected.commitChanges()
+    _transform_features(features, bulk_transform, crs_transform, equivalent)
+    data_provider.addFeatures(features)
+    reprojected.updateExtents()
 
     # We transfer keywords to the output.
     # We don't need to update keywords as the CRS is dynamic.
@@ -74,3 +113,234 @@ def reproject(layer, output_crs, callback=None):
     reprojected.keywords['title'] = output_layer_name
     check_layer(reprojected)
     return reprojected
+
+
+def equivalent_crs(crs_a, crs_b):
+    """Check if two CRS describe the same coordinate system.
+
+    Two CRS can be the same with different authids, for instance EPSG:3857
+    and EPSG:900913.
+
+    :param crs_a: The first CRS.
+    :type crs_a: QgsCoordinateReferenceSystem
+
+    :param crs_b: The second CRS.
+    :type crs_b: QgsCoordinateReferenceSystem
+
+    :return: True if the transformation between them does nothing.
+    :rtype: bool
+
+    .. versionadded:: 4.3
+    """
+    if crs_a.authid() == crs_b.authid() and crs_a.authid():
+        return True
+    if crs_a.toProj4() == crs_b.toProj4():
+        return True
+
+    reference_a = osr.SpatialReference()
+    reference_b = osr.SpatialReference()
+    if reference_a.ImportFromProj4(str(crs_a.toProj4())) != 0:
+        return False
+    if reference_b.ImportFromProj4(str(crs_b.toProj4())) != 0:
+        return False
+    return bool(reference_a.IsSame(reference_b))
+
+
+def coordinate_transformation(input_crs, output_crs):
+    """Create an OSR transformation between two CRS.
+
+    The CRS are read from their PROJ.4 definition, like QGIS does.
+
+    :param input_crs: The source CRS.
+    :type input_crs: QgsCoordinateReferenceSystem
+
+    :param output_crs: The destination CRS.
+    :type output_crs: QgsCoordinateReferenceSystem
+
+    :return: The transformation, None if OSR can not create it.
+    :rtype: osr.CoordinateTransformation
+
+    .. versionadded:: 4.3
+    """
+    references = []
+    for crs in (input_crs, output_crs):
+        reference = osr.SpatialReference()
+        if reference.ImportFromProj4(str(crs.toProj4())) != 0:
+            return None
+        if hasattr(reference, 'SetAxisMappingStrategy'):
+            # GDAL 3, keep the x, y order of QGIS.
+            reference.SetAxisMappingStrategy(
+                osr.OAMS_TRADITIONAL_GIS_ORDER)
+        references.append(reference)
+
+    try:
+        return osr.CoordinateTransformation(*references)
+    except (RuntimeError, ValueError):
+        return None
+
+
+def wkb_coordinates(wkb, offset=0):
+    """List the sequences of coordinates in a little endian WKB.
+
+    Only the headers of geometries and rings are read, so the coordinates
+    can be read and written with numpy.
+
+    :param wkb: The WKB.
+    :type wkb: bytearray
+
+    :param offset: The position of the geometry in the WKB.
+    :type offset: int
+
+    :return: Tuple with the list of (position, number of points), the
+        number of values for each point, if points have a Z value and the
+        position of the end of the geometry.
+    :rtype: (list, int, bool, int)
+
+    :raise ValueError: If the WKB is big endian or the type is not known.
+    """
+    if wkb[offset] != 1:
+        raise ValueError('Big endian WKB')
+    wkb_type = struct.unpack_from('<I', wkb, offset + 1)[0]
+    offset += 5
+
+    # Z and M values, as extended WKB flags or ISO types.
+    has_z = bool(wkb_type & 0x80000000)
+    has_m = bool(wkb_type & 0x40000000)
+    if wkb_type & 0x20000000:
+        # Skip the SRID of an extended WKB.
+        offset += 4
+    wkb_type &= 0x0FFFFFFF
+    if wkb_type >= 1000:
+        has_z = has_z or wkb_type // 1000 in (1, 3)
+        has_m = has_m or wkb_type // 1000 in (2, 3)
+        wkb_type %= 1000
+    dimension = 2 + has_z + has_m
+
+    sequences = []
+    if wkb_type in wkb_point_types:
+        sequences.append((offset, 1))
+        offset += 8 * dimension
+    elif wkb_type in wkb_curve_types:
+        count = struct.unpack_from('<I', wkb, offset)[0]
+        sequences.append((offset + 4, count))
+        offset += 4 + 8 * dimension * count
+    elif wkb_type in wkb_surface_types:
+        rings = struct.unpack_from('<I', wkb, offset)[0]
+        offset += 4
+        for _ in range(rings):
+            count = struct.unpack_from('<I', wkb, offset)[0]
+            sequences.append((offset + 4, count))
+            offset += 4 + 8 * dimension * count
+    elif wkb_type in wkb_collection_types:
+        parts = struct.unpack_from('<I', wkb, offset)[0]
+        offset += 4
+        for _ in range(parts):
+            part_sequences, part_dimension, part_z, offset = (
+                wkb_coordinates(wkb, offset))
+            if part_dimension != dimension:
+                raise ValueError('Mixed dimensions in WKB')
+            sequences.extend(part_sequences)
+    else:
+        raise ValueError('Unknown WKB type %s' % wkb_type)
+
+    return sequences, dimension, has_z, offset
+
+
+def _transform_features(
+        features, bulk_transform, crs_transform, equivalent=False):
+    """Transform the geometries of features, in place.
+
+    Coordinates of all features are gathered in numpy arrays and transformed
+    with a single call to OSR. Geometries which can not be read from their
+    WKB are transformed one by one with QGIS, like all geometries if there is
+    no OSR transformation.
+
+    :param features: The features.
+    :type features: list
+
+    :param bulk_transform: The OSR transformation, None if OSR can not
+        create it.
+    :type bulk_transform: osr.CoordinateTransformation
+
+    :param crs_transform: The QGIS transformation.
+    :type crs_transform: QgsCoordinateTransform
+
+    :param equivalent: If the CRS are equivalent, geometries are not
+        transformed.
+    :type equivalent: bool
+    """
+    if equivalent:
+        return
+
+    if bulk_transform is None:
+        _qgis_transform(features, crs_transform)
+        return
+
+    arrays = []
+    geometries = []
+    for feature in features:
+        geometry = feature.geometry()
+        if not geometry:
+            continue
+        wkb = bytearray(geometry.asWkb())
+        try:
+            sequences, dimension, has_z, _ = wkb_coordinates(wkb)
+        except (ValueError, IndexError, struct.error):
+            geometry.transform(crs_transform)
+            feature.setGeometry(geometry)
+            continue
+        for position, count in sequences:
+            array = numpy.frombuffer(
+                wkb, dtype='<f8', count=count * dimension, offset=position)
+            arrays.append((array.reshape(count, dimension), has_z))
+        geometries.append((feature, wkb))
+
+    if not arrays:
+        return
+
+    points = numpy.zeros((sum(len(array) for array, _ in arrays), 3))
+    start = 0
+    for array, has_z in arrays:
+        end = start + len(array)
+        points[start:end, 0:2] = array[:, 0:2]
+        if has_z:
+            points[start:end, 2] = array[:, 2]
+        start = end
+
+    try:
+        points = numpy.array(bulk_transform.TransformPoints(points.tolist()))
+    except RuntimeError:
+        # Some points can not be transformed, use QGIS for each geometry.
+        _qgis_transform(
+            [feature for feature, _wkb in geometries], crs_transform)
+        return
+
+    start = 0
+    for array, has_z in arrays:
+        end = start + len(array)
+        array[:, 0:2] = points[start:end, 0:2]
+        if has_z:
+            array[:, 2] = points[start:end, 2]
+        start = end
+
+    for feature, wkb in geometries:
+        geometry = QgsGeometry()
+        geometry.fromWkb(str(wkb))
+        feature.setGeometry(geometry)
+
+
+def _qgis_transform(features, crs_transform):
+    """Transform the geometries of features one by one with QGIS, in place.
+
+    :param features: The features.
+    :type features: list
+
+    :param crs_transform: The QGIS transformation.
+    :type crs_transform: QgsCoordinateTransform
+    """
+    for feature in features:
+        geometry = feature.geometry()
+        if not geometry:
+            continue
+        geometry.transform(crs_transform)
+        feature.setGeometry(geometry)
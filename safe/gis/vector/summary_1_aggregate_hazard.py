@@ -25,7 +25,13 @@ from safe.definitions.layer_purposes import (
 from safe.definitions.utilities import definition
 from safe.gis.sanity_check import check_layer
 from safe.gis.vector.summary_tools import (
-    check_inputs, create_absolute_values_structure, add_fields)
+    check_inputs,
+    create_absolute_values_structure,
+    add_fields,
+    write_values,
+    summarization_structure,
+    summarize_feature,
+)
 from safe.processors import post_processor_affected_function
 from safe.utilities.gis import qgis_version
 from safe.utilities.i18n import tr
@@ -39,6 +45,9 @@ __revision__ = '$Format:%H$'
 
 LOGGER = logging.getLogger('InaSAFE')
 
+# Number of features added at once to flat tables.
+summary_chunk_size = 100000
+
 
 @profile
 def aggregate_hazard_summary(impact, aggregate_hazard, callback=None):
@@ -71,16 +80,32 @@ def aggregate_hazard_summary(impact, aggregate_hazard, callback=None):
 
     .. versionadded:: 4.0
     """
-    source_fields = impact.keywords['inasafe_fields']
-    target_fields = aggregate_hazard.keywords['inasafe_fields']
+    tables = impact_summary_tables(impact)
+    layer, _ = summarize_aggregate_hazard(impact, aggregate_hazard, tables)
+    return layer
 
-    target_compulsory_fields = [
-        aggregation_id_field,
-        aggregation_name_field,
-        hazard_id_field,
-        hazard_class_field
-    ]
-    check_inputs(target_compulsory_fields, target_fields)
+
+@profile
+def impact_summary_tables(impact, summarize=False):
+    """Group the impact layer by aggregation, hazard and exposure class.
+
+    This is the only scan of the impact layer needed by all summaries.
+
+    :param impact: The impact layer.
+    :type impact: QgsVectorLayer
+
+    :param summarize: True to compute the summary rules of the exposure
+        summary table at the same time, see `summarize_result`.
+    :type summarize: bool
+
+    :return: Tuple with the flat table of the exposure by aggregation,
+        hazard and exposure class, the absolute values structure by
+        aggregation and hazard and the summary rules dictionaries.
+    :rtype: (FlatTable, dict, dict)
+
+    .. versionadded:: 4.3
+    """
+    source_fields = impact.keywords['inasafe_fields']
 
     source_compulsory_fields = [
         exposure_id_field,
@@ -92,14 +117,9 @@ def aggregate_hazard_summary(impact, aggregate_hazard, callback=None):
     ]
     check_inputs(source_compulsory_fields, source_fields)
 
-    aggregation_id = target_fields[aggregation_id_field['key']]
-
-    hazard_id = target_fields[hazard_id_field['key']]
-    hazard_class = target_fields[hazard_class_field['key']]
-
+    aggregation_id = source_fields[aggregation_id_field['key']]
+    hazard_id = source_fields[hazard_id_field['key']]
     exposure_class = source_fields[exposure_class_field['key']]
-    exposure_class_index = impact.fieldNameIndex(exposure_class)
-    unique_exposure = impact.uniqueValues(exposure_class_index)
 
     fields = ['aggregation_id', 'hazard_id']
     absolute_values = create_absolute_values_structure(impact, fields)
@@ -108,19 +128,40 @@ def aggregate_hazard_summary(impact, aggregate_hazard, callback=None):
     # the size, or the number of features or population.
     field_index = report_on_field(impact)
 
-    aggregate_hazard.startEditing()
-
-    shift = aggregate_hazard.fields().count()
-    add_fields(
-        aggregate_hazard,
-        absolute_values,
-        [affected_field, total_field],
-        unique_exposure,
-        exposure_count_field
-    )
-
     flat_table = FlatTable('aggregation_id', 'hazard_id', 'exposure_class')
 
+    summarization_dicts = {}
+    if summarize:
+        summarization_dicts = summarization_structure(impact)
+
+    # Groups and values are added to flat tables by chunks, in bulk.
+    aggregation_values = []
+    hazard_values = []
+    exposure_values = []
+    values = []
+    absolute = dict((field, []) for field in absolute_values)
+
+    def flush():
+        """Add the current chunk of features to the flat tables."""
+        flat_table.add_values(
+            values,
+            aggregation_id=flat_table.codes(
+                'aggregation_id', aggregation_values),
+            hazard_id=flat_table.codes('hazard_id', hazard_values),
+            exposure_class=flat_table.codes(
+                'exposure_class', exposure_values))
+        for absolute_field, field_definition in absolute_values.iteritems():
+            table = field_definition[0]
+            table.add_values(
+                absolute[absolute_field],
+                aggregation_id=table.codes(
+                    'aggregation_id', aggregation_values),
+                hazard_id=table.codes('hazard_id', hazard_values))
+            del absolute[absolute_field][:]
+        for chunk in (
+                aggregation_values, hazard_values, exposure_values, values):
+            del chunk[:]
+
     request = QgsFeatureRequest()
     request.setFlags(QgsFeatureRequest.NoGeometry)
     LOGGER.debug('Computing the aggregate hazard summary.')
@@ -139,23 +180,85 @@ def aggregate_hazard_summary(impact, aggregate_hazard, callback=None):
         if exposure_value == '' or isinstance(exposure_value, QPyNullVariant):
             exposure_value = 'NULL'
 
-        flat_table.add_value(
-            value,
-            aggregation_id=aggregation_value,
-            hazard_id=hazard_value,
-            exposure_class=exposure_value
-        )
+        values.append(value)
+        aggregation_values.append(aggregation_value)
+        hazard_values.append(hazard_value)
+        exposure_values.append(exposure_value)
 
         # We summarize every absolute values.
-        for field, field_definition in absolute_values.iteritems():
+        for field in absolute_values:
             value = feature[field]
             if value == '' or isinstance(value, QPyNullVariant):
                 value = 0
-            field_definition[0].add_value(
-                value,
-                aggregation_id=aggregation_value,
-                hazard_id=hazard_value
-            )
+            absolute[field].append(value)
+
+        if summarization_dicts:
+            summarize_feature(feature, summarization_dicts)
+
+        if len(values) >= summary_chunk_size:
+            flush()
+
+    flush()
+
+    return flat_table, absolute_values, summarization_dicts
+
+
+@profile
+def summarize_aggregate_hazard(impact, aggregate_hazard, tables):
+    """Write the summary of the impact layer to the aggregate_hazard layer.
+
+    :param impact: The impact layer.
+    :type impact: QgsVectorLayer
+
+    :param aggregate_hazard: The aggregate_hazard vector layer where to write
+        statistics.
+    :type aggregate_hazard: QgsVectorLayer
+
+    :param tables: The output of `impact_summary_tables` for this impact.
+    :type tables: tuple
+
+    :return: Tuple with the new aggregate_hazard layer and the list of its
+        attributes, see `read_areas`.
+    :rtype: (QgsVectorLayer, list)
+
+    .. versionadded:: 4.3
+    """
+    flat_table, absolute_values, _ = tables
+
+    source_fields = impact.keywords['inasafe_fields']
+    target_fields = aggregate_hazard.keywords['inasafe_fields']
+
+    target_compulsory_fields = [
+        aggregation_id_field,
+        aggregation_name_field,
+        hazard_id_field,
+        hazard_class_field
+    ]
+    check_inputs(target_compulsory_fields, target_fields)
+
+    aggregation_id = target_fields[aggregation_id_field['key']]
+
+    hazard_id = target_fields[hazard_id_field['key']]
+    hazard_class = target_fields[hazard_class_field['key']]
+
+    exposure_class = source_fields[exposure_class_field['key']]
+    exposure_class_index = impact.fieldNameIndex(exposure_class)
+    unique_exposure = impact.uniqueValues(exposure_class_index)
+
+    aggregate_hazard.startEditing()
+
+    shift = aggregate_hazard.fields().count()
+    add_fields(
+        aggregate_hazard,
+        absolute_values,
+        [affected_field, total_field],
+        unique_exposure,
+        exposure_count_field
+    )
+
+    # Fields must be in the provider before we write values in bulk.
+    aggregate_hazard.commitChanges()
+    names = [field.name() for field in aggregate_hazard.fields()]
 
     hazard_keywords = aggregate_hazard.keywords['hazard_keywords']
     hazard = hazard_keywords['hazard']
@@ -164,6 +267,10 @@ def aggregate_hazard_summary(impact, aggregate_hazard, callback=None):
     exposure_keywords = impact.keywords['exposure_keywords']
     exposure = exposure_keywords['exposure']
 
+    values = {}
+    areas = []
+    request = QgsFeatureRequest()
+    request.setFlags(QgsFeatureRequest.NoGeometry)
     for area in aggregate_hazard.getFeatures(request):
         aggregation_value = area[aggregation_id]
         feature_hazard_id = area[hazard_id]
@@ -171,6 +278,7 @@ def aggregate_hazard_summary(impact, aggregate_hazard, callback=None):
                 feature_hazard_id, QPyNullVariant):
             feature_hazard_id = not_exposed_class['key']
         feature_hazard_value = area[hazard_class]
+        attributes = {}
         total = 0
         for i, val in enumerate(unique_exposure):
             sum = flat_table.get_value(
@@ -179,7 +287,7 @@ def aggregate_hazard_summary(impact, aggregate_hazard, callback=None):
                 exposure_class=val
             )
             total += sum
-            aggregate_hazard.changeAttributeValue(area.id(), shift + i, sum)
+            attributes[shift + i] = sum
 
         affected = post_processor_affected_function(
             exposure=exposure,
@@ -187,21 +295,25 @@ def aggregate_hazard_summary(impact, aggregate_hazard, callback=None):
             classification=classification,
             hazard_class=feature_hazard_value)
         affected = tr(unicode(affected))
-        aggregate_hazard.changeAttributeValue(
-            area.id(), shift + len(unique_exposure), affected)
+        attributes[shift + len(unique_exposure)] = affected
 
-        aggregate_hazard.changeAttributeValue(
-            area.id(), shift + len(unique_exposure) + 1, total)
+        attributes[shift + len(unique_exposure) + 1] = total
 
         for i, field in enumerate(absolute_values.itervalues()):
             value = field[0].get_value(
                 aggregation_id=aggregation_value,
                 hazard_id=feature_hazard_id
             )
-            aggregate_hazard.changeAttributeValue(
-                area.id(), shift + len(unique_exposure) + 2 + i, value)
+            attributes[shift + len(unique_exposure) + 2 + i] = value
 
-    aggregate_hazard.commitChanges()
+        values[area.id()] = attributes
+
+        row = dict(zip(names, area.attributes()))
+        for index, value in attributes.iteritems():
+            row[names[index]] = value
+        areas.append(row)
+
+    write_values(aggregate_hazard, values)
 
     aggregate_hazard.keywords['title'] = (
         layer_purpose_aggregate_hazard_impacted['name'])
@@ -213,7 +325,7 @@ def aggregate_hazard_summary(impact, aggregate_hazard, callback=None):
         layer_purpose_aggregate_hazard_impacted['key'])
     aggregate_hazard.keywords['exposure_keywords'] = impact.keywords.copy()
     check_layer(aggregate_hazard)
-    return aggregate_hazard
+    return aggregate_hazard, areas
 
 
 def report_on_field(layer):
@@ -19,7 +19,12 @@ from safe.definitions.layer_purposes import (
     layer_purpose_aggregation_summary)
 from safe.gis.sanity_check import check_layer
 from safe.gis.vector.summary_tools import (
-    check_inputs, create_absolute_values_structure, add_fields)
+    check_inputs,
+    create_absolute_values_structure,
+    add_fields,
+    read_areas,
+    write_values,
+)
 from safe.gis.vector.tools import read_dynamic_inasafe_field
 from safe.utilities.gis import qgis_version
 from safe.utilities.i18n import tr
@@ -33,7 +38,8 @@ __revision__ = '$Format:%H$'
 
 
 @profile
-def aggregation_summary(aggregate_hazard, aggregation, callback=None):
+def aggregation_summary(
+        aggregate_hazard, aggregation, callback=None, areas=None):
     """Compute the summary from the aggregate hazard to the analysis layer.
 
     Source layer :
@@ -56,6 +62,10 @@ def aggregation_summary(aggregate_hazard, aggregation, callback=None):
         Defaults to None.
     :type callback: function
 
+    :param areas: The attributes of the aggregate hazard layer if they have
+        been read already, see `read_areas`.
+    :type areas: list
+
     :return: The new aggregation layer with summary.
     :rtype: QgsVectorLayer
 
@@ -92,13 +102,15 @@ def aggregation_summary(aggregate_hazard, aggregation, callback=None):
 
     aggregation_index = source_fields[aggregation_id_field['key']]
 
+    if areas is None:
+        areas = read_areas(aggregate_hazard)
+    names = [field.name() for field in aggregate_hazard.fields()]
+
     # We want to loop over affected features only.
-    request = QgsFeatureRequest()
-    request.setFlags(QgsFeatureRequest.NoGeometry)
-    expression = '\"%s\" = \'%s\'' % (
-        affected_field['field_name'], tr('True'))
-    request.setFilterExpression(expression)
-    for area in aggregate_hazard.getFeatures(request):
+    affected = tr('True')
+    for area in areas:
+        if area[affected_field['field_name']] != affected:
+            continue
 
         for key, name_field in source_fields.iteritems():
             if key.endswith(pattern):
@@ -113,7 +125,7 @@ def aggregation_summary(aggregate_hazard, aggregation, callback=None):
 
         # We summarize every absolute values.
         for field, field_definition in absolute_values.iteritems():
-            value = area[field]
+            value = area[names[field]]
             if value == '' or isinstance(value, QPyNullVariant):
                 value = 0
             field_definition[0].add_value(
@@ -132,12 +144,17 @@ def aggregation_summary(aggregate_hazard, aggregation, callback=None):
         unique_exposure,
         affected_exposure_count_field)
 
+    # Fields must be in the provider before we write values in bulk.
+    aggregation.commitChanges()
+
     aggregation_index = target_fields[aggregation_id_field['key']]
 
+    values = {}
     request = QgsFeatureRequest()
     request.setFlags(QgsFeatureRequest.NoGeometry)
     for area in aggregation.getFeatures(request):
         aggregation_value = area[aggregation_index]
+        attributes = {}
         total = 0
         for i, val in enumerate(unique_exposure):
             sum = flat_table.get_value(
@@ -145,20 +162,20 @@ def aggregation_summary(aggregate_hazard, aggregation, callback=None):
                 exposure_class=val
             )
             total += sum
-            aggregation.changeAttributeValue(area.id(), shift + i, sum)
+            attributes[shift + i] = sum
 
-        aggregation.changeAttributeValue(
-            area.id(), shift + len(unique_exposure), total)
+        attributes[shift + len(unique_exposure)] = total
 
         for i, field in enumerate(absolute_values.itervalues()):
             value = field[0].get_value(
                 aggregation_id=aggregation_value,
             )
             target_index = shift + len(unique_exposure) + 1 + i
-            aggregation.changeAttributeValue(
-                area.id(), target_index, value)
+            attributes[target_index] = value
 
-    aggregation.commitChanges()
+        values[area.id()] = attributes
+
+    write_values(aggregation, values)
 
     aggregation.keywords['title'] = layer_purpose_aggregation_summary['name']
     if qgis_version() >= 21800:
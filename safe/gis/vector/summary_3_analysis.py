@@ -26,7 +26,12 @@ from safe.definitions.processing_steps import (
     summary_3_analysis_steps)
 from safe.gis.sanity_check import check_layer
 from safe.gis.vector.summary_tools import (
-    check_inputs, create_absolute_values_structure, add_fields)
+    check_inputs,
+    create_absolute_values_structure,
+    add_fields,
+    read_areas,
+    write_values,
+)
 from safe.processors import post_processor_affected_function
 from safe.utilities.gis import qgis_version
 from safe.utilities.pivot_table import FlatTable
@@ -39,7 +44,7 @@ __revision__ = '$Format:%H$'
 
 
 @profile
-def analysis_summary(aggregate_hazard, analysis, callback=None):
+def analysis_summary(aggregate_hazard, analysis, callback=None, areas=None):
     """Compute the summary from the aggregate hazard to analysis.
 
     Source layer :
@@ -62,6 +67,10 @@ def analysis_summary(aggregate_hazard, analysis, callback=None):
         Defaults to None.
     :type callback: function
 
+    :param areas: The attributes of the aggregate hazard layer if they have
+        been read already, see `read_areas`.
+    :type areas: list
+
     :return: The new target layer with summary.
     :rtype: QgsVectorLayer
 
@@ -106,12 +115,11 @@ def analysis_summary(aggregate_hazard, analysis, callback=None):
     flat_table = FlatTable('hazard_class')
 
     # First loop over the aggregate_hazard layer
-    request = QgsFeatureRequest()
-    request.setSubsetOfAttributes(
-        [hazard_class, total], aggregate_hazard.fields())
-    request.setFlags(QgsFeatureRequest.NoGeometry)
-    for area in aggregate_hazard.getFeatures():
-        hazard_value = area[hazard_class_index]
+    if areas is None:
+        areas = read_areas(aggregate_hazard)
+    names = [field.name() for field in aggregate_hazard.fields()]
+    for area in areas:
+        hazard_value = area[hazard_class]
         value = area[total]
         if value == '' or isinstance(value, QPyNullVariant) or isnan(value):
             # For isnan, see ticket #3812
@@ -125,7 +133,7 @@ def analysis_summary(aggregate_hazard, analysis, callback=None):
 
         # We summarize every absolute values.
         for field, field_definition in absolute_values.iteritems():
-            value = area[field]
+            value = area[names[field]]
             if value == '' or isinstance(value, QPyNullVariant):
                 value = 0
             field_definition[0].add_value(
@@ -151,18 +159,25 @@ def analysis_summary(aggregate_hazard, analysis, callback=None):
         unique_hazard,
         hazard_count_field)
 
+    # Fields must be in the provider before we write values in bulk.
+    analysis.commitChanges()
+
     affected_sum = 0
     not_affected_sum = 0
     not_exposed_sum = 0
 
+    values = {}
+    request = QgsFeatureRequest()
+    request.setFlags(QgsFeatureRequest.NoGeometry)
     for area in analysis.getFeatures(request):
+        attributes = {}
         total = 0
         for i, val in enumerate(unique_hazard):
             if val == '' or isinstance(val, QPyNullVariant):
                 val = 'NULL'
             sum = flat_table.get_value(hazard_class=val)
             total += sum
-            analysis.changeAttributeValue(area.id(), shift + i, sum)
+            attributes[shift + i] = sum
 
             affected = post_processor_affected_function(
                 exposure=exposure,
@@ -177,32 +192,28 @@ def analysis_summary(aggregate_hazard, analysis, callback=None):
                 not_affected_sum += sum
 
         # Total Affected field
-        analysis.changeAttributeValue(
-            area.id(), shift + len(unique_hazard), affected_sum)
+        attributes[shift + len(unique_hazard)] = affected_sum
 
         # Total Not affected field
-        analysis.changeAttributeValue(
-            area.id(), shift + len(unique_hazard) + 1, not_affected_sum)
+        attributes[shift + len(unique_hazard) + 1] = not_affected_sum
 
         # Total Exposed field
-        analysis.changeAttributeValue(
-            area.id(), shift + len(unique_hazard) + 2, total - not_exposed_sum)
+        attributes[shift + len(unique_hazard) + 2] = total - not_exposed_sum
 
         # Total Not exposed field
-        analysis.changeAttributeValue(
-            area.id(), shift + len(unique_hazard) + 3, not_exposed_sum)
+        attributes[shift + len(unique_hazard) + 3] = not_exposed_sum
 
         # Total field
-        analysis.changeAttributeValue(
-            area.id(), shift + len(unique_hazard) + 4, total)
+        attributes[shift + len(unique_hazard) + 4] = total
 
         # Any absolute postprocessors
         for i, field in enumerate(absolute_values.itervalues()):
             value = field[0].get_value(
                 all='all'
             )
-            analysis.changeAttributeValue(
-                area.id(), shift + len(unique_hazard) + 5 + i, value)
+            attributes[shift + len(unique_hazard) + 5 + i] = value
+
+        values[area.id()] = attributes
 
     # Sanity check ± 1 to the result. Disabled for now as it seems ± 1 is not
     # enough. ET 13/02/17
@@ -211,7 +222,7 @@ def analysis_summary(aggregate_hazard, analysis, callback=None):
     # if not -1 < (total_computed - total) < 1:
     #     raise ComputationError
 
-    analysis.commitChanges()
+    write_values(analysis, values)
 
     analysis.keywords['title'] = layer_purpose_analysis_impacted['name']
     if qgis_version() >= 21600:
@@ -2,10 +2,8 @@
 
 """Aggregate the aggregate hazard to the analysis layer."""
 
-from numbers import Number
-
 from PyQt4.QtCore import QPyNullVariant
-from qgis.core import QGis, QgsFeatureRequest, QgsFeature
+from qgis.core import QGis, QgsFeature
 
 from safe.definitions.fields import (
     aggregation_id_field,
@@ -20,7 +18,6 @@ from safe.definitions.fields import (
     affected_field,
     hazard_count_field,
     exposure_count_field,
-    exposure_class_field,
     summary_rules,
 )
 from safe.definitions.hazard_classifications import not_exposed_class
@@ -31,7 +28,12 @@ from safe.definitions.processing_steps import (
 from safe.definitions.utilities import definition
 from safe.gis.sanity_check import check_layer
 from safe.gis.vector.summary_tools import (
-    check_inputs, create_absolute_values_structure)
+    check_inputs,
+    create_absolute_values_structure,
+    read_areas,
+    summarization_structure,
+    summarize_feature,
+)
 from safe.gis.vector.tools import (
     create_field_from_definition,
     read_dynamic_inasafe_field,
@@ -49,7 +51,11 @@ __revision__ = '$Format:%H$'
 
 @profile
 def exposure_summary_table(
-        aggregate_hazard, exposure_summary=None, callback=None):
+        aggregate_hazard,
+        exposure_summary=None,
+        callback=None,
+        areas=None,
+        summarization_dicts=None):
     """Compute the summary from the aggregate hazard to analysis.
 
     Source layer :
@@ -69,6 +75,14 @@ def exposure_summary_table(
         Defaults to None.
     :type callback: function
 
+    :param areas: The attributes of the aggregate hazard layer if they have
+        been read already, see `read_areas`.
+    :type areas: list
+
+    :param summarization_dicts: The summary rules of the exposure summary if
+        they have been computed already, see `summarize_result`.
+    :type summarization_dicts: dict
+
     :return: The new tabular table, without geometry.
     :rtype: QgsVectorLayer
 
@@ -101,10 +115,12 @@ def exposure_summary_table(
 
     flat_table = FlatTable('hazard_class', 'exposure_class')
 
-    request = QgsFeatureRequest()
-    request.setFlags(QgsFeatureRequest.NoGeometry)
-    for area in aggregate_hazard.getFeatures():
-        hazard_value = area[hazard_class_index]
+    if areas is None:
+        areas = read_areas(aggregate_hazard)
+    names = [field.name() for field in aggregate_hazard.fields()]
+
+    for area in areas:
+        hazard_value = area[hazard_class]
         for exposure in unique_exposure:
             key_name = exposure_count_field['key'] % exposure
             field_name = source_fields[key_name]
@@ -121,7 +137,7 @@ def exposure_summary_table(
 
         # We summarize every absolute values.
         for field, field_definition in absolute_values.iteritems():
-            value = area[field]
+            value = area[names[field]]
             if not value or isinstance(value, QPyNullVariant):
                 value = 0
             field_definition[0].add_value(
@@ -184,9 +200,10 @@ def exposure_summary_table(
     tabular.keywords['inasafe_fields'][total_field['key']] = (
         total_field['field_name'])
 
-    summarization_dicts = {}
-    if exposure_summary:
-        summarization_dicts = summarize_result(exposure_summary, callback)
+    if summarization_dicts is None:
+        summarization_dicts = {}
+        if exposure_summary:
+            summarization_dicts = summarize_result(exposure_summary, callback)
 
     sorted_keys = sorted(summarization_dicts.keys())
 
@@ -210,6 +227,9 @@ def exposure_summary_table(
             value = field_definition['field_name']
             tabular.keywords['inasafe_fields'][key] = value
 
+    tabular.commitChanges()
+
+    features = []
     for exposure_type in unique_exposure:
         feature = QgsFeature()
         attributes = [exposure_type]
@@ -252,7 +272,7 @@ def exposure_summary_table(
                 attributes.append(value)
 
         feature.setAttributes(attributes)
-        tabular.addFeature(feature)
+        features.append(feature)
 
         # Sanity check ± 1 to the result. Disabled for now as it seems ± 1 is
         # not enough. ET 13/02/17
@@ -261,7 +281,7 @@ def exposure_summary_table(
         # if not -1 < (total_computed - total) < 1:
         #     raise ComputationError
 
-    tabular.commitChanges()
+    tabular.dataProvider().addFeatures(features)
 
     tabular.keywords['title'] = layer_purpose_exposure_summary_table['name']
     if qgis_version() >= 21800:
@@ -292,35 +312,8 @@ def summarize_result(exposure_summary, callback=None):
 
     .. versionadded:: 4.2
     """
-    summarization_dicts = {}
-    summarizer_flags = {}
-
-    # for summarizer_field in summarizer_fields:
-    for key, summary_rule in summary_rules.items():
-        input_field = summary_rule['input_field']
-        if exposure_summary.fieldNameIndex(
-                input_field['field_name']) == -1:
-            summarizer_flags[key] = False
-        else:
-            summarizer_flags[key] = True
-            summarization_dicts[key] = {}
-
+    summarization_dicts = summarization_structure(exposure_summary)
     for feature in exposure_summary.getFeatures():
-        exposure_class_name = feature[exposure_class_field['field_name']]
-        # for summarizer_field in summarizer_fields:
-        for key, summary_rule in summary_rules.items():
-            input_field = summary_rule['input_field']
-            case_field = summary_rule['case_field']
-            case_value = feature[case_field['field_name']]
-
-            flag = summarizer_flags[key]
-            if not flag:
-                continue
-            if case_value in summary_rule['case_values']:
-                if exposure_class_name not in summarization_dicts[key]:
-                    summarization_dicts[key][exposure_class_name] = 0
-                value = feature[input_field['field_name']]
-                if isinstance(value, Number):
-                    summarization_dicts[key][exposure_class_name] += value
+        summarize_feature(feature, summarization_dicts)
 
     return summarization_dicts
@@ -2,10 +2,14 @@
 
 """Some helpers about the summary calculation."""
 
+from numbers import Number
+
 from PyQt4.QtCore import QPyNullVariant
+from qgis.core import QgsFeatureRequest
 
 from safe.common.exceptions import InvalidKeywordsForProcessingAlgorithm
-from safe.definitions.fields import count_fields
+from safe.definitions.fields import (
+    count_fields, exposure_class_field, summary_rules)
 from safe.definitions.utilities import definition
 from safe.gis.vector.tools import create_field_from_definition
 from safe.utilities.pivot_table import FlatTable
@@ -106,3 +110,81 @@ def add_fields(
         key = field_definition['key']
         value = field_definition['field_name']
         layer.keywords['inasafe_fields'][key] = value
+
+
+def read_areas(layer):
+    """Read the attributes of every feature of a layer.
+
+    The summaries need only a few attributes of each area. We read them once
+    and summaries can share this list instead of scanning the layer again.
+
+    :param layer: The vector layer.
+    :type layer: QgsVectorLayer
+
+    :return: List of dictionaries, field name: value, one for each feature.
+    :rtype: list
+    """
+    names = [field.name() for field in layer.fields()]
+    request = QgsFeatureRequest()
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    return [
+        dict(zip(names, feature.attributes()))
+        for feature in layer.getFeatures(request)]
+
+
+def write_values(layer, values):
+    """Write attribute values of many features at once.
+
+    Fields must be committed in the data provider before.
+
+    :param layer: The vector layer.
+    :type layer: QgsVectorLayer
+
+    :param values: Dictionary of feature ID: {field index: value}.
+    :type values: dict
+    """
+    if values:
+        layer.dataProvider().changeAttributeValues(values)
+
+
+def summarization_structure(exposure_summary):
+    """Helper function to create the structure for the summary rules.
+
+    :param exposure_summary: The layer impact layer.
+    :type exposure_summary: QgsVectorLayer
+
+    :return: Dictionary with an empty dictionary for each summary rule which
+        can be computed from this layer.
+    :rtype: dict
+    """
+    summarization_dicts = {}
+    for key, summary_rule in summary_rules.items():
+        input_field = summary_rule['input_field']
+        if exposure_summary.fieldNameIndex(
+                input_field['field_name']) != -1:
+            summarization_dicts[key] = {}
+    return summarization_dicts
+
+
+def summarize_feature(feature, summarization_dicts):
+    """Add one feature of the impact layer to the summary rules.
+
+    :param feature: The feature of the impact layer.
+    :type feature: QgsFeature
+
+    :param summarization_dicts: The structure from `summarization_structure`.
+    :type summarization_dicts: dict
+    """
+    exposure_class_name = feature[exposure_class_field['field_name']]
+    for key, summary_dict in summarization_dicts.iteritems():
+        summary_rule = summary_rules[key]
+        input_field = summary_rule['input_field']
+        case_field = summary_rule['case_field']
+        case_value = feature[case_field['field_name']]
+
+        if case_value in summary_rule['case_values']:
+            if exposure_class_name not in summary_dict:
+                summary_dict[exposure_class_name] = 0
+            value = feature[input_field['field_name']]
+            if isinstance(value, Number):
+                summary_dict[exposure_class_name] += value
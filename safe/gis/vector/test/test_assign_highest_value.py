@@ -7,10 +7,13 @@ from safe.test.utilities import (
     load_test_vector_layer)
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
 
+import numpy
 from qgis.core import QgsFeatureRequest
 
 from safe.definitions.fields import hazard_class_field
 from safe.gis.vector.assign_highest_value import assign_highest_value
+from safe.gis.vector.tools import (
+    create_packed_index, packed_index_intersects)
 
 __copyright__ = "Copyright 2016, The InaSAFE Project"
 __license__ = "GPL version 3"
@@ -66,3 +69,24 @@ class TestAssignHighestValueVector(unittest.TestCase):
             request = QgsFeatureRequest().setFilterExpression(expression)
             self.assertEqual(
                 sum(1 for _ in layer.getFeatures(request)), count)
+
+    def test_packed_index(self):
+        """Test the packed index finds the same boxes as a full scan."""
+        random = numpy.random.RandomState(0)
+        corners = random.rand(1000, 2) * 100
+        boxes = numpy.column_stack(
+            (corners, corners + random.rand(1000, 2) * 5))
+        index = create_packed_index(boxes)
+
+        for _ in range(20):
+            x, y = random.rand(2) * 100
+            box = (x, y, x + 10, y + 10)
+            expected = numpy.flatnonzero(
+                (boxes[:, 0] <= box[2]) & (boxes[:, 2] >= box[0])
+                & (boxes[:, 1] <= box[3]) & (boxes[:, 3] >= box[1]))
+            self.assertEqual(
+                sorted(packed_index_intersects(index, box)),
+                expected.tolist())
+
+        index = create_packed_index(numpy.zeros((0, 4)))
+        self.assertEqual(len(packed_index_intersects(index, box)), 0)
@@ -0,0 +1,84 @@
+# coding=utf-8
+
+import unittest
+
+from safe.test.utilities import get_qgis_app
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+from qgis.core import (
+    QGis, QgsCoordinateReferenceSystem, QgsFeature, QgsGeometry)
+
+from safe.gis.vector.clean_geometry import (
+    clean_layer, has_valid_geometries, _check_chunk)
+from safe.gis.vector.tools import create_memory_layer
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+# A square and a self-intersecting polygon.
+valid_polygon = 'POLYGON((0 0, 1 0, 1 1, 0 1, 0 0))'
+invalid_polygon = 'POLYGON((0 0, 1 1, 1 0, 0 1, 0 0))'
+
+
+class TestCleanGeometry(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    @staticmethod
+    def polygon_layer(polygons):
+        """Create a memory layer with some polygons."""
+        layer = create_memory_layer(
+            'polygons', QGis.Polygon, QgsCoordinateReferenceSystem(4326))
+        features = []
+        for polygon in polygons:
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry.fromWkt(polygon))
+            features.append(feature)
+        layer.dataProvider().addFeatures(features)
+        layer.keywords = {'layer_purpose': 'hazard'}
+        return layer
+
+    def test_clean_layer(self):
+        """Test invalid geometries are repaired in the layer."""
+        layer = self.polygon_layer([valid_polygon, invalid_polygon])
+        self.assertFalse(has_valid_geometries(layer))
+
+        cleaned = clean_layer(layer, processes=1)
+        self.assertTrue(has_valid_geometries(cleaned))
+        self.assertEqual(cleaned.featureCount(), 2)
+        for feature in cleaned.getFeatures():
+            self.assertTrue(feature.geometry().isGeosValid())
+
+        # The layer is flagged as valid, it is not checked again.
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromWkt(invalid_polygon))
+        layer.dataProvider().addFeatures([feature])
+        cleaned = clean_layer(layer, processes=1)
+        valid = [f.geometry().isGeosValid() for f in cleaned.getFeatures()]
+        self.assertEqual(valid.count(False), 1)
+
+    def test_check_chunk(self):
+        """Test geometries are checked and repaired with OGR."""
+        chunk = [
+            (1, QgsGeometry.fromWkt(valid_polygon).asWkb()),
+            (2, QgsGeometry.fromWkt(invalid_polygon).asWkb()),
+        ]
+        valid_count, repaired, removed = _check_chunk(chunk)
+        self.assertEqual(valid_count, 1)
+        self.assertEqual([feature_id for feature_id, _ in repaired], [2])
+        self.assertEqual(removed, [])
+
+        geometry = QgsGeometry()
+        geometry.fromWkb(repaired[0][1])
+        self.assertTrue(geometry.isGeosValid())
+        self.assertEqual(geometry.type(), QGis.Polygon)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -35,5 +35,28 @@ class TestClipVector(unittest.TestCase):
         layer = clip(exposure, aggregation)
         self.assertEqual(layer.featureCount(), 9)
 
+    def test_clip_vector_in_place(self):
+        """Test we can clip a memory layer without copying it."""
+        aggregation = load_test_vector_layer(
+            'gisv4', 'aggregation', 'small_grid.geojson')
+
+        exposure = load_test_vector_layer(
+            'gisv4', 'exposure', 'buildings.geojson')
+        expected = clip(exposure, aggregation)
+
+        exposure = load_test_vector_layer(
+            'gisv4', 'exposure', 'buildings.geojson', clone_to_memory=True)
+        layer = clip(exposure, aggregation, in_place=True)
+        self.assertIs(layer, exposure)
+        self.assertEqual(layer.featureCount(), expected.featureCount())
+
+        expected_areas = sorted(
+            round(feature.geometry().area(), 10)
+            for feature in expected.getFeatures())
+        areas = sorted(
+            round(feature.geometry().area(), 10)
+            for feature in layer.getFeatures())
+        self.assertEqual(areas, expected_areas)
+
         # Add test about keywords
         # todo
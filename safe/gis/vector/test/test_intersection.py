@@ -45,3 +45,26 @@ class TestIntersectionVector(unittest.TestCase):
             aggregation.fields().count() + exposure.fields().count(),
             layer.fields().count()
         )
+
+    def test_intersection_progress(self):
+        """Test the intersection reports its progress for each feature."""
+        exposure = load_test_vector_layer(
+            'gisv4', 'exposure', 'roads.geojson')
+        aggregation = load_test_vector_layer(
+            'gisv4', 'hazard', 'classified_vector.geojson')
+        aggregation.keywords = {
+            'aggregation_keywords': {},
+            'hazard_keywords': {},
+            'inasafe_fields': {}
+        }
+
+        steps = []
+
+        def callback(current, maximum, step):
+            steps.append((current, maximum))
+
+        intersection(exposure, aggregation, callback=callback)
+
+        self.assertEqual(len(steps), exposure.featureCount())
+        self.assertEqual(steps[-1], (
+            exposure.featureCount() - 1, exposure.featureCount()))
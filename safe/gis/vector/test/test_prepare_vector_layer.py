@@ -98,6 +98,23 @@ class TestPrepareLayer(unittest.TestCase):
             cleaned.fieldNameIndex(exposure_type_field['field_name']),
             [0, 1, 2])
 
+    def test_prepare_layer_in_place(self):
+        """Test we can prepare a memory layer without copying it."""
+        layer = load_test_vector_layer(
+            'exposure', 'building-points.shp', clone_to_memory=True)
+        keywords = layer.keywords
+        cleaned = prepare_vector_layer(layer, in_place=True)
+
+        self.assertIs(cleaned, layer)
+        self.assertEqual(len(cleaned.fields().toList()), 2)
+        self.assertGreater(
+            cleaned.fieldNameIndex(exposure_id_field['field_name']), -1)
+
+        # The keywords of the input are not modified.
+        self.assertIsNot(cleaned.keywords, keywords)
+        self.assertNotIn(
+            exposure_id_field['key'], keywords['inasafe_fields'])
+
     def test_size_needed(self):
         """Test we can add the size when it is needed."""
         # A building layer should be always false.
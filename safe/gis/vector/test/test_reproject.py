@@ -2,14 +2,18 @@
 
 import unittest
 
+import mock
+
 from safe.test.utilities import (
     get_qgis_app,
     load_test_vector_layer)
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
 
-from qgis.core import QgsCoordinateReferenceSystem
+from qgis.core import (
+    QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsGeometry)
 
-from safe.gis.vector.reproject import reproject
+from safe.gis.vector.reproject import (
+    reproject, equivalent_crs, wkb_coordinates)
 
 __copyright__ = "Copyright 2016, The InaSAFE Project"
 __license__ = "GPL version 3"
@@ -38,3 +42,65 @@ class TestReprojectVector(unittest.TestCase):
         self.assertEqual(
             reprojected.featureCount(), layer.featureCount())
         self.assertDictEqual(layer.keywords, reprojected.keywords)
+
+    def test_bulk_reprojection(self):
+        """Test coordinates are the same as the transformation from QGIS."""
+        layer = load_test_vector_layer('exposure', 'buildings.shp')
+        output_crs = QgsCoordinateReferenceSystem(3857)
+        reprojected = reproject(layer=layer, output_crs=output_crs)
+
+        crs_transform = QgsCoordinateTransform(layer.crs(), output_crs)
+        for feature, reprojected_feature in zip(
+                layer.getFeatures(), reprojected.getFeatures()):
+            expected = QgsGeometry(feature.geometry())
+            expected.transform(crs_transform)
+            self.assertTrue(
+                reprojected_feature.geometry().isGeosEqual(expected)
+                or reprojected_feature.geometry().hausdorffDistance(
+                    expected) < 0.001)
+
+    def test_reprojection_without_osr(self):
+        """Test geometries are transformed by QGIS if OSR fails."""
+        layer = load_test_vector_layer('exposure', 'buildings.shp')
+        output_crs = QgsCoordinateReferenceSystem(3857)
+        with mock.patch(
+                'safe.gis.vector.reproject.coordinate_transformation',
+                return_value=None):
+            reprojected = reproject(layer=layer, output_crs=output_crs)
+
+        crs_transform = QgsCoordinateTransform(layer.crs(), output_crs)
+        for feature, reprojected_feature in zip(
+                layer.getFeatures(), reprojected.getFeatures()):
+            expected = QgsGeometry(feature.geometry())
+            expected.transform(crs_transform)
+            self.assertTrue(
+                reprojected_feature.geometry().isGeosEqual(expected))
+
+    def test_equivalent_crs(self):
+        """Test we do not transform coordinates between equivalent CRS."""
+        web_mercator = QgsCoordinateReferenceSystem('EPSG:3857')
+        google_mercator = QgsCoordinateReferenceSystem('EPSG:900913')
+        self.assertTrue(equivalent_crs(web_mercator, web_mercator))
+        self.assertTrue(equivalent_crs(web_mercator, google_mercator))
+        self.assertFalse(equivalent_crs(
+            web_mercator, QgsCoordinateReferenceSystem('EPSG:4326')))
+
+        layer = load_test_vector_layer('exposure', 'buildings.shp')
+        reprojected = reproject(layer, layer.crs())
+        for feature, reprojected_feature in zip(
+                layer.getFeatures(), reprojected.getFeatures()):
+            self.assertEqual(
+                feature.geometry().exportToWkt(),
+                reprojected_feature.geometry().exportToWkt())
+
+    def test_wkb_coordinates(self):
+        """Test we can find coordinates in a WKB."""
+        geometry = QgsGeometry.fromWkt(
+            'MULTIPOLYGON(((0 0, 1 0, 1 1, 0 0)),'
+            '((2 2, 3 2, 3 3, 2 2), (2.1 2.1, 2.2 2.1, 2.2 2.2, 2.1 2.1)))')
+        wkb = bytearray(geometry.asWkb())
+        sequences, dimension, has_z, end = wkb_coordinates(wkb)
+        self.assertEqual([count for _, count in sequences], [4, 4, 4])
+        self.assertEqual(dimension, 2)
+        self.assertFalse(has_z)
+        self.assertEqual(end, len(wkb))
@@ -17,11 +17,14 @@ from safe.definitions.fields import (
 )
 from safe.gis.vector.tools import read_dynamic_inasafe_field
 from safe.gis.vector.summary_1_aggregate_hazard import (
-    aggregate_hazard_summary)
+    aggregate_hazard_summary,
+    impact_summary_tables,
+    summarize_aggregate_hazard)
 from safe.gis.vector.summary_2_aggregation import aggregation_summary
 from safe.gis.vector.summary_3_analysis import analysis_summary
 from safe.gis.vector.summary_4_exposure_summary_table import (
     exposure_summary_table, summarize_result)
+from safe.gis.vector.summary_tools import read_areas
 from safe.gis.vector.summary_5_multi_exposure import (
     multi_exposure_aggregation_summary, multi_exposure_analysis_summary)
 from safe.gis.sanity_check import check_inasafe_fields
@@ -84,6 +87,56 @@ class TestSummary(unittest.TestCase):
             len(unique_exposure) + number_of_fields + 3
         )
 
+    def test_summary_areas(self):
+        """Test summaries can share one scan of the impact layer."""
+        impact = load_test_vector_layer(
+            'gisv4',
+            'impacts',
+            'building-points-classified-vector.geojson')
+
+        aggregate_hazard = load_test_vector_layer(
+            'gisv4',
+            'intermediate',
+            'aggregate_classified_hazard.geojson',
+            clone=True)
+
+        aggregate_hazard.keywords['hazard_keywords'] = {
+            'hazard': 'generic',
+            'classification': 'generic_hazard_classes'
+        }
+        impact.keywords['exposure_keywords'] = {
+            'exposure': 'structure'
+        }
+
+        tables = impact_summary_tables(impact, summarize=True)
+        self.assertEqual(tables[2], summarize_result(impact))
+
+        layer, areas = summarize_aggregate_hazard(
+            impact, aggregate_hazard, tables)
+        check_inasafe_fields(layer)
+
+        # Areas in memory are the same as the attribute table.
+        expected = read_areas(layer)
+        self.assertEqual(len(areas), len(expected))
+        total = layer.keywords['inasafe_fields'][total_field['key']]
+        for area, expected_area in zip(areas, expected):
+            self.assertEqual(
+                sorted(area.keys()), sorted(expected_area.keys()))
+            self.assertAlmostEqual(area[total], expected_area[total])
+
+        # Summaries from these areas are the same as the ones from the layer.
+        analysis = load_test_vector_layer(
+            'gisv4', 'intermediate', 'analysis.geojson', clone=True)
+        analysis_from_areas = load_test_vector_layer(
+            'gisv4', 'intermediate', 'analysis.geojson', clone=True)
+        analysis = analysis_summary(layer, analysis)
+        analysis_from_areas = analysis_summary(
+            layer, analysis_from_areas, areas=areas)
+        for feature, expected_feature in zip(
+                analysis_from_areas.getFeatures(), analysis.getFeatures()):
+            self.assertEqual(
+                feature.attributes(), expected_feature.attributes())
+
     def test_aggregation_summary(self):
         """Test we can aggregate the aggregate hazard to the aggregation."""
         aggregate_hazard = load_test_vector_layer(
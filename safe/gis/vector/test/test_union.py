@@ -8,7 +8,7 @@ from safe.test.utilities import (
 from safe.gis.vector.clean_geometry import clean_layer
 QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
 
-from safe.gis.vector.union import union
+from safe.gis.vector.union import union, tiled_union
 from safe.definitions.fields import hazard_class_field, hazard_value_field
 
 __copyright__ = "Copyright 2016, The InaSAFE Project"
@@ -44,6 +44,32 @@ class TestUnionVector(unittest.TestCase):
             layer.fields().count()
         )
 
+    def test_tiled_union(self):
+        """Test the tiled union gives the same features as the union."""
+        union_a = load_test_vector_layer(
+            'gisv4', 'hazard', 'classified_vector.geojson')
+        union_a.keywords['inasafe_fields'][hazard_class_field['key']] = (
+            union_a.keywords['inasafe_fields'][hazard_value_field['key']])
+        union_b = load_test_vector_layer(
+            'gisv4', 'aggregation', 'small_grid.geojson')
+        expected = union(union_a, union_b)
+
+        def areas(layer):
+            """Sorted area of each feature, with its attributes."""
+            return sorted(
+                (feature.attributes(), round(feature.geometry().area(), 8))
+                for feature in layer.getFeatures())
+
+        # Tiles are computed in the current process.
+        layer = tiled_union(union_a, union_b, tiles=9, processes=1)
+        self.assertEqual(
+            layer.fields().count(), expected.fields().count())
+        self.assertEqual(areas(layer), areas(expected))
+
+        # And in worker processes.
+        layer = tiled_union(union_a, union_b, tiles=9, processes=2)
+        self.assertEqual(areas(layer), areas(expected))
+
     @unittest.expectedFailure
     def test_union_error(self):
         """Test we can union two layers like hazard and aggregation (2)."""
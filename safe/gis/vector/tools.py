@@ -3,9 +3,10 @@
 """Tools for vector layers."""
 
 import logging
-from math import isnan
+from math import isnan, ceil, sqrt
 from uuid import uuid4
 
+import numpy
 from PyQt4.QtCore import QPyNullVariant
 from qgis.core import (
     QgsGeometry,
@@ -296,6 +297,84 @@ def create_spatial_index(layer):
     return spatial_index
 
 
+def create_packed_index(boxes, node_capacity=16):
+    """Pack bounding boxes in a read only Sort-Tile-Recursive tree.
+
+    The tree is only made of numpy arrays: boxes are sorted so that each
+    node holds `node_capacity` consecutive boxes of the level below. It is
+    much smaller than a QgsSpatialIndex for millions of features.
+
+    :param boxes: Array of (x min, y min, x max, y max) with one row by box.
+    :type boxes: numpy.ndarray
+
+    :param node_capacity: Number of children of each node.
+    :type node_capacity: int
+
+    :return: Tuple with the order of the boxes in the tree and the list of
+        levels, from the boxes to the root. Each level is an array of boxes.
+    :rtype: (numpy.ndarray, list)
+
+    .. versionadded:: 4.3
+    """
+    count = len(boxes)
+    if not count:
+        return numpy.zeros(0, dtype=int), [numpy.zeros((0, 4))]
+
+    # Sort by x, cut in vertical slices, then sort each slice by y.
+    leaves = int(ceil(float(count) / node_capacity))
+    slice_size = int(ceil(sqrt(leaves))) * node_capacity
+    x_order = numpy.argsort(boxes[:, 0] + boxes[:, 2], kind='mergesort')
+    slices = numpy.arange(count) // slice_size
+    y_centers = (boxes[x_order, 1] + boxes[x_order, 3])
+    order = x_order[numpy.lexsort((y_centers, slices))]
+
+    levels = [boxes[order]]
+    while len(levels[-1]) > node_capacity:
+        children = levels[-1]
+        starts = numpy.arange(0, len(children), node_capacity)
+        levels.append(numpy.column_stack([
+            numpy.minimum.reduceat(children[:, 0], starts),
+            numpy.minimum.reduceat(children[:, 1], starts),
+            numpy.maximum.reduceat(children[:, 2], starts),
+            numpy.maximum.reduceat(children[:, 3], starts),
+        ]))
+    return order, levels
+
+
+def packed_index_intersects(index, box, node_capacity=16):
+    """List the boxes of a packed index intersecting a box.
+
+    :param index: The index from `create_packed_index`.
+    :type index: tuple
+
+    :param box: The box as (x min, y min, x max, y max).
+    :type box: tuple
+
+    :param node_capacity: Number of children of each node, the same as for
+        the creation of the index.
+    :type node_capacity: int
+
+    :return: The positions of the boxes in the array used to create the
+        index.
+    :rtype: numpy.ndarray
+    """
+    order, levels = index
+    x_min, y_min, x_max, y_max = box
+    candidates = numpy.arange(len(levels[-1]))
+    for depth in range(len(levels) - 1, -1, -1):
+        boxes = levels[depth][candidates]
+        candidates = candidates[
+            (boxes[:, 0] <= x_max) & (boxes[:, 2] >= x_min) &
+            (boxes[:, 1] <= y_max) & (boxes[:, 3] >= y_min)]
+        if depth:
+            # Replace each node by its children.
+            candidates = (
+                candidates[:, numpy.newaxis] * node_capacity +
+                numpy.arange(node_capacity)).ravel()
+            candidates = candidates[candidates < len(levels[depth - 1])]
+    return order[candidates]
+
+
 def create_field_from_definition(field_definition, name=None, sub_name=None):
     """Helper to create a field from definition.
 
@@ -3,20 +3,25 @@
 """Clip and mask a hazard layer."""
 
 import logging
+import math
 
+from osgeo import ogr
 from PyQt4.QtCore import QPyNullVariant
 from qgis.core import (
     QgsGeometry,
     QgsFeatureRequest,
+    QgsRectangle,
     QgsWKBTypes,
     QgsFeature,
 )
 
+from safe.common.utilities import process_pool
 from safe.definitions.fields import hazard_class_field, aggregation_id_field
 from safe.definitions.hazard_classifications import not_exposed_class
 from safe.definitions.processing_steps import union_steps
 from safe.gis.sanity_check import check_layer
-from safe.gis.vector.clean_geometry import geometry_checker
+from safe.gis.vector.clean_geometry import (
+    geometry_checker, layer_geometry_checker, set_valid_geometries)
 from safe.gis.vector.tools import (
     create_memory_layer, wkb_type_groups, create_spatial_index)
 from safe.utilities.i18n import tr
@@ -30,6 +35,9 @@ __revision__ = '$Format:%H$'
 
 LOGGER = logging.getLogger('InaSAFE')
 
+# Number of tiles by worker process in the tiled union.
+tiles_per_process = 4
+
 
 @profile
 def union(union_a, union_b, callback=None):
@@ -57,38 +65,7 @@ def union(union_a, union_b, callback=None):
 
     .. versionadded:: 4.0
     """
-    output_layer_name = union_steps['output_layer_name']
-    processing_step = union_steps['step_name']  # NOQA
-    output_layer_name = output_layer_name % (
-        union_a.keywords['layer_purpose'],
-        union_b.keywords['layer_purpose']
-    )
-
-    fields = union_a.fields()
-    fields.extend(union_b.fields())
-
-    writer = create_memory_layer(
-        output_layer_name,
-        union_a.geometryType(),
-        union_a.crs(),
-        fields
-    )
-    keywords_union_1 = union_a.keywords
-    keywords_union_2 = union_b.keywords
-    inasafe_fields_union_1 = keywords_union_1['inasafe_fields']
-    inasafe_fields_union_2 = keywords_union_2['inasafe_fields']
-    inasafe_fields = inasafe_fields_union_1
-    inasafe_fields.update(inasafe_fields_union_2)
-
-    # use to avoid modifying original source
-    writer.keywords = dict(union_a.keywords)
-    writer.keywords['inasafe_fields'] = inasafe_fields
-    writer.keywords['title'] = output_layer_name
-    writer.keywords['layer_purpose'] = 'aggregate_hazard'
-    writer.keywords['hazard_keywords'] = keywords_union_1.copy()
-    writer.keywords['aggregation_keywords'] = keywords_union_2.copy()
-    skip_field = inasafe_fields_union_2[aggregation_id_field['key']]
-    not_null_field_index = writer.fieldNameIndex(skip_field)
+    writer, not_null_field_index = _union_writer(union_a, union_b)
 
     writer.startEditing()
 
@@ -100,6 +77,10 @@ def union(union_a, union_b, callback=None):
     index_a = create_spatial_index(union_b)
     index_b = create_spatial_index(union_a)
 
+    # Input geometries are not checked again if the layer is already valid.
+    checker_a = layer_geometry_checker(union_a)
+    checker_b = layer_geometry_checker(union_b)
+
     count = 0
     n_element = 0
     # Todo fix callback
@@ -108,7 +89,7 @@ def union(union_a, union_b, callback=None):
         # progress.setPercentage(nElement / float(nFeat) * 50)
         n_element += 1
         list_intersecting_b = []
-        geom = geometry_checker(in_feat_a.geometry())
+        geom = checker_a(in_feat_a.geometry())
         at_map_a = in_feat_a.attributes()
         intersects = index_a.intersects(geom.boundingBox())
         if len(intersects) < 1:
@@ -130,7 +111,7 @@ def union(union_a, union_b, callback=None):
                 count += 1
 
                 at_map_b = in_feat_b.attributes()
-                tmp_geom = geometry_checker(in_feat_b.geometry())
+                tmp_geom = checker_b(in_feat_b.geometry())
 
                 if engine.intersects(tmp_geom.geometry()):
                     int_geom = geometry_checker(geom.intersection(tmp_geom))
@@ -224,7 +205,7 @@ def union(union_a, union_b, callback=None):
     # nFeat = len(union_b.getFeatures())
     for in_feat_a in union_b.getFeatures():
         # progress.setPercentage(nElement / float(nFeat) * 100)
-        geom = geometry_checker(in_feat_a.geometry())
+        geom = checker_b(in_feat_a.geometry())
         atMap = [None] * length
         atMap.extend(in_feat_a.attributes())
         intersects = index_b.intersects(geom.boundingBox())
@@ -233,7 +214,7 @@ def union(union_a, union_b, callback=None):
         for id in intersects:
             request = QgsFeatureRequest().setFilterFid(id)
             inFeatB = union_a.getFeatures(request).next()
-            tmpGeom = QgsGeometry(geometry_checker(inFeatB.geometry()))
+            tmpGeom = QgsGeometry(checker_a(inFeatB.geometry()))
 
             if geom.intersects(tmpGeom):
                 lstIntersectingA.append(tmpGeom)
@@ -276,6 +257,326 @@ def union(union_a, union_b, callback=None):
     return writer
 
 
+def _union_writer(union_a, union_b):
+    """Create the empty output layer of the union of two layers.
+
+    :param union_a: The vector layer for the union.
+    :type union_a: QgsVectorLayer
+
+    :param union_b: The vector layer for the union.
+    :type union_b: QgsVectorLayer
+
+    :return: Tuple with the output layer and the index of the aggregation ID
+        field, which must not be null.
+    :rtype: (QgsVectorLayer, int)
+    """
+    output_layer_name = union_steps['output_layer_name']
+    output_layer_name = output_layer_name % (
+        union_a.keywords['layer_purpose'],
+        union_b.keywords['layer_purpose']
+    )
+
+    fields = union_a.fields()
+    fields.extend(union_b.fields())
+
+    writer = create_memory_layer(
+        output_layer_name,
+        union_a.geometryType(),
+        union_a.crs(),
+        fields
+    )
+    keywords_union_1 = union_a.keywords
+    keywords_union_2 = union_b.keywords
+    inasafe_fields_union_1 = keywords_union_1['inasafe_fields']
+    inasafe_fields_union_2 = keywords_union_2['inasafe_fields']
+    inasafe_fields = inasafe_fields_union_1
+    inasafe_fields.update(inasafe_fields_union_2)
+
+    # use to avoid modifying original source
+    writer.keywords = dict(union_a.keywords)
+    writer.keywords['inasafe_fields'] = inasafe_fields
+    writer.keywords['title'] = output_layer_name
+    writer.keywords['layer_purpose'] = 'aggregate_hazard'
+    writer.keywords['hazard_keywords'] = keywords_union_1.copy()
+    writer.keywords['aggregation_keywords'] = keywords_union_2.copy()
+    skip_field = inasafe_fields_union_2[aggregation_id_field['key']]
+    not_null_field_index = writer.fieldNameIndex(skip_field)
+    return writer, not_null_field_index
+
+
+@profile
+def tiled_union(union_a, union_b, callback=None, tiles=None, processes=1):
+    """Union of two vector layers, computed by tiles in worker processes.
+
+    The extent of union_b is split in a grid of tiles. Each tile is processed
+    in a worker process with OGR on WKB geometries, then the pieces of each
+    pair of features are merged back together. Like the union, parts of
+    union_a outside of union_b are not kept as they don't have any
+    aggregation ID.
+
+    :param union_a: The vector layer for the union, usually the hazard.
+    :type union_a: QgsVectorLayer
+
+    :param union_b: The vector layer for the union, usually the aggregation.
+    :type union_b: QgsVectorLayer
+
+    :param callback: A function to all to indicate progress. The function
+        should accept params 'current' (int), 'maximum' (int) and 'step' (str).
+        Defaults to None.
+    :type callback: function
+
+    :param tiles: Number of tiles. Defaults to a few tiles by process.
+    :type tiles: int
+
+    :param processes: Number of worker processes. With one process, the
+        default, tiles are processed in the current process.
+    :type processes: int
+
+    :return: The union vector layer.
+    :rtype: QgsVectorLayer
+
+    .. versionadded:: 4.3
+    """
+    processing_step = union_steps['step_name']
+    processes = max(1, processes or 1)
+    if not tiles:
+        tiles = processes * tiles_per_process
+
+    writer, not_null_field_index = _union_writer(union_a, union_b)
+
+    features_a = _read_features(union_a)
+    features_b = _read_features(union_b)
+
+    extent = QgsRectangle()
+    extent.setMinimal()
+    for geometry, _ in features_b.itervalues():
+        extent.combineExtentWith(geometry.boundingBox())
+
+    jobs = []
+    for tile in _grid(extent, tiles):
+        job_a = _tile_features(features_a, tile)
+        job_b = _tile_features(features_b, tile)
+        if job_b:
+            tile_wkb = QgsGeometry.fromRect(tile).asWkb()
+            jobs.append((tile_wkb, job_a, job_b))
+
+    if processes > 1 and len(jobs) > 1:
+        pool = process_pool(min(processes, len(jobs)))
+        results = pool.imap_unordered(_union_tile, jobs)
+    else:
+        pool = None
+        results = (_union_tile(job) for job in jobs)
+
+    pieces = {}
+    try:
+        for i, result in enumerate(results):
+            if callback:
+                callback(current=i, maximum=len(jobs), step=processing_step)
+            for fid_a, fid_b, wkb in result:
+                pieces.setdefault((fid_a, fid_b), []).append(wkb)
+    finally:
+        # All results have been read, or the workers must be stopped, for
+        # instance if the analysis has been cancelled by the callback.
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    # Stitch the pieces of each pair of features from the different tiles.
+    length = len(union_a.fields())
+    out_features = []
+    for (fid_a, fid_b) in sorted(pieces.keys()):
+        geometries = []
+        for wkb in pieces[(fid_a, fid_b)]:
+            geometry = QgsGeometry()
+            geometry.fromWkb(wkb)
+            geometries.append(geometry)
+        if len(geometries) == 1:
+            geometry = geometries[0]
+        else:
+            geometry = QgsGeometry.unaryUnion(geometries)
+        geometry = geometry_checker(geometry)
+        if geometry is None or geometry.isGeosEmpty():
+            continue
+
+        if fid_a is None:
+            attributes = [None] * length
+        else:
+            attributes = list(features_a[fid_a][1])
+        attributes.extend(features_b[fid_b][1])
+
+        if writer.geometryType() != geometry.type():
+            continue
+        compulsary_field = attributes[not_null_field_index]
+        if not compulsary_field or isinstance(
+                compulsary_field, QPyNullVariant):
+            continue
+
+        out_feature = QgsFeature()
+        out_feature.setGeometry(geometry)
+        out_feature.setAttributes(attributes)
+        out_features.append(out_feature)
+
+    writer.dataProvider().addFeatures(out_features)
+    writer.updateExtents()
+    # All geometries have been checked above.
+    set_valid_geometries(writer)
+
+    fill_hazard_class(writer)
+
+    check_layer(writer)
+    return writer
+
+
+def _read_features(layer):
+    """Read valid geometries and attributes of a layer.
+
+    :param layer: The vector layer.
+    :type layer: QgsVectorLayer
+
+    :return: Dictionary of feature ID to (geometry, attributes).
+    :rtype: dict
+    """
+    checker = layer_geometry_checker(layer)
+    features = {}
+    for feature in layer.getFeatures():
+        geometry = checker(feature.geometry())
+        if geometry is None or geometry.isGeosEmpty():
+            continue
+        features[feature.id()] = (geometry, feature.attributes())
+    return features
+
+
+def _grid(extent, tiles):
+    """Split an extent in a grid of about `tiles` tiles.
+
+    :param extent: The extent to split.
+    :type extent: QgsRectangle
+
+    :param tiles: The number of tiles wanted.
+    :type tiles: int
+
+    :return: The list of tiles.
+    :rtype: list
+    """
+    columns = max(1, int(math.ceil(math.sqrt(tiles))))
+    rows = max(1, int(math.ceil(float(tiles) / columns)))
+    width = extent.width() / columns
+    height = extent.height() / rows
+
+    grid = []
+    for row in range(rows):
+        for column in range(columns):
+            x_min = extent.xMinimum() + column * width
+            y_min = extent.yMinimum() + row * height
+            # The last tiles are snapped to the extent to avoid any gap.
+            if column == columns - 1:
+                x_max = extent.xMaximum()
+            else:
+                x_max = x_min + width
+            if row == rows - 1:
+                y_max = extent.yMaximum()
+            else:
+                y_max = y_min + height
+            grid.append(QgsRectangle(x_min, y_min, x_max, y_max))
+    return grid
+
+
+def _tile_features(features, tile):
+    """List the features touching a tile, as WKB.
+
+    :param features: Dictionary from `_read_features`.
+    :type features: dict
+
+    :param tile: The tile.
+    :type tile: QgsRectangle
+
+    :return: List of (feature ID, WKB).
+    :rtype: list
+    """
+    return [
+        (fid, geometry.asWkb())
+        for fid, (geometry, _) in features.iteritems()
+        if geometry.boundingBox().intersects(tile)]
+
+
+def _polygons(geometry):
+    """Keep only the polygonal part of an OGR geometry.
+
+    :param geometry: The OGR geometry.
+    :type geometry: ogr.Geometry
+
+    :return: The polygon or multipolygon, None if there is no polygon.
+    :rtype: ogr.Geometry
+    """
+    if geometry is None or geometry.IsEmpty():
+        return None
+    flat_type = ogr.GT_Flatten(geometry.GetGeometryType())
+    if flat_type in (ogr.wkbPolygon, ogr.wkbMultiPolygon):
+        return geometry
+    if flat_type != ogr.wkbGeometryCollection:
+        return None
+    multi_polygon = ogr.Geometry(ogr.wkbMultiPolygon)
+    for i in range(geometry.GetGeometryCount()):
+        part = _polygons(geometry.GetGeometryRef(i))
+        if part is None:
+            continue
+        if ogr.GT_Flatten(part.GetGeometryType()) == ogr.wkbPolygon:
+            multi_polygon.AddGeometry(part)
+        else:
+            for j in range(part.GetGeometryCount()):
+                multi_polygon.AddGeometry(part.GetGeometryRef(j))
+    if multi_polygon.IsEmpty():
+        return None
+    return multi_polygon
+
+
+def _union_tile(job):
+    """Union of two sets of polygons inside a tile.
+
+    This function runs in a worker process, so it only uses OGR and WKB.
+
+    :param job: Tuple with the WKB of the tile, the list of (ID, WKB) of
+        the features from union_a and the same for union_b.
+    :type job: tuple
+
+    :return: List of (ID A, ID B, WKB) for each piece. ID A is None for the
+        part of a feature B which is not covered by any feature A.
+    :rtype: list
+    """
+    tile_wkb, features_a, features_b = job
+    tile = ogr.CreateGeometryFromWkb(tile_wkb)
+
+    clipped_a = []
+    for fid, wkb in features_a:
+        geometry = _polygons(
+            tile.Intersection(ogr.CreateGeometryFromWkb(wkb)))
+        if geometry is not None:
+            clipped_a.append((fid, geometry, geometry.GetEnvelope()))
+
+    pieces = []
+    for fid_b, wkb in features_b:
+        geometry_b = _polygons(
+            tile.Intersection(ogr.CreateGeometryFromWkb(wkb)))
+        if geometry_b is None:
+            continue
+        x_min, x_max, y_min, y_max = geometry_b.GetEnvelope()
+        remaining = geometry_b
+        for fid_a, geometry_a, envelope in clipped_a:
+            if envelope[0] > x_max or envelope[1] < x_min \
+                    or envelope[2] > y_max or envelope[3] < y_min:
+                continue
+            if not geometry_b.Intersects(geometry_a):
+                continue
+            piece = _polygons(geometry_b.Intersection(geometry_a))
+            if piece is not None:
+                pieces.append((fid_a, fid_b, piece.ExportToWkb()))
+            if remaining is not None:
+                remaining = _polygons(remaining.Difference(geometry_a))
+        if remaining is not None:
+            pieces.append((None, fid_b, remaining.ExportToWkb()))
+    return pieces
+
+
 def _write_feature(attributes, geometry, writer, not_null_field_index):
     """
     Internal function to write the feature to the output.
@@ -6,7 +6,7 @@ import os
 from collections import OrderedDict
 from copy import deepcopy
 
-from PyQt4.QtCore import QDir, Qt
+from PyQt4.QtCore import QDir, QFileInfo, Qt
 from PyQt4.QtXml import QDomDocument
 from qgis.core import (
     QGis,
@@ -112,8 +112,8 @@ def generate_report(impact_function, iface):
 
         # no other option for now
         # TODO: retrieve the information from data store
-        if isinstance(impact_function.datastore.uri, QDir):
-            layer_dir = impact_function.datastore.uri.absolutePath()
+        if isinstance(impact_function.datastore.uri, (QDir, QFileInfo)):
+            layer_dir = impact_function.datastore.uri_path
         else:
             # No other way for now
             return
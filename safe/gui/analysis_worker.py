@@ -0,0 +1,147 @@
+# coding=utf-8
+
+"""Run an impact function outside of the main thread."""
+
+import logging
+import sys
+
+from PyQt4.QtCore import QCoreApplication, QEventLoop, QThread, pyqtSignal
+
+from safe.common.exceptions import AnalysisCancelledError
+from safe.definitions.constants import ANALYSIS_SUCCESS
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+LOGGER = logging.getLogger('InaSAFE')
+
+
+class AnalysisWorker(QThread):
+
+    """Thread running an impact function or a multi exposure impact function.
+
+    The progress of each step is sent with the progress signal, which is
+    received in the main thread. The analysis can be cancelled between two
+    steps. Output layers are moved to the main thread at the end, so they
+    can be added to the map and used in reports.
+
+    .. versionadded:: 4.3
+    """
+
+    progress = pyqtSignal(int, int, object)
+
+    def __init__(self, impact_function, parent=None):
+        """Constructor.
+
+        :param impact_function: The impact function, ready to run.
+        :type impact_function: ImpactFunction, MultiExposureImpactFunction
+
+        :param parent: The parent of the thread.
+        :type parent: QObject
+        """
+        super(AnalysisWorker, self).__init__(parent)
+        self.impact_function = impact_function
+        self.status = None
+        self.message = None
+        self.exception = None
+        self._cancelled = False
+
+        # Impact functions of a multi exposure analysis have their own
+        # callback.
+        for function in self._impact_functions():
+            function.callback = self.progress_callback
+
+    @property
+    def cancelled(self):
+        """Property to know if the analysis has been cancelled.
+
+        :return: True if cancel has been called.
+        :rtype: bool
+        """
+        return self._cancelled
+
+    def cancel(self):
+        """Cancel the analysis at the next step."""
+        LOGGER.info('The analysis is going to be cancelled.')
+        self._cancelled = True
+
+    def progress_callback(self, current_value, maximum_value, message=None):
+        """Callback of the impact function, called in the thread.
+
+        :param current_value: Current progress.
+        :type current_value: int
+
+        :param maximum_value: Maximum range (point at which task is complete.
+        :type maximum_value: int
+
+        :param message: Optional message dictionary, see
+            safe.definitions.analysis_steps.
+        :type message: dict
+
+        :raises: AnalysisCancelledError if the analysis has been cancelled.
+        """
+        if self._cancelled:
+            raise AnalysisCancelledError(
+                'The analysis has been cancelled by the user.')
+        self.progress.emit(current_value, maximum_value, message)
+
+    def _impact_functions(self):
+        """The impact function and its own impact functions if any.
+
+        :return: List of impact functions.
+        :rtype: list
+        """
+        functions = [self.impact_function]
+        functions.extend(
+            getattr(self.impact_function, 'impact_functions', None) or [])
+        return functions
+
+    def _layers(self):
+        """Layers of the analysis used after the end of the thread.
+
+        :return: List of layers.
+        :rtype: list
+        """
+        layers = []
+        for function in self._impact_functions():
+            layers.extend(function.outputs)
+            for name in ['hazard', 'exposure', 'aggregation']:
+                layers.append(getattr(function, name, None))
+        return [layer for layer in layers if layer is not None]
+
+    def run(self):
+        """Run the impact function, in the thread."""
+        try:
+            self.status, self.message = self.impact_function.run()
+            if self.status == ANALYSIS_SUCCESS:
+                # Qt objects belong to the thread which created them.
+                main_thread = QCoreApplication.instance().thread()
+                for layer in self._layers():
+                    if layer.thread() == self:
+                        layer.moveToThread(main_thread)
+        except Exception:  # pylint: disable=broad-except
+            # Raised again in the main thread.
+            self.exception = sys.exc_info()
+
+    def wait_for_result(self):
+        """Start the thread and wait for the end of the analysis.
+
+        Qt events are processed while waiting, so the user interface stays
+        alive.
+
+        :return: A tuple with the status of the IF and an error message if
+            needed. See ImpactFunction.run.
+        :rtype: (int, m.Message)
+        """
+        loop = QEventLoop()
+        self.finished.connect(loop.quit)
+        self.start()
+        loop.exec_()
+        self.wait()
+
+        if self.exception:
+            exception_type, value, traceback = self.exception
+            raise exception_type, value, traceback
+        return self.status, self.message
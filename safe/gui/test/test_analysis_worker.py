@@ -0,0 +1,59 @@
+# coding=utf-8
+"""Test the analysis worker."""
+
+import unittest
+
+from safe.test.utilities import get_qgis_app
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+from PyQt4 import QtCore
+
+from safe.common.exceptions import AnalysisCancelledError
+from safe.definitions.constants import ANALYSIS_SUCCESS
+from safe.gui.analysis_worker import AnalysisWorker
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+
+class StepsImpactFunction(object):
+
+    """Impact function calling its callback at each step."""
+
+    def __init__(self):
+        self.callback = None
+        self.outputs = []
+
+    def run(self):
+        for step in range(3):
+            self.callback(step, 3, {'name': 'Step %s' % step})
+        return ANALYSIS_SUCCESS, None
+
+
+class TestAnalysisWorker(unittest.TestCase):
+
+    """Test an analysis running in a thread."""
+
+    def test_progress(self):
+        """Test the progress of each step is sent to the main thread."""
+        worker = AnalysisWorker(StepsImpactFunction())
+        steps = []
+        worker.progress.connect(
+            lambda current, maximum, message: steps.append(current))
+        self.assertEqual(worker.wait_for_result(), (ANALYSIS_SUCCESS, None))
+        # Progress signals are queued from the thread.
+        QtCore.QCoreApplication.processEvents()
+        self.assertEqual(steps, [0, 1, 2])
+
+    def test_cancel(self):
+        """Test the analysis stops at the next step."""
+        worker = AnalysisWorker(StepsImpactFunction())
+        worker.cancel()
+        self.assertTrue(worker.cancelled)
+        self.assertRaises(AnalysisCancelledError, worker.wait_for_result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,9 +21,7 @@ __copyright__ = ('Copyright 2012, Australia Indonesia Facility for '
 import logging
 import os
 import sys
-from ConfigParser import ConfigParser, MissingSectionHeaderError, ParsingError
-from StringIO import StringIO
-from datetime import datetime
+from ConfigParser import ParsingError
 
 from PyQt4 import QtGui, QtCore
 from PyQt4.QtCore import pyqtSignature, pyqtSlot, Qt
@@ -34,36 +32,24 @@ from PyQt4.QtGui import (
     QTableWidgetItem,
     QPushButton,
     QDialogButtonBox)
-from qgis.core import (
-    QgsRectangle,
-    QgsCoordinateReferenceSystem,
-    QgsMapLayerRegistry,
-    QgsProject,
-    QgsVectorLayer,
-    QgsRasterLayer)
-
-from safe.common.signals import send_error_message
+from qgis.core import QgsMapLayerRegistry, QgsProject
+
 from safe.common.utilities import temp_dir
-from safe.definitions.constants import (
-    ANALYSIS_SUCCESS,
-    PREPARE_SUCCESS,
-    ANALYSIS_FAILED_BAD_CODE,
-    ANALYSIS_FAILED_BAD_INPUT)
 from safe.definitions.layer_purposes import (
     layer_purpose_hazard,
     layer_purpose_exposure,
     layer_purpose_aggregation)
-from safe.definitions.reports.components import (
-    standard_impact_report_metadata_pdf,
-    map_report,
-    all_default_report_components)
-from safe.definitions.utilities import update_template_component
 from safe.gui.tools.help.batch_help import batch_help
-from safe.impact_function.impact_function import ImpactFunction
 from safe.messaging import styles
-from safe.report.impact_report import ImpactReport
-from safe.report.report_metadata import ReportMetadata
-from safe.utilities.gis import extent_string_to_array
+from safe.utilities.batch_runner import (
+    read_scenarios,
+    validate_scenario,
+    define_layer,
+    prepare_scenario,
+    generate_pdf_report,
+    run_scenario,
+    run_scenarios,
+    write_report)
 from safe.utilities.qgis_utilities import display_critical_message_box
 from safe.utilities.resources import (
     html_footer, html_header, get_ui_class)
@@ -286,77 +272,11 @@ class BatchDialog(QDialog, FORM_CLASS):
                  if something went wrong.
         """
 
-        status = True
-        message = ''
-        # get hazard
-        if 'hazard' in items:
-            hazard_path = items['hazard']
-            hazard = self.define_layer(hazard_path)
-            if not hazard:
-                status = False
-                message = self.tr(
-                    'Unable to find {hazard_path}').format(
-                    hazard_path=hazard_path)
-        else:
-            hazard = None
-            LOGGER.warning('Scenario does not contain hazard path')
-
-        # get exposure
-        if 'exposure' in items:
-            exposure_path = items['exposure']
-            exposure = self.define_layer(exposure_path)
-            if not exposure:
-                status = False
-                if message:
-                    message += '\n'
-                message += self.tr(
-                    'Unable to find {exposure_path}').format(
-                    exposure_path=exposure_path)
-        else:
-            exposure = None
-            LOGGER.warning('Scenario does not contain hazard path')
-
-        # get aggregation
-        if 'aggregation' in items:
-            aggregation_path = items['aggregation']
-            aggregation = self.define_layer(aggregation_path)
-        else:
-            aggregation = None
-            LOGGER.info('Scenario does not contain aggregation path')
-
-        # get extent
-        if 'extent' in items:
-            LOGGER.info('Extent coordinate is found')
-            coordinates = items['extent']
-            array_coord = extent_string_to_array(coordinates)
-            extent = QgsRectangle(*array_coord)
-        else:
-            extent = None
-            LOGGER.info('Scenario does not contain extent coordinates')
-
-        # get extent crs id
-        if 'extent_crs' in items:
-            LOGGER.info('Extent CRS is found')
-            crs = items['extent_crs']
-            extent_crs = QgsCoordinateReferenceSystem(crs)
-        else:
-            LOGGER.info('Extent crs is not found, assuming crs to EPSG:4326')
-            extent_crs = QgsCoordinateReferenceSystem('EPSG:4326')
-
-        # make sure at least hazard and exposure data are available in
-        # scenario. Aggregation and extent checking will be done when
-        # assigning layer to impact_function
-        if status:
-            parameters = {
-                layer_purpose_hazard['key']: hazard,
-                layer_purpose_exposure['key']: exposure,
-                layer_purpose_aggregation['key']: aggregation,
-                'extent': extent,
-                'crs': extent_crs
-            }
+        scenario_directory = self.source_directory.text()
+        parameters, message = prepare_scenario(items, scenario_directory)
+        if parameters is not None:
             return True, parameters
         else:
-            LOGGER.warning(message)
             display_critical_message_box(
                 title=self.tr('Error while preparing scenario'),
                 message=message)
@@ -371,26 +291,7 @@ class BatchDialog(QDialog, FORM_CLASS):
         :return: QGIS layer.
         :rtype: QgsMapLayer
         """
-        scenario_dir = self.source_directory.text()
-        joined_path = os.path.join(scenario_dir, layer_path)
-        full_path = os.path.normpath(joined_path)
-        file_name = os.path.split(layer_path)[-1]
-
-        # get extension and basename to create layer
-        base_name, extension = os.path.splitext(file_name)
-
-        # load layer in scenario
-        layer = QgsRasterLayer(full_path, base_name)
-        if layer.isValid():
-            return layer
-        else:
-            layer = QgsVectorLayer(full_path, base_name, 'ogr')
-            if layer.isValid():
-                return layer
-            # if layer is not vector nor raster
-            else:
-                LOGGER.warning('Input in scenario is not recognized/supported')
-                return
+        return define_layer(layer_path, self.source_directory.text())
 
     def run_task(self, task_item, status_item, count=0, index=''):
         """Run a single task.
@@ -445,83 +346,19 @@ class BatchDialog(QDialog, FORM_CLASS):
             self.layer_group = self.root.addGroup(group_name)
             self.layer_group_container.append(self.layer_group)
 
-            # Its a dict containing files for a scenario
-            success, parameters = self.prepare_task(value)
-            if not success:
-                # set status to 'running'
-                status_item.setText(self.tr('Please update scenario'))
-                self.disable_busy_cursor()
-                return False
-            # If impact function parameters loaded successfully, initiate IF.
-            impact_function = ImpactFunction()
-            impact_function.hazard = parameters[layer_purpose_hazard['key']]
-            impact_function.exposure = (
-                parameters[layer_purpose_exposure['key']])
-            if parameters[layer_purpose_aggregation['key']]:
-                impact_function.aggregation = (
-                    parameters[layer_purpose_aggregation['key']])
-            elif parameters['extent']:
-                impact_function.requested_extent = parameters['extent']
-                impact_function.crs = parameters['crs']
-            prepare_status, prepare_message = impact_function.prepare()
-            if prepare_status == PREPARE_SUCCESS:
-                LOGGER.info('Impact function ready')
-                status, message = impact_function.run()
-                if status == ANALYSIS_SUCCESS:
-                    status_item.setText(self.tr('Analysis Success'))
-                    impact_layer = impact_function.impact
-                    if impact_layer.isValid():
-                        layer_list = [
-                            impact_layer,
-                            parameters[layer_purpose_hazard['key']],
-                            parameters[layer_purpose_exposure['key']],
-                            parameters[layer_purpose_aggregation['key']]]
-                        QgsMapLayerRegistry.instance().addMapLayers(
-                            layer_list, False)
-                        for layer in layer_list:
-                            self.layer_group.addLayer(layer)
-                        map_canvas = QgsMapLayerRegistry.instance().mapLayers()
-                        for layer in map_canvas:
-                            # turn of layer visibility if not impact layer
-                            if map_canvas[layer].id() == impact_layer.id():
-                                self.legend.setLayerVisible(
-                                    map_canvas[layer], True)
-                            else:
-                                self.legend.setLayerVisible(
-                                    map_canvas[layer], False)
-
-                        # we need to set analysis_impacted as an active layer
-                        # because we need to get all qgis variables that we
-                        # need from this layer for infographic.
-                        if self.iface:
-                            self.iface.setActiveLayer(
-                                impact_function.analysis_impacted)
-
-                        # generate map report and impact report
-                        try:
-                            error_code, message = (
-                                impact_function.generate_report(
-                                    all_default_report_components))
-
-                            # this line is to save the report in user specified
-                            # directory.
-                            self.generate_pdf_report(
-                                impact_function, self.iface, group_name)
-                        except:
-                            status_item.setText(
-                                self.tr('Report failed to generate.'))
-                    else:
-                        LOGGER.info('Impact layer is invalid')
-
-                elif status == ANALYSIS_FAILED_BAD_INPUT:
-                    LOGGER.info('Bad input detected')
-
-                elif status == ANALYSIS_FAILED_BAD_CODE:
-                    LOGGER.info('Impact function encountered a bug')
-
-            else:
-                LOGGER.warning('Impact function not ready')
-                send_error_message(self, prepare_message)
+            scenario_result = run_scenario(
+                value,
+                self.source_directory.text(),
+                self.output_directory.text(),
+                iface=self.iface,
+                analysis_callback=self.add_analysis_layers)
+            if scenario_result['status']:
+                status_item.setText(scenario_result['status'])
+            if scenario_result.get('message'):
+                display_critical_message_box(
+                    title=self.tr('Error while running scenario'),
+                    message=scenario_result['message'])
+            result = scenario_result['success']
 
         else:
             LOGGER.exception('Data type not supported: "%s"' % value)
@@ -530,6 +367,44 @@ class BatchDialog(QDialog, FORM_CLASS):
         self.disable_busy_cursor()
         return result
 
+    def add_analysis_layers(self, impact_function, parameters):
+        """Add the layers of a scenario to its group in the project.
+
+        Only the impact layer is visible. The analysis layer becomes the
+        active layer, as the infographic needs its QGIS variables.
+
+        :param impact_function: The impact function of the scenario.
+        :type impact_function: ImpactFunction
+
+        :param parameters: The parameters of the scenario, with the layers.
+        :type parameters: dict
+
+        .. versionadded:: 4.3
+        """
+        impact_layer = impact_function.impact
+        layer_list = [
+            impact_layer,
+            parameters[layer_purpose_hazard['key']],
+            parameters[layer_purpose_exposure['key']],
+            parameters[layer_purpose_aggregation['key']]]
+        layer_list = [layer for layer in layer_list if layer]
+        QgsMapLayerRegistry.instance().addMapLayers(layer_list, False)
+        for layer in layer_list:
+            self.layer_group.addLayer(layer)
+        map_canvas = QgsMapLayerRegistry.instance().mapLayers()
+        for layer in map_canvas:
+            # turn of layer visibility if not impact layer
+            if map_canvas[layer].id() == impact_layer.id():
+                self.legend.setLayerVisible(map_canvas[layer], True)
+            else:
+                self.legend.setLayerVisible(map_canvas[layer], False)
+
+        # we need to set analysis_impacted as an active layer because we
+        # need to get all qgis variables that we need from this layer for
+        # infographic.
+        if self.iface:
+            self.iface.setActiveLayer(impact_function.analysis_impacted)
+
     def show_parser_results(self, parsed_list, unparsed_list):
         """Compile a formatted list of un/successfully parsed files.
 
@@ -577,6 +452,11 @@ class BatchDialog(QDialog, FORM_CLASS):
         """Run all scenario when pbRunAll is clicked."""
         self.reset_status()
 
+        processes = setting('batch_processes', expected_type=int)
+        if processes != 1:
+            self.run_all_in_parallel(processes)
+            return
+
         self.enable_busy_cursor()
         report = []
         fail_count = 0
@@ -616,6 +496,101 @@ class BatchDialog(QDialog, FORM_CLASS):
             self.disable_busy_cursor()
         self.disable_busy_cursor()
 
+    def run_all_in_parallel(self, processes=None):
+        """Run all scenarios, scenario files on a pool of worker processes.
+
+        Python scripts need QGIS so they are still run in the dialog. The
+        status of each scenario is updated in the table as soon as it is
+        finished and the report is in the same order as the table.
+
+        :param processes: Number of worker processes. Defaults to the number
+            of CPUs.
+        :type processes: int
+
+        .. versionadded:: 4.3
+        """
+        self.enable_busy_cursor()
+        report = {}
+        fail_count = 0
+        pass_count = 0
+
+        scenarios = []
+        scenario_rows = []
+        for row in range(self.table.rowCount()):
+            item = self.table.item(row, 0)
+            status_item = self.table.item(row, 1)
+            value = item.data(QtCore.Qt.UserRole)[0]
+            if isinstance(value, dict):
+                scenarios.append(value)
+                scenario_rows.append(row)
+                status_item.setText(self.tr('Queued'))
+                continue
+
+            try:
+                result = self.run_task(item, status_item)
+            except Exception, e:  # pylint: disable=W0703
+                LOGGER.exception('Batch execution failed. The exception: ' +
+                                 str(e))
+                result = False
+            if result:
+                report[row] = 'P: %s\n' % item.text()
+                pass_count += 1
+            else:
+                report[row] = 'F: %s\n' % item.text()
+                fail_count += 1
+
+        QtGui.qApp.processEvents()
+        results = run_scenarios(
+            scenarios,
+            self.source_directory.text(),
+            self.output_directory.text(),
+            processes)
+        for position, result in results:
+            row = scenario_rows[position]
+            item = self.table.item(row, 0)
+            self.table.item(row, 1).setText(result['status'])
+            if result['success']:
+                report[row] = 'P: %s\n' % item.text()
+                pass_count += 1
+                if result['impact']:
+                    self.add_scenario_layer(
+                        result['scenario_name'], result['impact'])
+            else:
+                report[row] = 'F: %s\n' % item.text()
+                fail_count += 1
+            QtGui.qApp.processEvents()
+
+        try:
+            report_path = self.write_report(
+                [report[key] for key in sorted(report)],
+                pass_count,
+                fail_count)
+            self.show_report(report_path)
+        except IOError:
+            # noinspection PyArgumentList,PyCallByClass,PyTypeChecker
+            QtGui.QMessageBox.question(self, 'Error',
+                                       'Failed to write report file.')
+        self.disable_busy_cursor()
+
+    def add_scenario_layer(self, scenario_name, path):
+        """Add the impact layer of a scenario run in a worker to the project.
+
+        :param scenario_name: The name of the scenario, used for the group.
+        :type scenario_name: str
+
+        :param path: The path of the impact layer.
+        :type path: str
+
+        .. versionadded:: 4.3
+        """
+        layer = define_layer(path, self.output_directory.text())
+        if not layer:
+            return
+        layer_group = self.root.addGroup(scenario_name)
+        self.layer_group_container.append(layer_group)
+        QgsMapLayerRegistry.instance().addMapLayers([layer], False)
+        layer_group.addLayer(layer)
+
     def write_report(self, report, pass_count, fail_count):
         """Write a report status of Batch Runner.
 
@@ -635,29 +610,8 @@ class BatchDialog(QDialog, FORM_CLASS):
 
         :raises: IOError
         """
-        separator = '-----------------------------\n'
-        current_time = datetime.now().strftime('%Y%m%d%H%M%S')
-        report_path = 'batch-report-' + current_time + '.txt'
-        output_path = self.output_directory.text()
-        path = os.path.join(output_path, report_path)
-
-        try:
-            report_file = file(path, 'w')
-            report_file.write('InaSAFE Batch Report File\n')
-            report_file.write(separator)
-            for myLine in report:
-                report_file.write(myLine)
-            report_file.write(separator)
-            report_file.write('Total passed: %s\n' % pass_count)
-            report_file.write('Total failed: %s\n' % fail_count)
-            report_file.write('Total tasks: %s\n' % len(report))
-            report_file.write(separator)
-            report_file.close()
-
-            # LOGGER.info('Log written to %s' % path)
-            return path
-        except IOError:
-            raise IOError
+        return write_report(
+            report, pass_count, fail_count, self.output_directory.text())
 
     def generate_pdf_report(self, impact_function, iface, scenario_name):
         """Generate and store map and impact report from impact function.
@@ -674,34 +628,11 @@ class BatchDialog(QDialog, FORM_CLASS):
         :param scenario_name: name of the scenario
         :type scenario_name: str
         """
-        # output folder
-        output_dir = self.output_directory.text()
-        file_path = os.path.join(output_dir, scenario_name)
-
-        # create impact table report instance
-        table_report_metadata = ReportMetadata(
-            metadata_dict=standard_impact_report_metadata_pdf)
-        impact_table_report = ImpactReport(
+        generate_pdf_report(
+            impact_function,
             iface,
-            table_report_metadata,
-            impact_function=impact_function)
-        impact_table_report.output_folder = file_path
-        impact_table_report.process_components()
-
-        # create impact map report instance
-        map_report_metadata = ReportMetadata(
-            metadata_dict=update_template_component(map_report))
-        impact_map_report = ImpactReport(
-            iface,
-            map_report_metadata,
-            impact_function=impact_function)
-        # TODO: Get from settings file
-
-        # get the extent of impact layer
-        impact_map_report.qgis_composition_context.extent = \
-            impact_function.impact.extent()
-        impact_map_report.output_folder = file_path
-        impact_map_report.process_components()
+            self.output_directory.text(),
+            scenario_name)
 
     def show_report(self, report_path):
         """Show batch report file in batchReportFileName using an external app.
@@ -808,102 +739,6 @@ class BatchDialog(QDialog, FORM_CLASS):
         self.help_web_view.setHtml(string)
 
 
-def read_scenarios(filename):
-    """Read keywords dictionary from file.
-
-    :param filename: Name of file holding scenarios .
-
-    :return Dictionary of with structure like this
-        {{ 'foo' : { 'a': 'b', 'c': 'd'},
-            { 'bar' : { 'd': 'e', 'f': 'g'}}
-
-    A scenarios file may look like this:
-
-        [jakarta_flood]
-        hazard: /path/to/hazard.tif
-        exposure: /path/to/exposure.tif
-        function: function_id
-        aggregation: /path/to/aggregation_layer.tif
-        extent: minx, miny, maxx, maxy
-
-    Notes:
-        path for hazard, exposure, and aggregation are relative to scenario
-        file path
-    """
-    # Input checks
-    filename = os.path.abspath(filename)
-
-    blocks = {}
-    parser = ConfigParser()
-
-    # Parse the file content.
-    # if the content don't have section header
-    # we use the filename.
-    try:
-        parser.read(filename)
-    except MissingSectionHeaderError:
-        base_name = os.path.basename(filename)
-        name = os.path.splitext(base_name)[0]
-        section = '[%s]\n' % name
-        content = section + open(filename).read()
-        parser.readfp(StringIO(content))
-
-    # convert to dictionary
-    for section in parser.sections():
-        items = parser.items(section)
-        # add section as scenario name
-        items.append(('scenario_name', section))
-        # add full path to the blocks
-        items.append(('full_path', filename))
-        blocks[section] = {}
-        for key, value in items:
-            blocks[section][key] = value
-
-    # Ok we have generated a structure that looks like this:
-    # blocks = {{ 'foo' : { 'a': 'b', 'c': 'd'},
-    #           { 'bar' : { 'd': 'e', 'f': 'g'}}
-    # where foo and bar are scenarios and their dicts are the options for
-    # that scenario (e.g. hazard, exposure etc)
-    return blocks
-
-
-def validate_scenario(blocks, scenario_directory):
-    """Function to validate input layer stored in scenario file.
-
-    Check whether the files that are used in scenario file need to be
-    updated or not.
-
-    :param blocks: dictionary from read_scenarios
-    :type blocks: dictionary
-
-    :param scenario_directory: directory where scenario text file is saved
-    :type scenario_directory: file directory
-
-    :return: pass message to dialog and log detailed status
-    """
-    # dictionary to temporary contain status message
-    blocks_update = {}
-    for section, section_item in blocks.iteritems():
-        ready = True
-        for item in section_item:
-            if item in ['hazard', 'exposure', 'aggregation']:
-                # get relative path
-                rel_path = section_item[item]
-                full_path = os.path.join(scenario_directory, rel_path)
-                filepath = os.path.normpath(full_path)
-                if not os.path.exists(filepath):
-                    blocks_update[section] = {
-                        'status': 'Please update scenario'}
-                    LOGGER.info(section + ' needs to be updated')
-                    LOGGER.info('Unable to find ' + filepath)
-                    ready = False
-        if ready:
-            blocks_update[section] = {'status': 'Scenario ready'}
-            # LOGGER.info(section + " scenario is ready")
-    for section, section_item in blocks_update.iteritems():
-        blocks[section]['status'] = blocks_update[section]['status']
-
-
 def append_row(table, label, data):
     """Append new row to table widget.
 
@@ -51,6 +51,7 @@ from safe.gui.analysis_utilities import (
     add_impact_layers_to_canvas,
     add_layers_to_canvas_with_custom_orders,
 )
+from safe.gui.analysis_worker import AnalysisWorker
 from safe.gui.gui_utilities import layer_from_combo, add_ordered_combo_item
 from safe.gui.widgets.message import (
     enable_messaging,
@@ -541,7 +542,12 @@ class MultiExposureDialog(QDialog, FORM_CLASS):
         self.set_enabled_buttons(False)
         enable_busy_cursor()
         try:
-            code, message = self._multi_exposure_if.run()
+            if setting('background_analysis', expected_type=bool):
+                worker = AnalysisWorker(self._multi_exposure_if)
+                worker.progress.connect(self.progress_callback)
+                code, message = worker.wait_for_result()
+            else:
+                code, message = self._multi_exposure_if.run()
             message = basestring_to_message(message)
             if code == ANALYSIS_FAILED_BAD_INPUT:
                 self.hide_busy()
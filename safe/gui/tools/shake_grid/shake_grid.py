@@ -9,14 +9,14 @@ import sys
 
 from datetime import datetime
 from subprocess import call, CalledProcessError
-from xml.dom import minidom
+from xml.etree.cElementTree import iterparse
 import numpy as np
 
 import pytz
 # This import is required to enable PyQt API v2
 # noinspection PyUnresolvedReferences
 import qgis  # NOQA pylint: disable=unused-import
-from osgeo import gdal, ogr
+from osgeo import gdal, ogr, osr
 from osgeo.gdalconst import GA_ReadOnly
 from pytz import timezone
 from qgis.core import (
@@ -435,110 +435,124 @@ class ShakeGrid(object):
         LOGGER.debug('ParseGridXml requested.')
         grid_path = self.grid_file_path()
         try:
-            document = minidom.parse(grid_path)
-            event_element = document.getElementsByTagName('event')
-            event_element = event_element[0]
-            self.magnitude = float(
-                event_element.attributes['magnitude'].nodeValue)
-            self.longitude = float(
-                event_element.attributes['lon'].nodeValue)
-            self.latitude = float(
-                event_element.attributes['lat'].nodeValue)
-            self.location = event_element.attributes[
-                'event_description'].nodeValue.strip()
-            self.depth = float(
-                event_element.attributes['depth'].nodeValue)
-            # Get the date - it's going to look something like this:
-            # 2012-08-07T01:55:12WIB
-            time_stamp = event_element.attributes['event_timestamp'].nodeValue
-            # Note the timezone here is inconsistent with YZ from grid.xml
-            # use the latter
-            self.time_zone = time_stamp[19:]
-            self.extract_date_time(time_stamp)
-
-            specification_element = document.getElementsByTagName(
-                'grid_specification')
-            specification_element = specification_element[0]
-            self.x_minimum = float(
-                specification_element.attributes['lon_min'].nodeValue)
-            self.x_maximum = float(
-                specification_element.attributes['lon_max'].nodeValue)
-            self.y_minimum = float(
-                specification_element.attributes['lat_min'].nodeValue)
-            self.y_maximum = float(
-                specification_element.attributes['lat_max'].nodeValue)
-            self.grid_bounding_box = QgsRectangle(
-                self.x_minimum, self.y_maximum, self.x_maximum, self.y_minimum)
-            self.rows = float(
-                specification_element.attributes['nlat'].nodeValue)
-            self.columns = float(
-                specification_element.attributes['nlon'].nodeValue)
-            data_element = document.getElementsByTagName(
-                'grid_data')
-            data_element = data_element[0]
-            data = data_element.firstChild.nodeValue
+            # Only the headers are parsed as elements, grid_data is read
+            # once as a string straight into a numpy array.
+            field_indexes = {}
+            data = None
+            for event, element in iterparse(grid_path, ('start', 'end')):
+                tag = element.tag.split('}')[-1]
+                if event == 'start' and tag == 'event':
+                    self._parse_event(element.attrib)
+                elif event == 'start' and tag == 'grid_specification':
+                    self._parse_specification(element.attrib)
+                elif event == 'start' and tag == 'grid_field':
+                    field_indexes[element.attrib['name']] = (
+                        int(element.attrib['index']) - 1)
+                elif event == 'end' and tag == 'grid_data':
+                    text = element.text.strip()
+                    field_count = len(text.split('\n', 1)[0].split())
+                    data = np.fromstring(text, sep=' ')
+                    data = data.reshape(-1, field_count)
+                    del text
+                    element.clear()
 
             # Extract the 1,2 and 5th (MMI) columns and populate mmi_data
-            longitude_column = 0
-            latitude_column = 1
-            mmi_column = 4
-            lon_list = []
-            lat_list = []
-            mmi_list = []
-            for line in data.split('\n'):
-                if not line:
-                    continue
-                tokens = line.split(' ')
-                longitude = tokens[longitude_column]
-                latitude = tokens[latitude_column]
-                mmi = tokens[mmi_column]
-                lon_list.append(float(longitude))
-                lat_list.append(float(latitude))
-                mmi_list.append(float(mmi))
-
-            from datetime import datetime
+            longitude_column = field_indexes.get('LON', 0)
+            latitude_column = field_indexes.get('LAT', 1)
+            mmi_column = field_indexes.get('MMI', 4)
+            self.mmi_data = data[
+                :, [longitude_column, latitude_column, mmi_column]].copy()
+            del data
+
             start = datetime.now()
             if self.smoothing_method == NUMPY_SMOOTHING:
                 LOGGER.debug('We are using NUMPY smoothing')
-                ncols = len(np.where(np.array(lon_list) == lon_list[0])[0])
-                nrows = len(np.where(np.array(lat_list) == lat_list[0])[0])
+                nrows, ncols = self._grid_shape()
 
                 # reshape mmi_list to 2D array to apply gaussian filter
-                Z = np.reshape(mmi_list, (nrows, ncols))
+                Z = np.reshape(self.mmi_data[:, 2], (nrows, ncols))
 
                 # smooth MMI matrix
                 mmi_list = convolve(Z, gaussian_kernel(self.smoothing_sigma))
 
                 # reshape array back to 1D long list of mmi
-                mmi_list = np.reshape(mmi_list, ncols * nrows)
+                self.mmi_data[:, 2] = np.reshape(mmi_list, ncols * nrows)
 
             elif self.smoothing_method == SCIPY_SMOOTHING:
                 LOGGER.debug('We are using SCIPY smoothing')
                 from scipy.ndimage.filters import gaussian_filter
-                ncols = len(np.where(np.array(lon_list) == lon_list[0])[0])
-                nrows = len(np.where(np.array(lat_list) == lat_list[0])[0])
+                nrows, ncols = self._grid_shape()
 
                 # reshape mmi_list to 2D array to apply gaussian filter
-                Z = np.reshape(mmi_list, (nrows, ncols))
+                Z = np.reshape(self.mmi_data[:, 2], (nrows, ncols))
 
                 # smooth MMI matrix
                 # Help from Hadi Ghasemi
                 mmi_list = gaussian_filter(Z, self.smoothing_sigma)
 
                 # reshape array back to 1D long list of mmi
-                mmi_list = np.reshape(mmi_list, ncols * nrows)
+                self.mmi_data[:, 2] = np.reshape(mmi_list, ncols * nrows)
             end = datetime.now()
             duration = end - start
             LOGGER.debug('Duration : %s' % duration.total_seconds())
 
-            # zip lists as list of tuples
-            self.mmi_data = zip(lon_list, lat_list, mmi_list)
-
         except Exception, e:
             LOGGER.exception('Event parse failed')
             raise GridXmlParseError(
                 'Failed to parse grid file.\n%s\n%s' % (e.__class__, str(e)))
 
+    def _parse_event(self, attributes):
+        """Read the attributes of the event element of grid.xml.
+
+        :param attributes: The attributes of the element.
+        :type attributes: dict
+        """
+        self.magnitude = float(attributes['magnitude'])
+        self.longitude = float(attributes['lon'])
+        self.latitude = float(attributes['lat'])
+        self.location = attributes['event_description'].strip()
+        self.depth = float(attributes['depth'])
+        # Get the date - it's going to look something like this:
+        # 2012-08-07T01:55:12WIB
+        time_stamp = attributes['event_timestamp']
+        # Note the timezone here is inconsistent with YZ from grid.xml
+        # use the latter
+        self.time_zone = time_stamp[19:]
+        self.extract_date_time(time_stamp)
+
+    def _parse_specification(self, attributes):
+        """Read the attributes of the grid_specification element of grid.xml.
+
+        :param attributes: The attributes of the element.
+        :type attributes: dict
+        """
+        self.x_minimum = float(attributes['lon_min'])
+        self.x_maximum = float(attributes['lon_max'])
+        self.y_minimum = float(attributes['lat_min'])
+        self.y_maximum = float(attributes['lat_max'])
+        self.grid_bounding_box = QgsRectangle(
+            self.x_minimum, self.y_maximum, self.x_maximum, self.y_minimum)
+        self.rows = float(attributes['nlat'])
+        self.columns = float(attributes['nlon'])
+
+    def _grid_shape(self):
+        """Get the number of rows and columns of the points of the grid.
+
+        They are read from the grid specification. If they do not match the
+        number of points, they are counted from the coordinates.
+
+        :return: The number of rows and the number of columns.
+        :rtype: (int, int)
+        """
+        nrows = int(self.rows)
+        ncols = int(self.columns)
+        if nrows * ncols != len(self.mmi_data):
+            longitudes = self.mmi_data[:, 0]
+            latitudes = self.mmi_data[:, 1]
+            nrows = len(np.where(longitudes == longitudes[0])[0])
+            ncols = len(np.where(latitudes == latitudes[0])[0])
+        return nrows, ncols
+
     def grid_file_path(self):
         """Validate that grid file path points to a file.
 
@@ -681,12 +695,13 @@ class ShakeGrid(object):
                 raise Exception(message)
 
     def mmi_to_raster(self, force_flag=False, algorithm='nearest'):
-        """Convert the grid.xml's mmi column to a raster using gdal_grid.
+        """Convert the grid.xml's mmi column to a raster.
 
         A geotiff file will be created.
 
-        Unfortunately no python bindings exist for doing this so we are
-        going to do it using a shell call.
+        The raster is computed in memory: the grid is resampled with numpy
+        for the nearest neighbour, otherwise gdal.Grid interpolates the
+        points. The gdal_grid command is only used with GDAL < 2.1.
 
         .. see also:: http://www.gdal.org/gdal_grid.html
 
@@ -737,15 +752,151 @@ class ShakeGrid(object):
         if os.path.exists(tif_path) and force_flag is not True:
             return tif_path
 
-        # Ensure the vrt mmi file exists (it will generate csv too if needed)
-        vrt_path = self.mmi_to_vrt(force_flag)
+        if 'invdist' in algorithm:
+            algorithm = 'invdist:power=2.0:smoothing=1.0'
 
-        # now generate the tif using default nearest neighbour interpolation
-        # options. This gives us the same output as the mi.grd generated by
-        # the earthquake server.
+        # The raster is computed in memory, without the delimited text and
+        # VRT files needed by gdal_grid.
+        nrows, ncols = self._grid_shape()
+        regular_grid = (
+            nrows > 1 and ncols > 1 and nrows * ncols == len(self.mmi_data))
+        if algorithm == 'nearest' and regular_grid:
+            # The points are already on a grid, we only need to resample it.
+            dataset = self._nearest_raster()
+        else:
+            dataset = self._interpolated_raster(algorithm)
+
+        if dataset is not None:
+            driver = gdal.GetDriverByName('GTiff')
+            output = driver.CreateCopy(tif_path, dataset)
+            # Close the datasets to write the file.
+            output.FlushCache()
+            output = None
+            dataset = None
+        else:
+            self._gdal_grid(algorithm, tif_path, force_flag)
 
+        # We will use keywords file name with simple algorithm name since it
+        # will raise an error in windows related to having double colon in path
         if 'invdist' in algorithm:
-            algorithm = 'invdist:power=2.0:smoothing=1.0'
+            algorithm = 'invdist'
+
+        # copy the keywords file from fixtures for this layer
+        self.create_keyword_file(algorithm)
+
+        # Lastly copy over the standard qml (QGIS Style file) for the mmi.tif
+        if self.algorithm_name:
+            qml_path = os.path.join(
+                self.output_dir, '%s-%s.qml' % (
+                    self.output_basename, algorithm))
+        else:
+            qml_path = os.path.join(
+                self.output_dir, '%s.qml' % self.output_basename)
+        qml_source_path = os.path.join(data_dir(), 'mmi.qml')
+        shutil.copyfile(qml_source_path, qml_path)
+        return tif_path
+
+    def _mmi_grid(self):
+        """Get the MMI values as a 2D array, north up.
+
+        :return: The MMI values, one row by latitude.
+        :rtype: numpy.ndarray
+        """
+        nrows, ncols = self._grid_shape()
+        longitudes = self.mmi_data[:, 0]
+        latitudes = self.mmi_data[:, 1]
+        order = np.lexsort((longitudes, -latitudes))
+        return self.mmi_data[order, 2].reshape(nrows, ncols)
+
+    def _nearest_raster(self):
+        """Create an in-memory raster from the grid with nearest neighbour.
+
+        The raster has the same size and extent as the one from gdal_grid:
+        each pixel gets the value of the nearest point of the grid.
+
+        :return: The raster dataset, in the MEM driver.
+        :rtype: gdal.Dataset
+        """
+        grid = self._mmi_grid()
+        nrows, ncols = grid.shape
+        x_size = int(self.columns)
+        y_size = int(self.rows)
+        width = (self.x_maximum - self.x_minimum) / x_size
+        height = (self.y_maximum - self.y_minimum) / y_size
+
+        # Position of the nearest point from the centre of each pixel.
+        x_spacing = (self.x_maximum - self.x_minimum) / max(1, ncols - 1)
+        y_spacing = (self.y_maximum - self.y_minimum) / max(1, nrows - 1)
+        columns = np.rint((np.arange(x_size) + 0.5) * width / x_spacing)
+        columns = columns.astype(int).clip(0, ncols - 1)
+        rows = np.rint((np.arange(y_size) + 0.5) * height / y_spacing)
+        rows = rows.astype(int).clip(0, nrows - 1)
+
+        spatial_reference = osr.SpatialReference()
+        spatial_reference.ImportFromEPSG(4326)
+        dataset = gdal.GetDriverByName('MEM').Create(
+            '', x_size, y_size, 1, gdal.GDT_Float32)
+        dataset.SetGeoTransform(
+            [self.x_minimum, width, 0, self.y_maximum, 0, -height])
+        dataset.SetProjection(spatial_reference.ExportToWkt())
+        dataset.GetRasterBand(1).WriteArray(grid[np.ix_(rows, columns)])
+        return dataset
+
+    def _interpolated_raster(self, algorithm):
+        """Create an in-memory raster from the points with gdal.Grid.
+
+        :param algorithm: The algorithm of gdal_grid.
+        :type algorithm: str
+
+        :return: The raster dataset, in the MEM driver. None if gdal.Grid is
+            not available (GDAL < 2.1).
+        :rtype: gdal.Dataset
+        """
+        if not hasattr(gdal, 'Grid'):
+            return None
+
+        spatial_reference = osr.SpatialReference()
+        spatial_reference.ImportFromEPSG(4326)
+        points = ogr.GetDriverByName('Memory').CreateDataSource('mmi')
+        layer = points.CreateLayer('mmi', spatial_reference, ogr.wkbPoint25D)
+        definition = layer.GetLayerDefn()
+        layer.StartTransaction()
+        for longitude, latitude, mmi in self.mmi_data:
+            point = ogr.Geometry(ogr.wkbPoint25D)
+            point.AddPoint(float(longitude), float(latitude), float(mmi))
+            feature = ogr.Feature(definition)
+            feature.SetGeometry(point)
+            layer.CreateFeature(feature)
+        layer.CommitTransaction()
+
+        return gdal.Grid(
+            '',
+            points,
+            format='MEM',
+            outputType=gdal.GDT_Float32,
+            algorithm=algorithm,
+            outputBounds=[
+                self.x_minimum, self.y_maximum,
+                self.x_maximum, self.y_minimum],
+            width=int(self.columns),
+            height=int(self.rows),
+            outputSRS='EPSG:4326')
+
+    def _gdal_grid(self, algorithm, tif_path, force_flag):
+        """Create the raster with the gdal_grid command.
+
+        :param algorithm: The algorithm of gdal_grid.
+        :type algorithm: str
+
+        :param tif_path: The path of the raster.
+        :type tif_path: str
+
+        :param force_flag: Whether to force the regeneration of the
+            delimited text and VRT files.
+        :type force_flag: bool
+        """
+        # Ensure the vrt mmi file exists (it will generate csv too if needed)
+        vrt_path = self.mmi_to_vrt(force_flag)
 
         # (Sunni): I'm not sure how this 'mmi' will work
         # (Tim): Its the mapping to which field in the CSV contains the data
@@ -774,26 +925,6 @@ class ShakeGrid(object):
         # Now run GDAL warp scottie...
         self._run_command(command)
 
-        # We will use keywords file name with simple algorithm name since it
-        # will raise an error in windows related to having double colon in path
-        if 'invdist' in algorithm:
-            algorithm = 'invdist'
-
-        # copy the keywords file from fixtures for this layer
-        self.create_keyword_file(algorithm)
-
-        # Lastly copy over the standard qml (QGIS Style file) for the mmi.tif
-        if self.algorithm_name:
-            qml_path = os.path.join(
-                self.output_dir, '%s-%s.qml' % (
-                    self.output_basename, algorithm))
-        else:
-            qml_path = os.path.join(
-                self.output_dir, '%s.qml' % self.output_basename)
-        qml_source_path = os.path.join(data_dir(), 'mmi.qml')
-        shutil.copyfile(qml_source_path, qml_path)
-        return tif_path
-
     def mmi_to_shapefile(self, force_flag=False):
         """Convert grid.xml's mmi column to a vector shp file using ogr2ogr.
 
@@ -5,6 +5,7 @@ import os
 import unittest
 import shutil
 
+from osgeo import gdal
 from qgis.core import QgsVectorLayer
 from safe.common.utilities import unique_filename, temp_dir
 from safe.test.utilities import standard_data_path, get_qgis_app
@@ -179,6 +180,26 @@ class TestShakeGrid(unittest.TestCase):
         keywords = read_iso19115_metadata(raster_path)
         self.assertIn('extra_keywords', keywords.keys())
 
+    def test_mmi_to_raster_in_memory(self):
+        """Check the raster is created without the delimited text file."""
+        output_dir = temp_dir(os.path.join(__name__, 'in_memory'))
+        shake_grid = ShakeGrid(
+            'Test Title', 'Test Source', GRID_PATH, output_dir=output_dir)
+        self.assertEqual(shake_grid.mmi_data.shape, (10201, 3))
+
+        raster_path = shake_grid.mmi_to_raster(force_flag=True)
+        self.assertFalse(os.path.exists(os.path.join(output_dir, 'mmi.csv')))
+
+        dataset = gdal.Open(raster_path)
+        self.assertEqual(dataset.RasterXSize, 101)
+        self.assertEqual(dataset.RasterYSize, 101)
+        values = dataset.GetRasterBand(1).ReadAsArray()
+        # The first point of the grid is in the north west corner.
+        self.assertAlmostEqual(
+            values[0, 0], shake_grid.mmi_data[0, 2], places=5)
+        self.assertAlmostEqual(
+            values.max(), shake_grid.mmi_data[:, 2].max(), places=5)
+
     def test_mmi_to_shapefile(self):
         """Check we can convert the shake event to a shapefile."""
         # Check the shp file
@@ -75,6 +75,7 @@ from safe.definitions.utilities import (
 from safe.gui.analysis_utilities import (
     add_impact_layers_to_canvas,
     add_debug_layers_to_canvas)
+from safe.gui.analysis_worker import AnalysisWorker
 from safe.gui.gui_utilities import layer_from_combo, add_ordered_combo_item
 from safe.gui.tools.about_dialog import AboutDialog
 from safe.gui.tools.help_dialog import HelpDialog
@@ -163,6 +164,8 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         self.iface = iface
 
         self.impact_function = None
+        # Thread running the analysis, if any
+        self.analysis_worker = None
         self.keyword_io = KeywordIO()
         self.state = None
         self.extent = Extent(self.iface)
@@ -1244,7 +1247,17 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
 
         Please update the code in step_fc990_analysis.py in function
         setup_and_run_analysis(). It should follow approximately the same code.
+
+        The analysis runs in a thread if the background_analysis setting is
+        enabled. The run button cancels the analysis in the meantime. The
+        input layers are not locked: they must not be removed or edited
+        while the analysis runs, so the setting is disabled by default.
         """
+        if self.analysis_worker:
+            # The analysis is running, the run button cancels it.
+            self.analysis_worker.cancel()
+            return ANALYSIS_FAILED_BAD_INPUT, None
+
         if self.conflicting_plugin_detected:
             display_critical_message_bar(
                 tr('Conflicting plugin'), conflicting_plugin_string())
@@ -1263,7 +1276,10 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         self.impact_function.callback = self.progress_callback
         self.impact_function.debug_mode = self.debug_mode.isChecked()
         try:
-            status, message = self.impact_function.run()
+            if setting('background_analysis', expected_type=bool):
+                status, message = self.run_in_background()
+            else:
+                status, message = self.impact_function.run()
             message = basestring_to_message(message)
         except:
             # We have an exception only if we are in debug mode.
@@ -1336,6 +1352,30 @@ class Dock(QtGui.QDockWidget, FORM_CLASS):
         self.hide_busy(check_next_impact=False)
         return ANALYSIS_SUCCESS, None
 
+    def run_in_background(self):
+        """Run the impact function in a thread until it is done.
+
+        The progress is shown in the dock and the run button cancels the
+        analysis between two steps. Output layers are given back to the main
+        thread to be added to the map and used in reports.
+
+        .. versionadded:: 4.3
+
+        :return: A tuple with the status of the IF and an error message if
+            needed. See ImpactFunction.run.
+        :rtype: (int, m.Message)
+        """
+        run_text = self.run_button.text()
+        self.analysis_worker = AnalysisWorker(self.impact_function)
+        self.analysis_worker.progress.connect(self.progress_callback)
+        self.run_button.setText(self.tr('Cancel'))
+        try:
+            return self.analysis_worker.wait_for_result()
+        finally:
+            self.analysis_worker = None
+            self.impact_function.callback = self.progress_callback
+            self.run_button.setText(run_text)
+
     def validate_impact_function(self):
         """Helper method to evaluate the current state of the impact function.
 
@@ -7,6 +7,7 @@ import logging
 from collections import OrderedDict
 from copy import deepcopy
 from datetime import datetime
+from functools import partial
 from os import makedirs
 from os.path import join, exists, dirname
 from socket import gethostname
@@ -30,6 +31,7 @@ from qgis.utils import iface as iface_object
 
 from safe import messaging as m
 from safe.common.exceptions import (
+    AnalysisCancelledError,
     InaSAFEError,
     InvalidExtentError,
     WrongEarthquakeFunction,
@@ -41,6 +43,7 @@ from safe.common.utilities import temp_dir
 from safe.common.version import get_version
 from safe.datastore.datastore import DataStore
 from safe.datastore.folder import Folder
+from safe.datastore.geopackage import GeoPackage
 from safe.definitions import count_ratio_mapping
 from safe.definitions.analysis_steps import analysis_steps
 from safe.definitions.constants import (
@@ -54,7 +57,8 @@ from safe.definitions.constants import (
     PREPARE_FAILED_INSUFFICIENT_OVERLAP_REQUESTED_EXTENT,
     PREPARE_FAILED_BAD_LAYER,
     PREPARE_FAILED_BAD_CODE)
-from safe.definitions.earthquake import EARTHQUAKE_FUNCTIONS
+from safe.definitions.earthquake import (
+    EARTHQUAKE_FUNCTIONS, current_earthquake_fatality_rates)
 from safe.definitions.exposure import (
     indivisible_exposure,
     exposure_population,
@@ -139,11 +143,13 @@ from safe.definitions.utilities import (
     get_name,
     set_provenance,
     get_provenance,
-    update_template_component
+    update_template_component,
+    hazard_class_policy,
 )
 from safe.gis.raster.clip_bounding_box import clip_by_extent
 from safe.gis.raster.polygonize import polygonize
 from safe.gis.raster.reclassify import reclassify as reclassify_raster
+from safe.gis.raster.zonal_hazard_statistics import zonal_hazard_stats
 from safe.gis.raster.zonal_statistics import zonal_stats
 from safe.gis.sanity_check import check_inasafe_fields, check_layer
 from safe.gis.tools import (
@@ -164,13 +170,14 @@ from safe.gis.vector.recompute_counts import recompute_counts
 from safe.gis.vector.reproject import reproject
 from safe.gis.vector.smart_clip import smart_clip
 from safe.gis.vector.summary_1_aggregate_hazard import (
-    aggregate_hazard_summary)
+    impact_summary_tables, summarize_aggregate_hazard)
 from safe.gis.vector.summary_2_aggregation import aggregation_summary
 from safe.gis.vector.summary_3_analysis import analysis_summary
 from safe.gis.vector.summary_4_exposure_summary_table import (
     exposure_summary_table)
+from safe.gis.vector.summary_tools import read_areas
 from safe.gis.vector.tools import remove_fields, create_memory_layer
-from safe.gis.vector.union import union
+from safe.gis.vector.union import union, tiled_union
 from safe.gis.vector.update_value_map import update_value_map
 from safe.gui.analysis_utilities import add_layer_to_canvas
 from safe.gui.widgets.message import generate_input_error_message
@@ -181,6 +188,8 @@ from safe.impact_function.create_extra_layers import (
     create_valid_aggregation,
 )
 from safe.impact_function.impact_function_utilities import check_input_layer
+from safe.impact_function.layer_cache import (
+    cache_key, layer_cache_key, shared_layer_cache)
 from safe.impact_function.postprocessors import (
     run_single_post_processor, enough_input)
 from safe.impact_function.provenance_utilities import (
@@ -201,6 +210,7 @@ from safe.utilities.gis import (
 from safe.utilities.gis import qgis_version
 from safe.utilities.i18n import tr
 from safe.utilities.metadata import (
+    active_classification,
     active_thresholds_value_maps,
     copy_layer_keywords,
     write_iso19115_metadata,
@@ -260,6 +270,12 @@ class ImpactFunction(object):
         self._crs = None
         # Use exposure view only
         self.use_exposure_view_only = False
+        # Raster hazard on raster exposure without polygonizing the hazard.
+        self._raster_native_hazard = False
+        # Prepared hazard layers shared with other impact functions.
+        self._hazard_cache = None
+        self._layer_cache = None
+        self._hazard_key = None
 
         # The current extent defined by the impact function. Read-only.
         # The CRS is the aggregation CRS or the crs property if no
@@ -476,6 +492,10 @@ class ImpactFunction(object):
             else:
                 text += '| '
             text += tree.__str__()
+            if tree.counters:
+                # No comma, the table is also exported as CSV.
+                text += ' (%s)' % ' '.join(
+                    '%s=%s' % item for item in sorted(tree.counters.items()))
 
             busy = tr('Busy')
             new_row.add(m.Cell(text))
@@ -893,6 +913,75 @@ class ImpactFunction(object):
         """
         self._callback = callback
 
+    @property
+    def hazard_cache(self):
+        """Property for the cache of prepared hazard layers.
+
+        :returns: The cache shared between impact functions, None if the
+            hazard is prepared by this impact function only.
+        :rtype: LayerCache
+
+        .. versionadded:: 4.3
+        """
+        return self._hazard_cache
+
+    @hazard_cache.setter
+    def hazard_cache(self, cache):
+        """Setter for the cache of prepared hazard layers.
+
+        Impact functions using the same hazard and aggregation layers can
+        share a cache, so the hazard and the aggregate hazard are prepared
+        only once for the classification of each exposure.
+
+        :param cache: The cache.
+        :type cache: LayerCache
+
+        .. versionadded:: 4.3
+        """
+        self._hazard_cache = cache
+
+    def _shared_hazard_step(self, step, parameters, function, *args):
+        """Run a step of the hazard preparation, or reuse its result.
+
+        The key of the result is made from the key of the current hazard
+        layer, the step and its parameters.
+
+        :param step: The name of the step.
+        :type step: str
+
+        :param parameters: The parameters of the step which are not part of
+            the hazard layer.
+        :type parameters: list
+
+        :param function: The function to call, with the hazard layer as
+            first argument.
+        :type function: function
+
+        :return: The new hazard layer.
+        :rtype: QgsMapLayer
+
+        .. versionadded:: 4.3
+        """
+        if self._layer_cache is None:
+            return function(self.hazard, *args)
+        self._hazard_key = cache_key(self._hazard_key, step, parameters)
+        return self._layer_cache.run(
+            self._hazard_key, function, self.hazard, *args)
+
+    def _hazard_classification(self):
+        """The hazard classification used with the current exposure.
+
+        :return: The classification key and its thresholds or value map.
+        :rtype: list
+
+        .. versionadded:: 4.3
+        """
+        exposure_key = self.exposure.keywords['exposure']
+        return [
+            active_classification(self.hazard.keywords, exposure_key),
+            active_thresholds_value_maps(self.hazard.keywords, exposure_key)
+        ]
+
     @staticmethod
     def console_progress_callback(current, maximum, message=None):
         """Simple console based callback implementation for tests.
@@ -1132,6 +1221,11 @@ class ImpactFunction(object):
                 if pre_processor['condition'](self):
                     self._preprocessors.append(pre_processor)
 
+            # Resolve the settings used by post processors only once for the
+            # analysis. They are refreshed only if a setting is changed.
+            hazard_class_policy()
+            current_earthquake_fatality_rates()
+
         except Exception as e:
             if self.debug_mode:
                 # We run in debug mode, we do not want to catch the exception.
@@ -1524,6 +1618,16 @@ class ImpactFunction(object):
             message.add(suggestion)
             return ANALYSIS_FAILED_BAD_INPUT, message
 
+        except AnalysisCancelledError:
+            warning_heading = m.Heading(
+                tr('Analysis cancelled'), **WARNING_STYLE)
+            warning_message = tr(
+                'The analysis has been cancelled before the end.')
+            message = m.Message()
+            message.add(warning_heading)
+            message.add(warning_message)
+            return ANALYSIS_FAILED_BAD_INPUT, message
+
         except InaSAFEError as e:
             message = get_error_message(e)
             return ANALYSIS_FAILED_BAD_CODE, message
@@ -1587,11 +1691,17 @@ class ImpactFunction(object):
                 path = join(default_user_directory, self._unique_name)
                 if not exists(path):
                     makedirs(path)
-                self._datastore = Folder(path)
             else:
-                self._datastore = Folder(temp_dir(sub_dir=self._unique_name))
+                path = temp_dir(sub_dir=self._unique_name)
 
-            self._datastore.default_vector_format = 'geojson'
+            if setting('single_geopackage_output', expected_type=bool):
+                # All layers of the analysis in a single file.
+                self._datastore = GeoPackage(
+                    join(path, self._unique_name + '.gpkg'))
+            else:
+                self._datastore = Folder(path)
+                self._datastore.default_vector_format = setting(
+                    'vector_output_format', expected_type=unicode)
         LOGGER.info('Datastore : %s' % self.datastore.uri_path)
 
         if self.debug_mode:
@@ -1630,6 +1740,8 @@ class ImpactFunction(object):
 
         step_count = len(analysis_steps)
 
+        self._raster_native_hazard = self.use_raster_native_hazard()
+
         self._performance_log = profiling_log()
         self.callback(4, step_count, analysis_steps['hazard_preparation'])
         self.hazard_preparation()
@@ -1818,9 +1930,14 @@ class ImpactFunction(object):
         # Put profiling file path to the provenance
         # FIXME(IS): Very hacky
         if not self.debug_mode:
-            profiling_path = join(dirname(
-                self._analysis_impacted.source()),
-                layer_purpose_profiling['name'] + '.csv')
+            if isinstance(self.datastore, GeoPackage):
+                profiling_path = u'{}|layername={}'.format(
+                    self.datastore.uri.absoluteFilePath(),
+                    layer_purpose_profiling['name'])
+            else:
+                profiling_path = join(dirname(
+                    self._analysis_impacted.source()),
+                    layer_purpose_profiling['name'] + '.csv')
             output_layer_provenance[
                 provenance_layer_profiling['provenance_key']] = profiling_path
 
@@ -2105,11 +2222,49 @@ class ImpactFunction(object):
         self._analysis_impacted.keywords['hazard_keywords'] = (
             copy_layer_keywords(self.hazard.keywords))
 
+    def use_raster_native_hazard(self):
+        """Check if we can keep the hazard as a raster during the analysis.
+
+        The raster hazard is not polygonized if the setting is enabled and the
+        exposure is a continuous raster. The aggregate hazard layer is then
+        computed directly from the rasters by zonal_hazard_stats.
+
+        :return: True if the raster native hazard path can be used.
+        :rtype: bool
+
+        .. versionadded:: 4.3
+        """
+        if not setting('raster_native_hazard', expected_type=bool):
+            return False
+        if not is_raster_layer(self.hazard):
+            return False
+        if not is_raster_layer(self.exposure):
+            return False
+        if self.exposure.keywords.get('layer_mode') != 'continuous':
+            return False
+        exposure_key = self.exposure.keywords['exposure']
+        return bool(active_classification(self.hazard.keywords, exposure_key))
+
     @profile
     def hazard_preparation(self):
         """This function is doing the hazard preparation."""
         LOGGER.info('ANALYSIS : Hazard preparation')
 
+        # The cache from the multi exposure impact function, or the cache on
+        # disk shared between analyses if it's enabled.
+        self._layer_cache = self._hazard_cache
+        if self._layer_cache is None:
+            self._layer_cache = shared_layer_cache()
+
+        if self._layer_cache is not None:
+            # Clip and union results depend on the analysis geometry, not
+            # only on its extent.
+            self._hazard_key = cache_key(
+                layer_cache_key(self.hazard),
+                self._crs.authid(),
+                self._analysis_impacted.extent().toString(),
+                layer_cache_key(self._analysis_impacted))
+
         use_same_projection = (
             self.hazard.crs().authid() == self._crs.authid())
         self.set_state_info(
@@ -2128,21 +2283,32 @@ class ImpactFunction(object):
             self.set_state_process(
                 'hazard', 'Clip raster by analysis bounding box')
             # noinspection PyTypeChecker
-            self.hazard = clip_by_extent(self.hazard, extent)
+            self.hazard = self._shared_hazard_step(
+                'clip_by_extent', [extent.toString()], clip_by_extent, extent)
             self.debug_layer(self.hazard)
 
             if self.hazard.keywords.get('layer_mode') == 'continuous':
                 self.set_state_process(
                     'hazard', 'Classify continuous raster hazard')
                 # noinspection PyTypeChecker
-                self.hazard = reclassify_raster(
-                    self.hazard, self.exposure.keywords['exposure'])
+                self.hazard = self._shared_hazard_step(
+                    'reclassify_raster',
+                    self._hazard_classification(),
+                    reclassify_raster,
+                    self.exposure.keywords['exposure'])
                 self.debug_layer(self.hazard)
 
+            if self._raster_native_hazard:
+                # The hazard stays a raster, zonal_hazard_stats will do the
+                # work of polygonize, union and zonal_stats. It will resolve
+                # the classification of the hazard too.
+                return
+
             self.set_state_process(
                 'hazard', 'Polygonize classified raster hazard')
             # noinspection PyTypeChecker
-            self.hazard = polygonize(self.hazard)
+            self.hazard = self._shared_hazard_step(
+                'polygonize', [], polygonize)
             self.debug_layer(self.hazard)
 
         if not use_same_projection:
@@ -2150,20 +2316,23 @@ class ImpactFunction(object):
                 'hazard',
                 'Reproject hazard layer to aggregation CRS')
             # noinspection PyTypeChecker
-            self.hazard = reproject(self.hazard, self._crs)
+            self.hazard = self._shared_hazard_step(
+                'reproject', [self._crs.authid()], reproject, self._crs)
             self.debug_layer(self.hazard, check_fields=False)
 
         self.set_state_process(
             'hazard',
             'Clip and mask hazard polygons with the analysis layer')
-        self.hazard = clip(self.hazard, self._analysis_impacted)
+        self.hazard = self._shared_hazard_step(
+            'clip', [], clip, self._analysis_impacted)
         self.debug_layer(self.hazard, check_fields=False)
 
         self.set_state_process(
             'hazard',
             'Cleaning the vector hazard attribute table')
         # noinspection PyTypeChecker
-        self.hazard = prepare_vector_layer(self.hazard)
+        self.hazard = self._shared_hazard_step(
+            'prepare_vector_layer', [], prepare_vector_layer)
         self.debug_layer(self.hazard)
 
         if self.hazard.keywords.get('layer_mode') == 'continuous':
@@ -2172,16 +2341,22 @@ class ImpactFunction(object):
             self.set_state_process(
                 'hazard',
                 'Classify continuous hazard and assign class names')
-            self.hazard = reclassify_vector(
-                self.hazard, self.exposure.keywords['exposure'])
+            self.hazard = self._shared_hazard_step(
+                'reclassify_vector',
+                self._hazard_classification(),
+                reclassify_vector,
+                self.exposure.keywords['exposure'])
             self.debug_layer(self.hazard)
         else:
             # However, if it's a classified dataset, we only transpose the
             # value map using inasafe hazard classes.
             self.set_state_process(
                 'hazard', 'Assign classes based on value map')
-            self.hazard = update_value_map(
-                self.hazard, self.exposure.keywords['exposure'])
+            self.hazard = self._shared_hazard_step(
+                'update_value_map',
+                self._hazard_classification(),
+                update_value_map,
+                self.exposure.keywords['exposure'])
             self.debug_layer(self.hazard)
 
     @profile
@@ -2192,15 +2367,43 @@ class ImpactFunction(object):
         aggregation areas and assign hazard class.
         """
         LOGGER.info('ANALYSIS : Aggregate hazard preparation')
+        if self._raster_native_hazard:
+            # Done later with the exposure, by zonal_hazard_stats.
+            return
+
         self.set_state_process('hazard', 'Make hazard layer valid')
-        self.hazard = clean_layer(self.hazard)
+        # The number of processes does not change the result, it is not a
+        # parameter of the step.
+        self.hazard = self._shared_hazard_step(
+            'clean_layer',
+            [],
+            clean_layer,
+            None,
+            setting('geometry_processes', expected_type=int))
         self.debug_layer(self.hazard)
 
         self.set_state_process(
             'aggregation',
             'Union hazard polygons with aggregation areas and assign '
             'hazard class')
-        self._aggregate_hazard_impacted = union(self.hazard, self.aggregation)
+        if setting('tiled_union', expected_type=bool):
+            union_function = partial(
+                tiled_union,
+                processes=setting('geometry_processes', expected_type=int))
+        else:
+            union_function = union
+        if self._layer_cache is None:
+            self._aggregate_hazard_impacted = union_function(
+                self.hazard, self.aggregation)
+        else:
+            key = cache_key(
+                self._hazard_key, 'union', layer_cache_key(self.aggregation))
+            self._aggregate_hazard_impacted = self._layer_cache.run(
+                key, union_function, self.hazard, self.aggregation)
+            # The union adds the aggregation fields to the hazard keywords,
+            # even when the layer comes from the cache.
+            self.hazard.keywords['inasafe_fields'].update(
+                self.aggregation.keywords['inasafe_fields'])
         self.debug_layer(self._aggregate_hazard_impacted)
 
     @profile
@@ -2242,11 +2445,15 @@ class ImpactFunction(object):
         self.exposure = smart_clip(self.exposure, mask)
         self.debug_layer(self.exposure, check_fields=False)
 
+        # From now, the exposure is a memory layer owned by the analysis.
+        # Steps which do not change geometries can edit it in place.
+        in_place = setting('in_place_pipeline', expected_type=bool)
+
         self.set_state_process(
             'exposure',
             'Cleaning the vector exposure attribute table')
         # noinspection PyTypeChecker
-        self.exposure = prepare_vector_layer(self.exposure)
+        self.exposure = prepare_vector_layer(self.exposure, in_place=in_place)
         self.debug_layer(self.exposure)
 
         if not use_same_projection:
@@ -2271,7 +2478,8 @@ class ImpactFunction(object):
             self.set_state_process(
                 'exposure',
                 'Clip the exposure layer with the analysis layer')
-            self.exposure = clip(self.exposure, self._analysis_impacted)
+            self.exposure = clip(
+                self.exposure, self._analysis_impacted, in_place=in_place)
             self.debug_layer(self.exposure)
 
         self.set_state_process('exposure', 'Add default values')
@@ -2295,16 +2503,27 @@ class ImpactFunction(object):
         """
         LOGGER.info('ANALYSIS : Intersect Exposure and Aggregate Hazard')
         if is_raster_layer(self.exposure):
-            self.set_state_process(
-                'impact function',
-                'Zonal stats between exposure and aggregate hazard')
+            if self._raster_native_hazard:
+                self.set_state_process(
+                    'impact function',
+                    'Zonal stats between exposure, hazard and aggregation')
+                # noinspection PyTypeChecker
+                self._aggregate_hazard_impacted = zonal_hazard_stats(
+                    self.exposure, self.hazard, self.aggregation)
+            else:
+                self.set_state_process(
+                    'impact function',
+                    'Zonal stats between exposure and aggregate hazard')
 
-            # Be careful, our own zonal stats will take care of different
-            # projections between the two layers. We don't want to reproject
-            # rasters.
-            # noinspection PyTypeChecker
-            self._aggregate_hazard_impacted = zonal_stats(
-                self.exposure, self._aggregate_hazard_impacted)
+                # Be careful, our own zonal stats will take care of different
+                # projections between the two layers. We don't want to
+                # reproject rasters.
+                # noinspection PyTypeChecker
+                self._aggregate_hazard_impacted = zonal_stats(
+                    self.exposure,
+                    self._aggregate_hazard_impacted,
+                    native=setting(
+                        'native_zonal_statistics', expected_type=bool))
             self.debug_layer(self._aggregate_hazard_impacted)
 
             self.set_state_process('impact function', 'Add default values')
@@ -2326,13 +2545,15 @@ class ImpactFunction(object):
 
                 self.set_state_process(
                     'exposure', 'Make exposure layer valid')
-                self._exposure = clean_layer(self.exposure)
+                processes = setting('geometry_processes', expected_type=int)
+                self._exposure = clean_layer(
+                    self.exposure, processes=processes)
                 self.debug_layer(self.exposure)
 
                 self.set_state_process(
                     'impact function', 'Make aggregate hazard layer valid')
                 self._aggregate_hazard_impacted = clean_layer(
-                    self._aggregate_hazard_impacted)
+                    self._aggregate_hazard_impacted, processes=processes)
                 self.debug_layer(self._aggregate_hazard_impacted)
 
                 self.set_state_process(
@@ -2391,13 +2612,16 @@ class ImpactFunction(object):
             # On an aggregation layer, the default title does make any sense.
             layer_title(layer)
 
+        columnar = setting(
+            'columnar_post_processors', expected_type=bool)
+
         for post_processor in post_processors:
             valid, message = enough_input(layer, post_processor['input'])
             name = get_unicode(post_processor['name'])
 
             if valid:
                 valid, message = run_single_post_processor(
-                    layer, post_processor)
+                    layer, post_processor, columnar)
                 if valid:
                     self.set_state_process('post_processor', name)
                     message = u'{name} : Running'.format(name=name)
@@ -2416,35 +2640,54 @@ class ImpactFunction(object):
         """Do the summary calculation.
 
         We do not check layers here, we will check them in the next step.
+
+        The exposure summary is scanned only once. The aggregate hazard layer
+        is then summarized in memory for the aggregation, the analysis and
+        the exposure summary table.
         """
         LOGGER.info('ANALYSIS : Summary calculation')
+        classified_exposure = self._exposure.keywords.get('classification')
+        summarization_dicts = None
         if is_vector_layer(self._exposure_summary):
             # With continuous exposure, we don't have an exposure summary layer
             self.set_state_process(
                 'impact function',
                 'Aggregate the impact summary')
-            self._aggregate_hazard_impacted = aggregate_hazard_summary(
-                self.exposure_summary, self._aggregate_hazard_impacted)
+            tables = impact_summary_tables(
+                self.exposure_summary, summarize=bool(classified_exposure))
+            summarization_dicts = tables[2]
+            self._aggregate_hazard_impacted, areas = (
+                summarize_aggregate_hazard(
+                    self.exposure_summary,
+                    self._aggregate_hazard_impacted,
+                    tables))
             self.debug_layer(self._exposure_summary, add_to_datastore=False)
+        else:
+            areas = read_areas(self._aggregate_hazard_impacted)
 
         self.set_state_process(
             'impact function', 'Aggregate the aggregation summary')
         self._aggregation_summary = aggregation_summary(
-            self._aggregate_hazard_impacted, self.aggregation)
+            self._aggregate_hazard_impacted, self.aggregation, areas=areas)
         self.debug_layer(
             self._aggregation_summary, add_to_datastore=False)
 
         self.set_state_process(
             'impact function', 'Aggregate the analysis summary')
         self._analysis_impacted = analysis_summary(
-            self._aggregate_hazard_impacted, self._analysis_impacted)
+            self._aggregate_hazard_impacted,
+            self._analysis_impacted,
+            areas=areas)
         self.debug_layer(self._analysis_impacted)
 
-        if self._exposure.keywords.get('classification'):
+        if classified_exposure:
             self.set_state_process(
                 'impact function', 'Build the exposure summary table')
             self._exposure_summary_table = exposure_summary_table(
-                self._aggregate_hazard_impacted, self._exposure_summary)
+                self._aggregate_hazard_impacted,
+                self._exposure_summary,
+                areas=areas,
+                summarization_dicts=summarization_dicts)
             self.debug_layer(
                 self._exposure_summary_table, add_to_datastore=False)
 
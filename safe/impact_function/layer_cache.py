@@ -0,0 +1,431 @@
+# coding=utf-8
+
+"""Cache of layers prepared by the impact function."""
+
+import getpass
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from osgeo import gdal
+from qgis.core import QgsRasterLayer, QgsVectorLayer, QgsVectorFileWriter
+
+from safe.common.version import get_version
+from safe.gis.vector.clean_geometry import (
+    has_valid_geometries, set_valid_geometries)
+from safe.gis.vector.tools import create_memory_layer, copy_layer
+from safe.utilities.gis import is_raster_layer
+from safe.utilities.metadata import copy_layer_keywords
+from safe.utilities.profiling import add_counter
+from safe.utilities.settings import setting
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+LOGGER = logging.getLogger('InaSAFE')
+
+# Extensions used for shapefiles, they are part of the content of the layer.
+shapefile_extensions = ['.shp', '.shx', '.dbf', '.prj', '.cpg', '.qpj']
+
+# Hashes of files already read, by (path, size, modification time).
+_file_hashes = {}
+
+# The cache on disk shared by every impact function, see shared_layer_cache.
+_shared_cache = None
+
+
+def cache_key(*parts):
+    """Compute a key from a list of JSON serializable parts.
+
+    :param parts: The parts of the key. Dictionaries are sorted, other
+        objects are converted to unicode.
+    :type parts: list
+
+    :return: The SHA1 of the parts.
+    :rtype: str
+
+    .. versionadded:: 4.3
+    """
+    text = json.dumps(parts, sort_keys=True, default=unicode)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def file_hash(path):
+    """Compute the SHA1 of a file, and its sidecar files for a shapefile.
+
+    The hash is computed once for a given size and modification time.
+
+    :param path: The path of the file.
+    :type path: basestring
+
+    :return: The SHA1 of the content.
+    :rtype: str
+
+    .. versionadded:: 4.3
+    """
+    base_name, extension = os.path.splitext(path)
+    paths = [path]
+    if extension.lower() == '.shp':
+        paths = [
+            base_name + sidecar for sidecar in shapefile_extensions
+            if os.path.isfile(base_name + sidecar)]
+
+    content_hash = hashlib.sha1()
+    for file_path in paths:
+        status = os.stat(file_path)
+        signature = (file_path, status.st_size, status.st_mtime)
+        if signature not in _file_hashes:
+            sha = hashlib.sha1()
+            with open(file_path, 'rb') as source:
+                for chunk in iter(lambda: source.read(2 ** 20), b''):
+                    sha.update(chunk)
+            _file_hashes[signature] = sha.hexdigest()
+        content_hash.update(_file_hashes[signature])
+    return content_hash.hexdigest()
+
+
+def features_hash(layer):
+    """Compute the SHA1 of the features of a vector layer.
+
+    :param layer: The vector layer.
+    :type layer: QgsVectorLayer
+
+    :return: The SHA1 of the geometries and the attributes.
+    :rtype: str
+
+    .. versionadded:: 4.3
+    """
+    content_hash = hashlib.sha1()
+    content_hash.update(
+        repr([field.name() for field in layer.fields()]))
+    for feature in layer.getFeatures():
+        geometry = feature.geometry()
+        if geometry:
+            content_hash.update(geometry.asWkb())
+        content_hash.update(repr(feature.attributes()))
+    return content_hash.hexdigest()
+
+
+def layer_cache_key(layer):
+    """Compute a key from the content and the keywords of a layer.
+
+    Layers from a file are hashed from the file, other vector layers from
+    their features.
+
+    :param layer: The layer.
+    :type layer: QgsMapLayer
+
+    :return: The key.
+    :rtype: str
+
+    .. versionadded:: 4.3
+    """
+    path = layer.source().split('|')[0]
+    if os.path.isfile(path):
+        content = [file_hash(path), layer.source().split('|')[1:]]
+    elif is_raster_layer(layer):
+        content = [layer.source(), layer.providerType()]
+    else:
+        content = features_hash(layer)
+    return cache_key(content, copy_layer_keywords(layer.keywords))
+
+
+def duplicate_layer(layer):
+    """Duplicate a layer produced by the impact function.
+
+    Vector layers are copied in memory because the next steps of the
+    analysis might edit them. Raster layers are only read, so we use the
+    same file.
+
+    :param layer: The layer.
+    :type layer: QgsMapLayer
+
+    :return: The new layer, with a copy of the keywords.
+    :rtype: QgsMapLayer
+
+    .. versionadded:: 4.3
+    """
+    if is_raster_layer(layer):
+        new_layer = QgsRasterLayer(
+            layer.source(), layer.name(), layer.providerType())
+    else:
+        new_layer = create_memory_layer(
+            layer.name(), layer.geometryType(), layer.crs(), layer.fields())
+        copy_layer(layer, new_layer)
+        set_valid_geometries(new_layer, has_valid_geometries(layer))
+    new_layer.keywords = copy_layer_keywords(layer.keywords)
+    return new_layer
+
+
+def default_cache_directory():
+    """The directory of the cache on disk, if it is not set in the settings.
+
+    Unlike temp_dir, it does not depend on the date.
+
+    :return: The path of the directory.
+    :rtype: str
+
+    .. versionadded:: 4.3
+    """
+    base_directory = os.environ.get(
+        'INASAFE_WORK_DIR', tempfile.gettempdir())
+    user = getpass.getuser().replace(' ', '_')
+    return os.path.join(base_directory, 'inasafe', 'layer_cache', user)
+
+
+def shared_layer_cache():
+    """The cache on disk of prepared layers, according to the settings.
+
+    :return: The cache, None if it is disabled in the settings.
+    :rtype: LayerCache
+
+    .. versionadded:: 4.3
+    """
+    global _shared_cache
+    if not setting('prepared_layer_cache', expected_type=bool):
+        return None
+
+    directory = setting(
+        'prepared_layer_cache_directory', expected_type=unicode)
+    if not directory:
+        directory = default_cache_directory()
+    max_size = setting('prepared_layer_cache_size', expected_type=int)
+    max_size = max_size * 1024 * 1024
+
+    if _shared_cache is None or _shared_cache.directory != directory:
+        _shared_cache = LayerCache(directory, max_size)
+    _shared_cache.max_size = max_size
+    return _shared_cache
+
+
+class LayerCache(object):
+    """Layers prepared once and shared between many impact functions.
+
+    Each entry is the output of a step of the analysis. Its key is made from
+    the key of the input layer, the name of the step and its parameters, so
+    a chain of steps can be replayed from the cache.
+
+    Without a directory, layers are kept in memory for the life of the
+    cache. With a directory, vector layers are stored in GeoPackage files and
+    raster layers in GeoTIFF files, with their keywords in a JSON file. The
+    least recently used files are removed when the size of the directory is
+    above max_size.
+
+    .. versionadded:: 4.3
+    """
+
+    def __init__(self, directory=None, max_size=None):
+        """Constructor.
+
+        :param directory: The directory of the cache on disk, None to keep
+            layers in memory.
+        :type directory: basestring
+
+        :param max_size: The maximum size of the directory, in bytes.
+        :type max_size: int
+        """
+        self._layers = {}
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def __contains__(self, key):
+        if self.directory:
+            return os.path.exists(self._metadata_path(key))
+        return key in self._layers
+
+    def __len__(self):
+        if self.directory:
+            return len(self._entries())
+        return len(self._layers)
+
+    def get(self, key):
+        """Get a copy of a layer from the cache.
+
+        :param key: The key of the layer.
+        :type key: str
+
+        :return: A copy of the layer, None if it is not in the cache.
+        :rtype: QgsMapLayer
+        """
+        if self.directory:
+            layer = self._read(key)
+        else:
+            layer = self._layers.get(key)
+        if layer is None:
+            self.misses += 1
+            add_counter('layer_cache_misses')
+            return None
+        self.hits += 1
+        add_counter('layer_cache_hits')
+        return duplicate_layer(layer)
+
+    def put(self, key, layer):
+        """Add a copy of a layer to the cache.
+
+        :param key: The key of the layer.
+        :type key: str
+
+        :param layer: The layer.
+        :type layer: QgsMapLayer
+        """
+        if self.directory:
+            self._write(key, layer)
+            self._evict()
+        else:
+            self._layers[key] = duplicate_layer(layer)
+
+    def run(self, key, function, *args, **kwargs):
+        """Get a layer from the cache or compute it.
+
+        :param key: The key of the layer.
+        :type key: str
+
+        :param function: The function to call if the layer is not in the
+            cache. It must return a layer.
+        :type function: function
+
+        :return: The layer.
+        :rtype: QgsMapLayer
+        """
+        layer = self.get(key)
+        if layer is not None:
+            LOGGER.info('Using the prepared layer %s from the cache' % key)
+            return layer
+        layer = function(*args, **kwargs)
+        self.put(key, layer)
+        return layer
+
+    def clear(self):
+        """Remove all layers from the cache."""
+        self._layers = {}
+        if self.directory:
+            for entry in self._entries():
+                self._remove(entry)
+
+    def _file_key(self, key):
+        """The key of a layer on disk, it depends on the InaSAFE version."""
+        return cache_key(get_version(), key)
+
+    def _metadata_path(self, key):
+        return os.path.join(self.directory, self._file_key(key) + '.json')
+
+    def _read(self, key):
+        """Read a layer from the disk.
+
+        :return: The layer, None if it is not in the cache or not valid.
+        :rtype: QgsMapLayer
+        """
+        metadata_path = self._metadata_path(key)
+        if not os.path.exists(metadata_path):
+            return None
+        try:
+            with open(metadata_path) as metadata_file:
+                metadata = json.load(metadata_file)
+        except ValueError:
+            return None
+
+        path = os.path.join(self.directory, metadata['file'])
+        if metadata['type'] == 'raster':
+            layer = QgsRasterLayer(path, metadata['name'])
+        else:
+            layer = QgsVectorLayer(path, metadata['name'], 'ogr')
+            if layer.isValid():
+                fields = [field.name() for field in layer.fields()]
+                if fields != metadata['fields']:
+                    LOGGER.info('Fields are not the same in %s' % path)
+                    return None
+                set_valid_geometries(
+                    layer, metadata.get('valid_geometries', False))
+        if not layer.isValid():
+            return None
+
+        layer.keywords = metadata['keywords']
+        # The last access time is used to remove old entries.
+        os.utime(metadata_path, None)
+        return layer
+
+    def _write(self, key, layer):
+        """Write a layer to the disk."""
+        file_key = self._file_key(key)
+        metadata = {
+            'name': layer.name(),
+            'keywords': copy_layer_keywords(layer.keywords),
+        }
+        if is_raster_layer(layer):
+            metadata['type'] = 'raster'
+            metadata['file'] = file_key + '.tif'
+            path = os.path.join(self.directory, metadata['file'])
+            driver = gdal.GetDriverByName('GTiff')
+            source = gdal.Open(layer.source())
+            output = driver.CreateCopy(
+                path, source, options=['TILED=YES', 'COMPRESS=DEFLATE'])
+            if output is None:
+                LOGGER.info('The layer %s can not be cached.' % key)
+                return
+            del output
+        else:
+            metadata['type'] = 'vector'
+            metadata['file'] = file_key + '.gpkg'
+            metadata['fields'] = [field.name() for field in layer.fields()]
+            metadata['valid_geometries'] = has_valid_geometries(layer)
+            path = os.path.join(self.directory, metadata['file'])
+            if os.path.exists(path):
+                os.remove(path)
+            error = QgsVectorFileWriter.writeAsVectorFormat(
+                layer, path, 'utf-8', layer.crs(), 'GPKG')
+            if error != QgsVectorFileWriter.NoError:
+                LOGGER.info('The layer %s can not be cached.' % key)
+                return
+
+        # The metadata is written last, an entry without it is not valid.
+        with open(self._metadata_path(key), 'w') as metadata_file:
+            json.dump(metadata, metadata_file, default=unicode)
+
+    def _entries(self):
+        """List the entries on disk.
+
+        :return: List of (last access time, size, file key).
+        :rtype: list
+        """
+        sizes = {}
+        access_times = {}
+        for file_name in os.listdir(self.directory):
+            file_key, extension = os.path.splitext(file_name)
+            path = os.path.join(self.directory, file_name)
+            sizes[file_key] = sizes.get(file_key, 0) + os.path.getsize(path)
+            if extension == '.json':
+                access_times[file_key] = os.path.getmtime(path)
+        return [
+            (access_time, sizes[key], key)
+            for key, access_time in access_times.iteritems()]
+
+    def _remove(self, entry):
+        """Remove an entry from the disk."""
+        file_key = entry[2]
+        # The metadata first, so the entry is never partially read.
+        for extension in ['.json', '.gpkg', '.tif']:
+            path = os.path.join(self.directory, file_key + extension)
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    LOGGER.info('The file %s can not be removed.' % path)
+
+    def _evict(self):
+        """Remove the least recently used entries above the maximum size."""
+        if not self.max_size:
+            return
+        entries = sorted(self._entries())
+        total = sum(entry[1] for entry in entries)
+        while entries and total > self.max_size:
+            entry = entries.pop(0)
+            total -= entry[1]
+            self._remove(entry)
@@ -102,6 +102,8 @@ from safe.impact_function.create_extra_layers import (
 from safe.impact_function.impact_function import ImpactFunction
 from safe.impact_function.impact_function_utilities import (
     check_input_layer, FROM_CANVAS)
+from safe.impact_function.layer_cache import (
+    LayerCache, shared_layer_cache)
 from safe.impact_function.provenance_utilities import (
     get_multi_exposure_analysis_question)
 from safe.impact_function.style import simple_polygon_without_brush
@@ -924,7 +926,8 @@ class MultiExposureImpactFunction(object):
             else:
                 self._datastore = Folder(temp_dir(sub_dir=self._unique_name))
 
-            self._datastore.default_vector_format = 'geojson'
+            self._datastore.default_vector_format = setting(
+                'vector_output_format', expected_type=unicode)
         LOGGER.info('Datastore : %s' % self.datastore.uri_path)
 
         if self._aggregation:
@@ -936,8 +939,16 @@ class MultiExposureImpactFunction(object):
         list_geometries = []
         list_of_analysis_path = []
 
+        # The hazard and the aggregate hazard are prepared once and shared
+        # by every impact function. Only steps depending on the
+        # classification of the exposure are computed again.
+        hazard_cache = shared_layer_cache()
+        if hazard_cache is None:
+            hazard_cache = LayerCache()
+
         for i, impact_function in enumerate(self._impact_functions):
             self._current_impact_function = impact_function
+            impact_function.hazard_cache = hazard_cache
             LOGGER.info('Running %s' % impact_function.name)
             if isinstance(self._datastore, Folder):
                 # We can include this analysis in the parent datastore.
@@ -948,9 +959,11 @@ class MultiExposureImpactFunction(object):
                 if not exists(folder):
                     makedirs(folder)
                 impact_function.datastore = Folder(folder)
-                impact_function.datastore.default_vector_format = 'geojson'
+                impact_function.datastore.default_vector_format = setting(
+                    'vector_output_format', expected_type=unicode)
 
             code, message = impact_function.run()
+            impact_function.hazard_cache = None
             if code != ANALYSIS_SUCCESS:
                 return code, message
 
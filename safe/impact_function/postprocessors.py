@@ -2,6 +2,7 @@
 
 """Postprocessors."""
 
+import numpy
 # noinspection PyUnresolvedReferences
 from PyQt4.QtCore import QPyNullVariant
 from qgis.core import QgsFeatureRequest
@@ -21,6 +22,7 @@ from safe.processors import (
     layer_property_input_type,
     size_calculator_input_value
 )
+from safe.processors.post_processor_functions import multiply
 from safe.utilities.i18n import tr
 from safe.utilities.profiling import profile
 
@@ -51,8 +53,256 @@ def evaluate_formula(formula, variables):
     return result
 
 
+def _is_null(value):
+    """Check if a value coming from an attribute table is null.
+
+    :param value: The value to check.
+    :type value: object
+
+    :returns: True if the value is null.
+    :rtype: bool
+    """
+    return value is None or isinstance(value, QPyNullVariant)
+
+
+def _keyword_order(**kwargs):
+    """Return the order used by Python to iterate over keyword arguments.
+
+    :param kwargs: Keyword arguments.
+    :type kwargs: dict
+
+    :returns: List of keys, in the order seen by a `**kwargs` function.
+    :rtype: list
+    """
+    return list(kwargs.keys())
+
+
+def _formula_operand(value):
+    """Convert a value the same way `evaluate_formula` sees it.
+
+    `evaluate_formula` substitutes `str(value)` in the formula, so a float is
+    rounded to 12 significant digits before being evaluated. We do the same
+    so both engines give exactly the same result.
+
+    :param value: The value to convert.
+    :type value: object
+
+    :returns: The converted value.
+    :rtype: object
+    """
+    if isinstance(value, float):
+        return float(str(value))
+    return value
+
+
+def evaluate_formula_columns(formula, columns, constants, count):
+    """Evaluate a formula once on whole columns of values.
+
+    This is the vectorized version of `evaluate_formula`. If one value of a
+    row is null, the result for this row is null.
+
+    :param formula: A simple formula.
+    :type formula: str
+
+    :param columns: Dictionary of variable name and list of values, one per
+        row.
+    :type columns: dict
+
+    :param constants: Dictionary of variable name and value which is the same
+        for every row.
+    :type constants: dict
+
+    :param count: The number of rows.
+    :type count: int
+
+    :returns: List of results, one per row.
+    :rtype: list
+    """
+    for value in constants.values():
+        if _is_null(value):
+            return [value] * count
+
+    valid = numpy.ones(count, dtype=bool)
+    for values in columns.values():
+        valid &= numpy.fromiter(
+            (not _is_null(value) for value in values), bool, count)
+
+    results = [None] * count
+    valid_rows = numpy.flatnonzero(valid)
+    if not len(valid_rows):
+        return results
+
+    namespace = {}
+    for key, value in constants.items():
+        namespace[key] = _formula_operand(value)
+    for key, values in columns.items():
+        namespace[key] = numpy.array(
+            [_formula_operand(values[i]) for i in valid_rows])
+
+    code = compile(formula, '<formula>', 'eval')
+    computed = numpy.asarray(eval(code, {'__builtins__': {}}, namespace))
+    if computed.ndim == 0:
+        # The formula is only using constants.
+        computed = numpy.repeat(computed, len(valid_rows))
+    computed = computed.tolist()
+    for i, value in zip(valid_rows, computed):
+        results[i] = value
+    return results
+
+
+def multiply_columns(count, **kwargs):
+    """Vectorized version of the `multiply` post processor function.
+
+    :param count: The number of rows.
+    :type count: int
+
+    :param kwargs: Dictionary of variable name and list of values, one per
+        row, or a single value for every row.
+    :type kwargs: dict
+
+    :returns: List of results, one per row.
+    :rtype: list
+    """
+    product = numpy.ones(count, dtype=int)
+    falsy_values = []
+    for key in _keyword_order(**kwargs):
+        values = kwargs[key]
+        if not isinstance(values, list):
+            values = [values] * count
+        falsy = numpy.fromiter(
+            (_is_null(value) or not value for value in values), bool, count)
+        product = product * numpy.array(
+            [1 if is_falsy else value
+             for value, is_falsy in zip(values, falsy)])
+        falsy_values.append((values, falsy))
+
+    results = product.tolist()
+    # Like `multiply`, we return the first null or zero value we found.
+    for values, falsy in reversed(falsy_values):
+        for i in numpy.flatnonzero(falsy):
+            results[i] = values[i]
+    return results
+
+
+def map_columns(function, columns, constants, count, memoize=True):
+    """Call a post processor function row by row on columns of values.
+
+    If memoize is True, rows with the same input values are only computed
+    once.
+
+    :param function: The post processor function.
+    :type function: function
+
+    :param columns: Dictionary of variable name and list of values, one per
+        row.
+    :type columns: dict
+
+    :param constants: Dictionary of variable name and value which is the same
+        for every row.
+    :type constants: dict
+
+    :param count: The number of rows.
+    :type count: int
+
+    :param memoize: If the results should be cached by input values.
+    :type memoize: bool
+
+    :returns: List of results, one per row.
+    :rtype: list
+    """
+    keys = columns.keys()
+    rows = zip(*[columns[key] for key in keys]) if keys else [()] * count
+
+    cache = {}
+    results = []
+    for row in rows:
+        if memoize and row in cache:
+            results.append(cache[row])
+            continue
+        parameters = dict(constants)
+        parameters.update(zip(keys, row))
+        result = function(**parameters)
+        if memoize:
+            cache[row] = result
+        results.append(result)
+    return results
+
+
+# Post processor functions which have a vectorized implementation.
+vectorized_functions = {
+    multiply: multiply_columns,
+}
+
+
+def _evaluate_columns(
+        layer, output_value, input_indexes, input_properties,
+        default_parameters):
+    """Evaluate one post processor output on the whole layer at once.
+
+    :param layer: The vector layer to use for post processing.
+    :type layer: QgsVectorLayer
+
+    :param output_value: The post processor output definition.
+    :type output_value: dict
+
+    :param input_indexes: Dictionary of input name and field index.
+    :type input_indexes: dict
+
+    :param input_properties: Dictionary of input name and geometry property.
+    :type input_properties: dict
+
+    :param default_parameters: Dictionary of input name and constant value.
+    :type default_parameters: dict
+
+    :returns: Tuple with the list of feature ids and the list of results.
+    :rtype: (list, list)
+    """
+    request = QgsFeatureRequest().setSubsetOfAttributes(
+        input_indexes.values())
+    if not input_properties:
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+
+    # Read the input fields only once into columns.
+    feature_ids = []
+    columns = dict((key, []) for key in input_indexes)
+    columns.update((key, []) for key in input_properties)
+    for feature in layer.getFeatures(request):
+        feature_ids.append(feature.id())
+        attributes = feature.attributes()
+        for key, index in input_indexes.items():
+            columns[key].append(attributes[index])
+        for key in input_properties:
+            columns[key].append(feature.geometry())
+
+    count = len(feature_ids)
+    python_function = output_value.get('function')
+    if python_function:
+        parameters = dict(default_parameters)
+        parameters.update(columns)
+        if python_function in vectorized_functions:
+            results = vectorized_functions[python_function](
+                count, **parameters)
+        else:
+            # Geometries can't be used as a cache key.
+            results = map_columns(
+                python_function,
+                columns,
+                default_parameters,
+                count,
+                memoize=not input_properties)
+    else:
+        results = evaluate_formula_columns(
+            output_value['formula'], columns, default_parameters, count)
+
+    # The affected postprocessor returns a boolean.
+    results = [
+        tr(unicode(result)) if isinstance(result, bool) else result
+        for result in results]
+    return feature_ids, results
+
+
 @profile
-def run_single_post_processor(layer, post_processor):
+def run_single_post_processor(layer, post_processor, columnar=False):
     """Run single post processor.
 
     If the layer has the output field, it will pass the post
@@ -64,9 +314,18 @@ def run_single_post_processor(layer, post_processor):
     :param post_processor: A post processor definition.
     :type post_processor: dict
 
+    :param columnar: If True, the inputs are read once as columns, the
+        formula or the function is evaluated on the whole columns and the
+        outputs are written with a single `changeAttributeValues` call.
+        Results are the same as the default feature by feature mode.
+    :type columnar: bool
+
     :returns: Tuple with True if success, else False with an error message.
     :rtype: (bool, str)
     """
+    # Output field name and results from the columnar mode.
+    columnar_results = {}
+
     if not layer.editBuffer():
 
         # Turn on the editing mode.
@@ -219,6 +478,15 @@ def run_single_post_processor(layer, post_processor):
                 layer.rollBack()
                 return False, msg
 
+        if columnar:
+            columnar_results[output_field_name] = _evaluate_columns(
+                layer,
+                output_value,
+                input_indexes,
+                input_properties,
+                default_parameters)
+            continue
+
         # Create iterator for feature
         request = QgsFeatureRequest().setSubsetOfAttributes(
             input_indexes.values())
@@ -265,6 +533,18 @@ def run_single_post_processor(layer, post_processor):
             )
 
     layer.commitChanges()
+
+    if columnar_results:
+        # New fields are committed, we can write all values at once.
+        provider = layer.dataProvider()
+        update_map = {}
+        for field_name, (feature_ids, results) in columnar_results.items():
+            index = provider.fieldNameIndex(field_name)
+            for feature_id, result in zip(feature_ids, results):
+                update_map.setdefault(feature_id, {})[index] = result
+        provider.changeAttributeValues(update_map)
+        layer.updateFields()
+
     return True, None
 
 
@@ -26,6 +26,8 @@ from safe.definitions.fields import (
     female_displaced_count_field,
     youth_displaced_count_field,
     displaced_field,
+    total_field,
+    total_affected_field,
 )
 from safe.definitions.layer_purposes import (
     layer_purpose_profiling,
@@ -115,6 +117,7 @@ from safe.definitions.constants import (
 from safe.gis.sanity_check import check_inasafe_fields
 from safe.utilities.unicode import byteify
 from safe.utilities.gis import wkt_to_rectangle
+from safe.utilities.settings import setting, set_setting
 from safe.utilities.utilities import readable_os_version
 from safe.impact_function.impact_function import ImpactFunction
 from safe.impact_function.impact_function_utilities import check_input_layer
@@ -646,6 +649,41 @@ class TestImpactFunction(unittest.TestCase):
         self.assertEqual(1, len(values))
         self.assertEqual(0.75, values[0])
 
+    def test_raster_native_hazard(self):
+        """Test the raster native hazard with a classified raster hazard.
+
+        The result must be the same as the analysis with polygonize.
+        """
+        native = setting('raster_native_hazard', expected_type=bool)
+        results = []
+        try:
+            for enabled in [False, True]:
+                set_setting('raster_native_hazard', enabled)
+                hazard_layer = load_test_raster_layer(
+                    'hazard', 'classified_flood_20_20.asc')
+                exposure_layer = load_test_raster_layer(
+                    'exposure', 'pop_binary_raster_20_20.asc')
+
+                impact_function = ImpactFunction()
+                impact_function.exposure = exposure_layer
+                impact_function.hazard = hazard_layer
+                status, message = impact_function.prepare()
+                self.assertEqual(PREPARE_SUCCESS, status, message)
+                status, message = impact_function.run()
+                self.assertEqual(ANALYSIS_SUCCESS, status, message)
+
+                analysis = impact_function.analysis_impacted
+                feature = next(analysis.getFeatures())
+                results.append((
+                    feature[total_field['field_name']],
+                    feature[total_affected_field['field_name']]))
+        finally:
+            set_setting('raster_native_hazard', native)
+
+        self.assertGreater(results[1][1], 0)
+        self.assertAlmostEqual(results[0][0], results[1][0])
+        self.assertAlmostEqual(results[0][1], results[1][1])
+
     def test_profiling(self):
         """Test running impact function on test data."""
         hazard_layer = load_test_vector_layer(
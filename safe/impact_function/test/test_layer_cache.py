@@ -0,0 +1,91 @@
+# coding=utf-8
+
+"""Test for the cache of prepared layers."""
+
+import unittest
+
+from safe.test.utilities import get_qgis_app, load_test_vector_layer
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+from safe.common.utilities import temp_dir, unique_filename
+from safe.impact_function.layer_cache import (
+    LayerCache, cache_key, layer_cache_key)
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+
+class TestLayerCache(unittest.TestCase):
+    """Test the cache of prepared layers."""
+
+    def test_cache_key(self):
+        """Test keys do not depend on the order of dictionaries."""
+        self.assertEqual(
+            cache_key('step', {'a': 1, 'b': 2}),
+            cache_key('step', {'b': 2, 'a': 1}))
+        self.assertNotEqual(
+            cache_key('step', {'a': 1}), cache_key('step', {'a': 2}))
+
+        layer = load_test_vector_layer(
+            'gisv4', 'hazard', 'classified_vector.geojson')
+        key = layer_cache_key(layer)
+        layer.keywords['hazard'] = 'other'
+        self.assertNotEqual(key, layer_cache_key(layer))
+
+    def test_layer_cache(self):
+        """Test layers are computed once and copied from the cache."""
+        layer = load_test_vector_layer(
+            'gisv4', 'hazard', 'classified_vector.geojson')
+        cache = LayerCache()
+        calls = []
+
+        def step(input_layer):
+            calls.append(input_layer)
+            return input_layer
+
+        first = cache.run('key', step, layer)
+        second = cache.run('key', step, layer)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 1)
+
+        # The layer from the cache is a copy.
+        self.assertIsNot(first, second)
+        self.assertEqual(first.featureCount(), second.featureCount())
+        second.keywords['title'] = 'edited'
+        self.assertNotEqual(
+            cache.get('key').keywords.get('title'), 'edited')
+
+    def test_disk_cache(self):
+        """Test layers are stored on disk and evicted by size."""
+        layer = load_test_vector_layer(
+            'gisv4', 'hazard', 'classified_vector.geojson')
+        directory = unique_filename(dir=temp_dir('test'))
+        cache = LayerCache(directory)
+        cache.put('key', layer)
+
+        # Another cache with the same directory can read the layer.
+        cache = LayerCache(directory)
+        self.assertIn('key', cache)
+        cached = cache.get('key')
+        self.assertEqual(cached.featureCount(), layer.featureCount())
+        self.assertEqual(cached.fields().count(), layer.fields().count())
+        self.assertEqual(
+            cached.keywords['inasafe_fields'],
+            layer.keywords['inasafe_fields'])
+        self.assertIsNone(cache.get('other'))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+        # Only the last entry is kept if the cache is too small for both.
+        cache.max_size = sum(entry[1] for entry in cache._entries())
+        cache.put('second', layer)
+        self.assertEqual(len(cache), 1)
+        self.assertIn('second', cache)
+        self.assertNotIn('key', cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -55,7 +55,11 @@ from safe.test.utilities import load_test_vector_layer
 from safe.impact_function.postprocessors import (
     run_single_post_processor,
     evaluate_formula,
+    evaluate_formula_columns,
+    multiply_columns,
+    map_columns,
     enough_input)
+from safe.processors.post_processor_functions import multiply
 
 
 __copyright__ = "Copyright 2016, The InaSAFE Project"
@@ -519,6 +523,75 @@ class TestPostProcessors(unittest.TestCase):
         }
         self.assertIsNone(evaluate_formula(formula, variables))
 
+    def test_evaluate_formula_columns(self):
+        """Test for evaluating formula on columns."""
+        formula = '(population - fatalities) * gender_ratio'
+        columns = {
+            'population': [100, None, 10.123456789012345, 0],
+            'gender_ratio': [0.45, 0.5, 0.1, 0.3]
+        }
+        constants = {'fatalities': 0}
+        results = evaluate_formula_columns(formula, columns, constants, 4)
+
+        for i, result in enumerate(results):
+            variables = dict(constants)
+            variables['population'] = columns['population'][i]
+            variables['gender_ratio'] = columns['gender_ratio'][i]
+            self.assertEqual(evaluate_formula(formula, variables), result)
+
+        # A null constant gives a null value for every row.
+        constants = {'fatalities': None}
+        results = evaluate_formula_columns(formula, columns, constants, 4)
+        self.assertEqual([None] * 4, results)
+
+    def test_multiply_columns(self):
+        """Test the vectorized multiply."""
+        population = [100, None, 0, 12.5]
+        amount = 2.8
+        results = multiply_columns(4, population=population, amount=amount)
+        expected = [
+            multiply(population=value, amount=amount) for value in population]
+        self.assertEqual(expected, results)
+
+    def test_map_columns(self):
+        """Test calling a function on columns."""
+        calls = []
+
+        def function(hazard_class, ratio):
+            calls.append(hazard_class)
+            return '%s_%s' % (hazard_class, ratio)
+
+        results = map_columns(
+            function, {'hazard_class': ['high', 'low', 'high']},
+            {'ratio': 1}, 3)
+        self.assertEqual(['high_1', 'low_1', 'high_1'], results)
+        # The second 'high' is coming from the cache.
+        self.assertEqual(['high', 'low'], calls)
+
+    def test_columnar_post_processor(self):
+        """Test the columnar mode gives the same result."""
+        layers = []
+        for columnar in [False, True]:
+            impact_layer = load_test_vector_layer(
+                'impact',
+                'indivisible_polygon_impact.geojson',
+                clone_to_memory=True)
+            for post_processor in [
+                    post_processor_female, post_processor_hygiene_packs]:
+                result, message = run_single_post_processor(
+                    impact_layer, post_processor, columnar)
+                self.assertTrue(result, message)
+            layers.append(impact_layer)
+
+        fields = [
+            female_displaced_count_field['field_name'],
+            hygiene_packs_count_field['field_name']]
+        for feature_a, feature_b in zip(
+                layers[0].getFeatures(), layers[1].getFeatures()):
+            for field in fields:
+                self.assertEqual(
+                    feature_a.attribute(field), feature_b.attribute(field))
+
 
 if __name__ == '__main__':
     unittest.main()
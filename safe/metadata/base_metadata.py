@@ -13,6 +13,7 @@ from safe.metadata.encoder import MetadataEncoder
 from safe.metadata.metadata_db_io import MetadataDbIO
 from safe.metadata.utilities import (
     XML_NS,
+    ancillary_file_path,
     insert_xml_element,
     read_property_from_xml,
     reading_ancillary_files
@@ -208,11 +209,9 @@ class BaseMetadata(object):
 
         instantiate_metadata_db = False
 
-        path = os.path.splitext(clean_uri)[0]
-
         if xml_uri is None:
             if self.layer_is_file_based:
-                self._xml_uri = '%s.xml' % path
+                self._xml_uri = ancillary_file_path(layer_uri, 'xml')
             else:
                 # xml should be stored in cacheDB
                 self._xml_uri = None
@@ -222,7 +221,7 @@ class BaseMetadata(object):
 
         if json_uri is None:
             if self.layer_is_file_based:
-                self._json_uri = '%s.json' % path
+                self._json_uri = ancillary_file_path(layer_uri, 'json')
             else:
                 # json should be stored in cacheDB
                 self._json_uri = None
@@ -1,7 +1,7 @@
 # coding=utf-8
 """Test Metadata."""
 
-from safe.metadata.utilities import insert_xml_element
+from safe.metadata.utilities import insert_xml_element, ancillary_file_path
 
 from xml.etree import ElementTree
 from safe.metadata import BaseMetadata
@@ -47,3 +47,14 @@ class TestMetadata(TestCase):
         result_xml = ElementTree.tostring(root)
 
         self.assertEquals(expected_xml, result_xml)
+
+    def test_ancillary_file_path(self):
+        """Check each layer of a geopackage has its own XML file."""
+        self.assertEqual(
+            ancillary_file_path('/data/roads.shp', 'xml'), '/data/roads.xml')
+        self.assertEqual(
+            ancillary_file_path('/data/roads.shp|layerid=0', 'json'),
+            '/data/roads.json')
+        self.assertEqual(
+            ancillary_file_path('/data/jakarta.gpkg|layername=roads', 'xml'),
+            '/data/jakarta.roads.xml')
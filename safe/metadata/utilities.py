@@ -1,6 +1,7 @@
 # coding=utf-8
 """Metadata utilities."""
 
+import os
 from contextlib import contextmanager
 from datetime import datetime, date
 from xml.dom.minidom import parseString
@@ -25,6 +26,31 @@ ElementTree.register_namespace('gmd', XML_NS['gmd'])
 ElementTree.register_namespace('xsi', XML_NS['xsi'])
 
 
+def ancillary_file_path(layer_uri, extension):
+    """Path of the XML or JSON file of a file based layer.
+
+    A layer inside a geopackage has its own file next to the geopackage,
+    named after the layer, because a geopackage holds many layers.
+
+    :param layer_uri: Uri to layer.
+    :type layer_uri: basestring
+
+    :param extension: The extension of the file, 'xml' or 'json'.
+    :type extension: basestring
+
+    :return: The path of the file.
+    :rtype: basestring
+
+    .. versionadded:: 4.3
+    """
+    parts = layer_uri.split('|')
+    path = os.path.splitext(parts[0])[0]
+    for option in parts[1:]:
+        if option.startswith('layername='):
+            path = '%s.%s' % (path, option[len('layername='):])
+    return '%s.%s' % (path, extension)
+
+
 def insert_xml_element(root, element_path):
     """insert an XML element in an other creating the needed parents.
     :param root: The container
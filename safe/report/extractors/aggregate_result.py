@@ -130,7 +130,7 @@ def aggregation_result_extractor(impact_report, component_metadata):
         type_index = aggregation_summary.fieldNameIndex(field_name)
         type_field_index.append(type_index)
 
-    for feat in aggregation_summary.getFeatures():
+    for feat in impact_report.layer_features(aggregation_summary):
         total_affected_value = format_number(
             feat[total_field_index],
             enable_rounding=is_rounded,
@@ -181,7 +181,7 @@ def aggregation_result_extractor(impact_report, component_metadata):
 
     # Fetch total affected for each breakdown name
     value_dict = {}
-    for feat in exposure_summary_table.getFeatures():
+    for feat in impact_report.layer_features(exposure_summary_table):
         # exposure summary table is in csv format, so the field returned is
         # always in text format
         affected_value = int(float(feat[affected_field_index]))
@@ -214,7 +214,7 @@ def aggregation_result_extractor(impact_report, component_metadata):
     """Get the super total affected."""
 
     # total for affected (super total)
-    analysis_feature = analysis_layer.getFeatures().next()
+    analysis_feature = impact_report.layer_features(analysis_layer)[0]
     field_index = analysis_layer.fieldNameIndex(
         total_affected_field['field_name'])
     total_all = format_number(
@@ -58,7 +58,7 @@ def analysis_detail_extractor(impact_report, component_metadata):
 
     analysis_layer = impact_report.analysis
     analysis_layer_fields = analysis_layer.keywords['inasafe_fields']
-    analysis_feature = analysis_layer.getFeatures().next()
+    analysis_feature = impact_report.layer_features(analysis_layer)[0]
     exposure_summary_table = impact_report.exposure_summary_table
     if exposure_summary_table:
         exposure_summary_table_fields = exposure_summary_table.keywords[
@@ -210,7 +210,7 @@ def analysis_detail_extractor(impact_report, component_metadata):
 
     """Create detail rows."""
     details = []
-    for feat in exposure_summary_table.getFeatures():
+    for feat in impact_report.layer_features(exposure_summary_table):
         row = []
 
         # Get breakdown name
@@ -564,7 +564,7 @@ def analysis_detail_extractor(impact_report, component_metadata):
 
         # rows
         details = []
-        for feat in exposure_summary_table.getFeatures():
+        for feat in impact_report.layer_features(exposure_summary_table):
             row = []
 
             # Get breakdown name
@@ -62,7 +62,7 @@ def general_report_extractor(impact_report, component_metadata):
     # find hazard class
     summary = []
 
-    analysis_feature = analysis_layer.getFeatures().next()
+    analysis_feature = impact_report.layer_features(analysis_layer)[0]
     analysis_inasafe_fields = analysis_layer.keywords['inasafe_fields']
 
     exposure_unit = exposure_type['units'][0]
@@ -257,7 +257,7 @@ def multi_exposure_general_report_extractor(impact_report, component_metadata):
         if is_population:
             population_exist = True
 
-        analysis_feature = analysis_layer.getFeatures().next()
+        analysis_feature = impact_report.layer_features(analysis_layer)[0]
         analysis_inasafe_fields = analysis_layer.keywords['inasafe_fields']
 
         exposure_unit = exposure_type['units'][0]
@@ -88,7 +88,7 @@ def minimum_needs_extractor(impact_report, component_metadata):
                 frequencies[frequency].append(field)
 
     needs = []
-    analysis_feature = analysis_layer.getFeatures().next()
+    analysis_feature = impact_report.layer_features(analysis_layer)[0]
     header_frequency_format = resolve_from_dictionary(
         extra_args, 'header_frequency_format')
     total_header = resolve_from_dictionary(extra_args, 'total_header')
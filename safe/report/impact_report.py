@@ -6,16 +6,22 @@ Easily customize map report or document based report.
 
 """
 
+import hashlib
 import imp
+import json
 import logging
 import os
 import shutil
+from collections import OrderedDict
+from multiprocessing.pool import AsyncResult, ThreadPool
+from tempfile import mkdtemp
 
-from qgis.core import QgsComposition, QgsRasterLayer
+from qgis.core import QgsComposition, QgsMapSettings, QgsRasterLayer
 
 from safe import messaging as m
 from safe.common.exceptions import (
     KeywordNotFoundError)
+from safe.common.utilities import temp_dir
 from safe.defaults import (
     white_inasafe_logo_path,
     black_inasafe_logo_path,
@@ -23,8 +29,11 @@ from safe.defaults import (
     default_north_arrow_path)
 from safe.definitions.messages import disclaimer
 from safe.messaging import styles
+from safe.report.processors.default import thread_safe_renderers
+from safe.report.report_metadata import Jinja2ComponentsMetadata
 from safe.utilities.i18n import tr
 from safe.utilities.keyword_io import KeywordIO
+from safe.utilities.settings import setting
 from safe.utilities.utilities import get_error_message
 
 __copyright__ = "Copyright 2016, The InaSAFE Project"
@@ -37,6 +46,64 @@ WARNING_STYLE = styles.RED_LEVEL_4_STYLE
 
 LOGGER = logging.getLogger('InaSAFE')
 
+# Extractor and renderer modules, by name and path.
+_loaded_modules = {}
+
+# Hash of the inputs and output of the last rendered components, by output
+# folder and component key, the most recently used last.
+_rendered_components = OrderedDict()
+
+# Maximum number of rendered components remembered by process.
+rendered_components_size = 64
+
+
+def remember_rendered_component(output_key, component_hash, output):
+    """Remember the output of a rendered component.
+
+    The least recently used components are forgotten, so only
+    rendered_components_size outputs are kept in memory.
+
+    :param output_key: The output folder and the key of the component.
+    :type output_key: tuple
+
+    :param component_hash: The hash of the inputs of the component.
+    :type component_hash: str
+
+    :param output: The output of the component.
+    :type output: str, dict
+
+    .. versionadded:: 4.3
+    """
+    _rendered_components.pop(output_key, None)
+    _rendered_components[output_key] = (component_hash, output)
+    while len(_rendered_components) > rendered_components_size:
+        _rendered_components.popitem(last=False)
+
+
+def load_source(name, path):
+    """Load a module from a Python file, once by process.
+
+    The module is loaded again only if the file has been modified.
+
+    :param name: The name of the module.
+    :type name: str
+
+    :param path: The path of the Python file.
+    :type path: str
+
+    :return: The module.
+    :rtype: module
+
+    .. versionadded:: 4.3
+    """
+    path = os.path.abspath(path)
+    modified_time = os.path.getmtime(path)
+    module = _loaded_modules.get((name, path))
+    if module is None or module[0] != modified_time:
+        module = modified_time, imp.load_source(name, path)
+        _loaded_modules[(name, path)] = module
+    return module[1]
+
 
 class InaSAFEReportContext(object):
 
@@ -287,7 +354,8 @@ class ImpactReport(object):
             multi_exposure_impact_function=None):
         """Constructor for the Composition Report class.
 
-        :param iface: Reference to the QGIS iface object.
+        :param iface: Reference to the QGIS iface object, None without a
+            map canvas.
         :type iface: QgsAppInterface
 
         :param template_metadata: InaSAFE template metadata.
@@ -323,17 +391,41 @@ class ImpactReport(object):
         self._extra_layers = extra_layers
         self._minimum_needs = minimum_needs_profile
         self._multi_exposure_impact_function = multi_exposure_impact_function
-        self._extent = self._iface.mapCanvas().extent()
         self._inasafe_context = InaSAFEReportContext()
 
-        # QgsMapSettings is added in 2.4
-        map_settings = self._iface.mapCanvas().mapSettings()
+        if self._iface:
+            self._extent = self._iface.mapCanvas().extent()
+            # QgsMapSettings is added in 2.4
+            map_settings = self._iface.mapCanvas().mapSettings()
+        else:
+            # No map canvas, for instance from the command line or in a
+            # batch worker.
+            map_settings = self._layer_map_settings()
+            self._extent = map_settings.extent()
 
         self._qgis_composition_context = QGISCompositionContext(
             None,
             map_settings,
             ImpactReport.DEFAULT_PAGE_DPI)
         self._keyword_io = KeywordIO()
+        self._layer_features = {}
+
+    def _layer_map_settings(self):
+        """Map settings made from the impact layer, without a map canvas.
+
+        The analysis layer is used if there is no impact layer.
+
+        :return: The map settings, in the CRS of the layer and zoomed to it.
+        :rtype: QgsMapSettings
+
+        .. versionadded:: 4.3
+        """
+        layer = getattr(self, '_impact', None) or self._analysis
+        map_settings = QgsMapSettings()
+        map_settings.setCrsTransformEnabled(True)
+        map_settings.setDestinationCrs(layer.crs())
+        map_settings.setExtent(layer.extent())
+        return map_settings
 
     @property
     def inasafe_context(self):
@@ -662,9 +754,171 @@ class ImpactReport(object):
                 pass
         return legend_attribute_dict
 
+    def layer_features(self, layer):
+        """Get the features of a layer, read once by report.
+
+        Extractors share these features instead of reading the layer again.
+
+        :param layer: The vector layer.
+        :type layer: QgsVectorLayer
+
+        :return: The features of the layer.
+        :rtype: list
+
+        .. versionadded:: 4.3
+        """
+        if layer.id() not in self._layer_features:
+            self._layer_features[layer.id()] = list(layer.getFeatures())
+        return self._layer_features[layer.id()]
+
+    @staticmethod
+    def component_stages(components):
+        """Group the components in stages, according to their dependencies.
+
+        A component only needs components from the previous stages. A
+        component without dependencies in its metadata needs all the
+        components before it.
+
+        :param components: The components of the report.
+        :type components: list[ReportComponentsMetadata]
+
+        :return: List of stages, each stage is a list of components in the
+            order of the report.
+        :rtype: list
+
+        .. versionadded:: 4.3
+        """
+        stage_by_key = {}
+        stages = []
+        for i, component in enumerate(components):
+            dependencies = component.dependencies
+            if dependencies is None:
+                dependencies = [c.key for c in components[:i]]
+            stage = 0
+            for key in dependencies:
+                if key in stage_by_key:
+                    stage = max(stage, stage_by_key[key] + 1)
+            stage_by_key[component.key] = stage
+            if stage == len(stages):
+                stages.append([])
+            stages[stage].append(component)
+        return stages
+
+    def _component_hash(self, component, renderer):
+        """Hash the inputs of a component: its context and template.
+
+        :param component: The component, with its context.
+        :type component: ReportComponentsMetadata
+
+        :param renderer: The renderer of the component.
+        :type renderer: function
+
+        :return: The hash, None if the context can not be hashed.
+        :rtype: str
+        """
+        try:
+            # Objects without representation have their address, so they
+            # always look new.
+            content = json.dumps([
+                component.key,
+                getattr(renderer, '__module__', None),
+                getattr(renderer, '__name__', repr(renderer)),
+                component.context,
+                component.output_path,
+                component.resources,
+            ], sort_keys=True, default=repr)
+        except (TypeError, ValueError):
+            return None
+
+        content_hash = hashlib.md5(content)
+        if component.template and self.metadata.template_folder:
+            template_path = os.path.join(
+                self.metadata.template_folder, component.template)
+            if os.path.isfile(template_path):
+                with open(template_path, 'rb') as template_file:
+                    content_hash.update(template_file.read())
+        return content_hash.hexdigest()
+
+    def _is_rendered(self, component, component_hash):
+        """Check if a component has been rendered with the same inputs.
+
+        The output of the component is restored if so.
+
+        :param component: The component.
+        :type component: ReportComponentsMetadata
+
+        :param component_hash: The hash of the inputs of the component.
+        :type component_hash: str
+
+        :return: True if the component does not need to be rendered again.
+        :rtype: bool
+        """
+        if not component_hash or not self.output_folder:
+            return False
+        output_key = (os.path.abspath(self.output_folder), component.key)
+        rendered = _rendered_components.get(output_key)
+        if not rendered or rendered[0] != component_hash:
+            return False
+
+        string_format = Jinja2ComponentsMetadata.OutputFormat.String
+        if component.output_format != string_format:
+            output_path = self.component_absolute_output_path(component.key)
+            if isinstance(output_path, dict):
+                output_path = output_path.values()
+            elif not isinstance(output_path, list):
+                output_path = [output_path]
+            if not all(path and os.path.exists(path) for path in output_path):
+                return False
+
+        component.output = rendered[1]
+        remember_rendered_component(output_key, *rendered)
+        return True
+
+    def _render_component(self, renderer, component):
+        """Render a component and copy its resources.
+
+        :param renderer: The renderer of the component.
+        :type renderer: function
+
+        :param component: The component, with its context.
+        :type component: ReportComponentsMetadata
+
+        :return: The output of the renderer.
+        :rtype: str, dict
+        """
+        # method signature:
+        #  - this ImpactReport
+        #  - this component
+        output = renderer(self, component)
+        output_path = self.component_absolute_output_path(
+            component.key)
+        if isinstance(output_path, dict):
+            try:
+                dirname = os.path.dirname(output_path.get('doc'))
+            except:
+                dirname = os.path.dirname(output_path.get('map'))
+        else:
+            dirname = os.path.dirname(output_path)
+        if component.resources:
+            for resource in component.resources:
+                target_resource = os.path.basename(resource)
+                target_dir = os.path.join(
+                    dirname, 'resources', target_resource)
+                # copy here
+                if os.path.exists(target_dir):
+                    shutil.rmtree(target_dir)
+                shutil.copytree(resource, target_dir)
+        return output
+
     def process_components(self):
         """Process context for each component and a given template.
 
+        Components are processed in stages, according to their dependencies.
+        In a stage, contexts are extracted in the main thread while renderers
+        without Qt run in a pool of threads. A component is not rendered
+        again if its context and template did not change since the last
+        report in the same output folder.
+
         :returns: Tuple of error code and message
         :type: tuple
 
@@ -685,122 +939,147 @@ class ImpactReport(object):
 
         generation_error_code = self.REPORT_GENERATION_SUCCESS
 
-        for component in self.metadata.components:
-            # load extractors
-            try:
-                if not component.context:
-                    if callable(component.extractor):
-                        _extractor_method = component.extractor
-                    else:
-                        _package_name = (
-                            '%(report-key)s.extractors.%(component-key)s')
-                        _package_name %= {
-                            'report-key': self.metadata.key,
-                            'component-key': component.key
-                        }
-                        # replace dash with underscores
-                        _package_name = _package_name.replace('-', '_')
-                        _extractor_path = os.path.join(
-                            self.metadata.template_folder,
-                            component.extractor
-                        )
-                        _module = imp.load_source(
-                            _package_name, _extractor_path)
-                        _extractor_method = getattr(_module, 'extractor')
-                else:
-                    LOGGER.info('Predefined context. Extractor not needed.')
-            except Exception as e:  # pylint: disable=broad-except
-                generation_error_code = self.REPORT_GENERATION_FAILED
-                LOGGER.info(e)
-                if self.impact_function.debug_mode:
-                    raise
-                else:
-                    message.add(failed_find_extractor)
-                    message.add(component.info)
-                    message.add(get_error_message(e))
-                    continue
-
-            # method signature:
-            #  - this ImpactReport
-            #  - this component
-            try:
-                if not component.context:
-                    context = _extractor_method(self, component)
-                    component.context = context
-                else:
-                    LOGGER.info('Using predefined context.')
-            except Exception as e:  # pylint: disable=broad-except
-                generation_error_code = self.REPORT_GENERATION_FAILED
-                LOGGER.info(e)
-                if self.impact_function.debug_mode:
-                    raise
-                else:
-                    message.add(failed_extract_context)
-                    message.add(get_error_message(e))
-                    continue
+        threads = setting('report_rendering_threads', expected_type=int)
+        pool = ThreadPool(threads) if threads > 1 else None
+        try:
+            for stage in self.component_stages(self.metadata.components):
+                renders = []
+                for component in stage:
+                    # load extractors
+                    try:
+                        if not component.context:
+                            if callable(component.extractor):
+                                _extractor_method = component.extractor
+                            else:
+                                _package_name = (
+                                    '%(report-key)s.extractors.'
+                                    '%(component-key)s')
+                                _package_name %= {
+                                    'report-key': self.metadata.key,
+                                    'component-key': component.key
+                                }
+                                # replace dash with underscores
+                                _package_name = _package_name.replace(
+                                    '-', '_')
+                                _extractor_path = os.path.join(
+                                    self.metadata.template_folder,
+                                    component.extractor
+                                )
+                                _module = load_source(
+                                    _package_name, _extractor_path)
+                                _extractor_method = getattr(
+                                    _module, 'extractor')
+                        else:
+                            LOGGER.info(
+                                'Predefined context. Extractor not needed.')
+                    except Exception as e:  # pylint: disable=broad-except
+                        generation_error_code = self.REPORT_GENERATION_FAILED
+                        LOGGER.info(e)
+                        if self.impact_function.debug_mode:
+                            raise
+                        else:
+                            message.add(failed_find_extractor)
+                            message.add(component.info)
+                            message.add(get_error_message(e))
+                            continue
+
+                    # method signature:
+                    #  - this ImpactReport
+                    #  - this component
+                    try:
+                        if not component.context:
+                            context = _extractor_method(self, component)
+                            component.context = context
+                        else:
+                            LOGGER.info('Using predefined context.')
+                    except Exception as e:  # pylint: disable=broad-except
+                        generation_error_code = self.REPORT_GENERATION_FAILED
+                        LOGGER.info(e)
+                        if self.impact_function.debug_mode:
+                            raise
+                        else:
+                            message.add(failed_extract_context)
+                            message.add(get_error_message(e))
+                            continue
+
+                    try:
+                        # load processor
+                        if callable(component.processor):
+                            _renderer = component.processor
+                        else:
+                            _package_name = (
+                                '%(report-key)s.renderer.%(component-key)s')
+                            _package_name %= {
+                                'report-key': self.metadata.key,
+                                'component-key': component.key
+                            }
+                            # replace dash with underscores
+                            _package_name = _package_name.replace('-', '_')
+                            _renderer_path = os.path.join(
+                                self.metadata.template_folder,
+                                component.processor
+                            )
+                            _module = load_source(
+                                _package_name, _renderer_path)
+                            _renderer = getattr(_module, 'renderer')
+                    except Exception as e:  # pylint: disable=broad-except
+                        generation_error_code = self.REPORT_GENERATION_FAILED
+                        LOGGER.info(e)
+                        if self.impact_function.debug_mode:
+                            raise
+                        else:
+                            message.add(failed_find_renderer)
+                            message.add(component.info)
+                            message.add(get_error_message(e))
+                            continue
+
+                    if not component.context:
+                        continue
 
-            try:
-                # load processor
-                if callable(component.processor):
-                    _renderer = component.processor
-                else:
-                    _package_name = '%(report-key)s.renderer.%(component-key)s'
-                    _package_name %= {
-                        'report-key': self.metadata.key,
-                        'component-key': component.key
-                    }
-                    # replace dash with underscores
-                    _package_name = _package_name.replace('-', '_')
-                    _renderer_path = os.path.join(
-                        self.metadata.template_folder,
-                        component.processor
-                    )
-                    _module = imp.load_source(_package_name, _renderer_path)
-                    _renderer = getattr(_module, 'renderer')
-            except Exception as e:  # pylint: disable=broad-except
-                generation_error_code = self.REPORT_GENERATION_FAILED
-                LOGGER.info(e)
-                if self.impact_function.debug_mode:
-                    raise
-                else:
-                    message.add(failed_find_renderer)
-                    message.add(component.info)
-                    message.add(get_error_message(e))
-                    continue
-
-            # method signature:
-            #  - this ImpactReport
-            #  - this component
-            if component.context:
-                try:
-                    output = _renderer(self, component)
-                    output_path = self.component_absolute_output_path(
-                        component.key)
-                    if isinstance(output_path, dict):
-                        try:
-                            dirname = os.path.dirname(output_path.get('doc'))
-                        except:
-                            dirname = os.path.dirname(output_path.get('map'))
-                    else:
-                        dirname = os.path.dirname(output_path)
-                    if component.resources:
-                        for resource in component.resources:
-                            target_resource = os.path.basename(resource)
-                            target_dir = os.path.join(
-                                dirname, 'resources', target_resource)
-                            # copy here
-                            if os.path.exists(target_dir):
-                                shutil.rmtree(target_dir)
-                            shutil.copytree(resource, target_dir)
-                    component.output = output
-                except Exception as e:  # pylint: disable=broad-except
-                    generation_error_code = self.REPORT_GENERATION_FAILED
-                    LOGGER.info(e)
-                    if self.impact_function.debug_mode:
-                        raise
-                    else:
-                        message.add(failed_render_context)
-                        message.add(get_error_message(e))
+                    component_hash = self._component_hash(
+                        component, _renderer)
+                    if self._is_rendered(component, component_hash):
+                        LOGGER.info(
+                            'Component %s did not change.' % component.key)
                         continue
 
+                    if pool and _renderer in thread_safe_renderers:
+                        if self.output_folder is None:
+                            self.output_folder = mkdtemp(dir=temp_dir())
+                        render = pool.apply_async(
+                            self._render_component, (_renderer, component))
+                    else:
+                        # Rendered in the main thread, after the extraction
+                        # of the stage.
+                        render = _renderer
+                    renders.append((component, component_hash, render))
+
+                for component, component_hash, render in renders:
+                    output_key = (
+                        os.path.abspath(self.output_folder or ''),
+                        component.key)
+                    _rendered_components.pop(output_key, None)
+                    try:
+                        if isinstance(render, AsyncResult):
+                            component.output = render.get()
+                        else:
+                            component.output = self._render_component(
+                                render, component)
+                    except Exception as e:  # pylint: disable=broad-except
+                        generation_error_code = self.REPORT_GENERATION_FAILED
+                        LOGGER.info(e)
+                        if self.impact_function.debug_mode:
+                            raise
+                        else:
+                            message.add(failed_render_context)
+                            message.add(get_error_message(e))
+                            continue
+                    if component_hash and self.output_folder:
+                        remember_rendered_component(
+                            output_key, component_hash, component.output)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
         return generation_error_code, message
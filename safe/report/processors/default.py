@@ -16,6 +16,7 @@ from PyQt4 import QtXml
 from PyQt4.QtCore import QUrl
 from PyQt4.QtGui import QImage, QPainter, QPrinter
 from PyQt4.QtSvg import QSvgRenderer
+from jinja2.bccache import FileSystemBytecodeCache
 from jinja2.environment import Environment
 from jinja2.loaders import FileSystemLoader
 from qgis.core import (
@@ -50,6 +51,9 @@ __revision__ = '$Format:%H$'
 
 LOGGER = logging.getLogger('InaSAFE')
 
+# Jinja2 environments, by template folder.
+_jinja2_environments = {}
+
 
 def composition_item(composer, item_id, item_class):
     """Fetch a specific item according to its type in a composer.
@@ -93,6 +97,38 @@ def composition_item(composer, item_id, item_class):
     return None
 
 
+def jinja2_environment(template_folder):
+    """Get the Jinja2 environment of a template folder.
+
+    The environment is created once by process and by folder, so each
+    template is compiled once. Compiled templates are also stored on the
+    disk for the next processes.
+
+    :param template_folder: The folder of the templates.
+    :type template_folder: str
+
+    :return: The environment.
+    :rtype: jinja2.Environment
+
+    .. versionadded:: 4.3
+    """
+    template_folder = os.path.abspath(template_folder)
+    environment = _jinja2_environments.get(template_folder)
+    if environment is None:
+        environment = Environment(
+            loader=FileSystemLoader(template_folder),
+            extensions=[
+                'jinja2.ext.i18n',
+                'jinja2.ext.with_',
+                'jinja2.ext.loopcontrols',
+                'jinja2.ext.do',
+            ],
+            bytecode_cache=FileSystemBytecodeCache(
+                temp_dir('jinja2_bytecode')))
+        _jinja2_environments[template_folder] = environment
+    return environment
+
+
 def jinja2_renderer(impact_report, component):
     """Versatile text renderer using Jinja2 Template.
 
@@ -113,19 +149,7 @@ def jinja2_renderer(impact_report, component):
     """
     context = component.context
 
-    main_template_folder = impact_report.metadata.template_folder
-    loader = FileSystemLoader(
-        os.path.abspath(main_template_folder))
-    extensions = [
-        'jinja2.ext.i18n',
-        'jinja2.ext.with_',
-        'jinja2.ext.loopcontrols',
-        'jinja2.ext.do',
-    ]
-    env = Environment(
-        loader=loader,
-        extensions=extensions)
-
+    env = jinja2_environment(impact_report.metadata.template_folder)
     template = env.get_template(component.template)
     rendered = template.render(context)
     if component.output_format == 'string':
@@ -139,13 +163,22 @@ def jinja2_renderer(impact_report, component):
         # make sure directory is created
         dirname = os.path.dirname(output_path)
         if not os.path.exists(dirname):
-            os.makedirs(dirname)
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # It may be created by another thread.
+                if not os.path.isdir(dirname):
+                    raise
 
         with io.open(output_path, mode='w', encoding='utf-8') as output_file:
             output_file.write(rendered)
         return output_path
 
 
+# Renderers without Qt, which can run outside of the main thread.
+thread_safe_renderers = [jinja2_renderer]
+
+
 def create_qgis_pdf_output(
         impact_report,
         output_path,
@@ -26,7 +26,8 @@ class ReportComponentsMetadata(object):
     def __init__(
             self, key, processor, extractor,
             output_format, template, output_path, resources=None,
-            tags=None, context=None, extra_args=None, **kwargs):
+            tags=None, context=None, extra_args=None, dependencies=None,
+            **kwargs):
         """Base class for component metadata.
 
         ReportComponentMetadata is a metadata about the component element of
@@ -63,6 +64,11 @@ class ReportComponentsMetadata(object):
             Needed to pass it out to extractors.
         :type extra_args: str
 
+        :param dependencies: The keys of the components needed before this
+            one is extracted. None if the component needs all the components
+            before it in the report.
+        :type dependencies: list
+
         .. versionadded:: 4.0
         """
         self._key = key
@@ -84,6 +90,7 @@ class ReportComponentsMetadata(object):
         else:
             self._component_context = {}
         self._extra_args = extra_args
+        self._dependencies = dependencies
 
     @property
     def key(self):
@@ -213,6 +220,18 @@ class ReportComponentsMetadata(object):
         """
         self._extra_args = value
 
+    @property
+    def dependencies(self):
+        """Keys of the components needed by this component.
+
+        None if the component needs all the components before it.
+
+        :return: list, None
+
+        .. versionadded:: 4.3
+        """
+        return self._dependencies
+
     @property
     def info(self):
         """Short info about the component.
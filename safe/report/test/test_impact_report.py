@@ -37,6 +37,7 @@ from safe.test.utilities import (
     load_test_raster_layer)
 from safe.utilities.utilities import readable_os_version
 from safe.definitions.reports.components import (
+    infographic_report,
     map_report,
     standard_impact_report_metadata_html,
     standard_impact_report_metadata_pdf,
@@ -52,7 +53,13 @@ from safe.definitions.reports.components import (
     analysis_provenance_details_simplified_component,
     standard_multi_exposure_impact_report_metadata_html)
 from safe.definitions.utilities import update_template_component
-from safe.report.impact_report import ImpactReport
+from safe.report.impact_report import (
+    ImpactReport,
+    load_source,
+    _rendered_components,
+    remember_rendered_component,
+    rendered_components_size)
+from safe.report.processors.default import jinja2_environment
 from safe.utilities.resources import resources_path
 from safe.definitions.utilities import (
     get_displacement_rate, generate_default_profile, is_affected)
@@ -2161,3 +2168,51 @@ class TestImpactReport(unittest.TestCase):
             self.assertTrue(os.path.exists(path), msg=path)
 
         shutil.rmtree(output_folder, ignore_errors=True)
+
+    def test_report_caches(self):
+        """Test Jinja2 environments and report modules are loaded once."""
+        template_folder = resources_path('report-templates')
+        environment = jinja2_environment(template_folder)
+        self.assertIs(environment, jinja2_environment(template_folder))
+        self.assertIsNotNone(environment.bytecode_cache)
+
+        path = os.path.join(
+            os.path.dirname(__file__), 'hello_world_report.py')
+        module = load_source('hello_world_report', path)
+        self.assertIs(module, load_source('hello_world_report', path))
+
+        # Only the last rendered components are remembered.
+        for i in range(rendered_components_size + 10):
+            remember_rendered_component(('folder', i), 'hash', 'output')
+        self.assertEqual(len(_rendered_components), rendered_components_size)
+        self.assertNotIn(('folder', 0), _rendered_components)
+        self.assertIn(
+            ('folder', rendered_components_size + 9), _rendered_components)
+        _rendered_components.clear()
+
+    def test_component_stages(self):
+        """Test components are processed in stages by their dependencies."""
+        metadata = ReportMetadata(metadata_dict=infographic_report)
+        stages = ImpactReport.component_stages(metadata.components)
+        keys = [[component.key for component in stage] for stage in stages]
+        expected_keys = [
+            ['population-chart', 'infographic-people-section-notes'],
+            ['population-chart-png'],
+            ['population-chart-legend'],
+            ['population-infographic']
+        ]
+        self.assertEqual(keys, expected_keys)
+
+        metadata = ReportMetadata(
+            metadata_dict=standard_impact_report_metadata_pdf)
+        stages = ImpactReport.component_stages(metadata.components)
+        self.assertEqual(len(stages), 3)
+        self.assertIn('general-report', [c.key for c in stages[0]])
+        self.assertIn('impact-report', [c.key for c in stages[1]])
+        self.assertIn('impact-report-pdf', [c.key for c in stages[2]])
+
+        # Without dependencies, components are processed one by one.
+        for component in metadata.components:
+            component._dependencies = None
+        stages = ImpactReport.component_stages(metadata.components)
+        self.assertEqual(len(stages), len(metadata.components))
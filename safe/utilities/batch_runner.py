@@ -0,0 +1,581 @@
+# coding=utf-8
+
+"""Headless engine to run the scenarios of the batch runner.
+
+The scenarios are read from the same files as the batch runner dialog. They
+can be run one after the other in the current process or in a pool of
+worker processes, each worker having its own QGIS application.
+"""
+
+import logging
+import os
+from ConfigParser import ConfigParser, MissingSectionHeaderError
+from StringIO import StringIO
+from datetime import datetime
+from multiprocessing import cpu_count
+
+from qgis.core import (
+    QgsApplication,
+    QgsRectangle,
+    QgsCoordinateReferenceSystem,
+    QgsVectorLayer,
+    QgsRasterLayer)
+
+from safe.common.utilities import process_pool
+from safe.datastore.folder import Folder
+from safe.definitions.constants import (
+    ANALYSIS_SUCCESS,
+    PREPARE_SUCCESS,
+    ANALYSIS_FAILED_BAD_CODE,
+    ANALYSIS_FAILED_BAD_INPUT)
+from safe.definitions.layer_purposes import (
+    layer_purpose_hazard,
+    layer_purpose_exposure,
+    layer_purpose_aggregation)
+from safe.definitions.reports.components import (
+    standard_impact_report_metadata_pdf,
+    map_report,
+    all_default_report_components)
+from safe.definitions.utilities import update_template_component
+from safe.impact_function.impact_function import ImpactFunction
+from safe.report.impact_report import ImpactReport
+from safe.report.report_metadata import ReportMetadata
+from safe.utilities.gis import extent_string_to_array
+from safe.utilities.i18n import tr
+from safe.utilities.settings import setting
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+LOGGER = logging.getLogger('InaSAFE')
+
+# The QGIS application of a worker process.
+_qgis_application = None
+
+
+def read_scenarios(filename):
+    """Read keywords dictionary from file.
+
+    :param filename: Name of file holding scenarios .
+
+    :return Dictionary of with structure like this
+        {{ 'foo' : { 'a': 'b', 'c': 'd'},
+            { 'bar' : { 'd': 'e', 'f': 'g'}}
+
+    A scenarios file may look like this:
+
+        [jakarta_flood]
+        hazard: /path/to/hazard.tif
+        exposure: /path/to/exposure.tif
+        function: function_id
+        aggregation: /path/to/aggregation_layer.tif
+        extent: minx, miny, maxx, maxy
+
+    Notes:
+        path for hazard, exposure, and aggregation are relative to scenario
+        file path
+    """
+    # Input checks
+    filename = os.path.abspath(filename)
+
+    blocks = {}
+    parser = ConfigParser()
+
+    # Parse the file content.
+    # if the content don't have section header
+    # we use the filename.
+    try:
+        parser.read(filename)
+    except MissingSectionHeaderError:
+        base_name = os.path.basename(filename)
+        name = os.path.splitext(base_name)[0]
+        section = '[%s]\n' % name
+        content = section + open(filename).read()
+        parser.readfp(StringIO(content))
+
+    # convert to dictionary
+    for section in parser.sections():
+        items = parser.items(section)
+        # add section as scenario name
+        items.append(('scenario_name', section))
+        # add full path to the blocks
+        items.append(('full_path', filename))
+        blocks[section] = {}
+        for key, value in items:
+            blocks[section][key] = value
+
+    # Ok we have generated a structure that looks like this:
+    # blocks = {{ 'foo' : { 'a': 'b', 'c': 'd'},
+    #           { 'bar' : { 'd': 'e', 'f': 'g'}}
+    # where foo and bar are scenarios and their dicts are the options for
+    # that scenario (e.g. hazard, exposure etc)
+    return blocks
+
+
+def validate_scenario(blocks, scenario_directory):
+    """Function to validate input layer stored in scenario file.
+
+    Check whether the files that are used in scenario file need to be
+    updated or not.
+
+    :param blocks: dictionary from read_scenarios
+    :type blocks: dictionary
+
+    :param scenario_directory: directory where scenario text file is saved
+    :type scenario_directory: file directory
+
+    :return: pass message to dialog and log detailed status
+    """
+    # dictionary to temporary contain status message
+    blocks_update = {}
+    for section, section_item in blocks.iteritems():
+        ready = True
+        for item in section_item:
+            if item in ['hazard', 'exposure', 'aggregation']:
+                # get relative path
+                rel_path = section_item[item]
+                full_path = os.path.join(scenario_directory, rel_path)
+                filepath = os.path.normpath(full_path)
+                if not os.path.exists(filepath):
+                    blocks_update[section] = {
+                        'status': 'Please update scenario'}
+                    LOGGER.info(section + ' needs to be updated')
+                    LOGGER.info('Unable to find ' + filepath)
+                    ready = False
+        if ready:
+            blocks_update[section] = {'status': 'Scenario ready'}
+            # LOGGER.info(section + " scenario is ready")
+    for section, section_item in blocks_update.iteritems():
+        blocks[section]['status'] = blocks_update[section]['status']
+
+
+def define_layer(layer_path, scenario_directory):
+    """Create QGIS layer (either vector or raster) from file path input.
+
+    .. versionadded:: 4.3
+
+    :param layer_path: Path to layer file, relative to the scenario
+        directory.
+    :type layer_path: str
+
+    :param scenario_directory: The directory of the scenario.
+    :type scenario_directory: str
+
+    :return: QGIS layer, None if the file is not a layer.
+    :rtype: QgsMapLayer
+    """
+    joined_path = os.path.join(scenario_directory, layer_path)
+    full_path = os.path.normpath(joined_path)
+    file_name = os.path.split(layer_path)[-1]
+
+    # get extension and basename to create layer
+    base_name, extension = os.path.splitext(file_name)
+
+    # load layer in scenario
+    layer = QgsRasterLayer(full_path, base_name)
+    if layer.isValid():
+        return layer
+    else:
+        layer = QgsVectorLayer(full_path, base_name, 'ogr')
+        if layer.isValid():
+            return layer
+        # if layer is not vector nor raster
+        else:
+            LOGGER.warning('Input in scenario is not recognized/supported')
+            return
+
+
+def prepare_scenario(items, scenario_directory):
+    """Prepare scenario for impact function variable.
+
+    .. versionadded:: 4.3
+
+    :param items: Dictionary containing settings for impact function.
+    :type items: dict
+
+    :param scenario_directory: The directory of the scenario.
+    :type scenario_directory: str
+
+    :return: A tuple with a dictionary containing parameters and an empty
+        message if we could load the layers. Or None and an error message
+        if something went wrong.
+    :rtype: (dict, str)
+    """
+    status = True
+    message = ''
+    # get hazard
+    if 'hazard' in items:
+        hazard_path = items['hazard']
+        hazard = define_layer(hazard_path, scenario_directory)
+        if not hazard:
+            status = False
+            message = tr(
+                'Unable to find {hazard_path}').format(
+                hazard_path=hazard_path)
+    else:
+        hazard = None
+        LOGGER.warning('Scenario does not contain hazard path')
+
+    # get exposure
+    if 'exposure' in items:
+        exposure_path = items['exposure']
+        exposure = define_layer(exposure_path, scenario_directory)
+        if not exposure:
+            status = False
+            if message:
+                message += '\n'
+            message += tr(
+                'Unable to find {exposure_path}').format(
+                exposure_path=exposure_path)
+    else:
+        exposure = None
+        LOGGER.warning('Scenario does not contain hazard path')
+
+    # get aggregation
+    if 'aggregation' in items:
+        aggregation_path = items['aggregation']
+        aggregation = define_layer(aggregation_path, scenario_directory)
+    else:
+        aggregation = None
+        LOGGER.info('Scenario does not contain aggregation path')
+
+    # get extent
+    if 'extent' in items:
+        LOGGER.info('Extent coordinate is found')
+        coordinates = items['extent']
+        array_coord = extent_string_to_array(coordinates)
+        extent = QgsRectangle(*array_coord)
+    else:
+        extent = None
+        LOGGER.info('Scenario does not contain extent coordinates')
+
+    # get extent crs id
+    if 'extent_crs' in items:
+        LOGGER.info('Extent CRS is found')
+        crs = items['extent_crs']
+        extent_crs = QgsCoordinateReferenceSystem(crs)
+    else:
+        LOGGER.info('Extent crs is not found, assuming crs to EPSG:4326')
+        extent_crs = QgsCoordinateReferenceSystem('EPSG:4326')
+
+    # make sure at least hazard and exposure data are available in
+    # scenario. Aggregation and extent checking will be done when
+    # assigning layer to impact_function
+    if status:
+        parameters = {
+            layer_purpose_hazard['key']: hazard,
+            layer_purpose_exposure['key']: exposure,
+            layer_purpose_aggregation['key']: aggregation,
+            'extent': extent,
+            'crs': extent_crs
+        }
+        return parameters, message
+    else:
+        LOGGER.warning(message)
+        return None, message
+
+
+def create_impact_function(parameters):
+    """Create an impact function from the parameters of a scenario.
+
+    .. versionadded:: 4.3
+
+    :param parameters: The parameters from prepare_scenario.
+    :type parameters: dict
+
+    :return: The impact function, not prepared yet.
+    :rtype: ImpactFunction
+    """
+    impact_function = ImpactFunction()
+    impact_function.hazard = parameters[layer_purpose_hazard['key']]
+    impact_function.exposure = parameters[layer_purpose_exposure['key']]
+    if parameters[layer_purpose_aggregation['key']]:
+        impact_function.aggregation = (
+            parameters[layer_purpose_aggregation['key']])
+    elif parameters['extent']:
+        impact_function.requested_extent = parameters['extent']
+        impact_function.crs = parameters['crs']
+    return impact_function
+
+
+def generate_pdf_report(
+        impact_function, iface, output_directory, scenario_name):
+    """Generate and store map and impact report from impact function.
+
+    This function is adapted from analysis_utilities.py
+
+    .. versionadded:: 4.3
+
+    :param impact_function: Impact Function.
+    :type impact_function: ImpactFunction()
+
+    :param iface: iface.
+    :type iface: iface
+
+    :param output_directory: The directory where the report is stored.
+    :type output_directory: str
+
+    :param scenario_name: name of the scenario
+    :type scenario_name: str
+    """
+    # output folder
+    file_path = os.path.join(output_directory, scenario_name)
+
+    # create impact table report instance
+    table_report_metadata = ReportMetadata(
+        metadata_dict=standard_impact_report_metadata_pdf)
+    impact_table_report = ImpactReport(
+        iface,
+        table_report_metadata,
+        impact_function=impact_function)
+    impact_table_report.output_folder = file_path
+    impact_table_report.process_components()
+
+    # create impact map report instance
+    map_report_metadata = ReportMetadata(
+        metadata_dict=update_template_component(map_report))
+    impact_map_report = ImpactReport(
+        iface,
+        map_report_metadata,
+        impact_function=impact_function)
+    # TODO: Get from settings file
+
+    # get the extent of impact layer
+    impact_map_report.qgis_composition_context.extent = \
+        impact_function.impact.extent()
+    impact_map_report.output_folder = file_path
+    impact_map_report.process_components()
+
+
+def run_scenario(
+        scenario,
+        scenario_directory,
+        output_directory,
+        iface=None,
+        analysis_callback=None):
+    """Run a scenario, in a worker process or in the batch dialog.
+
+    The analysis is stored in its own Folder datastore, in the directory of
+    the scenario inside the output directory, next to the reports.
+
+    .. versionadded:: 4.3
+
+    :param scenario: The scenario from read_scenarios.
+    :type scenario: dict
+
+    :param scenario_directory: The directory of the scenario.
+    :type scenario_directory: str
+
+    :param output_directory: The directory of the reports.
+    :type output_directory: str
+
+    :param iface: A QGIS App interface, if any.
+    :type iface: QgsInterface
+
+    :param analysis_callback: A function called after a successful analysis,
+        before the reports, with the impact function and the parameters
+        from prepare_scenario. The batch dialog adds the layers to the
+        project with it.
+    :type analysis_callback: function
+
+    :return: Dictionary with the scenario name, the status text, a success
+        flag, and the path of the impact layer or None.
+    :rtype: dict
+    """
+    scenario_name = scenario['scenario_name']
+    result = {
+        'scenario_name': scenario_name,
+        'status': '',
+        'success': True,
+        'impact': None,
+    }
+
+    parameters, message = prepare_scenario(scenario, scenario_directory)
+    if parameters is None:
+        result['status'] = tr('Please update scenario')
+        result['message'] = message
+        result['success'] = False
+        return result
+
+    impact_function = create_impact_function(parameters)
+    datastore_path = os.path.join(
+        output_directory, scenario_name, 'analysis')
+    if not os.path.exists(datastore_path):
+        os.makedirs(datastore_path)
+    impact_function.datastore = Folder(datastore_path)
+    impact_function.datastore.default_vector_format = setting(
+        'vector_output_format', expected_type=unicode)
+
+    prepare_status, prepare_message = impact_function.prepare()
+    if prepare_status != PREPARE_SUCCESS:
+        LOGGER.warning('Impact function not ready')
+        result['message'] = prepare_message.to_text()
+        return result
+
+    LOGGER.info('Impact function ready')
+    status, message = impact_function.run()
+    if status == ANALYSIS_SUCCESS:
+        result['status'] = tr('Analysis Success')
+        impact_layer = impact_function.impact
+        if impact_layer.isValid():
+            result['impact'] = impact_layer.source()
+            if analysis_callback:
+                analysis_callback(impact_function, parameters)
+            # generate map report and impact report, iface is None in a
+            # worker process.
+            try:
+                report = impact_function.generate_report(
+                    all_default_report_components, iface=iface)
+                if report and (
+                        report[0] == ImpactReport.REPORT_GENERATION_FAILED):
+                    result['status'] = tr('Report failed to generate.')
+                    result['message'] = report[1].to_text()
+                    result['success'] = False
+                    return result
+                # this line is to save the report in user specified
+                # directory.
+                generate_pdf_report(
+                    impact_function, iface, output_directory, scenario_name)
+            except Exception as e:  # pylint: disable=broad-except
+                LOGGER.exception(
+                    'Reports of %s failed.' % scenario_name)
+                result['status'] = tr('Report failed to generate.')
+                result['message'] = str(e)
+                result['success'] = False
+        else:
+            LOGGER.info('Impact layer is invalid')
+
+    elif status == ANALYSIS_FAILED_BAD_INPUT:
+        LOGGER.info('Bad input detected')
+
+    elif status == ANALYSIS_FAILED_BAD_CODE:
+        LOGGER.info('Impact function encountered a bug')
+
+    return result
+
+
+def start_qgis():
+    """Start the QGIS application of a worker process.
+
+    A forked worker inherits the application of its parent.
+
+    .. versionadded:: 4.3
+    """
+    global _qgis_application
+    if QgsApplication.instance() is None:
+        _qgis_application = QgsApplication([], False)
+        _qgis_application.initQgis()
+
+
+def _run_scenario_in_worker(job):
+    """Run a scenario in a worker process.
+
+    :param job: Tuple with the position of the scenario, the scenario, the
+        scenario directory and the output directory.
+    :type job: tuple
+
+    :return: Tuple with the position and the result of run_scenario.
+    :rtype: tuple
+    """
+    position, scenario, scenario_directory, output_directory = job
+    try:
+        result = run_scenario(scenario, scenario_directory, output_directory)
+    except Exception as e:  # pylint: disable=broad-except
+        LOGGER.exception('Batch execution failed. The exception: ' + str(e))
+        result = {
+            'scenario_name': scenario['scenario_name'],
+            'status': tr('Analysis Fail'),
+            'success': False,
+            'impact': None,
+            'message': str(e),
+        }
+    return position, result
+
+
+def run_scenarios(
+        scenarios, scenario_directory, output_directory, processes=None):
+    """Run many scenarios on a pool of worker processes.
+
+    .. versionadded:: 4.3
+
+    :param scenarios: List of scenarios from read_scenarios.
+    :type scenarios: list
+
+    :param scenario_directory: The directory of the scenarios.
+    :type scenario_directory: str
+
+    :param output_directory: The directory of the reports.
+    :type output_directory: str
+
+    :param processes: Number of worker processes. Defaults to the number of
+        CPUs. With one process, scenarios are run in the current process.
+    :type processes: int
+
+    :return: A generator of (position, result) as soon as each scenario is
+        finished, where position is the index of the scenario in the list.
+    :rtype: generator
+    """
+    if not processes:
+        processes = cpu_count()
+    jobs = [
+        (position, scenario, scenario_directory, output_directory)
+        for position, scenario in enumerate(scenarios)]
+
+    if processes == 1 or len(jobs) < 2:
+        for job in jobs:
+            yield _run_scenario_in_worker(job)
+        return
+
+    pool = process_pool(min(processes, len(jobs)), initializer=start_qgis)
+    try:
+        for result in pool.imap_unordered(_run_scenario_in_worker, jobs):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def write_report(report, pass_count, fail_count, output_directory):
+    """Write a report status of Batch Runner.
+
+    For convenience, the name will use current time.
+
+    .. versionadded:: 4.3
+
+    :param report: A list of each scenario and its status.
+    :type report: list
+
+    :param pass_count: Number of passing scenarios.
+    :type pass_count: int
+
+    :param fail_count: Number of failed scenarios.
+    :type fail_count: int
+
+    :param output_directory: The directory of the report.
+    :type output_directory: str
+
+    :returns: A string containing the path to the report file.
+    :rtype: str
+
+    :raises: IOError
+    """
+    separator = '-----------------------------\n'
+    current_time = datetime.now().strftime('%Y%m%d%H%M%S')
+    report_path = 'batch-report-' + current_time + '.txt'
+    path = os.path.join(output_directory, report_path)
+
+    report_file = file(path, 'w')
+    report_file.write('InaSAFE Batch Report File\n')
+    report_file.write(separator)
+    for line in report:
+        report_file.write(line)
+    report_file.write(separator)
+    report_file.write('Total passed: %s\n' % pass_count)
+    report_file.write('Total failed: %s\n' % fail_count)
+    report_file.write('Total tasks: %s\n' % len(report))
+    report_file.write(separator)
+    report_file.close()
+
+    return path
@@ -0,0 +1,352 @@
+# coding=utf-8
+
+"""Run analyses described in JSON or YAML jobs, without any user interface.
+
+A job looks like this::
+
+    {
+        "name": "jakarta_flood",
+        "hazard": "hazard/flood.shp",
+        "exposure": "exposure/buildings.shp",
+        "aggregation": "aggregation/district.shp",
+        "extent": [106.7, -6.3, 106.9, -6.1],
+        "crs": "EPSG:4326",
+        "datastore": "output/jakarta_flood",
+        "report_components": ["impact-report-pdf"]
+    }
+
+Paths are relative to the file of the job. The aggregation or the extent
+are optional. The datastore is a folder, or a GeoPackage if the path ends
+with .gpkg. A file can hold a single job, a list of jobs or a dictionary
+with a "jobs" list.
+
+From the command line::
+
+    python -m safe.utilities.job_runner job.json [job.yaml ...] \
+        [--output result.json]
+
+QGIS is started once for all jobs. The result of each job is written as
+JSON and the exit code is ANALYSIS_SUCCESS only if all jobs succeed.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+from qgis.core import QgsRectangle, QgsCoordinateReferenceSystem
+
+from safe.datastore.folder import Folder
+from safe.datastore.geopackage import GeoPackage
+from safe.definitions.constants import (
+    ANALYSIS_SUCCESS,
+    PREPARE_SUCCESS,
+    PREPARE_FAILED_BAD_CODE,
+    ANALYSIS_FAILED_BAD_CODE,
+    ANALYSIS_FAILED_BAD_INPUT)
+from safe.definitions.reports.components import all_default_report_components
+from safe.impact_function.impact_function import ImpactFunction
+from safe.report.impact_report import ImpactReport
+from safe.utilities.batch_runner import define_layer, start_qgis
+from safe.utilities.profiling import flame_graph
+from safe.utilities.settings import setting
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+LOGGER = logging.getLogger('InaSAFE')
+
+
+def read_jobs(path):
+    """Read the jobs from a JSON or a YAML file.
+
+    YAML files need PyYAML, which is not a dependency of InaSAFE.
+
+    .. versionadded:: 4.3
+
+    :param path: The path of the file, YAML if the extension is .yml or
+        .yaml.
+    :type path: str
+
+    :return: The list of jobs. Each job gets the directory of the file in
+        the 'directory' key, and a name if it has none.
+    :rtype: list
+
+    :raises: ValueError if the file is not a valid job.
+    """
+    path = os.path.abspath(path)
+    with open(path) as job_file:
+        if os.path.splitext(path)[1].lower() in ['.yml', '.yaml']:
+            import yaml
+            content = yaml.safe_load(job_file)
+        else:
+            content = json.load(job_file)
+
+    if isinstance(content, dict):
+        content = content.get('jobs', [content])
+    if not isinstance(content, list):
+        raise ValueError('The file %s does not contain any job.' % path)
+
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    jobs = []
+    for i, job in enumerate(content):
+        if not isinstance(job, dict):
+            raise ValueError('The job %s in %s is not valid.' % (i, path))
+        job = dict(job)
+        job.setdefault('directory', os.path.dirname(path))
+        if len(content) > 1:
+            job.setdefault('name', '%s_%s' % (base_name, i + 1))
+        else:
+            job.setdefault('name', base_name)
+        jobs.append(job)
+    return jobs
+
+
+def create_datastore(job):
+    """Create the datastore of a job.
+
+    .. versionadded:: 4.3
+
+    :param job: The job.
+    :type job: dict
+
+    :return: The datastore, None if the job does not have any.
+    :rtype: DataStore
+    """
+    path = job.get('datastore')
+    if not path:
+        return None
+    path = os.path.join(job.get('directory', ''), path)
+
+    if path.lower().endswith('.gpkg'):
+        return GeoPackage(path)
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+    datastore = Folder(path)
+    datastore.default_vector_format = job.get('vector_format') or setting(
+        'vector_output_format', expected_type=unicode)
+    return datastore
+
+
+def create_impact_function(job):
+    """Create the impact function of a job.
+
+    .. versionadded:: 4.3
+
+    :param job: The job.
+    :type job: dict
+
+    :return: The impact function, not prepared yet.
+    :rtype: ImpactFunction
+
+    :raises: ValueError if a layer can not be loaded.
+    """
+    directory = job.get('directory', '')
+    impact_function = ImpactFunction()
+
+    for key in ['hazard', 'exposure', 'aggregation']:
+        if not job.get(key):
+            continue
+        layer = define_layer(job[key], directory)
+        if not layer:
+            raise ValueError('Unable to load the %s %s' % (key, job[key]))
+        setattr(impact_function, key, layer)
+
+    if job.get('extent') and not job.get('aggregation'):
+        impact_function.requested_extent = QgsRectangle(*job['extent'])
+        impact_function.crs = QgsCoordinateReferenceSystem(
+            job.get('crs', 'EPSG:4326'))
+
+    datastore = create_datastore(job)
+    if datastore:
+        impact_function.datastore = datastore
+    return impact_function
+
+
+def _json_value(value):
+    """Convert a value to something which can be written in JSON.
+
+    :param value: Any value, like keywords with QUrl or datetime.
+    :type value: object
+
+    :return: The value with only JSON types.
+    :rtype: object
+    """
+    return json.loads(json.dumps(value, default=unicode))
+
+
+def _message_text(message):
+    """Get the text of a message from the impact function.
+
+    :param message: The message.
+    :type message: safe.messaging.Message, basestring
+
+    :return: The text.
+    :rtype: unicode
+    """
+    if hasattr(message, 'to_text'):
+        return message.to_text()
+    return unicode(message or '')
+
+
+def run_job(job):
+    """Run the analysis of a job.
+
+    .. versionadded:: 4.3
+
+    :param job: The job from read_jobs.
+    :type job: dict
+
+    :return: Dictionary with the name of the job, the status code, a
+        message, the URI of each output layer by layer purpose, the
+        provenance, the timings of the analysis and the report directory.
+    :rtype: dict
+    """
+    result = {
+        'name': job.get('name'),
+        'status': ANALYSIS_SUCCESS,
+        'message': '',
+        'outputs': {},
+        'provenance': {},
+        'performance_log': {},
+    }
+
+    try:
+        impact_function = create_impact_function(job)
+    except ValueError as e:
+        result['status'] = ANALYSIS_FAILED_BAD_INPUT
+        result['message'] = str(e)
+        return result
+
+    try:
+        status, message = impact_function.prepare()
+        if status != PREPARE_SUCCESS:
+            if status == PREPARE_FAILED_BAD_CODE:
+                result['status'] = ANALYSIS_FAILED_BAD_CODE
+            else:
+                result['status'] = ANALYSIS_FAILED_BAD_INPUT
+            result['message'] = _message_text(message)
+            return result
+
+        status, message = impact_function.run()
+    except Exception as e:  # pylint: disable=broad-except
+        LOGGER.exception('The job %s failed.' % job.get('name'))
+        result['status'] = ANALYSIS_FAILED_BAD_CODE
+        result['message'] = str(e)
+        return result
+
+    result['status'] = status
+    result['performance_log'] = flame_graph(impact_function.performance_log)
+    if status != ANALYSIS_SUCCESS:
+        result['message'] = _message_text(message)
+        return result
+
+    result['outputs'] = {
+        layer.keywords['layer_purpose']: layer.source()
+        for layer in impact_function.outputs}
+    result['provenance'] = _json_value(impact_function.provenance)
+
+    component_keys = job.get('report_components', [])
+    components = [
+        component for component in all_default_report_components
+        if component['key'] in component_keys]
+    if components:
+        output_folder = job.get('report_directory')
+        if output_folder:
+            output_folder = os.path.join(
+                job.get('directory', ''), output_folder)
+        try:
+            report = impact_function.generate_report(
+                components, output_folder=output_folder)
+            if report and report[0] == ImpactReport.REPORT_GENERATION_FAILED:
+                result['message'] = _message_text(report[1])
+            if impact_function.impact_report:
+                result['report_directory'] = (
+                    impact_function.impact_report.output_folder)
+        except Exception as e:  # pylint: disable=broad-except
+            LOGGER.exception('Reports of %s failed.' % job.get('name'))
+            result['message'] = 'Reports failed: %s' % e
+
+    return _json_value(result)
+
+
+def run_jobs(jobs):
+    """Run many jobs in the current process.
+
+    .. versionadded:: 4.3
+
+    :param jobs: The jobs from read_jobs.
+    :type jobs: list
+
+    :return: A generator of results from run_job.
+    :rtype: generator
+    """
+    for job in jobs:
+        LOGGER.info('Running the job %s' % job.get('name'))
+        yield run_job(job)
+
+
+def exit_code(results):
+    """Get the exit code for the results of many jobs.
+
+    .. versionadded:: 4.3
+
+    :param results: The results from run_job.
+    :type results: list
+
+    :return: ANALYSIS_SUCCESS if all jobs succeed, ANALYSIS_FAILED_BAD_CODE
+        if any job had an error from InaSAFE, otherwise
+        ANALYSIS_FAILED_BAD_INPUT.
+    :rtype: int
+    """
+    statuses = [result['status'] for result in results]
+    if ANALYSIS_FAILED_BAD_CODE in statuses:
+        return ANALYSIS_FAILED_BAD_CODE
+    if any(status != ANALYSIS_SUCCESS for status in statuses):
+        return ANALYSIS_FAILED_BAD_INPUT
+    return ANALYSIS_SUCCESS
+
+
+def main(arguments=None):
+    """Run the jobs from the command line.
+
+    .. versionadded:: 4.3
+
+    :param arguments: The arguments, defaults to sys.argv.
+    :type arguments: list
+
+    :return: The exit code.
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('jobs', nargs='+', help='JSON or YAML job files.')
+    parser.add_argument(
+        '--output', help='Write the results in this file, not stdout.')
+    arguments = parser.parse_args(arguments)
+
+    try:
+        jobs = []
+        for path in arguments.jobs:
+            jobs.extend(read_jobs(path))
+    except (IOError, ValueError, ImportError) as e:
+        sys.stderr.write('%s\n' % e)
+        return ANALYSIS_FAILED_BAD_INPUT
+
+    start_qgis()
+    results = list(run_jobs(jobs))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(results, output, indent=4)
+    else:
+        json.dump(results, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+    return exit_code(results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -43,6 +43,8 @@ from safe.metadata import (
     OutputLayerMetadata,
     GenericLayerMetadata
 )
+from safe.metadata.metadata_db_io import MetadataDbIO
+from safe.metadata.utilities import ancillary_file_path
 # 3.5 metadata
 from safe.metadata35 import GenericLayerMetadata as GenericLayerMetadata35
 from safe.metadata35 import ExposureLayerMetadata as ExposureLayerMetadata35
@@ -69,6 +71,7 @@ from safe.definitions.hazard_classifications import (
     tsunami_hazard_classes_ITB,
     volcano_hazard_classes,
 )
+from safe.utilities.profiling import add_counter
 from safe.utilities.settings import setting
 
 __copyright__ = "Copyright 2016, The InaSAFE Project"
@@ -78,6 +81,11 @@ __revision__ = '$Format:%H$'
 
 LOGGER = logging.getLogger('InaSAFE')
 
+# Keywords read from the metadata, by layer URI. Each entry is checked with
+# the modification time and the size of the file storing the metadata.
+_keywords_cache = {}
+keywords_cache_statistics = {'hits': 0, 'misses': 0}
+
 METADATA_CLASSES = {
     layer_purpose_exposure['key']: ExposureLayerMetadata,
     layer_purpose_hazard['key']: HazardLayerMetadata,
@@ -166,14 +174,15 @@ def write_iso19115_metadata(layer_uri, keywords, version_35=False):
         else:
             metadata = GenericLayerMetadata(layer_uri)
 
+    clear_keywords_cache(layer_uri)
+
     metadata.update_from_dict(keywords)
     # Always set keyword_version to the latest one.
     if not version_35:
         metadata.update_from_dict({'keyword_version': inasafe_keyword_version})
 
     if metadata.layer_is_file_based:
-        xml_file_path = os.path.splitext(layer_uri)[0] + '.xml'
-        metadata.write_to_file(xml_file_path)
+        metadata.write_to_file(metadata.xml_uri)
     else:
         metadata.write_to_db()
 
@@ -193,7 +202,7 @@ def read_iso19115_metadata(layer_uri, keyword=None, version_35=False):
     :returns: Dictionary of keywords or value of key as string.
     :rtype: dict, basestring
     """
-    xml_uri = os.path.splitext(layer_uri)[0] + '.xml'
+    xml_uri = ancillary_file_path(layer_uri, 'xml')
     # Remove the prefix for local file. For example csv.
     file_prefix = 'file:'
     if xml_uri.startswith(file_prefix):
@@ -204,7 +213,17 @@ def read_iso19115_metadata(layer_uri, keyword=None, version_35=False):
         message = 'Layer based file but no xml file.\n'
         message += 'Layer path: %s.' % layer_uri
         raise NoKeywordsFoundError(message)
-    metadata = GenericLayerMetadata(layer_uri, xml_uri)
+
+    cache_key = (layer_uri, version_35)
+    signature = _metadata_signature(xml_uri)
+    cached = _keywords_cache.get(cache_key)
+    if signature and cached and cached[0] == signature:
+        keywords_cache_statistics['hits'] += 1
+        add_counter('keywords_cache_hits')
+        return _select_keyword(_copy_keywords(cached[1]), keyword, layer_uri)
+    keywords_cache_statistics['misses'] += 1
+    add_counter('keywords_cache_misses')
+
     if version_35:
         metadata = GenericLayerMetadata35(layer_uri, xml_uri)
     else:
@@ -226,17 +245,34 @@ def read_iso19115_metadata(layer_uri, keyword=None, version_35=False):
         message = 'No keyword version found. Metadata xml file is invalid.\n'
         message += 'Layer uri: %s\n' % layer_uri
         message += 'Keywords file: %s\n' % os.path.exists(
-            os.path.splitext(layer_uri)[0] + '.xml')
+            ancillary_file_path(layer_uri, 'xml'))
         message += 'keywords:\n'
         for k, v in keywords.iteritems():
             message += '%s: %s\n' % (k, v)
         raise MetadataReadError(message)
 
-    # Get dictionary keywords that has value != None
-    keywords = {
-        x[0]: x[1]['value'] for x in metadata.dict['properties'].iteritems()
-        if x[1]['value'] is not None}
+    if signature:
+        _keywords_cache[cache_key] = (signature, _copy_keywords(keywords))
 
+    return _select_keyword(keywords, keyword, layer_uri)
+
+
+def _select_keyword(keywords, keyword, layer_uri):
+    """Return all keywords or the value of one keyword.
+
+    :param keywords: Dictionary of keywords.
+    :type keywords: dict
+
+    :param keyword: The key of keyword that want to be read. If None, return
+        all keywords in dictionary.
+    :type keyword: basestring
+
+    :param layer_uri: Uri to layer, for the error message.
+    :type layer_uri: basestring
+
+    :returns: Dictionary of keywords or value of key as string.
+    :rtype: dict, basestring
+    """
     if keyword:
         try:
             return keywords[keyword]
@@ -248,6 +284,73 @@ def read_iso19115_metadata(layer_uri, keyword=None, version_35=False):
     return keywords
 
 
+def _metadata_signature(xml_uri):
+    """Identify the version of the metadata of a layer.
+
+    :param xml_uri: Path to the XML file, None if the metadata is in the
+        metadata DB.
+    :type xml_uri: basestring
+
+    :returns: Tuple with the path, the modification time and the size of the
+        file storing the metadata. None if the file can not be found.
+    :rtype: tuple
+    """
+    path = xml_uri or MetadataDbIO().metadata_db_path
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return path, stat.st_mtime, stat.st_size
+
+
+def _copy_keywords(keywords):
+    """Copy keywords from the cache, keeping the type of each value.
+
+    :param keywords: Dictionary of keywords.
+    :type keywords: dict
+
+    :returns: A deep copy of the keywords.
+    :rtype: dict
+    """
+    copy_keywords = {}
+    for key, value in keywords.iteritems():
+        if isinstance(value, (QUrl, QDate, QDateTime)):
+            copy_keywords[key] = type(value)(value)
+        else:
+            copy_keywords[key] = deepcopy(value)
+    return copy_keywords
+
+
+def clear_keywords_cache(layer_uri=None):
+    """Remove keywords from the cache.
+
+    :param layer_uri: Uri to layer. If None, the cache is emptied.
+    :type layer_uri: basestring
+
+    .. versionadded:: 4.3
+    """
+    if layer_uri is None:
+        _keywords_cache.clear()
+        return
+    for version_35 in (True, False):
+        _keywords_cache.pop((layer_uri, version_35), None)
+
+
+def keywords_cache_hit_rate():
+    """Ratio of the keywords read from the cache.
+
+    :returns: The hit rate between 0 and 1, None if nothing has been read.
+    :rtype: float
+
+    .. versionadded:: 4.3
+    """
+    hits = keywords_cache_statistics['hits']
+    total = hits + keywords_cache_statistics['misses']
+    if not total:
+        return None
+    return float(hits) / total
+
+
 def active_classification(keywords, exposure_key):
     """Helper to retrieve active classification for an exposure.
 
@@ -12,6 +12,35 @@ Contact : ole.moller.nielsen@gmail.com
 
 import json
 
+import numpy as np
+
+# Number of additions kept before they are merged in the cells.
+merge_size = 10000
+
+
+def unique_rows(keys):
+    """Find the unique rows of a 2D array of integer codes.
+
+    :param keys: The codes, one row by key.
+    :type keys: numpy.ndarray
+
+    :return: Tuple with the unique rows, sorted, and for each row of keys the
+        position of its unique row.
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    count, width = keys.shape
+    if not count or not width:
+        return keys[:min(count, 1)], np.zeros(count, dtype=np.int64)
+
+    # Sort by the first column, then the second one...
+    order = np.lexsort(keys.T[::-1])
+    sorted_keys = keys[order]
+    first = np.ones(count, dtype=bool)
+    first[1:] = (sorted_keys[1:] != sorted_keys[:-1]).any(axis=1)
+    inverse = np.empty(count, dtype=np.int64)
+    inverse[order] = np.cumsum(first) - 1
+    return sorted_keys[first], inverse
+
 
 class FlatTable(object):
     """ Flat table object - used as a source of data for pivot tables.
@@ -32,33 +61,211 @@ class FlatTable(object):
             hazard_type=f['hazard'],
             road_type=f['road'],
             zone=f['zone'])
+
+    Each distinct value of a group is stored once and mapped to an integer
+    code. Only the cells with a value are stored, as numpy arrays of codes
+    and sums, so the memory does not depend on the number of combinations of
+    group values. For many rows, it's faster to encode groups with `codes`
+    and to add all values at once with `add_values`:
+
+    flat_table.add_values(
+        lengths,
+        hazard_type=flat_table.codes('hazard_type', hazards),
+        road_type=flat_table.codes('road_type', roads),
+        district=flat_table.codes('district', districts))
     """
 
     def __init__(self, *args):
         """ Construct flat table, fields are passe"""
-        self.groups = args
-        self.data = {}
+        self._set_groups(args)
+
+    def _set_groups(self, groups):
+        """Set the groups and clear the table.
+
+        :param groups: The group names.
+        :type groups: tuple
+        """
+        self.groups = tuple(groups)
+        # For each group, the code of each value and the value of each code.
+        self._codes = [{} for _ in self.groups]
+        self._values = [[] for _ in self.groups]
+        # Only cells with a value are stored: one row of codes by cell and
+        # the sum of the cell. Integers stay integers until we add a float.
+        self._keys = np.zeros((0, len(self.groups)), dtype=np.int64)
+        self._sums = np.zeros(0, dtype=np.int64)
+        # Values added since the last merge, with their keys.
+        self._new_keys = []
+        self._new_values = []
+        # Position of each key, for get_value.
+        self._index = None
+
+    def code(self, group, value):
+        """Return the integer code of a value, a new code if needed.
+
+        :param group: The group name.
+        :type group: str
+
+        :param value: The value of the group.
+        :type value: any
+
+        :return: The code.
+        :rtype: int
+        """
+        return self._code(self.groups.index(group), value)
+
+    def _code(self, group_index, value):
+        """Return the integer code of a value, from the group index."""
+        codes = self._codes[group_index]
+        try:
+            return codes[value]
+        except KeyError:
+            codes[value] = len(codes)
+            self._values[group_index].append(value)
+            return codes[value]
+
+    def codes(self, group, values):
+        """Return the integer codes of many values, new codes if needed.
+
+        :param group: The group name.
+        :type group: str
+
+        :param values: The values of the group.
+        :type values: list
+
+        :return: The codes.
+        :rtype: numpy.ndarray
+        """
+        group_index = self.groups.index(group)
+        return np.array(
+            [self._code(group_index, value) for value in values],
+            dtype=np.int64)
+
+    def _merge(self):
+        """Add the new values to the cells, so each key is stored once."""
+        if not self._new_values:
+            return
+
+        keys = np.concatenate([self._keys] + self._new_keys)
+        values = np.concatenate([self._sums] + self._new_values)
+        self._new_keys = []
+        self._new_values = []
+
+        self._keys, inverse = unique_rows(keys)
+        sums = np.bincount(
+            inverse, weights=values, minlength=len(self._keys))
+        if values.dtype.kind in 'biu':
+            sums = np.rint(sums).astype(np.int64)
+        self._sums = sums
+        self._index = None
+
+    def _cells(self):
+        """Return the keys and the sums of the cells with a value.
+
+        :return: Tuple with the codes of each cell, one row by cell, and the
+            sum of each cell.
+        :rtype: (numpy.ndarray, numpy.ndarray)
+        """
+        self._merge()
+        return self._keys, self._sums
 
     def add_value(self, value, **kwargs):
-        key = tuple(kwargs[group] for group in self.groups)
-        if key not in self.data:
-            self.data[key] = 0
-        self.data[key] += value
+        key = [
+            self._code(i, kwargs[group]) for i, group in enumerate(
+                self.groups)]
+        self._new_keys.append(
+            np.array([key], dtype=np.int64).reshape(1, len(self.groups)))
+        self._new_values.append(np.array([value]))
+        if len(self._new_values) >= merge_size:
+            self._merge()
+
+    def add_values(self, values, **code_arrays):
+        """Add many values at once.
+
+        :param values: The values to add.
+        :type values: numpy.ndarray
+
+        :param code_arrays: For each group, the codes of the values, from the
+            `codes` method.
+        :type code_arrays: numpy.ndarray
+        """
+        values = np.asarray(values).ravel()
+        if not values.size:
+            return
+        keys = np.zeros((values.size, len(self.groups)), dtype=np.int64)
+        for i, group in enumerate(self.groups):
+            keys[:, i] = np.asarray(code_arrays[group], dtype=np.int64)
+        self._new_keys.append(keys)
+        self._new_values.append(values)
+        if len(self._new_values) >= merge_size:
+            self._merge()
 
     def get_value(self, **kwargs):
         """Return the value for a specific key."""
-        key = tuple(kwargs[group] for group in self.groups)
-        if key not in self.data:
-            self.data[key] = 0
-        return self.data[key]
+        key = []
+        for i, group in enumerate(self.groups):
+            code = self._codes[i].get(kwargs[group])
+            if code is None:
+                return 0
+            key.append(code)
+
+        keys, sums = self._cells()
+        if self._index is None:
+            self._index = dict(
+                (tuple(row), position)
+                for position, row in enumerate(keys.tolist()))
+        position = self._index.get(tuple(key))
+        if position is None:
+            return 0
+        return sums[position].item()
+
+    def get_values(self, **code_arrays):
+        """Return the values for many keys at once.
+
+        :param code_arrays: For each group, the codes of the keys, from the
+            `codes` method. All arrays must have the same shape.
+        :type code_arrays: numpy.ndarray
+
+        :return: The values, 0 for unknown keys.
+        :rtype: numpy.ndarray
+        """
+        keys, sums = self._cells()
+        if not self.groups:
+            return np.array(sums.sum(), dtype=sums.dtype)
+
+        code_arrays = [
+            np.asarray(code_arrays[group], dtype=np.int64)
+            for group in self.groups]
+        shape = code_arrays[0].shape
+        queries = np.column_stack(
+            [codes.ravel() for codes in code_arrays])
+
+        # The cells and the queries with the same key are grouped together.
+        _, inverse = unique_rows(np.concatenate([keys, queries]))
+        group_sums = np.zeros(inverse.max() + 1, dtype=sums.dtype)
+        group_sums[inverse[:len(keys)]] = sums
+        return group_sums[inverse[len(keys):]].reshape(shape)
+
+    @property
+    def data(self):
+        """Dictionary of the aggregated values, keyed by the tuple of groups.
+
+        :returns: The aggregated values.
+        :rtype: dict
+        """
+        keys, sums = self._cells()
+        data = {}
+        for key, value in zip(keys.tolist(), sums.tolist()):
+            values = tuple(
+                self._values[i][code] for i, code in enumerate(key))
+            data[values] = value
+        return data
 
     def group_values(self, group_name):
         """Return all distinct group values for given group."""
         group_index = self.groups.index(group_name)
-        values = set()
-        for key in self.data:
-            values.add(key[group_index])
-        return values
+        keys, _ = self._cells()
+        values = self._values[group_index]
+        return set(values[code] for code in np.unique(keys[:, group_index]))
 
     def to_json(self):
         """Return json representation of FlatTable
@@ -113,7 +320,7 @@ class FlatTable(object):
             ["primary", "medium", 20]
             ]
         """
-        self.groups = tuple(groups)
+        self._set_groups(groups)
         for item in data:
             kwargs = {}
             for i in range(len(self.groups)):
@@ -205,46 +412,42 @@ class PivotTable(object):
         if affected_columns is None:
             affected_columns = []
 
-        if len(flat_table.data) == 0:
+        keys, sums = flat_table._cells()
+        if not len(keys):
             raise ValueError('No input data')
 
-        if row_field is not None:
-            flat_row_index = flat_table.groups.index(row_field)
-        if column_field is not None:
-            flat_column_index = flat_table.groups.index(column_field)
-        if filter_field is not None:
-            flat_filter_index = flat_table.groups.index(filter_field)
-
-        sums = {}  # key = (row, column), value = sum
-        sums_affected = {}  # key = row, value = sum
-        for flat_key, flat_value in flat_table.data.iteritems():
-            # apply filtering
-            if filter_field is not None:
-                if flat_key[flat_filter_index] != filter_value:
-                    continue
+        groups = flat_table.groups
 
-            if column_field is not None:
-                current_value = flat_key[flat_column_index]
-                if current_value in affected_columns:
-                    if row_field is not None:
-                        row_key = flat_key[flat_row_index]
-                    else:
-                        row_key = ''
-
-                    if row_key not in sums_affected.keys():
-                        sums_affected[row_key] = 0
-                    sums_affected[row_key] += flat_value
-
-            if column_field is not None and row_field is not None:
-                key = flat_key[flat_row_index], flat_key[flat_column_index]
-            elif row_field is not None:
-                key = (flat_key[flat_row_index], '')
-            elif column_field is not None:
-                key = ('', flat_key[flat_column_index])
-
-            if key not in sums:
-                sums[key] = 0
-            sums[key] += flat_value
+        # apply filtering
+        if filter_field is not None:
+            flat_filter_index = groups.index(filter_field)
+            code = flat_table._codes[flat_filter_index].get(filter_value)
+            if code is None:
+                selection = np.zeros(len(keys), dtype=bool)
+            else:
+                selection = keys[:, flat_filter_index] == code
+            keys = keys[selection]
+            sums = sums[selection]
+
+        # Sum every other group, we keep (row, column) cells.
+        if row_field is None:
+            row_keys = np.zeros(len(keys), dtype=np.int64)
+            row_count = 1
+        else:
+            row_index = groups.index(row_field)
+            row_keys = keys[:, row_index]
+            row_count = len(flat_table._values[row_index])
+        if column_field is None:
+            column_keys = np.zeros(len(keys), dtype=np.int64)
+            column_count = 1
+        else:
+            column_index = groups.index(column_field)
+            column_keys = keys[:, column_index]
+            column_count = len(flat_table._values[column_index])
+        cells = np.zeros((row_count, column_count), dtype=sums.dtype)
+        np.add.at(cells, (row_keys, column_keys), sums)
+        present = np.zeros((row_count, column_count), dtype=bool)
+        present[row_keys, column_keys] = True
 
         # TODO: configurable order of rows
         # - undefined
@@ -255,8 +458,11 @@ class PivotTable(object):
         # determine rows
         if row_field is None:
             self.rows = ['']
+            row_codes = [0]
         else:
             self.rows = list(flat_table.group_values(row_field))
+            row_codes = [
+                flat_table.code(row_field, row) for row in self.rows]
 
         # determine columns
         if columns is not None:
@@ -266,6 +472,14 @@ class PivotTable(object):
         else:
             self.columns = list(flat_table.group_values(column_field))
 
+        if column_field is None:
+            column_values = ['']
+        else:
+            column_values = flat_table._values[groups.index(column_field)]
+        for column_code in np.flatnonzero(present.any(axis=0)):
+            # Same error as list.index if a column is not expected.
+            self.columns.index(column_values[column_code])
+
         self.affected_columns = affected_columns
 
         self.total = 0.0
@@ -275,21 +489,40 @@ class PivotTable(object):
         for i in xrange(len(self.rows)):
             self.data[i] = [0.0] * len(self.columns)
 
-        for (sum_row, sum_column), sum_value in sums.iteritems():
-            sum_row_index = self.rows.index(sum_row)
-            sum_column_index = self.columns.index(sum_column)
-            self.data[sum_row_index][sum_column_index] = sum_value
+        column_codes = []
+        for column in self.columns:
+            if column_field is None:
+                column_codes.append(0)
+            else:
+                column_codes.append(
+                    flat_table._codes[groups.index(column_field)].get(column))
+
+        for i, row_code in enumerate(row_codes):
+            for j, column_code in enumerate(column_codes):
+                if column_code is None or column_code >= cells.shape[1]:
+                    continue
+                if not present[row_code, column_code]:
+                    continue
+                sum_value = cells[row_code, column_code].item()
+                self.data[i][j] = sum_value
 
-            self.total_rows[sum_row_index] += sum_value
-            self.total_columns[sum_column_index] += sum_value
-            self.total += sum_value
+                self.total_rows[i] += sum_value
+                self.total_columns[j] += sum_value
+                self.total += sum_value
 
         self.total_rows_affected = [0.0] * len(self.rows)
         self.total_affected = 0.0
-        for row, value in sums_affected.iteritems():
-            self.total_affected += value
-            sum_row_index = self.rows.index(row)
-            self.total_rows_affected[sum_row_index] = value
+        if column_field is not None:
+            affected_codes = [
+                column_code
+                for column_code, value in enumerate(column_values)
+                if value in affected_columns and column_code < cells.shape[1]]
+            for i, row_code in enumerate(row_codes):
+                if not present[row_code, affected_codes].any():
+                    continue
+                value = cells[row_code, affected_codes].sum().item()
+                self.total_affected += value
+                self.total_rows_affected[i] = value
 
         self.total_percent_rows_affected = [0.0] * len(self.rows)
         for row, value in enumerate(self.total_rows_affected):
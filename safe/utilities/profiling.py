@@ -2,16 +2,22 @@
 
 """This module contains logic for performance profiling.
 
-This code was taken from http://stackoverflow.com/a/3620972
+The first version of this code was taken from
+http://stackoverflow.com/a/3620972
 
+Each thread keeps its own stack of running functions, so we never need to
+inspect the frames to find the caller. Settings are read once, when the
+profiling data is cleared, and nothing is recorded when the profiling is
+disabled.
 """
 
-
-import inspect
+import json
+import os
+import threading
 import time
 from functools import wraps
 
-from safe.utilities.memory_checker import get_free_memory
+from safe.common.utilities import get_free_memory
 from safe.utilities.settings import setting
 
 __copyright__ = "Vadim Shender (original poster in stack overflow), InaSAFE"
@@ -20,37 +26,76 @@ __email__ = "info@inasafe.org"
 __revision__ = '$Format:%H$'
 
 
+def cpu_time():
+    """CPU time used by the process, user and system, in seconds.
+
+    :return: The CPU time.
+    :rtype: float
+    """
+    times = os.times()
+    return times[0] + times[1]
+
+
+def resident_memory():
+    """Resident memory of the process in MB, without spawning any process.
+
+    .. versionadded:: 4.3
+
+    :return: The resident memory, or None if it can't be read on this
+        platform.
+    :rtype: float
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024.0 / 1024.0
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss / 1024.0 / 1024.0
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
 class Tree(object):
     """Internal representation of the tree."""
 
-    def __init__(self, key):
+    def __init__(self, key, memory=False):
 
         # Name of the current function
         self.key = key
         self.parent = None
+        self.thread = threading.current_thread().name
 
         # Time of creation
         self._start_time = time.time()
+        self._start_cpu = cpu_time()
 
         # Time at the end.
         self._end_time = None
+        self._end_cpu = None
 
-        if setting(key='memory_profile', expected_type=bool):
-            # memory at creation
-            self._start_memory = get_free_memory()
-
-            # memory at termination
-            self._end_memory = None
+        # memory at creation and at termination
+        self._memory = memory
+        self._start_memory = None
+        self._end_memory = None
+        if memory:
+            self._start_memory = _memory_sample()
 
         # Children
         self.children = []
 
+        # Counters, like cache hits, see add_counter.
+        self.counters = {}
+
     def ended(self):
         """We call this method when the function is finished."""
         self._end_time = time.time()
+        self._end_cpu = cpu_time()
 
-        if setting(key='memory_profile', expected_type=bool):
-            self._end_memory = get_free_memory()
+        if self._memory:
+            self._end_memory = _memory_sample()
 
     @property
     def elapsed_time(self):
@@ -64,6 +109,19 @@ class Tree(object):
         else:
             return None
 
+    @property
+    def cpu_time(self):
+        """To know the CPU time used by the process during the function.
+
+        .. versionadded:: 4.3
+
+        This property might return None if the function is still running.
+        """
+        if self._end_cpu is not None:
+            return round(self._end_cpu - self._start_cpu, 3)
+        else:
+            return None
+
     @property
     def memory_used(self):
         """To know the allocated memory at function termination.
@@ -73,22 +131,21 @@ class Tree(object):
         This property might return None if the function is still running.
 
         This function should help to show memory leaks or ram greedy code.
+        Since 4.3, it is the delta of the resident memory of the process in
+        MB, or the delta of free memory if it is not available.
         """
-        if self._end_memory:
+        if self._end_memory is not None and self._start_memory is not None:
             memory_used = self._end_memory - self._start_memory
+            if isinstance(memory_used, float):
+                memory_used = round(memory_used, 3)
             return memory_used
         else:
             return None
 
     def append(self, node):
         """To append a new child."""
-        if node.parent == self.key and not self.elapsed_time:
-            self.children.append(node)
-        else:
-            # Recursive call
-            for child in self.children:
-                if not child.elapsed_time:
-                    child.append(node)
+        node.parent = self.key
+        self.children.append(node)
 
     def __str__(self):
         # It might be a private function.
@@ -103,32 +160,89 @@ class Tree(object):
         return step
 
 
+def _memory_sample():
+    """Sample the memory for a node of the tree.
+
+    :return: The resident memory in MB, or the opposite of the free memory
+        on platforms where we can't read it, so the delta has the same sign.
+    :rtype: float
+    """
+    memory = resident_memory()
+    if memory is None:
+        free_memory = get_free_memory()
+        if free_memory is not None:
+            memory = -free_memory
+    return memory
+
+
 ROOT = None
 
+# Read from the settings when the profiling data is cleared.
+_enabled = True
+_memory_profile = False
+
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _stack():
+    """The stack of running functions of the current thread."""
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
 
 def profile(fn):
     @wraps(fn)
     def with_profiling(*args, **kwargs):
         global ROOT
 
-        current_frame = inspect.currentframe()
-        parent_frame = inspect.getouterframes(current_frame)[1]
-        parent_name = parent_frame[3]
+        if not _enabled:
+            return fn(*args, **kwargs)
 
-        current_step = Tree(fn.__name__)
+        current_step = Tree(fn.__name__, _memory_profile)
+        stack = _stack()
 
-        if ROOT:
-            current_step.parent = parent_name
-            ROOT.append(current_step)
+        if stack:
+            stack[-1].append(current_step)
         else:
-            ROOT = current_step
+            with _lock:
+                if ROOT is None:
+                    ROOT = current_step
+                elif ROOT.elapsed_time is None:
+                    # A function called in another thread during the
+                    # analysis.
+                    ROOT.append(current_step)
+
+        stack.append(current_step)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stack.pop()
+            current_step.ended()
 
-        ret = fn(*args, **kwargs)
+    return with_profiling
 
-        current_step.ended()
-        return ret
 
-    return with_profiling
+def add_counter(key, increment=1):
+    """Increment a counter of the function being profiled.
+
+    .. versionadded:: 4.3
+
+    :param key: The name of the counter.
+    :type key: basestring
+
+    :param increment: The value to add.
+    :type increment: int
+    """
+    if not _enabled:
+        return
+    stack = _stack()
+    if stack:
+        node = stack[-1]
+        node.counters[key] = node.counters.get(key, 0) + increment
 
 
 def profiling_log():
@@ -138,5 +252,163 @@ def profiling_log():
 
 
 def clear_prof_data():
+    """Clear the profiling data and read the profiling settings."""
     global ROOT
+    global _enabled
+    global _memory_profile
     ROOT = None
+    _local.stack = []
+    _enabled = setting(key='profiling', default=True, expected_type=bool)
+    _memory_profile = setting(key='memory_profile', expected_type=bool)
+
+
+def enable_profiling(enabled=True, memory_profile=False):
+    """Enable or disable the profiling without reading the settings.
+
+    .. versionadded:: 4.3
+
+    :param enabled: True to record the profiled functions.
+    :type enabled: bool
+
+    :param memory_profile: True to record the memory.
+    :type memory_profile: bool
+    """
+    global _enabled
+    global _memory_profile
+    _enabled = enabled
+    _memory_profile = memory_profile
+
+
+def speedscope_profile(tree, name='InaSAFE'):
+    """Convert a profiling tree to the speedscope file format.
+
+    See https://www.speedscope.app/file-format-schema.json
+
+    There is one profile for the wall time and one for the CPU time. Nodes
+    which are still running are closed at the end of their parent.
+
+    .. versionadded:: 4.3
+
+    :param tree: The root of the profiling tree.
+    :type tree: Tree
+
+    :param name: The name of the profile.
+    :type name: basestring
+
+    :return: The speedscope document.
+    :rtype: dict
+    """
+    frames = []
+    frame_indexes = {}
+
+    def frame(node):
+        if node.key not in frame_indexes:
+            frame_indexes[node.key] = len(frames)
+            frames.append({'name': node.key})
+        return frame_indexes[node.key]
+
+    def events(node, start, end, origin, close_at):
+        result = [{'type': 'O', 'frame': frame(node), 'at': (
+            start(node) - origin)}]
+        node_end = end(node)
+        if node_end is None:
+            node_end = close_at
+        for child in node.children:
+            result.extend(events(child, start, end, origin, node_end))
+        result.append({'type': 'C', 'frame': frame(node), 'at': (
+            node_end - origin)})
+        return result
+
+    profiles = []
+    clocks = [
+        (
+            'Wall time',
+            lambda node: node._start_time,
+            lambda node: node._end_time,
+            time.time()),
+        (
+            'CPU time',
+            lambda node: node._start_cpu,
+            lambda node: node._end_cpu,
+            cpu_time()),
+    ]
+    if tree is not None:
+        for clock_name, start, end, now in clocks:
+            origin = start(tree)
+            profile_events = events(tree, start, end, origin, now)
+            profiles.append({
+                'type': 'evented',
+                'name': '%s - %s' % (name, clock_name),
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': profile_events[-1]['at'],
+                'events': profile_events,
+            })
+
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'activeProfileIndex': 0,
+        'exporter': 'InaSAFE',
+        'shared': {'frames': frames},
+        'profiles': profiles,
+    }
+
+
+def flame_graph(tree):
+    """Convert a profiling tree to the d3-flame-graph JSON format.
+
+    The value of each node is its wall time in milliseconds.
+
+    .. versionadded:: 4.3
+
+    :param tree: The root of the profiling tree.
+    :type tree: Tree
+
+    :return: The flame graph root node.
+    :rtype: dict
+    """
+    def convert(node):
+        elapsed_time = node.elapsed_time or 0
+        result = {
+            'name': node.key,
+            'value': int(round(elapsed_time * 1000)),
+            'thread': node.thread,
+            'children': [convert(child) for child in node.children],
+        }
+        if node.cpu_time is not None:
+            result['cpu_time'] = node.cpu_time
+        if node.memory_used is not None:
+            result['memory_used'] = node.memory_used
+        if node.counters:
+            result['counters'] = dict(node.counters)
+        return result
+
+    if tree is None:
+        return {}
+    return convert(tree)
+
+
+def write_profile(tree, path, output_format='speedscope'):
+    """Write a profiling tree to a JSON file.
+
+    .. versionadded:: 4.3
+
+    :param tree: The root of the profiling tree.
+    :type tree: Tree
+
+    :param path: The path of the JSON file.
+    :type path: basestring
+
+    :param output_format: 'speedscope' or 'flamegraph'.
+    :type output_format: basestring
+    """
+    if output_format == 'speedscope':
+        data = speedscope_profile(tree)
+    elif output_format == 'flamegraph':
+        data = flame_graph(tree)
+    else:
+        raise ValueError('Unknown profiling format %s' % output_format)
+
+    with open(path, 'w') as json_file:
+        json.dump(data, json_file, indent=2)
@@ -15,6 +15,25 @@ __license__ = "GPL version 3"
 __email__ = "info@inasafe.org"
 __revision__ = '$Format:%H$'
 
+# Incremented each time a setting is changed through these helpers. Values
+# derived from the settings can be cached as long as it doesn't change.
+_settings_generation = 0
+
+
+def settings_generation():
+    """Get a counter which changes each time a setting is changed.
+
+    :returns: The current generation of the settings.
+    :rtype: int
+    """
+    return _settings_generation
+
+
+def _settings_changed():
+    """Invalidate values cached from the settings."""
+    global _settings_generation
+    _settings_generation += 1
+
 
 def set_general_setting(key, value, qsettings=None):
     """Set value to QSettings based on key.
@@ -33,6 +52,7 @@ def set_general_setting(key, value, qsettings=None):
         qsettings = QSettings()
 
     qsettings.setValue(key, value)
+    _settings_changed()
 
 
 def general_setting(key, default=None, expected_type=None, qsettings=None):
@@ -88,6 +108,7 @@ def delete_general_setting(key, qsettings=None):
         qsettings = QSettings()
 
     qsettings.remove(key)
+    _settings_changed()
 
 
 def set_setting(key, value, qsettings=None):
@@ -207,6 +228,7 @@ def import_setting(file_path, qsettings=None):
     qsettings.beginGroup('inasafe')
     qsettings.remove('')
     qsettings.endGroup()
+    _settings_changed()
 
     for key, value in inasafe_settings.items():
         set_setting(key, value, qsettings=qsettings)
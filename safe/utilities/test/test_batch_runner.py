@@ -0,0 +1,75 @@
+# coding=utf-8
+"""Test for the headless batch runner."""
+
+import os
+import unittest
+
+from safe.test.utilities import get_qgis_app, standard_data_path
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+from safe.common.utilities import temp_dir
+from safe.utilities.batch_runner import (
+    read_scenarios,
+    validate_scenario,
+    prepare_scenario,
+    run_scenarios,
+    write_report)
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+
+class TestBatchRunner(unittest.TestCase):
+    """Test the headless batch runner."""
+
+    def setUp(self):
+        self.scenario_directory = standard_data_path('control', 'scenarios')
+        path = os.path.join(self.scenario_directory, 'scenario1.txt')
+        self.scenarios = read_scenarios(path)
+        validate_scenario(self.scenarios, self.scenario_directory)
+
+    def test_read_scenarios(self):
+        """Test we can read and validate scenarios."""
+        self.assertItemsEqual(
+            self.scenarios.keys(), ['dummy test', 'Flood Polygon'])
+        self.assertEqual(
+            self.scenarios['dummy test']['status'], 'Please update scenario')
+        self.assertEqual(
+            self.scenarios['Flood Polygon']['status'], 'Scenario ready')
+
+    def test_prepare_scenario(self):
+        """Test we can load the layers of a scenario."""
+        parameters, message = prepare_scenario(
+            self.scenarios['Flood Polygon'], self.scenario_directory)
+        self.assertEqual(message, '')
+        self.assertTrue(parameters['hazard'].isValid())
+        self.assertTrue(parameters['exposure'].isValid())
+        self.assertIsNone(parameters['aggregation'])
+        self.assertIsNotNone(parameters['extent'])
+
+        parameters, message = prepare_scenario(
+            self.scenarios['dummy test'], self.scenario_directory)
+        self.assertIsNone(parameters)
+        self.assertIn('hazard.shp', message)
+
+    def test_run_scenarios(self):
+        """Test we get a result for each scenario and write the report."""
+        output_directory = temp_dir('test')
+        scenarios = [self.scenarios['dummy test']]
+        results = list(run_scenarios(
+            scenarios, self.scenario_directory, output_directory, 1))
+        self.assertEqual(len(results), 1)
+        position, result = results[0]
+        self.assertEqual(position, 0)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['scenario_name'], 'dummy test')
+
+        path = write_report(['F: dummy test\n'], 0, 1, output_directory)
+        with open(path) as report:
+            self.assertIn('Total failed: 1', report.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# coding=utf-8
+"""Test for the headless job runner."""
+
+import json
+import os
+import unittest
+
+from safe.test.utilities import get_qgis_app, standard_data_path
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+from safe.common.utilities import temp_dir, unique_filename
+from safe.definitions.constants import (
+    ANALYSIS_SUCCESS, ANALYSIS_FAILED_BAD_INPUT, ANALYSIS_FAILED_BAD_CODE)
+from safe.definitions.layer_purposes import layer_purpose_analysis_impacted
+from safe.definitions.reports.components import (
+    standard_impact_report_metadata_pdf, map_report)
+from safe.utilities.job_runner import read_jobs, run_job, exit_code
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+
+class TestJobRunner(unittest.TestCase):
+    """Test the headless job runner."""
+
+    @staticmethod
+    def write_jobs(jobs):
+        """Write jobs in a JSON file next to the test data."""
+        path = unique_filename(suffix='.json', dir=temp_dir('test'))
+        with open(path, 'w') as job_file:
+            json.dump(jobs, job_file)
+        return path
+
+    def test_read_jobs(self):
+        """Test we can read one or many jobs."""
+        path = self.write_jobs({'hazard': 'hazard.shp'})
+        jobs = read_jobs(path)
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0]['directory'], os.path.dirname(path))
+        self.assertEqual(
+            jobs[0]['name'], os.path.splitext(os.path.basename(path))[0])
+
+        path = self.write_jobs(
+            {'jobs': [{'name': 'first'}, {'hazard': 'hazard.shp'}]})
+        jobs = read_jobs(path)
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[0]['name'], 'first')
+        self.assertTrue(jobs[1]['name'].endswith('_2'))
+
+        path = self.write_jobs(['not a job'])
+        self.assertRaises(ValueError, read_jobs, path)
+
+    def test_run_job(self):
+        """Test we can run a job and get its outputs."""
+        job = {
+            'name': 'flood',
+            'directory': standard_data_path(),
+            'hazard': os.path.join('hazard', 'flood_multipart_polygons.shp'),
+            'exposure': os.path.join('exposure', 'buildings.shp'),
+            'extent': [106.807822, -6.192757, 106.825675, -6.167227],
+            'crs': 'EPSG:4326',
+            'datastore': temp_dir('job_runner'),
+        }
+        result = run_job(job)
+        self.assertEqual(result['status'], ANALYSIS_SUCCESS, result['message'])
+        self.assertIn(
+            layer_purpose_analysis_impacted['key'], result['outputs'])
+        self.assertTrue(result['provenance'])
+        self.assertTrue(result['performance_log'])
+        # The result can be written as JSON.
+        json.dumps(result)
+
+        job['hazard'] = 'missing.shp'
+        result = run_job(job)
+        self.assertEqual(result['status'], ANALYSIS_FAILED_BAD_INPUT)
+
+    def test_run_job_with_report(self):
+        """Test we can produce reports without a map canvas."""
+        job = {
+            'name': 'flood_report',
+            'directory': standard_data_path(),
+            'hazard': os.path.join('hazard', 'flood_multipart_polygons.shp'),
+            'exposure': os.path.join('exposure', 'buildings.shp'),
+            'extent': [106.807822, -6.192757, 106.825675, -6.167227],
+            'crs': 'EPSG:4326',
+            'datastore': temp_dir('job_runner'),
+            'report_components': [
+                standard_impact_report_metadata_pdf['key'],
+                map_report['key']],
+        }
+        result = run_job(job)
+        self.assertEqual(result['status'], ANALYSIS_SUCCESS, result['message'])
+        self.assertFalse(result['message'])
+        report_directory = result['report_directory']
+        self.assertTrue(os.path.isdir(report_directory))
+        self.assertTrue(os.listdir(report_directory))
+
+    def test_exit_code(self):
+        """Test the exit code of many jobs."""
+        success = {'status': ANALYSIS_SUCCESS}
+        bad_input = {'status': ANALYSIS_FAILED_BAD_INPUT}
+        bad_code = {'status': ANALYSIS_FAILED_BAD_CODE}
+        self.assertEqual(exit_code([success, success]), ANALYSIS_SUCCESS)
+        self.assertEqual(
+            exit_code([success, bad_input]), ANALYSIS_FAILED_BAD_INPUT)
+        self.assertEqual(
+            exit_code([bad_input, bad_code]), ANALYSIS_FAILED_BAD_CODE)
+
+
+if __name__ == '__main__':
+    unittest.main()
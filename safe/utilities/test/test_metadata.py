@@ -18,6 +18,7 @@ from safe.utilities.metadata import (
     active_thresholds_value_maps,
     copy_layer_keywords,
     convert_metadata,
+    keywords_cache_statistics,
 )
 from safe.common.exceptions import MetadataConversionError
 
@@ -184,6 +185,31 @@ class TestMetadataUtilities(unittest.TestCase):
         read_metadata = read_iso19115_metadata(layer.source(), version_35=True)
         self.assertDictEqual(keywords, read_metadata)
 
+    def test_keywords_cache(self):
+        """Test keywords are cached until they are written again."""
+        layer = clone_shp_layer(
+            name='buildings',
+            include_keywords=True,
+            source_directory=standard_data_path('exposure'))
+        keywords = read_iso19115_metadata(layer.source())
+
+        hits = keywords_cache_statistics['hits']
+        self.assertDictEqual(keywords, read_iso19115_metadata(layer.source()))
+        self.assertEqual(
+            read_iso19115_metadata(layer.source(), 'title'),
+            keywords['title'])
+        self.assertEqual(keywords_cache_statistics['hits'], hits + 2)
+
+        # The cache returns a copy.
+        keywords['title'] = 'Edited'
+        self.assertNotEqual(
+            read_iso19115_metadata(layer.source(), 'title'), 'Edited')
+
+        # The cache is invalidated when keywords are written.
+        write_iso19115_metadata(layer.source(), keywords)
+        self.assertEqual(
+            read_iso19115_metadata(layer.source(), 'title'), 'Edited')
+
     def test_active_classification_thresholds_value_maps(self):
         """Test for active_classification and thresholds value maps method."""
         keywords = {
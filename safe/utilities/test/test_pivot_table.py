@@ -3,6 +3,8 @@
 import unittest
 import json
 
+import numpy as np
+
 from safe.utilities.pivot_table import FlatTable, PivotTable
 
 
@@ -200,6 +202,72 @@ class PivotTableTest(unittest.TestCase):
         self.assertEquals(flat_table.data[('primary', 'high')], 10)
         self.assertEquals(flat_table.data[('primary', 'medium')], 20)
 
+    def test_add_values(self):
+        """Test we can add and read many values at once."""
+        flat_table = FlatTable('road_type', 'hazard')
+        road_types = ['primary', 'primary', 'residential', 'secondary',
+                      'residential']
+        hazards = ['high', 'medium', 'medium', 'low', 'low']
+        flat_table.add_values(
+            [10, 20, 30, 40, 50],
+            road_type=flat_table.codes('road_type', road_types),
+            hazard=flat_table.codes('hazard', hazards))
+
+        self.assertEqual(flat_table.data, self.flat_table.data)
+        self.assertEqual(flat_table.get_value(
+            road_type='primary', hazard='high'), 10)
+        # Unknown keys are not added to the table.
+        self.assertEqual(flat_table.get_value(
+            road_type='primary', hazard='low'), 0)
+        self.assertEqual(len(flat_table.data), 5)
+
+        values = flat_table.get_values(
+            road_type=flat_table.codes('road_type', ['residential'] * 2),
+            hazard=flat_table.codes('hazard', ['low', 'high']))
+        self.assertEqual(list(values), [50, 0])
+
+        pivot_table = PivotTable(
+            flat_table, row_field="road_type", column_field="hazard")
+        expected = PivotTable(
+            self.flat_table, row_field="road_type", column_field="hazard")
+        self.assertEqual(pivot_table.data, expected.data)
+        self.assertEqual(pivot_table.total, expected.total)
+
+        # Integers become floats if we add floats.
+        flat_table.add_value(0.5, road_type='primary', hazard='high')
+        self.assertEqual(flat_table.get_value(
+            road_type='primary', hazard='high'), 10.5)
+
+
+    def test_sparse_values(self):
+        """Test only the cells with a value are stored."""
+        flat_table = FlatTable('aggregation_id', 'hazard_id', 'exposure')
+        count = 20000
+        hazard_ids = np.arange(count)
+        aggregation_ids = hazard_ids % 500
+        classes = ['class_%s' % (i % 10) for i in range(count)]
+        flat_table.add_values(
+            np.ones(count, dtype=np.int64),
+            aggregation_id=flat_table.codes('aggregation_id', aggregation_ids),
+            hazard_id=flat_table.codes('hazard_id', hazard_ids),
+            exposure=flat_table.codes('exposure', classes))
+        # The same cells again.
+        flat_table.add_value(
+            1, aggregation_id=0, hazard_id=0, exposure='class_0')
+
+        keys, sums = flat_table._cells()
+        self.assertEqual(len(keys), count)
+        self.assertEqual(sums.sum(), count + 1)
+        self.assertEqual(flat_table.get_value(
+            aggregation_id=0, hazard_id=0, exposure='class_0'), 2)
+        self.assertEqual(flat_table.get_value(
+            aggregation_id=1, hazard_id=0, exposure='class_0'), 0)
+
+        pivot_table = PivotTable(
+            flat_table, row_field='aggregation_id', column_field='exposure')
+        self.assertEqual(pivot_table.total, count + 1)
+        self.assertEqual(len(pivot_table.rows), 500)
+
 
 if __name__ == '__main__':
     suite = unittest.makeSuite(PivotTableTest, 'test')
@@ -0,0 +1,104 @@
+# coding=utf-8
+"""Test for the profiling."""
+
+import json
+import threading
+import unittest
+
+from safe.test.utilities import get_qgis_app
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+from safe.common.utilities import unique_filename
+from safe.utilities.profiling import (
+    profile,
+    profiling_log,
+    clear_prof_data,
+    enable_profiling,
+    speedscope_profile,
+    flame_graph,
+    write_profile,
+)
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+
+@profile
+def _leaf():
+    return sum(range(1000))
+
+
+@profile
+def _node():
+    _leaf()
+    _leaf()
+
+
+@profile
+def _analysis():
+    _node()
+    thread = threading.Thread(target=_leaf)
+    thread.start()
+    thread.join()
+
+
+class TestProfiling(unittest.TestCase):
+    """Test the profiling."""
+
+    def setUp(self):
+        clear_prof_data()
+        enable_profiling(True, memory_profile=True)
+
+    def tearDown(self):
+        clear_prof_data()
+
+    def test_tree(self):
+        """Test we build the tree of profiled functions."""
+        _analysis()
+        root = profiling_log()
+        self.assertEqual(root.key, '_analysis')
+        self.assertEqual(
+            [child.key for child in root.children], ['_node', '_leaf'])
+        node = root.children[0]
+        self.assertEqual(node.parent, '_analysis')
+        self.assertEqual(len(node.children), 2)
+        self.assertIsNotNone(node.elapsed_time)
+        self.assertIsNotNone(node.cpu_time)
+
+        # The function from the other thread is attached to the root.
+        self.assertNotEqual(root.children[1].thread, root.thread)
+
+    def test_disabled(self):
+        """Test nothing is recorded when the profiling is disabled."""
+        enable_profiling(False)
+        _analysis()
+        self.assertIsNone(profiling_log())
+
+    def test_export(self):
+        """Test we can export the tree to speedscope and flame graphs."""
+        _analysis()
+        root = profiling_log()
+
+        speedscope = speedscope_profile(root)
+        self.assertEqual(
+            [frame['name'] for frame in speedscope['shared']['frames']],
+            ['_analysis', '_node', '_leaf'])
+        self.assertEqual(len(speedscope['profiles']), 2)
+        events = speedscope['profiles'][0]['events']
+        self.assertEqual(len(events), 2 * 5)
+        self.assertEqual(events[0]['type'], 'O')
+        self.assertEqual(events[-1]['type'], 'C')
+
+        graph = flame_graph(root)
+        self.assertEqual(graph['name'], '_analysis')
+        self.assertEqual(len(graph['children'][0]['children']), 2)
+
+        path = unique_filename(suffix='.json')
+        write_profile(root, path)
+        with open(path) as json_file:
+            self.assertEqual(json.load(json_file)['name'], 'InaSAFE')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# coding=utf-8
+"""Benchmark the vector formats of the folder datastore.
+
+For each format supported by OGR, the layer is written in a folder
+datastore, reloaded and read completely. The time of each step and the size
+of the files are printed as CSV.
+
+Usage::
+
+    python scripts/benchmark_vector_formats.py [--copies N] [layer ...]
+
+Layers can be outputs of an analysis, such as the exposure summary. Without
+any layer, the buildings from the test data are used. Features can be copied
+many times with --copies to get a layer as big as a real analysis.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+from tempfile import mkdtemp
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from safe.test.utilities import get_qgis_app, standard_data_path  # NOQA
+QGIS_APP, CANVAS, IFACE, PARENT = get_qgis_app()
+
+from qgis.core import QgsVectorLayer  # NOQA
+
+from safe.datastore.folder import Folder, available_vector_formats  # NOQA
+from safe.gis.vector.tools import create_memory_layer, copy_layer  # NOQA
+from safe.utilities.metadata import read_iso19115_metadata  # NOQA
+
+__copyright__ = "Copyright 2017, The InaSAFE Project"
+__license__ = "GPL version 3"
+__email__ = "info@inasafe.org"
+__revision__ = '$Format:%H$'
+
+
+def load_layer(path, copies):
+    """Load the layer to write, in memory.
+
+    :param path: The path of the layer.
+    :type path: str
+
+    :param copies: Number of copies of each feature.
+    :type copies: int
+
+    :return: The memory layer.
+    :rtype: QgsVectorLayer
+    """
+    source = QgsVectorLayer(path, os.path.basename(path), 'ogr')
+    if not source.isValid():
+        raise Exception('The layer %s is not valid.' % path)
+
+    layer = create_memory_layer(
+        source.name(), source.geometryType(), source.crs(), source.fields())
+    for _ in range(copies):
+        copy_layer(source, layer)
+
+    try:
+        layer.keywords = read_iso19115_metadata(path)
+    except Exception:  # pylint: disable=broad-except
+        layer.keywords = {}
+    return layer
+
+
+def folder_size(path):
+    """Size of all files in a folder.
+
+    :param path: The path of the folder.
+    :type path: str
+
+    :return: The size in bytes.
+    :rtype: int
+    """
+    return sum(
+        os.path.getsize(os.path.join(path, file_name))
+        for file_name in os.listdir(path))
+
+
+def benchmark(layer, vector_format):
+    """Write, reload and read a layer in a folder datastore.
+
+    :param layer: The layer to write.
+    :type layer: QgsVectorLayer
+
+    :param vector_format: The extension of the format.
+    :type vector_format: str
+
+    :return: Time to write, time to reload, time to read and size in bytes.
+    :rtype: tuple
+    """
+    directory = mkdtemp()
+    try:
+        data_store = Folder(directory)
+        data_store.default_vector_format = vector_format
+
+        start = time.time()
+        result, name = data_store.add_layer(layer, 'benchmark')
+        write_time = time.time() - start
+        if not result:
+            raise Exception(name)
+
+        start = time.time()
+        stored_layer = data_store.layer(name)
+        reload_time = time.time() - start
+
+        start = time.time()
+        for feature in stored_layer.getFeatures():
+            feature.geometry()
+            feature.attributes()
+        read_time = time.time() - start
+
+        size = folder_size(directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return write_time, reload_time, read_time, size
+
+
+def main():
+    """Run the benchmark on the layers from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('layers', nargs='*')
+    parser.add_argument('--copies', type=int, default=1)
+    parser.add_argument(
+        '--formats', nargs='*', default=available_vector_formats())
+    arguments = parser.parse_args()
+
+    paths = arguments.layers or [
+        standard_data_path('exposure', 'buildings.shp')]
+
+    print 'layer,features,format,write (s),reload (s),read (s),size (MB)'
+    for path in paths:
+        layer = load_layer(path, arguments.copies)
+        for vector_format in arguments.formats:
+            write_time, reload_time, read_time, size = benchmark(
+                layer, vector_format)
+            print '%s,%s,%s,%.3f,%.3f,%.3f,%.2f' % (
+                os.path.basename(path),
+                layer.featureCount(),
+                vector_format,
+                write_time,
+                reload_time,
+                read_time,
+                size / 1024.0 / 1024.0)
+
+
+if __name__ == '__main__':
+    main()